@@ -0,0 +1,5 @@
+#!/bin/sh
+# Build and install pgfluxai into the server that PG_CONFIG (default: the pg_config on PATH) belongs to.
+set -e
+cd "$(dirname "$0")"
+make PG_CONFIG="${PG_CONFIG:-pg_config}" install
@@ -0,0 +1 @@
+DROP EXTENSION IF EXISTS pgfluxai CASCADE;
@@ -0,0 +1,83 @@
+-- Builds with and without parallel workers, checked against exact search.
+-- Probing every list makes the index scan exact, so its order must match a seq scan.
+
+CREATE TABLE items (id int PRIMARY KEY, v vector(3));
+INSERT INTO items SELECT i, ARRAY[sin(i), cos(i), sin(i * 0.7)] FROM generate_series(1, 20000) i;
+ANALYZE items;
+SET pgfluxai.ivfflat_probes = 20;
+
+SET enable_indexscan = off;
+SELECT array_agg(id) AS l2 FROM (SELECT id FROM items ORDER BY v <-> '[0.5,0.5,0.5]' LIMIT 10) s \gset
+SELECT array_agg(id) AS ip FROM (SELECT id FROM items ORDER BY v <#> '[0.5,0.5,0.5]' LIMIT 10) s \gset
+SELECT array_agg(id) AS cosine FROM (SELECT id FROM items ORDER BY v <=> '[0.5,0.5,0.5]' LIMIT 10) s \gset
+RESET enable_indexscan;
+
+-- Serial build
+
+SET max_parallel_maintenance_workers = 0;
+CREATE INDEX items_serial ON items USING ivfflat (v) WITH (lists = 20);
+SET enable_seqscan = off;
+EXPLAIN (COSTS OFF) SELECT id FROM items ORDER BY v <-> '[0.5,0.5,0.5]' LIMIT 10;
+SELECT array_agg(id) = :'l2' AS same FROM (SELECT id FROM items ORDER BY v <-> '[0.5,0.5,0.5]' LIMIT 10) s;
+SELECT count(*) FROM (SELECT id FROM items ORDER BY v <-> '[0.5,0.5,0.5]') s;
+RESET enable_seqscan;
+DROP INDEX items_serial;
+
+-- Parallel build: two workers need a table over min_parallel_table_scan_size and 32MB of
+-- maintenance_work_mem each
+
+SET max_parallel_maintenance_workers = 2;
+SET min_parallel_table_scan_size = 0;
+SET maintenance_work_mem = '128MB';
+CREATE INDEX items_parallel ON items USING ivfflat (v) WITH (lists = 20);
+SET enable_seqscan = off;
+SELECT array_agg(id) = :'l2' AS same FROM (SELECT id FROM items ORDER BY v <-> '[0.5,0.5,0.5]' LIMIT 10) s;
+SELECT count(*) FROM (SELECT id FROM items ORDER BY v <-> '[0.5,0.5,0.5]') s;
+RESET enable_seqscan;
+DROP INDEX items_parallel;
+
+-- The other opclasses, built in parallel
+
+CREATE INDEX items_ip ON items USING ivfflat (v vector_ip_ops) WITH (lists = 20);
+SET enable_seqscan = off;
+EXPLAIN (COSTS OFF) SELECT id FROM items ORDER BY v <#> '[0.5,0.5,0.5]' LIMIT 10;
+SELECT array_agg(id) = :'ip' AS same FROM (SELECT id FROM items ORDER BY v <#> '[0.5,0.5,0.5]' LIMIT 10) s;
+RESET enable_seqscan;
+DROP INDEX items_ip;
+
+CREATE INDEX items_cosine ON items USING ivfflat (v vector_cosine_ops) WITH (lists = 20);
+SET enable_seqscan = off;
+EXPLAIN (COSTS OFF) SELECT id FROM items ORDER BY v <=> '[0.5,0.5,0.5]' LIMIT 10;
+SELECT array_agg(id) = :'cosine' AS same FROM (SELECT id FROM items ORDER BY v <=> '[0.5,0.5,0.5]' LIMIT 10) s;
+RESET enable_seqscan;
+DROP INDEX items_cosine;
+
+RESET max_parallel_maintenance_workers;
+RESET min_parallel_table_scan_size;
+RESET maintenance_work_mem;
+
+-- A single probe reads one list only
+
+CREATE INDEX items_l2 ON items USING ivfflat (v) WITH (lists = 20);
+SET enable_seqscan = off;
+SET pgfluxai.ivfflat_probes = 1;
+SELECT count(*) BETWEEN 1 AND 19999 AS partial FROM (SELECT id FROM items ORDER BY v <-> '[0.5,0.5,0.5]') s;
+RESET pgfluxai.ivfflat_probes;
+SELECT id FROM items ORDER BY v <-> '[1,2]' LIMIT 1;
+RESET enable_seqscan;
+DROP TABLE items;
+
+-- Errors and edge cases
+
+CREATE TABLE nodims (v vector);
+CREATE INDEX ON nodims USING ivfflat (v);
+DROP TABLE nodims;
+CREATE TABLE toomany (v vector(2001));
+CREATE INDEX ON toomany USING ivfflat (v);
+DROP TABLE toomany;
+CREATE TABLE little (v vector(2));
+INSERT INTO little VALUES ('[1,1]'), ('[2,2]');
+CREATE INDEX ON little USING ivfflat (v) WITH (lists = 10);
+CREATE INDEX ON little USING ivfflat (v) WITH (lists = 0);
+SET pgfluxai.ivfflat_probes = 0;
+DROP TABLE little;
@@ -0,0 +1,49 @@
+-- Inserts and deletes after the build, checked against exact search
+
+CREATE TABLE items (id int PRIMARY KEY, v vector(3));
+INSERT INTO items SELECT i, ARRAY[sin(i), cos(i), sin(i * 0.7)] FROM generate_series(1, 5000) i;
+CREATE INDEX ON items USING ivfflat (v) WITH (lists = 10);
+SET pgfluxai.ivfflat_probes = 10;
+
+-- Enough rows to chain new pages onto the lists, plus exact matches for the query
+INSERT INTO items SELECT i, ARRAY[cos(i), sin(i * 1.3), cos(i * 0.3)] FROM generate_series(5001, 15000) i;
+INSERT INTO items VALUES (15001, '[0.5,0.5,0.5]'), (15002, '[0.5,0.5,0.5]'), (15003, NULL);
+
+SET enable_indexscan = off;
+SELECT array_agg(id) AS exact FROM (SELECT id FROM items ORDER BY v <-> '[0.5,0.5,0.5]', id LIMIT 20) s \gset
+RESET enable_indexscan;
+
+SET enable_seqscan = off;
+EXPLAIN (COSTS OFF) SELECT id FROM items ORDER BY v <-> '[0.5,0.5,0.5]' LIMIT 20;
+SELECT array_agg(id ORDER BY d, id) = :'exact' AS same
+FROM (SELECT id, v <-> '[0.5,0.5,0.5]' AS d FROM items ORDER BY v <-> '[0.5,0.5,0.5]' LIMIT 20) s;
+SELECT count(*) FROM (SELECT id FROM items ORDER BY v <-> '[0.5,0.5,0.5]') s;
+RESET enable_seqscan;
+
+-- VACUUM removes deleted rows from the lists, and inserts go on afterwards
+
+DELETE FROM items WHERE id % 3 = 0 OR id = 15001;
+VACUUM items;
+INSERT INTO items SELECT i, ARRAY[sin(i), sin(i * 0.3), cos(i)] FROM generate_series(15004, 16000) i;
+
+SET enable_indexscan = off;
+SELECT array_agg(id) AS exact FROM (SELECT id FROM items ORDER BY v <-> '[0.5,0.5,0.5]', id LIMIT 20) s \gset
+RESET enable_indexscan;
+
+SET enable_seqscan = off;
+SELECT array_agg(id ORDER BY d, id) = :'exact' AS same
+FROM (SELECT id, v <-> '[0.5,0.5,0.5]' AS d FROM items ORDER BY v <-> '[0.5,0.5,0.5]' LIMIT 20) s;
+SELECT count(*) FROM (SELECT id FROM items ORDER BY v <-> '[0.5,0.5,0.5]') s;
+RESET enable_seqscan;
+
+DROP TABLE items;
+
+-- An index built on an empty table takes rows afterwards
+
+CREATE TABLE empty (id int, v vector(2));
+CREATE INDEX ON empty USING ivfflat (v) WITH (lists = 2);
+INSERT INTO empty VALUES (1, '[1,1]'), (2, '[5,5]'), (3, '[2,2]');
+SET enable_seqscan = off;
+SELECT id FROM empty ORDER BY v <-> '[0,0]';
+RESET enable_seqscan;
+DROP TABLE empty;
@@ -0,0 +1,61 @@
+-- Type I/O
+
+SELECT '[1,2,3]'::vector;
+SELECT ' [ 1.5 , -2e-3,0.1 ] '::vector;
+SELECT '[1.23456789]'::vector;
+SELECT '[3.4028235e38,-1e-45]'::vector;
+SELECT '[1,2,3]'::vector(3);
+
+SELECT '[1,2,3]'::vector(2);
+SELECT '[]'::vector;
+SELECT '1,2'::vector;
+SELECT '[1,2'::vector;
+SELECT '[1,,2]'::vector;
+SELECT '[1,2] x'::vector;
+SELECT '[1,a]'::vector;
+SELECT '[NaN]'::vector;
+SELECT '[Infinity]'::vector;
+SELECT '[4e38]'::vector;
+SELECT '[1]'::vector(0);
+SELECT '[1]'::vector(16001);
+SELECT '[1]'::vector(1, 2);
+
+-- Binary I/O round trip
+
+\getenv abs_builddir PG_ABS_BUILDDIR
+\set filename :abs_builddir '/results/vector.data'
+
+SELECT vector_send('[1,-2.5]');
+CREATE TABLE vector_io (v vector(2));
+INSERT INTO vector_io VALUES ('[1,-2.5]'), ('[0.1,3e-5]'), (NULL);
+COPY vector_io TO :'filename' WITH (FORMAT binary);
+CREATE TABLE vector_io_copy (v vector(2));
+COPY vector_io_copy FROM :'filename' WITH (FORMAT binary);
+SELECT v FROM vector_io_copy;
+CREATE TABLE vector_io_short (v vector(3));
+COPY vector_io_short FROM :'filename' WITH (FORMAT binary);
+DROP TABLE vector_io, vector_io_copy, vector_io_short;
+
+-- Casts
+
+SELECT ARRAY[1,2,3]::vector;
+SELECT ARRAY[1.5,2.5]::real[]::vector;
+SELECT ARRAY[1.5,2.5]::double precision[]::vector;
+SELECT ARRAY[1.5,2.5]::numeric[]::vector;
+SELECT '[1,2,3]'::vector::real[];
+SELECT ARRAY[1,2,3]::vector(2);
+SELECT ARRAY[[1,2],[3,4]]::vector;
+SELECT ARRAY[1,NULL]::vector;
+SELECT '{}'::real[]::vector;
+SELECT ARRAY[1e300]::double precision[]::vector;
+
+-- Functions and operators
+
+SELECT l2_distance('[0,0]', '[3,4]'), '[0,0]'::vector <-> '[3,4]';
+SELECT inner_product('[1,2]', '[3,4]'), '[1,2]'::vector <#> '[3,4]';
+SELECT cosine_distance('[1,2]', '[2,4]'), '[1,0]'::vector <=> '[0,1]', '[1,1]'::vector <=> '[-1,-1]';
+SELECT cosine_distance('[0,0]', '[1,1]');
+SELECT vector_dims('[1,2,3]'), vector_norm('[3,4]');
+SELECT '[1,2]'::vector <-> '[1,2,3]';
+SELECT inner_product('[1,2]', '[1,2,3]');
+SELECT cosine_distance('[1,2]', '[1,2,3]');
@@ -0,0 +1,1500 @@
+/*
+ * ivfflat: an inverted-file index for approximate nearest-neighbour search.
+ *
+ * The build trains centres with k-means on a sample of the table and files
+ * every vector under its nearest centre. A scan ranks the centres against
+ * the query, reads the pgfluxai.ivfflat_probes nearest lists in full and
+ * returns their tuples sorted by distance.
+ *
+ * Page layout: block 0 is the metapage, followed by the list directory (a
+ * chain of pages of IvfflatListData items), followed by the entry pages.
+ * Each list owns a chain of entry pages from startPage to insertPage.
+ *
+ * Assigning rows to lists, a distance to every centre per row, runs in
+ * parallel workers when the planner allows them (max_parallel_maintenance_
+ * workers, the table's parallel_workers). Every participant scans part of
+ * the heap into a shared tuplesort ordered by list, and the leader writes
+ * each list's pages in one pass. Build pages are written without WAL and
+ * logged once, page by page, with log_newpage_range; inserts and VACUUM use
+ * generic WAL.
+ */
+#include "postgres.h"
+
+#include <float.h>
+
+#include "access/generic_xlog.h"
+#include "access/parallel.h"
+#include "access/relscan.h"
+#include "access/table.h"
+#include "access/tableam.h"
+#include "access/xact.h"
+#include "access/xloginsert.h"
+#include "catalog/index.h"
+#include "catalog/pg_operator_d.h"
+#include "catalog/pg_type_d.h"
+#include "commands/vacuum.h"
+#include "common/pg_prng.h"
+#include "executor/tuptable.h"
+#include "miscadmin.h"
+#include "optimizer/optimizer.h"
+#include "pgstat.h"
+#include "storage/bufmgr.h"
+#include "storage/condition_variable.h"
+#include "storage/spin.h"
+#include "tcop/tcopprot.h"
+#include "utils/guc.h"
+#include "utils/memutils.h"
+#include "utils/rel.h"
+#include "utils/selfuncs.h"
+#include "utils/snapmgr.h"
+#include "utils/tuplesort.h"
+
+#include "pgfluxai.h"
+
+/* Keys of the parallel build's shared memory */
+#define PARALLEL_KEY_IVFFLAT_SHARED	UINT64CONST(0xA000000000000001)
+#define PARALLEL_KEY_TUPLESORT		UINT64CONST(0xA000000000000002)
+#define PARALLEL_KEY_CENTERS		UINT64CONST(0xA000000000000003)
+#define PARALLEL_KEY_QUERY_TEXT		UINT64CONST(0xA000000000000004)
+
+int			ivfflat_probes = IVFFLAT_DEFAULT_PROBES;
+relopt_kind ivfflat_relopt_kind;
+
+/* A list as read from the directory */
+typedef struct ListInfo
+{
+	BlockNumber startPage;
+	BlockNumber insertPage;
+	ItemPointerData dirTid;		/* location of the directory entry */
+	float	   *center;
+} ListInfo;
+
+/* State shared by the leader and the workers of a parallel build */
+typedef struct IvfflatShared
+{
+	/* Immutable state */
+	Oid			heaprelid;
+	Oid			indexrelid;
+	bool		isconcurrent;
+	int			scantuplesortstates;
+
+	/* Signalled by each participant when its sort is done */
+	ConditionVariable workersdonecv;
+
+	/* Mutable state, under mutex */
+	slock_t		mutex;
+	int			nparticipantsdone;
+	double		reltuples;
+
+	/* A ParallelTableScanDescData follows */
+} IvfflatShared;
+
+#define ParallelTableScanFromIvfflatShared(shared) \
+	((ParallelTableScanDesc) ((char *) (shared) + BUFFERALIGN(sizeof(IvfflatShared))))
+
+typedef struct IvfflatLeader
+{
+	ParallelContext *pcxt;
+	int			nparticipanttuplesorts;	/* launched workers and the leader */
+	IvfflatShared *shared;
+	Sharedsort *sharedsort;
+	Snapshot	snapshot;
+} IvfflatLeader;
+
+typedef struct BuildState
+{
+	int			dimensions;
+	int			lists;
+	IvfflatMetric metric;
+	bool		normalize;
+
+	/* Sampling */
+	pg_prng_state prng;
+	float	   *samples;
+	int			maxSamples;
+	int			numSamples;
+	double		rowsSeen;
+
+	/* Assignment: (list, tid, vector) tuples sorted by list */
+	float	   *centers;
+	ListInfo   *listInfo;
+	TupleDesc	sortdesc;
+	TupleTableSlot *slot;		/* virtual slot the participants fill */
+	Tuplesortstate *sortstate;
+	IvfflatLeader *leader;
+	double		reltuples;
+	double		indtuples;
+
+	MemoryContext tmpCtx;
+} BuildState;
+
+typedef struct ListDistance
+{
+	int			list;
+	float		distance;
+} ListDistance;
+
+typedef struct ScanItem
+{
+	ItemPointerData tid;
+	float		distance;
+} ScanItem;
+
+typedef struct IvfflatScanOpaqueData
+{
+	int			lists;
+	int			dimensions;
+	IvfflatMetric metric;
+	bool		normalize;
+	bool		first;
+	ScanItem   *items;
+	int			nitems;
+	int			pos;
+	MemoryContext scanCtx;
+} IvfflatScanOpaqueData;
+
+typedef IvfflatScanOpaqueData *IvfflatScanOpaque;
+
+PGDLLEXPORT void IvfflatParallelBuildMain(dsm_segment *seg, shm_toc *toc);
+
+void
+IvfflatInit(void)
+{
+	ivfflat_relopt_kind = add_reloption_kind();
+	add_int_reloption(ivfflat_relopt_kind, "lists", "Number of inverted lists",
+					  IVFFLAT_DEFAULT_LISTS, IVFFLAT_MIN_LISTS, IVFFLAT_MAX_LISTS,
+					  AccessExclusiveLock);
+
+	DefineCustomIntVariable("pgfluxai.ivfflat_probes", "Sets the number of lists an ivfflat scan reads.",
+							"More probes find more of the true nearest neighbours at the cost of speed.",
+							&ivfflat_probes, IVFFLAT_DEFAULT_PROBES, IVFFLAT_MIN_LISTS, IVFFLAT_MAX_LISTS,
+							PGC_USERSET, 0, NULL, NULL, NULL);
+	MarkGUCPrefixReserved("pgfluxai");
+}
+
+void
+IvfflatInitPage(Page page)
+{
+	IvfflatPageOpaque opaque;
+
+	PageInit(page, BLCKSZ, sizeof(IvfflatPageOpaqueData));
+	opaque = IvfflatPageGetOpaque(page);
+	opaque->nextblkno = InvalidBlockNumber;
+	opaque->page_id = IVFFLAT_PAGE_ID;
+}
+
+int
+IvfflatGetLists(Relation index)
+{
+	IvfflatOptions *opts = (IvfflatOptions *) index->rd_options;
+
+	return opts ? opts->lists : IVFFLAT_DEFAULT_LISTS;
+}
+
+void
+IvfflatGetMetaPageInfo(Relation index, int *lists, int *dimensions)
+{
+	Buffer		buf = ReadBuffer(index, IVFFLAT_METAPAGE_BLKNO);
+	IvfflatMetaPage meta;
+
+	LockBuffer(buf, BUFFER_LOCK_SHARE);
+	meta = IvfflatPageGetMeta(BufferGetPage(buf));
+	if (meta->magicNumber != IVFFLAT_MAGIC_NUMBER)
+		ereport(ERROR,
+				(errcode(ERRCODE_INDEX_CORRUPTED),
+				 errmsg("index \"%s\" is not an ivfflat index", RelationGetRelationName(index))));
+	*lists = meta->lists;
+	*dimensions = meta->dimensions;
+	UnlockReleaseBuffer(buf);
+}
+
+/*
+ * The metric follows from the opclass's distance support function. Cosine
+ * opclasses also have a norm function: their vectors are stored normalized
+ * and compared by inner product.
+ */
+IvfflatMetric
+IvfflatGetMetric(Relation index, bool *normalize)
+{
+	FmgrInfo   *procinfo = index_getprocinfo(index, 1, IVFFLAT_DISTANCE_PROC);
+
+	*normalize = OidIsValid(index_getprocid(index, 1, IVFFLAT_NORM_PROC));
+	if (procinfo->fn_addr == vector_l2_squared_distance)
+		return IVFFLAT_METRIC_L2;
+	if (procinfo->fn_addr == vector_negative_inner_product)
+		return IVFFLAT_METRIC_IP;
+	elog(ERROR, "unsupported distance function for ivfflat index \"%s\"", RelationGetRelationName(index));
+	pg_unreachable();
+}
+
+float
+IvfflatDistance(IvfflatMetric metric, int dim, const float *a, const float *b)
+{
+	if (metric == IVFFLAT_METRIC_L2)
+		return VectorL2SquaredDistance(dim, a, b);
+	return -VectorInnerProduct(dim, a, b);
+}
+
+static int
+GetDimensions(Relation index)
+{
+	int			dimensions = TupleDescAttr(RelationGetDescr(index), 0)->atttypmod;
+
+	if (dimensions < 1)
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("column does not have dimensions")));
+	if (dimensions > IVFFLAT_MAX_DIM)
+		ereport(ERROR,
+				(errcode(ERRCODE_PROGRAM_LIMIT_EXCEEDED),
+				 errmsg("column cannot have more than %d dimensions for ivfflat index", IVFFLAT_MAX_DIM)));
+	return dimensions;
+}
+
+/*
+ * Detoast a value, normalizing a copy of it if the opclass asks for it.
+ * Returns NULL for a zero vector under cosine distance, which has no direction.
+ */
+static Vector *
+PrepareVector(Datum value, bool normalize)
+{
+	Vector	   *vec = DatumGetVector(value);
+	Vector	   *copy;
+
+	if (!normalize)
+		return vec;
+	copy = InitVector(vec->dim);
+	memcpy(copy->x, vec->x, sizeof(float) * vec->dim);
+	if (!VectorNormalize(copy->dim, copy->x))
+		return NULL;
+	return copy;
+}
+
+/*
+ * Read the list directory. The centres are stored contiguously, starting at
+ * result[0].center.
+ */
+static ListInfo *
+ReadLists(Relation index, int lists, int dimensions)
+{
+	ListInfo   *result = palloc(sizeof(ListInfo) * lists);
+	float	   *centers = palloc_extended(sizeof(float) * lists * dimensions, MCXT_ALLOC_HUGE);
+	BlockNumber blkno = IVFFLAT_HEAD_BLKNO;
+	int			n = 0;
+
+	while (BlockNumberIsValid(blkno))
+	{
+		Buffer		buf = ReadBuffer(index, blkno);
+		Page		page;
+		OffsetNumber maxoff;
+
+		LockBuffer(buf, BUFFER_LOCK_SHARE);
+		page = BufferGetPage(buf);
+		maxoff = PageGetMaxOffsetNumber(page);
+		for (OffsetNumber off = FirstOffsetNumber; off <= maxoff && n < lists; off = OffsetNumberNext(off))
+		{
+			IvfflatList list = (IvfflatList) PageGetItem(page, PageGetItemId(page, off));
+			ListInfo   *info = &result[n];
+
+			info->startPage = list->startPage;
+			info->insertPage = list->insertPage;
+			ItemPointerSet(&info->dirTid, blkno, off);
+			info->center = centers + (Size) n * dimensions;
+			memcpy(info->center, list->center.x, sizeof(float) * dimensions);
+			n++;
+		}
+		blkno = IvfflatPageGetOpaque(page)->nextblkno;
+		UnlockReleaseBuffer(buf);
+	}
+
+	if (n != lists)
+		elog(ERROR, "ivfflat index \"%s\" has %d lists in its directory, expected %d",
+			 RelationGetRelationName(index), n, lists);
+	return result;
+}
+
+static int
+NearestCenter(const float *centers, int lists, IvfflatMetric metric, int dim, const float *x)
+{
+	int			best = 0;
+	float		bestDistance = FLT_MAX;
+
+	for (int i = 0; i < lists; i++)
+	{
+		float		distance = IvfflatDistance(metric, dim, centers + (Size) i * dim, x);
+
+		if (distance < bestDistance)
+		{
+			best = i;
+			bestDistance = distance;
+		}
+	}
+	return best;
+}
+
+/*
+ * Append a tuple to a list's chain, starting at its insert page. Returns the
+ * page the tuple landed on, which becomes the list's insert page.
+ */
+static BlockNumber
+AppendTuple(Relation index, IndexTuple itup, BlockNumber insertPage)
+{
+	Size		itemsz = MAXALIGN(IndexTupleSize(itup));
+	BlockNumber blkno = insertPage;
+
+	for (;;)
+	{
+		Buffer		buf = ReadBuffer(index, blkno);
+		GenericXLogState *state;
+		Page		page;
+		BlockNumber next;
+		Buffer		newbuf;
+		Page		newpage;
+
+		LockBuffer(buf, BUFFER_LOCK_EXCLUSIVE);
+		page = BufferGetPage(buf);
+		if (PageGetFreeSpace(page) >= itemsz)
+		{
+			state = GenericXLogStart(index);
+			page = GenericXLogRegisterBuffer(state, buf, 0);
+			if (PageAddItem(page, (Item) itup, itemsz, InvalidOffsetNumber, false, false) == InvalidOffsetNumber)
+				elog(ERROR, "failed to add index item to \"%s\"", RelationGetRelationName(index));
+			GenericXLogFinish(state);
+			UnlockReleaseBuffer(buf);
+			return blkno;
+		}
+
+		next = IvfflatPageGetOpaque(page)->nextblkno;
+		if (BlockNumberIsValid(next))
+		{
+			/* Another backend already chained a page after this one */
+			UnlockReleaseBuffer(buf);
+			blkno = next;
+			continue;
+		}
+
+		newbuf = ExtendBufferedRel(BMR_REL(index), MAIN_FORKNUM, NULL, EB_LOCK_FIRST);
+		blkno = BufferGetBlockNumber(newbuf);
+		state = GenericXLogStart(index);
+		page = GenericXLogRegisterBuffer(state, buf, 0);
+		newpage = GenericXLogRegisterBuffer(state, newbuf, GENERIC_XLOG_FULL_IMAGE);
+		IvfflatInitPage(newpage);
+		IvfflatPageGetOpaque(page)->nextblkno = blkno;
+		if (PageAddItem(newpage, (Item) itup, itemsz, InvalidOffsetNumber, false, false) == InvalidOffsetNumber)
+			elog(ERROR, "failed to add index item to \"%s\"", RelationGetRelationName(index));
+		GenericXLogFinish(state);
+		UnlockReleaseBuffer(newbuf);
+		UnlockReleaseBuffer(buf);
+		return blkno;
+	}
+}
+
+/*
+ * Move a list's insert page forward, unless a concurrent insert already did
+ */
+static void
+UpdateInsertPage(Relation index, ItemPointer dirTid, BlockNumber oldPage, BlockNumber newPage)
+{
+	Buffer		buf = ReadBuffer(index, ItemPointerGetBlockNumber(dirTid));
+	GenericXLogState *state;
+	Page		page;
+	IvfflatList list;
+
+	LockBuffer(buf, BUFFER_LOCK_EXCLUSIVE);
+	state = GenericXLogStart(index);
+	page = GenericXLogRegisterBuffer(state, buf, 0);
+	list = (IvfflatList) PageGetItem(page, PageGetItemId(page, ItemPointerGetOffsetNumber(dirTid)));
+	if (list->insertPage == oldPage)
+	{
+		list->insertPage = newPage;
+		GenericXLogFinish(state);
+	}
+	else
+		GenericXLogAbort(state);
+	UnlockReleaseBuffer(buf);
+}
+
+/*
+ * Pages of an index being built are written without WAL; the build logs
+ * the finished fork with log_newpage_range.
+ */
+static Page
+StartNewPage(Relation index, ForkNumber forkNum, Buffer *buf)
+{
+	Page		page;
+
+	*buf = ExtendBufferedRel(BMR_REL(index), forkNum, NULL, EB_LOCK_FIRST);
+	page = BufferGetPage(*buf);
+	IvfflatInitPage(page);
+	return page;
+}
+
+static void
+FinishPage(Buffer buf)
+{
+	MarkBufferDirty(buf);
+	UnlockReleaseBuffer(buf);
+}
+
+/*
+ * Write the metapage, the list directory and one empty entry page per list.
+ * The directory takes a known number of pages, so each list's first entry
+ * page is known before the directory is written.
+ */
+static void
+CreatePages(Relation index, ForkNumber forkNum, int dimensions, int lists, const float *centers,
+			ListInfo *listInfo)
+{
+	Size		listSize = MAXALIGN(IVFFLAT_LIST_SIZE(dimensions));
+	int			perPage = (BLCKSZ - MAXALIGN(SizeOfPageHeaderData) - MAXALIGN(sizeof(IvfflatPageOpaqueData)))
+		/ (listSize + sizeof(ItemIdData));
+	BlockNumber firstEntryPage = IVFFLAT_HEAD_BLKNO + (lists + perPage - 1) / perPage;
+	IvfflatList list = palloc0(listSize);
+	IvfflatMetaPage meta;
+	Buffer		buf;
+	Page		page;
+
+	page = StartNewPage(index, forkNum, &buf);
+	Assert(BufferGetBlockNumber(buf) == IVFFLAT_METAPAGE_BLKNO);
+	meta = IvfflatPageGetMeta(page);
+	meta->magicNumber = IVFFLAT_MAGIC_NUMBER;
+	meta->version = IVFFLAT_VERSION;
+	meta->dimensions = dimensions;
+	meta->lists = lists;
+	((PageHeader) page)->pd_lower = ((char *) meta + sizeof(IvfflatMetaPageData)) - (char *) page;
+	FinishPage(buf);
+
+	page = StartNewPage(index, forkNum, &buf);
+	for (int i = 0; i < lists; i++)
+	{
+		OffsetNumber off;
+
+		if (i > 0 && i % perPage == 0)
+		{
+			Buffer		newbuf;
+			Page		newpage = StartNewPage(index, forkNum, &newbuf);
+
+			IvfflatPageGetOpaque(page)->nextblkno = BufferGetBlockNumber(newbuf);
+			FinishPage(buf);
+			page = newpage;
+			buf = newbuf;
+		}
+
+		list->startPage = firstEntryPage + i;
+		list->insertPage = list->startPage;
+		SET_VARSIZE(&list->center, VECTOR_SIZE(dimensions));
+		list->center.dim = dimensions;
+		memcpy(list->center.x, centers + (Size) i * dimensions, sizeof(float) * dimensions);
+		off = PageAddItem(page, (Item) list, listSize, InvalidOffsetNumber, false, false);
+		if (off == InvalidOffsetNumber)
+			elog(ERROR, "failed to add list to \"%s\"", RelationGetRelationName(index));
+
+		listInfo[i].startPage = list->startPage;
+		listInfo[i].insertPage = list->insertPage;
+		ItemPointerSet(&listInfo[i].dirTid, BufferGetBlockNumber(buf), off);
+	}
+	FinishPage(buf);
+
+	for (int i = 0; i < lists; i++)
+	{
+		StartNewPage(index, forkNum, &buf);
+		if (BufferGetBlockNumber(buf) != listInfo[i].startPage)
+			elog(ERROR, "unexpected entry page %u for list %d of \"%s\"",
+				 BufferGetBlockNumber(buf), i, RelationGetRelationName(index));
+		FinishPage(buf);
+	}
+	pfree(list);
+}
+
+static void
+SampleCallback(Relation index, ItemPointer tid, Datum *values, bool *isnull, bool tupleIsAlive, void *state)
+{
+	BuildState *buildstate = (BuildState *) state;
+	MemoryContext oldCtx;
+	Vector	   *vec;
+
+	if (isnull[0])
+		return;
+
+	oldCtx = MemoryContextSwitchTo(buildstate->tmpCtx);
+	vec = PrepareVector(values[0], buildstate->normalize);
+	if (vec != NULL)
+	{
+		int			slot = -1;
+
+		/* Reservoir sampling: every row ends up in the sample with equal probability */
+		buildstate->rowsSeen += 1;
+		if (buildstate->numSamples < buildstate->maxSamples)
+			slot = buildstate->numSamples++;
+		else
+		{
+			double		r = pg_prng_double(&buildstate->prng) * buildstate->rowsSeen;
+
+			if (r < buildstate->maxSamples)
+				slot = (int) r;
+		}
+		if (slot >= 0)
+			memcpy(buildstate->samples + (Size) slot * buildstate->dimensions, vec->x,
+				   sizeof(float) * buildstate->dimensions);
+	}
+	MemoryContextSwitchTo(oldCtx);
+	MemoryContextReset(buildstate->tmpCtx);
+}
+
+/*
+ * Lloyd's k-means on the sample. Training always uses squared L2; the
+ * centres are renormalized after each step for cosine opclasses.
+ */
+static void
+ComputeCenters(BuildState *buildstate)
+{
+	int			dim = buildstate->dimensions;
+	int			k = buildstate->lists;
+	int			n = buildstate->numSamples;
+	const float *samples = buildstate->samples;
+	float	   *centers = palloc_extended(sizeof(float) * k * dim, MCXT_ALLOC_HUGE | MCXT_ALLOC_ZERO);
+	float	   *sums = palloc_extended(sizeof(float) * k * dim, MCXT_ALLOC_HUGE);
+	int		   *counts = palloc(sizeof(int) * k);
+	int		   *assignments = palloc(sizeof(int) * Max(n, 1));
+
+	if (n < k)
+		ereport(NOTICE,
+				(errmsg("ivfflat index created with little data"),
+				 errdetail("This will cause low recall."),
+				 errhint("Drop the index until the table has more data.")));
+
+	/* Seed from evenly spaced samples; lists beyond the sample start at random points */
+	for (int j = 0; j < k; j++)
+	{
+		float	   *center = centers + (Size) j * dim;
+
+		if (j < n)
+			memcpy(center, samples + (Size) (n >= k ? (int64) j * n / k : j) * dim, sizeof(float) * dim);
+		else
+		{
+			for (int i = 0; i < dim; i++)
+				center[i] = (float) (pg_prng_double(&buildstate->prng) * 2 - 1);
+			if (buildstate->normalize)
+				VectorNormalize(dim, center);
+		}
+	}
+
+	for (int iter = 0; iter < IVFFLAT_KMEANS_ITERATIONS && n > 0; iter++)
+	{
+		bool		changed = false;
+
+		memset(sums, 0, sizeof(float) * k * dim);
+		memset(counts, 0, sizeof(int) * k);
+
+		for (int s = 0; s < n; s++)
+		{
+			const float *x = samples + (Size) s * dim;
+			float	   *sum;
+			int			best = 0;
+			float		bestDistance = FLT_MAX;
+
+			CHECK_FOR_INTERRUPTS();
+
+			for (int j = 0; j < k; j++)
+			{
+				float		distance = VectorL2SquaredDistance(dim, centers + (Size) j * dim, x);
+
+				if (distance < bestDistance)
+				{
+					best = j;
+					bestDistance = distance;
+				}
+			}
+			if (iter == 0 || assignments[s] != best)
+				changed = true;
+			assignments[s] = best;
+			counts[best]++;
+			sum = sums + (Size) best * dim;
+			for (int i = 0; i < dim; i++)
+				sum[i] += x[i];
+		}
+
+		if (!changed)
+			break;
+
+		for (int j = 0; j < k; j++)
+		{
+			float	   *center = centers + (Size) j * dim;
+			const float *sum = sums + (Size) j * dim;
+
+			if (counts[j] == 0)
+			{
+				/* Reseed an empty list at a random sample so it takes over part of a crowded one */
+				int			s = (int) (pg_prng_double(&buildstate->prng) * n);
+
+				memcpy(center, samples + (Size) s * dim, sizeof(float) * dim);
+			}
+			else
+			{
+				for (int i = 0; i < dim; i++)
+					center[i] = sum[i] / counts[j];
+			}
+			if (buildstate->normalize)
+				VectorNormalize(dim, center);
+		}
+	}
+
+	pfree(sums);
+	pfree(counts);
+	pfree(assignments);
+	buildstate->centers = centers;
+}
+
+static void
+InitBuildState(BuildState *buildstate, Relation index)
+{
+	memset(buildstate, 0, sizeof(BuildState));
+	buildstate->dimensions = GetDimensions(index);
+	buildstate->lists = IvfflatGetLists(index);
+	buildstate->metric = IvfflatGetMetric(index, &buildstate->normalize);
+	buildstate->tmpCtx = AllocSetContextCreate(CurrentMemoryContext, "ivfflat build temporary context",
+											   ALLOCSET_DEFAULT_SIZES);
+}
+
+/*
+ * Assignment sorts (list, tid, vector) tuples by list; the leader's and the
+ * workers' sorts must agree on the descriptor and the key
+ */
+static void
+BeginListSort(BuildState *buildstate, Relation index, int workMem, SortCoordinate coordinate)
+{
+	TupleDesc	sortdesc = CreateTemplateTupleDesc(3);
+	AttrNumber	attNums[] = {1};
+	Oid			sortOperators[] = {Int4LessOperator};
+	Oid			sortCollations[] = {InvalidOid};
+	bool		nullsFirstFlags[] = {false};
+
+	TupleDescInitEntry(sortdesc, (AttrNumber) 1, "list", INT4OID, -1, 0);
+	TupleDescInitEntry(sortdesc, (AttrNumber) 2, "tid", TIDOID, -1, 0);
+	TupleDescInitEntry(sortdesc, (AttrNumber) 3, "vector", TupleDescAttr(RelationGetDescr(index), 0)->atttypid,
+					   -1, 0);
+	buildstate->sortdesc = sortdesc;
+	buildstate->slot = MakeSingleTupleTableSlot(sortdesc, &TTSOpsVirtual);
+	buildstate->sortstate = tuplesort_begin_heap(sortdesc, 1, attNums, sortOperators, sortCollations,
+												 nullsFirstFlags, workMem, coordinate, TUPLESORT_NONE);
+}
+
+static void
+EndListSort(BuildState *buildstate)
+{
+	tuplesort_end(buildstate->sortstate);
+	ExecDropSingleTupleTableSlot(buildstate->slot);
+}
+
+static void
+AssignCallback(Relation index, ItemPointer tid, Datum *values, bool *isnull, bool tupleIsAlive, void *state)
+{
+	BuildState *buildstate = (BuildState *) state;
+	TupleTableSlot *slot = buildstate->slot;
+	MemoryContext oldCtx;
+	Vector	   *vec;
+
+	if (isnull[0])
+		return;
+
+	oldCtx = MemoryContextSwitchTo(buildstate->tmpCtx);
+	vec = PrepareVector(values[0], buildstate->normalize);
+	if (vec != NULL)
+	{
+		ExecClearTuple(slot);
+		slot->tts_values[0] = Int32GetDatum(NearestCenter(buildstate->centers, buildstate->lists,
+														  buildstate->metric, buildstate->dimensions, vec->x));
+		slot->tts_values[1] = PointerGetDatum(tid);
+		slot->tts_values[2] = PointerGetDatum(vec);
+		memset(slot->tts_isnull, false, sizeof(bool) * 3);
+		ExecStoreVirtualTuple(slot);
+		tuplesort_puttupleslot(buildstate->sortstate, slot);
+	}
+	MemoryContextSwitchTo(oldCtx);
+	MemoryContextReset(buildstate->tmpCtx);
+}
+
+/*
+ * Write the sorted tuples list by list: each list fills its first entry page
+ * and chains further pages at the end of the relation. The directory then
+ * records where each list ends.
+ */
+static void
+WriteLists(Relation index, BuildState *buildstate)
+{
+	TupleDesc	tupdesc = RelationGetDescr(index);
+	TupleTableSlot *slot = MakeSingleTupleTableSlot(buildstate->sortdesc, &TTSOpsMinimalTuple);
+	bool		hasTuple = tuplesort_gettupleslot(buildstate->sortstate, true, false, slot, NULL);
+
+	for (int i = 0; i < buildstate->lists; i++)
+	{
+		ListInfo   *list = &buildstate->listInfo[i];
+		Buffer		buf = ReadBuffer(index, list->startPage);
+		Page		page;
+
+		LockBuffer(buf, BUFFER_LOCK_EXCLUSIVE);
+		page = BufferGetPage(buf);
+
+		while (hasTuple)
+		{
+			bool		isnull;
+			Datum		value;
+			IndexTuple	itup;
+			Size		itemsz;
+
+			if (DatumGetInt32(slot_getattr(slot, 1, &isnull)) != i)
+				break;
+
+			CHECK_FOR_INTERRUPTS();
+
+			value = slot_getattr(slot, 3, &isnull);
+			itup = index_form_tuple(tupdesc, &value, &isnull);
+			itup->t_tid = *((ItemPointer) DatumGetPointer(slot_getattr(slot, 2, &isnull)));
+			itemsz = MAXALIGN(IndexTupleSize(itup));
+
+			if (PageGetFreeSpace(page) < itemsz)
+			{
+				Buffer		newbuf;
+				Page		newpage = StartNewPage(index, MAIN_FORKNUM, &newbuf);
+
+				IvfflatPageGetOpaque(page)->nextblkno = BufferGetBlockNumber(newbuf);
+				FinishPage(buf);
+				page = newpage;
+				buf = newbuf;
+			}
+			if (PageAddItem(page, (Item) itup, itemsz, InvalidOffsetNumber, false, false) == InvalidOffsetNumber)
+				elog(ERROR, "failed to add index item to \"%s\"", RelationGetRelationName(index));
+			pfree(itup);
+			buildstate->indtuples += 1;
+
+			hasTuple = tuplesort_gettupleslot(buildstate->sortstate, true, false, slot, NULL);
+		}
+
+		list->insertPage = BufferGetBlockNumber(buf);
+		FinishPage(buf);
+	}
+	ExecDropSingleTupleTableSlot(slot);
+
+	for (int i = 0; i < buildstate->lists; i++)
+	{
+		ListInfo   *list = &buildstate->listInfo[i];
+		Buffer		buf;
+		Page		page;
+		IvfflatList item;
+
+		if (list->insertPage == list->startPage)
+			continue;
+
+		buf = ReadBuffer(index, ItemPointerGetBlockNumber(&list->dirTid));
+		LockBuffer(buf, BUFFER_LOCK_EXCLUSIVE);
+		page = BufferGetPage(buf);
+		item = (IvfflatList) PageGetItem(page, PageGetItemId(page, ItemPointerGetOffsetNumber(&list->dirTid)));
+		item->insertPage = list->insertPage;
+		FinishPage(buf);
+	}
+}
+
+/*
+ * Scan a participant's share of the heap into its part of the shared sort
+ */
+static void
+ParallelScanAndSort(Relation heap, Relation index, IvfflatShared *shared, Sharedsort *sharedsort,
+					float *centers, int sortmem, bool progress)
+{
+	SortCoordinate coordinate = palloc0(sizeof(SortCoordinateData));
+	IndexInfo  *indexInfo = BuildIndexInfo(index);
+	BuildState	buildstate;
+	TableScanDesc scan;
+	double		reltuples;
+
+	coordinate->isWorker = true;
+	coordinate->nParticipants = -1;
+	coordinate->sharedsort = sharedsort;
+
+	InitBuildState(&buildstate, index);
+	buildstate.centers = centers;
+	BeginListSort(&buildstate, index, sortmem, coordinate);
+
+	indexInfo->ii_Concurrent = shared->isconcurrent;
+	scan = table_beginscan_parallel(heap, ParallelTableScanFromIvfflatShared(shared));
+	reltuples = table_index_build_scan(heap, index, indexInfo, true, progress, AssignCallback, &buildstate, scan);
+	tuplesort_performsort(buildstate.sortstate);
+
+	SpinLockAcquire(&shared->mutex);
+	shared->nparticipantsdone++;
+	shared->reltuples += reltuples;
+	SpinLockRelease(&shared->mutex);
+	ConditionVariableSignal(&shared->workersdonecv);
+
+	EndListSort(&buildstate);
+	MemoryContextDelete(buildstate.tmpCtx);
+}
+
+/*
+ * Entry point of a parallel build worker
+ */
+void
+IvfflatParallelBuildMain(dsm_segment *seg, shm_toc *toc)
+{
+	IvfflatShared *shared = shm_toc_lookup(toc, PARALLEL_KEY_IVFFLAT_SHARED, false);
+	Sharedsort *sharedsort = shm_toc_lookup(toc, PARALLEL_KEY_TUPLESORT, false);
+	float	   *centers = shm_toc_lookup(toc, PARALLEL_KEY_CENTERS, false);
+	LOCKMODE	heapLockmode = shared->isconcurrent ? ShareUpdateExclusiveLock : ShareLock;
+	LOCKMODE	indexLockmode = shared->isconcurrent ? RowExclusiveLock : AccessExclusiveLock;
+	Relation	heap;
+	Relation	index;
+
+	debug_query_string = shm_toc_lookup(toc, PARALLEL_KEY_QUERY_TEXT, true);
+	pgstat_report_activity(STATE_RUNNING, debug_query_string);
+
+	/* The same lock modes the leader holds, so the group's locks do not conflict */
+	heap = table_open(shared->heaprelid, heapLockmode);
+	index = index_open(shared->indexrelid, indexLockmode);
+
+	tuplesort_attach_shared(sharedsort, seg);
+	ParallelScanAndSort(heap, index, shared, sharedsort, centers,
+						maintenance_work_mem / shared->scantuplesortstates, false);
+
+	index_close(index, indexLockmode);
+	table_close(heap, heapLockmode);
+}
+
+static void
+EndParallel(IvfflatLeader *leader)
+{
+	WaitForParallelWorkersToFinish(leader->pcxt);
+	if (IsMVCCSnapshot(leader->snapshot))
+		UnregisterSnapshot(leader->snapshot);
+	DestroyParallelContext(leader->pcxt);
+	ExitParallelMode();
+}
+
+/*
+ * Launch the assignment workers, and take part as one. Leaves
+ * buildstate->leader unset when no worker could be started.
+ */
+static void
+BeginParallel(BuildState *buildstate, Relation heap, Relation index, bool isconcurrent, int request)
+{
+	ParallelContext *pcxt;
+	IvfflatLeader *leader;
+	IvfflatShared *shared;
+	Sharedsort *sharedsort;
+	float	   *centers;
+	Snapshot	snapshot;
+	Size		estshared;
+	Size		estsort;
+	Size		estcenters = sizeof(float) * buildstate->lists * buildstate->dimensions;
+	int			scantuplesortstates = request + 1;
+	Size		querylen = debug_query_string ? strlen(debug_query_string) : 0;
+
+	EnterParallelMode();
+	pcxt = CreateParallelContext("pgfluxai", "IvfflatParallelBuildMain", request);
+
+	/* Like nbtree: a concurrent build scans with an MVCC snapshot, a plain one sees every tuple */
+	snapshot = isconcurrent ? RegisterSnapshot(GetTransactionSnapshot()) : SnapshotAny;
+
+	estshared = add_size(BUFFERALIGN(sizeof(IvfflatShared)), table_parallelscan_estimate(heap, snapshot));
+	estsort = tuplesort_estimate_shared(scantuplesortstates);
+	shm_toc_estimate_chunk(&pcxt->estimator, estshared);
+	shm_toc_estimate_chunk(&pcxt->estimator, estsort);
+	shm_toc_estimate_chunk(&pcxt->estimator, estcenters);
+	shm_toc_estimate_keys(&pcxt->estimator, 3);
+	if (debug_query_string)
+	{
+		shm_toc_estimate_chunk(&pcxt->estimator, querylen + 1);
+		shm_toc_estimate_keys(&pcxt->estimator, 1);
+	}
+
+	InitializeParallelDSM(pcxt);
+	if (pcxt->seg == NULL)
+	{
+		/* No dynamic shared memory to be had: build serially */
+		if (IsMVCCSnapshot(snapshot))
+			UnregisterSnapshot(snapshot);
+		DestroyParallelContext(pcxt);
+		ExitParallelMode();
+		return;
+	}
+
+	shared = (IvfflatShared *) shm_toc_allocate(pcxt->toc, estshared);
+	shared->heaprelid = RelationGetRelid(heap);
+	shared->indexrelid = RelationGetRelid(index);
+	shared->isconcurrent = isconcurrent;
+	shared->scantuplesortstates = scantuplesortstates;
+	ConditionVariableInit(&shared->workersdonecv);
+	SpinLockInit(&shared->mutex);
+	shared->nparticipantsdone = 0;
+	shared->reltuples = 0;
+	table_parallelscan_initialize(heap, ParallelTableScanFromIvfflatShared(shared), snapshot);
+
+	sharedsort = (Sharedsort *) shm_toc_allocate(pcxt->toc, estsort);
+	tuplesort_initialize_shared(sharedsort, scantuplesortstates, pcxt->seg);
+
+	centers = (float *) shm_toc_allocate(pcxt->toc, estcenters);
+	memcpy(centers, buildstate->centers, estcenters);
+
+	shm_toc_insert(pcxt->toc, PARALLEL_KEY_IVFFLAT_SHARED, shared);
+	shm_toc_insert(pcxt->toc, PARALLEL_KEY_TUPLESORT, sharedsort);
+	shm_toc_insert(pcxt->toc, PARALLEL_KEY_CENTERS, centers);
+	if (debug_query_string)
+	{
+		char	   *sharedquery = (char *) shm_toc_allocate(pcxt->toc, querylen + 1);
+
+		memcpy(sharedquery, debug_query_string, querylen + 1);
+		shm_toc_insert(pcxt->toc, PARALLEL_KEY_QUERY_TEXT, sharedquery);
+	}
+
+	LaunchParallelWorkers(pcxt);
+
+	leader = (IvfflatLeader *) palloc0(sizeof(IvfflatLeader));
+	leader->pcxt = pcxt;
+	leader->nparticipanttuplesorts = pcxt->nworkers_launched + 1;
+	leader->shared = shared;
+	leader->sharedsort = sharedsort;
+	leader->snapshot = snapshot;
+
+	if (pcxt->nworkers_launched == 0)
+	{
+		EndParallel(leader);
+		return;
+	}
+
+	ereport(DEBUG1, (errmsg("ivfflat build using %d parallel workers", pcxt->nworkers_launched)));
+	buildstate->leader = leader;
+
+	ParallelScanAndSort(heap, index, shared, sharedsort, centers,
+						maintenance_work_mem / leader->nparticipanttuplesorts, true);
+	WaitForParallelWorkersToAttach(pcxt);
+}
+
+/*
+ * Wait until every participant has sorted its share; returns the heap tuples
+ * they scanned
+ */
+static double
+WaitForParticipants(IvfflatLeader *leader)
+{
+	IvfflatShared *shared = leader->shared;
+	double		reltuples;
+
+	for (;;)
+	{
+		SpinLockAcquire(&shared->mutex);
+		if (shared->nparticipantsdone == leader->nparticipanttuplesorts)
+		{
+			reltuples = shared->reltuples;
+			SpinLockRelease(&shared->mutex);
+			break;
+		}
+		SpinLockRelease(&shared->mutex);
+		ConditionVariableSleep(&shared->workersdonecv, WAIT_EVENT_PARALLEL_CREATE_INDEX_SCAN);
+	}
+	ConditionVariableCancelSleep();
+	return reltuples;
+}
+
+static int
+ParallelWorkers(Relation heap, Relation index, IndexInfo *indexInfo)
+{
+#if PG_VERSION_NUM >= 170000
+	/* The server plans workers for access methods with amcanbuildparallel */
+	return indexInfo->ii_ParallelWorkers;
+#else
+	/* Before PostgreSQL 17 it only does so for btree; ask the planner the same way */
+	return plan_create_index_workers(RelationGetRelid(heap), RelationGetRelid(index));
+#endif
+}
+
+IndexBuildResult *
+ivfflatbuild(Relation heap, Relation index, IndexInfo *indexInfo)
+{
+	IndexBuildResult *result;
+	BuildState	buildstate;
+	Size		budget;
+	int			workers;
+
+	if (RelationGetNumberOfBlocks(index) != 0)
+		elog(ERROR, "index \"%s\" already contains data", RelationGetRelationName(index));
+
+	InitBuildState(&buildstate, index);
+
+	/* Train on a fixed-seed sample so rebuilding the same table gives the same lists */
+	pg_prng_seed(&buildstate.prng, 42);
+	budget = (Size) maintenance_work_mem * 1024 / (sizeof(float) * buildstate.dimensions);
+	buildstate.maxSamples = Max(Min((Size) buildstate.lists * IVFFLAT_SAMPLES_PER_LIST, budget), 1);
+	buildstate.samples = palloc_extended(sizeof(float) * buildstate.maxSamples * buildstate.dimensions,
+										 MCXT_ALLOC_HUGE);
+	table_index_build_scan(heap, index, indexInfo, true, true, SampleCallback, &buildstate, NULL);
+
+	ComputeCenters(&buildstate);
+	pfree(buildstate.samples);
+
+	buildstate.listInfo = palloc(sizeof(ListInfo) * buildstate.lists);
+	CreatePages(index, MAIN_FORKNUM, buildstate.dimensions, buildstate.lists, buildstate.centers,
+				buildstate.listInfo);
+
+	workers = ParallelWorkers(heap, index, indexInfo);
+	if (workers > 0)
+		BeginParallel(&buildstate, heap, index, indexInfo->ii_Concurrent, workers);
+
+	if (buildstate.leader)
+	{
+		SortCoordinate coordinate = palloc0(sizeof(SortCoordinateData));
+
+		buildstate.reltuples = WaitForParticipants(buildstate.leader);
+		coordinate->isWorker = false;
+		coordinate->nParticipants = buildstate.leader->nparticipanttuplesorts;
+		coordinate->sharedsort = buildstate.leader->sharedsort;
+		BeginListSort(&buildstate, index, maintenance_work_mem, coordinate);
+	}
+	else
+	{
+		BeginListSort(&buildstate, index, maintenance_work_mem, NULL);
+		buildstate.reltuples = table_index_build_scan(heap, index, indexInfo, true, true, AssignCallback,
+													  &buildstate, NULL);
+	}
+	tuplesort_performsort(buildstate.sortstate);
+	WriteLists(index, &buildstate);
+	EndListSort(&buildstate);
+	if (buildstate.leader)
+		EndParallel(buildstate.leader);
+
+	/* One full-page image per page instead of a record per tuple */
+	if (RelationNeedsWAL(index))
+		log_newpage_range(index, MAIN_FORKNUM, 0, RelationGetNumberOfBlocks(index), true);
+
+	MemoryContextDelete(buildstate.tmpCtx);
+
+	result = (IndexBuildResult *) palloc(sizeof(IndexBuildResult));
+	result->heap_tuples = buildstate.reltuples;
+	result->index_tuples = buildstate.indtuples;
+	return result;
+}
+
+/*
+ * Build the init fork of an unlogged index: empty lists around zero centres
+ */
+void
+ivfflatbuildempty(Relation index)
+{
+	int			dimensions = GetDimensions(index);
+	int			lists = IvfflatGetLists(index);
+	float	   *centers = palloc_extended(sizeof(float) * lists * dimensions, MCXT_ALLOC_HUGE | MCXT_ALLOC_ZERO);
+	ListInfo   *listInfo = palloc(sizeof(ListInfo) * lists);
+
+	CreatePages(index, INIT_FORKNUM, dimensions, lists, centers, listInfo);
+
+	/* The pages were written without WAL, but the init fork must survive a crash */
+	log_newpage_range(index, INIT_FORKNUM, 0, RelationGetNumberOfBlocksInFork(index, INIT_FORKNUM), true);
+}
+
+bool
+ivfflatinsert(Relation index, Datum *values, bool *isnull, ItemPointer heap_tid,
+			  Relation heap, IndexUniqueCheck checkUnique, bool indexUnchanged,
+			  IndexInfo *indexInfo)
+{
+	MemoryContext tmpCtx;
+	MemoryContext oldCtx;
+	IvfflatMetric metric;
+	bool		normalize;
+	Vector	   *vec;
+
+	/* NULL has no distance to anything, so it is never returned and not indexed */
+	if (isnull[0])
+		return false;
+
+	tmpCtx = AllocSetContextCreate(CurrentMemoryContext, "ivfflat insert temporary context", ALLOCSET_DEFAULT_SIZES);
+	oldCtx = MemoryContextSwitchTo(tmpCtx);
+
+	metric = IvfflatGetMetric(index, &normalize);
+	vec = PrepareVector(values[0], normalize);
+	if (vec != NULL)
+	{
+		int			lists;
+		int			dimensions;
+		ListInfo   *listInfo;
+		ListInfo   *list;
+		Datum		value = PointerGetDatum(vec);
+		bool		notnull = false;
+		IndexTuple	itup;
+		BlockNumber insertPage;
+
+		IvfflatGetMetaPageInfo(index, &lists, &dimensions);
+		listInfo = ReadLists(index, lists, dimensions);
+		list = &listInfo[NearestCenter(listInfo[0].center, lists, metric, dimensions, vec->x)];
+
+		itup = index_form_tuple(RelationGetDescr(index), &value, &notnull);
+		itup->t_tid = *heap_tid;
+		insertPage = AppendTuple(index, itup, list->insertPage);
+		if (insertPage != list->insertPage)
+			UpdateInsertPage(index, &list->dirTid, list->insertPage, insertPage);
+	}
+
+	MemoryContextSwitchTo(oldCtx);
+	MemoryContextDelete(tmpCtx);
+	return false;
+}
+
+IndexBulkDeleteResult *
+ivfflatbulkdelete(IndexVacuumInfo *info, IndexBulkDeleteResult *stats,
+				  IndexBulkDeleteCallback callback, void *callback_state)
+{
+	Relation	index = info->index;
+	int			lists;
+	int			dimensions;
+	ListInfo   *listInfo;
+
+	if (stats == NULL)
+		stats = (IndexBulkDeleteResult *) palloc0(sizeof(IndexBulkDeleteResult));
+
+	IvfflatGetMetaPageInfo(index, &lists, &dimensions);
+	listInfo = ReadLists(index, lists, dimensions);
+
+	for (int i = 0; i < lists; i++)
+	{
+		BlockNumber blkno = listInfo[i].startPage;
+
+		while (BlockNumberIsValid(blkno))
+		{
+			Buffer		buf;
+			Page		page;
+			OffsetNumber deletable[MaxOffsetNumber];
+			int			ndeletable = 0;
+			OffsetNumber maxoff;
+
+			vacuum_delay_point();
+
+			buf = ReadBufferExtended(index, MAIN_FORKNUM, blkno, RBM_NORMAL, info->strategy);
+			LockBufferForCleanup(buf);
+			page = BufferGetPage(buf);
+			maxoff = PageGetMaxOffsetNumber(page);
+			for (OffsetNumber off = FirstOffsetNumber; off <= maxoff; off = OffsetNumberNext(off))
+			{
+				IndexTuple	itup = (IndexTuple) PageGetItem(page, PageGetItemId(page, off));
+
+				if (callback(&itup->t_tid, callback_state))
+				{
+					deletable[ndeletable++] = off;
+					stats->tuples_removed++;
+				}
+				else
+					stats->num_index_tuples++;
+			}
+
+			blkno = IvfflatPageGetOpaque(page)->nextblkno;
+			if (ndeletable > 0)
+			{
+				GenericXLogState *state = GenericXLogStart(index);
+
+				page = GenericXLogRegisterBuffer(state, buf, 0);
+				PageIndexMultiDelete(page, deletable, ndeletable);
+				GenericXLogFinish(state);
+			}
+			UnlockReleaseBuffer(buf);
+		}
+	}
+	return stats;
+}
+
+IndexBulkDeleteResult *
+ivfflatvacuumcleanup(IndexVacuumInfo *info, IndexBulkDeleteResult *stats)
+{
+	if (info->analyze_only)
+		return stats;
+
+	/* Without a bulk delete pass there is no fresh tuple count to report */
+	if (stats == NULL)
+		return NULL;
+
+	stats->num_pages = RelationGetNumberOfBlocks(info->index);
+	return stats;
+}
+
+IndexScanDesc
+ivfflatbeginscan(Relation index, int nkeys, int norderbys)
+{
+	IndexScanDesc scan = RelationGetIndexScan(index, nkeys, norderbys);
+	IvfflatScanOpaque so = (IvfflatScanOpaque) palloc0(sizeof(IvfflatScanOpaqueData));
+
+	IvfflatGetMetaPageInfo(index, &so->lists, &so->dimensions);
+	so->metric = IvfflatGetMetric(index, &so->normalize);
+	so->first = true;
+	so->scanCtx = AllocSetContextCreate(CurrentMemoryContext, "ivfflat scan context", ALLOCSET_DEFAULT_SIZES);
+	scan->opaque = so;
+	return scan;
+}
+
+void
+ivfflatrescan(IndexScanDesc scan, ScanKey keys, int nkeys, ScanKey orderbys, int norderbys)
+{
+	IvfflatScanOpaque so = (IvfflatScanOpaque) scan->opaque;
+
+	if (keys && scan->numberOfKeys > 0)
+		memmove(scan->keyData, keys, scan->numberOfKeys * sizeof(ScanKeyData));
+	if (orderbys && scan->numberOfOrderBys > 0)
+		memmove(scan->orderByData, orderbys, scan->numberOfOrderBys * sizeof(ScanKeyData));
+
+	MemoryContextReset(so->scanCtx);
+	so->items = NULL;
+	so->nitems = 0;
+	so->pos = 0;
+	so->first = true;
+}
+
+static int
+CompareListDistances(const void *a, const void *b)
+{
+	float		da = ((const ListDistance *) a)->distance;
+	float		db = ((const ListDistance *) b)->distance;
+
+	return (da > db) - (da < db);
+}
+
+static int
+CompareScanItems(const void *a, const void *b)
+{
+	float		da = ((const ScanItem *) a)->distance;
+	float		db = ((const ScanItem *) b)->distance;
+
+	return (da > db) - (da < db);
+}
+
+/*
+ * Read every tuple of the probed lists and sort them by distance to the query
+ */
+static void
+LoadItems(IndexScanDesc scan)
+{
+	IvfflatScanOpaque so = (IvfflatScanOpaque) scan->opaque;
+	Relation	index = scan->indexRelation;
+	TupleDesc	tupdesc = RelationGetDescr(index);
+	ScanKey		orderby = &scan->orderByData[0];
+	int			probes = Min(ivfflat_probes, so->lists);
+	int			capacity = 1024;
+	ListInfo   *listInfo;
+	ListDistance *nearest;
+	Vector	   *query = NULL;
+
+	/* ORDER BY col <-> NULL has no meaningful order; scan around the origin */
+	if (!(orderby->sk_flags & SK_ISNULL))
+		query = PrepareVector(orderby->sk_argument, so->normalize);
+	if (query == NULL)
+		query = InitVector(so->dimensions);
+	if (query->dim != so->dimensions)
+		ereport(ERROR,
+				(errcode(ERRCODE_DATA_EXCEPTION),
+				 errmsg("different vector dimensions %d and %d", so->dimensions, query->dim)));
+
+	listInfo = ReadLists(index, so->lists, so->dimensions);
+	nearest = palloc(sizeof(ListDistance) * so->lists);
+	for (int i = 0; i < so->lists; i++)
+	{
+		nearest[i].list = i;
+		nearest[i].distance = IvfflatDistance(so->metric, so->dimensions, listInfo[i].center, query->x);
+	}
+	qsort(nearest, so->lists, sizeof(ListDistance), CompareListDistances);
+
+	so->items = palloc(sizeof(ScanItem) * capacity);
+	for (int p = 0; p < probes; p++)
+	{
+		BlockNumber blkno = listInfo[nearest[p].list].startPage;
+
+		while (BlockNumberIsValid(blkno))
+		{
+			Buffer		buf = ReadBuffer(index, blkno);
+			Page		page;
+			OffsetNumber maxoff;
+
+			LockBuffer(buf, BUFFER_LOCK_SHARE);
+			page = BufferGetPage(buf);
+			maxoff = PageGetMaxOffsetNumber(page);
+			for (OffsetNumber off = FirstOffsetNumber; off <= maxoff; off = OffsetNumberNext(off))
+			{
+				IndexTuple	itup = (IndexTuple) PageGetItem(page, PageGetItemId(page, off));
+				bool		isnull;
+				Datum		value = index_getattr(itup, 1, tupdesc, &isnull);
+				Vector	   *vec = DatumGetVector(value);
+
+				if (so->nitems == capacity)
+				{
+					capacity *= 2;
+					so->items = repalloc_huge(so->items, sizeof(ScanItem) * capacity);
+				}
+				so->items[so->nitems].tid = itup->t_tid;
+				so->items[so->nitems].distance = IvfflatDistance(so->metric, so->dimensions, query->x, vec->x);
+				so->nitems++;
+
+				/* Short-header datums were copied to be aligned */
+				if ((Pointer) vec != DatumGetPointer(value))
+					pfree(vec);
+			}
+			blkno = IvfflatPageGetOpaque(page)->nextblkno;
+			UnlockReleaseBuffer(buf);
+		}
+	}
+
+	qsort(so->items, so->nitems, sizeof(ScanItem), CompareScanItems);
+}
+
+bool
+ivfflatgettuple(IndexScanDesc scan, ScanDirection dir)
+{
+	IvfflatScanOpaque so = (IvfflatScanOpaque) scan->opaque;
+
+	/* The index only serves ORDER BY distance, which always scans forward */
+	Assert(ScanDirectionIsForward(dir));
+
+	if (so->first)
+	{
+		MemoryContext oldCtx;
+
+		if (scan->orderByData == NULL)
+			elog(ERROR, "cannot scan ivfflat index without order");
+
+		/* No buffer pins are held between calls, so heap TIDs are only stable under MVCC */
+		if (!IsMVCCSnapshot(scan->xs_snapshot))
+			elog(ERROR, "non-MVCC snapshots are not supported with ivfflat");
+
+		oldCtx = MemoryContextSwitchTo(so->scanCtx);
+		LoadItems(scan);
+		MemoryContextSwitchTo(oldCtx);
+		so->first = false;
+	}
+
+	if (so->pos < so->nitems)
+	{
+		scan->xs_heaptid = so->items[so->pos++].tid;
+		scan->xs_recheck = false;
+		scan->xs_recheckorderby = false;
+		return true;
+	}
+	return false;
+}
+
+void
+ivfflatendscan(IndexScanDesc scan)
+{
+	IvfflatScanOpaque so = (IvfflatScanOpaque) scan->opaque;
+
+	MemoryContextDelete(so->scanCtx);
+	pfree(so);
+	scan->opaque = NULL;
+}
+
+/*
+ * A scan reads probes/lists of the index, all of it before the first row
+ */
+static void
+ivfflatcostestimate(PlannerInfo *root, IndexPath *path, double loop_count,
+					Cost *indexStartupCost, Cost *indexTotalCost,
+					Selectivity *indexSelectivity, double *indexCorrelation,
+					double *indexPages)
+{
+	GenericCosts costs;
+	Relation	index;
+	int			lists;
+	int			dimensions;
+	double		ratio;
+
+	/* Without ORDER BY distance the index is useless */
+	if (path->indexorderbys == NIL)
+	{
+		*indexStartupCost = DBL_MAX;
+		*indexTotalCost = DBL_MAX;
+		*indexSelectivity = 0;
+		*indexCorrelation = 0;
+		*indexPages = 0;
+		return;
+	}
+
+	MemSet(&costs, 0, sizeof(costs));
+	genericcostestimate(root, path, loop_count, &costs);
+
+	index = index_open(path->indexinfo->indexoid, NoLock);
+	IvfflatGetMetaPageInfo(index, &lists, &dimensions);
+	index_close(index, NoLock);
+
+	ratio = Min((double) ivfflat_probes / lists, 1.0);
+	*indexStartupCost = costs.indexTotalCost * ratio;
+	*indexTotalCost = *indexStartupCost;
+	*indexSelectivity = costs.indexSelectivity;
+	*indexCorrelation = costs.indexCorrelation;
+	*indexPages = costs.numIndexPages * ratio;
+}
+
+static bytea *
+ivfflatoptions(Datum reloptions, bool validate)
+{
+	static const relopt_parse_elt tab[] = {
+		{"lists", RELOPT_TYPE_INT, offsetof(IvfflatOptions, lists)},
+	};
+
+	return (bytea *) build_reloptions(reloptions, validate, ivfflat_relopt_kind,
+									  sizeof(IvfflatOptions), tab, lengthof(tab));
+}
+
+static bool
+ivfflatvalidate(Oid opclassoid)
+{
+	return true;
+}
+
+PG_FUNCTION_INFO_V1(ivfflathandler);
+Datum
+ivfflathandler(PG_FUNCTION_ARGS)
+{
+	IndexAmRoutine *amroutine = makeNode(IndexAmRoutine);
+
+	amroutine->amstrategies = 0;
+	amroutine->amsupport = 2;
+	amroutine->amoptsprocnum = 0;
+	amroutine->amcanorder = false;
+	amroutine->amcanorderbyop = true;
+	amroutine->amcanbackward = false;
+	amroutine->amcanunique = false;
+	amroutine->amcanmulticol = false;
+	amroutine->amoptionalkey = true;
+	amroutine->amsearcharray = false;
+	amroutine->amsearchnulls = false;
+	amroutine->amstorage = false;
+	amroutine->amclusterable = false;
+	amroutine->ampredlocks = false;
+	amroutine->amcanparallel = false;
+#if PG_VERSION_NUM >= 170000
+	amroutine->amcanbuildparallel = true;
+#endif
+	amroutine->amcaninclude = false;
+	amroutine->amusemaintenanceworkmem = false;
+	amroutine->amsummarizing = false;
+	amroutine->amparallelvacuumoptions = VACUUM_OPTION_PARALLEL_BULKDEL;
+	amroutine->amkeytype = InvalidOid;
+
+	amroutine->ambuild = ivfflatbuild;
+	amroutine->ambuildempty = ivfflatbuildempty;
+	amroutine->aminsert = ivfflatinsert;
+#if PG_VERSION_NUM >= 170000
+	amroutine->aminsertcleanup = NULL;
+#endif
+	amroutine->ambulkdelete = ivfflatbulkdelete;
+	amroutine->amvacuumcleanup = ivfflatvacuumcleanup;
+	amroutine->amcanreturn = NULL;
+	amroutine->amcostestimate = ivfflatcostestimate;
+	amroutine->amoptions = ivfflatoptions;
+	amroutine->amproperty = NULL;
+	amroutine->ambuildphasename = NULL;
+	amroutine->amvalidate = ivfflatvalidate;
+	amroutine->amadjustmembers = NULL;
+	amroutine->ambeginscan = ivfflatbeginscan;
+	amroutine->amrescan = ivfflatrescan;
+	amroutine->amgettuple = ivfflatgettuple;
+	amroutine->amgetbitmap = NULL;
+	amroutine->amendscan = ivfflatendscan;
+	amroutine->ammarkpos = NULL;
+	amroutine->amrestrpos = NULL;
+	amroutine->amestimateparallelscan = NULL;
+	amroutine->aminitparallelscan = NULL;
+	amroutine->amparallelrescan = NULL;
+
+	PG_RETURN_POINTER(amroutine);
+}
@@ -0,0 +1,518 @@
+/*
+ * pgfluxai: a fixed-dimension float4 vector type, distance operators and
+ * the ivfflat approximate nearest-neighbour index (see ivfflat.c).
+ *
+ * The distance kernels are plain loops over float arrays. The Makefile
+ * compiles them with -ftree-vectorize and -fassociative-math, which lets
+ * the compiler split each sum into SIMD lanes for whatever instruction
+ * set the server was built for.
+ */
+#include "postgres.h"
+
+#include <math.h>
+
+#include "catalog/pg_type.h"
+#include "common/shortest_dec.h"
+#include "fmgr.h"
+#include "lib/stringinfo.h"
+#include "libpq/pqformat.h"
+#include "parser/scansup.h"
+#include "utils/array.h"
+#include "utils/builtins.h"
+#include "utils/float.h"
+#include "utils/guc.h"
+#include "utils/lsyscache.h"
+#include "utils/numeric.h"
+
+#include "pgfluxai.h"
+
+PG_MODULE_MAGIC;
+
+void		_PG_init(void);
+
+void
+_PG_init(void)
+{
+	IvfflatInit();
+}
+
+/*
+ * Allocate a zeroed vector
+ */
+Vector *
+InitVector(int dim)
+{
+	int			size = VECTOR_SIZE(dim);
+	Vector	   *result = (Vector *) palloc0(size);
+
+	SET_VARSIZE(result, size);
+	result->dim = dim;
+	return result;
+}
+
+static void
+CheckDim(int dim)
+{
+	if (dim < 1)
+		ereport(ERROR,
+				(errcode(ERRCODE_DATA_EXCEPTION),
+				 errmsg("vector must have at least 1 dimension")));
+	if (dim > VECTOR_MAX_DIM)
+		ereport(ERROR,
+				(errcode(ERRCODE_PROGRAM_LIMIT_EXCEEDED),
+				 errmsg("vector cannot have more than %d dimensions", VECTOR_MAX_DIM)));
+}
+
+static void
+CheckExpectedDim(int32 typmod, int dim)
+{
+	if (typmod != -1 && typmod != dim)
+		ereport(ERROR,
+				(errcode(ERRCODE_DATA_EXCEPTION),
+				 errmsg("expected %d dimensions, not %d", typmod, dim)));
+}
+
+static void
+CheckSameDim(const Vector *a, const Vector *b)
+{
+	if (a->dim != b->dim)
+		ereport(ERROR,
+				(errcode(ERRCODE_DATA_EXCEPTION),
+				 errmsg("different vector dimensions %d and %d", a->dim, b->dim)));
+}
+
+static void
+CheckElement(float value)
+{
+	if (isnan(value))
+		ereport(ERROR,
+				(errcode(ERRCODE_DATA_EXCEPTION),
+				 errmsg("NaN not allowed in vector")));
+	if (isinf(value))
+		ereport(ERROR,
+				(errcode(ERRCODE_DATA_EXCEPTION),
+				 errmsg("infinite value not allowed in vector")));
+}
+
+static void
+InvalidSyntax(const char *lit, const char *detail)
+{
+	ereport(ERROR,
+			(errcode(ERRCODE_INVALID_TEXT_REPRESENTATION),
+			 errmsg("invalid input syntax for type vector: \"%s\"", lit),
+			 errdetail("%s", detail)));
+}
+
+/*
+ * Distance kernels
+ */
+float
+VectorL2SquaredDistance(int dim, const float *a, const float *b)
+{
+	float		distance = 0.0;
+
+	for (int i = 0; i < dim; i++)
+	{
+		float		diff = a[i] - b[i];
+
+		distance += diff * diff;
+	}
+	return distance;
+}
+
+float
+VectorInnerProduct(int dim, const float *a, const float *b)
+{
+	float		distance = 0.0;
+
+	for (int i = 0; i < dim; i++)
+		distance += a[i] * b[i];
+	return distance;
+}
+
+double
+VectorCosineDistance(int dim, const float *a, const float *b)
+{
+	float		dot = 0.0;
+	float		norma = 0.0;
+	float		normb = 0.0;
+	double		similarity;
+
+	/* One pass computes all three sums; each still vectorizes on its own */
+	for (int i = 0; i < dim; i++)
+	{
+		dot += a[i] * b[i];
+		norma += a[i] * a[i];
+		normb += b[i] * b[i];
+	}
+
+	/* Undefined for zero vectors */
+	similarity = (double) dot / sqrt((double) norma * (double) normb);
+	if (isnan(similarity))
+		return get_float8_nan();
+
+	/* Rounding can push the similarity slightly outside [-1, 1] */
+	if (similarity > 1)
+		similarity = 1.0;
+	else if (similarity < -1)
+		similarity = -1.0;
+	return 1.0 - similarity;
+}
+
+double
+VectorNorm(int dim, const float *a)
+{
+	double		norm = 0.0;
+
+	for (int i = 0; i < dim; i++)
+		norm += (double) a[i] * (double) a[i];
+	return sqrt(norm);
+}
+
+/*
+ * Scale a vector to unit length in place. Returns false for the zero vector.
+ */
+bool
+VectorNormalize(int dim, float *a)
+{
+	double		norm = VectorNorm(dim, a);
+
+	if (norm == 0)
+		return false;
+	for (int i = 0; i < dim; i++)
+		a[i] = a[i] / norm;
+	return true;
+}
+
+/*
+ * Type I/O
+ */
+PG_FUNCTION_INFO_V1(vector_in);
+Datum
+vector_in(PG_FUNCTION_ARGS)
+{
+	char	   *lit = PG_GETARG_CSTRING(0);
+	int32		typmod = PG_GETARG_INT32(2);
+	float	   *x = palloc(sizeof(float) * VECTOR_MAX_DIM);
+	int			dim = 0;
+	char	   *pt = lit;
+	Vector	   *result;
+
+	while (scanner_isspace(*pt))
+		pt++;
+	if (*pt != '[')
+		InvalidSyntax(lit, "Vector contents must start with \"[\".");
+	pt++;
+	while (scanner_isspace(*pt))
+		pt++;
+	if (*pt == ']')
+		ereport(ERROR,
+				(errcode(ERRCODE_DATA_EXCEPTION),
+				 errmsg("vector must have at least 1 dimension")));
+
+	for (;;)
+	{
+		float		val;
+		char	   *end;
+
+		if (dim == VECTOR_MAX_DIM)
+			ereport(ERROR,
+					(errcode(ERRCODE_PROGRAM_LIMIT_EXCEEDED),
+					 errmsg("vector cannot have more than %d dimensions", VECTOR_MAX_DIM)));
+
+		while (scanner_isspace(*pt))
+			pt++;
+		if (*pt == '\0')
+			InvalidSyntax(lit, "Unexpected end of input.");
+
+		errno = 0;
+		val = strtof(pt, &end);
+		if (end == pt)
+			InvalidSyntax(lit, "Expected a number.");
+		if (errno == ERANGE && isinf(val))
+			ereport(ERROR,
+					(errcode(ERRCODE_NUMERIC_VALUE_OUT_OF_RANGE),
+					 errmsg("\"%s\" is out of range for type vector", pnstrdup(pt, end - pt))));
+		CheckElement(val);
+		x[dim++] = val;
+
+		pt = end;
+		while (scanner_isspace(*pt))
+			pt++;
+		if (*pt == ',')
+			pt++;
+		else if (*pt == ']')
+		{
+			pt++;
+			break;
+		}
+		else
+			InvalidSyntax(lit, "Expected \",\" or \"]\".");
+	}
+
+	while (scanner_isspace(*pt))
+		pt++;
+	if (*pt != '\0')
+		InvalidSyntax(lit, "Junk after closing right bracket.");
+
+	CheckExpectedDim(typmod, dim);
+	result = InitVector(dim);
+	memcpy(result->x, x, sizeof(float) * dim);
+	pfree(x);
+	PG_RETURN_VECTOR_P(result);
+}
+
+PG_FUNCTION_INFO_V1(vector_out);
+Datum
+vector_out(PG_FUNCTION_ARGS)
+{
+	Vector	   *vector = PG_GETARG_VECTOR_P(0);
+	StringInfoData buf;
+
+	initStringInfo(&buf);
+	enlargeStringInfo(&buf, vector->dim * (FLOAT_SHORTEST_DECIMAL_LEN + 1) + 2);
+	appendStringInfoChar(&buf, '[');
+	for (int i = 0; i < vector->dim; i++)
+	{
+		if (i > 0)
+			appendStringInfoChar(&buf, ',');
+		/* Shortest text that reads back as the same float */
+		buf.len += float_to_shortest_decimal_bufn(vector->x[i], buf.data + buf.len);
+	}
+	appendStringInfoChar(&buf, ']');
+
+	PG_FREE_IF_COPY(vector, 0);
+	PG_RETURN_CSTRING(buf.data);
+}
+
+PG_FUNCTION_INFO_V1(vector_typmod_in);
+Datum
+vector_typmod_in(PG_FUNCTION_ARGS)
+{
+	ArrayType  *ta = PG_GETARG_ARRAYTYPE_P(0);
+	int32	   *tl;
+	int			n;
+
+	tl = ArrayGetIntegerTypmods(ta, &n);
+	if (n != 1)
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("invalid type modifier")));
+	if (*tl < 1)
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("dimensions for type vector must be at least 1")));
+	if (*tl > VECTOR_MAX_DIM)
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("dimensions for type vector cannot exceed %d", VECTOR_MAX_DIM)));
+	PG_RETURN_INT32(*tl);
+}
+
+PG_FUNCTION_INFO_V1(vector_recv);
+Datum
+vector_recv(PG_FUNCTION_ARGS)
+{
+	StringInfo	buf = (StringInfo) PG_GETARG_POINTER(0);
+	int32		typmod = PG_GETARG_INT32(2);
+	int16		dim;
+	int16		unused;
+	Vector	   *result;
+
+	dim = pq_getmsgint(buf, sizeof(int16));
+	unused = pq_getmsgint(buf, sizeof(int16));
+	CheckDim(dim);
+	CheckExpectedDim(typmod, dim);
+	if (unused != 0)
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_BINARY_REPRESENTATION),
+				 errmsg("expected unused to be 0, not %d", unused)));
+
+	result = InitVector(dim);
+	for (int i = 0; i < dim; i++)
+	{
+		result->x[i] = pq_getmsgfloat4(buf);
+		CheckElement(result->x[i]);
+	}
+	PG_RETURN_VECTOR_P(result);
+}
+
+PG_FUNCTION_INFO_V1(vector_send);
+Datum
+vector_send(PG_FUNCTION_ARGS)
+{
+	Vector	   *vec = PG_GETARG_VECTOR_P(0);
+	StringInfoData buf;
+
+	pq_begintypsend(&buf);
+	pq_sendint16(&buf, vec->dim);
+	pq_sendint16(&buf, vec->unused);
+	for (int i = 0; i < vec->dim; i++)
+		pq_sendfloat4(&buf, vec->x[i]);
+	PG_RETURN_BYTEA_P(pq_endtypsend(&buf));
+}
+
+/*
+ * Casts
+ */
+PG_FUNCTION_INFO_V1(vector_typmod_cast);
+Datum
+vector_typmod_cast(PG_FUNCTION_ARGS)
+{
+	Vector	   *vec = PG_GETARG_VECTOR_P(0);
+	int32		typmod = PG_GETARG_INT32(1);
+
+	CheckExpectedDim(typmod, vec->dim);
+	PG_RETURN_VECTOR_P(vec);
+}
+
+PG_FUNCTION_INFO_V1(array_to_vector);
+Datum
+array_to_vector(PG_FUNCTION_ARGS)
+{
+	ArrayType  *array = PG_GETARG_ARRAYTYPE_P(0);
+	int32		typmod = PG_GETARG_INT32(1);
+	Oid			elemtype = ARR_ELEMTYPE(array);
+	int16		typlen;
+	bool		typbyval;
+	char		typalign;
+	Datum	   *elems;
+	bool	   *nulls;
+	int			nelems;
+	Vector	   *result;
+
+	if (ARR_NDIM(array) > 1)
+		ereport(ERROR,
+				(errcode(ERRCODE_DATA_EXCEPTION),
+				 errmsg("array must be 1-D")));
+	if (ARR_HASNULL(array) && array_contains_nulls(array))
+		ereport(ERROR,
+				(errcode(ERRCODE_NULL_VALUE_NOT_ALLOWED),
+				 errmsg("array must not contain nulls")));
+
+	get_typlenbyvalalign(elemtype, &typlen, &typbyval, &typalign);
+	deconstruct_array(array, elemtype, typlen, typbyval, typalign, &elems, &nulls, &nelems);
+	CheckDim(nelems);
+	CheckExpectedDim(typmod, nelems);
+
+	result = InitVector(nelems);
+	for (int i = 0; i < nelems; i++)
+	{
+		switch (elemtype)
+		{
+			case INT4OID:
+				result->x[i] = DatumGetInt32(elems[i]);
+				break;
+			case FLOAT4OID:
+				result->x[i] = DatumGetFloat4(elems[i]);
+				break;
+			case FLOAT8OID:
+				result->x[i] = DatumGetFloat8(elems[i]);
+				break;
+			case NUMERICOID:
+				result->x[i] = DatumGetFloat4(DirectFunctionCall1(numeric_float4, elems[i]));
+				break;
+			default:
+				ereport(ERROR,
+						(errcode(ERRCODE_DATATYPE_MISMATCH),
+						 errmsg("unsupported array type")));
+		}
+		/* float8 values outside the float4 range become infinite */
+		CheckElement(result->x[i]);
+	}
+	PG_RETURN_VECTOR_P(result);
+}
+
+PG_FUNCTION_INFO_V1(vector_to_float4);
+Datum
+vector_to_float4(PG_FUNCTION_ARGS)
+{
+	Vector	   *vec = PG_GETARG_VECTOR_P(0);
+	Datum	   *datums = palloc(sizeof(Datum) * vec->dim);
+
+	for (int i = 0; i < vec->dim; i++)
+		datums[i] = Float4GetDatum(vec->x[i]);
+	PG_RETURN_POINTER(construct_array(datums, vec->dim, FLOAT4OID, sizeof(float4), true, TYPALIGN_INT));
+}
+
+/*
+ * Functions and operators
+ */
+PG_FUNCTION_INFO_V1(l2_distance);
+Datum
+l2_distance(PG_FUNCTION_ARGS)
+{
+	Vector	   *a = PG_GETARG_VECTOR_P(0);
+	Vector	   *b = PG_GETARG_VECTOR_P(1);
+
+	CheckSameDim(a, b);
+	PG_RETURN_FLOAT8(sqrt((double) VectorL2SquaredDistance(a->dim, a->x, b->x)));
+}
+
+/*
+ * Same order as l2_distance without the square root; the ivfflat support function
+ */
+PG_FUNCTION_INFO_V1(vector_l2_squared_distance);
+Datum
+vector_l2_squared_distance(PG_FUNCTION_ARGS)
+{
+	Vector	   *a = PG_GETARG_VECTOR_P(0);
+	Vector	   *b = PG_GETARG_VECTOR_P(1);
+
+	CheckSameDim(a, b);
+	PG_RETURN_FLOAT8((double) VectorL2SquaredDistance(a->dim, a->x, b->x));
+}
+
+PG_FUNCTION_INFO_V1(inner_product);
+Datum
+inner_product(PG_FUNCTION_ARGS)
+{
+	Vector	   *a = PG_GETARG_VECTOR_P(0);
+	Vector	   *b = PG_GETARG_VECTOR_P(1);
+
+	CheckSameDim(a, b);
+	PG_RETURN_FLOAT8((double) VectorInnerProduct(a->dim, a->x, b->x));
+}
+
+/*
+ * Negated so that ascending order puts the largest inner product first
+ */
+PG_FUNCTION_INFO_V1(vector_negative_inner_product);
+Datum
+vector_negative_inner_product(PG_FUNCTION_ARGS)
+{
+	Vector	   *a = PG_GETARG_VECTOR_P(0);
+	Vector	   *b = PG_GETARG_VECTOR_P(1);
+
+	CheckSameDim(a, b);
+	PG_RETURN_FLOAT8((double) -VectorInnerProduct(a->dim, a->x, b->x));
+}
+
+PG_FUNCTION_INFO_V1(cosine_distance);
+Datum
+cosine_distance(PG_FUNCTION_ARGS)
+{
+	Vector	   *a = PG_GETARG_VECTOR_P(0);
+	Vector	   *b = PG_GETARG_VECTOR_P(1);
+
+	CheckSameDim(a, b);
+	PG_RETURN_FLOAT8(VectorCosineDistance(a->dim, a->x, b->x));
+}
+
+PG_FUNCTION_INFO_V1(vector_dims);
+Datum
+vector_dims(PG_FUNCTION_ARGS)
+{
+	Vector	   *a = PG_GETARG_VECTOR_P(0);
+
+	PG_RETURN_INT32(a->dim);
+}
+
+PG_FUNCTION_INFO_V1(vector_norm);
+Datum
+vector_norm(PG_FUNCTION_ARGS)
+{
+	Vector	   *a = PG_GETARG_VECTOR_P(0);
+
+	PG_RETURN_FLOAT8(VectorNorm(a->dim, a->x));
+}
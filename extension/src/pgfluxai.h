@@ -0,0 +1,136 @@
+#ifndef PGFLUXAI_H
+#define PGFLUXAI_H
+
+#include "postgres.h"
+
+#include "access/amapi.h"
+#include "access/genam.h"
+#include "access/reloptions.h"
+#include "fmgr.h"
+#include "nodes/execnodes.h"
+#include "storage/bufpage.h"
+#include "utils/relcache.h"
+
+/* Vector type */
+
+#define VECTOR_MAX_DIM 16000
+
+typedef struct Vector
+{
+	int32		vl_len_;		/* varlena header (do not touch directly!) */
+	int16		dim;			/* number of dimensions */
+	int16		unused;			/* reserved, always zero */
+	float		x[FLEXIBLE_ARRAY_MEMBER];
+} Vector;
+
+#define VECTOR_SIZE(_dim)		(offsetof(Vector, x) + sizeof(float) * (_dim))
+#define DatumGetVector(x)		((Vector *) PG_DETOAST_DATUM(x))
+#define PG_GETARG_VECTOR_P(x)	DatumGetVector(PG_GETARG_DATUM(x))
+#define PG_RETURN_VECTOR_P(x)	PG_RETURN_POINTER(x)
+
+extern Vector *InitVector(int dim);
+extern float VectorL2SquaredDistance(int dim, const float *a, const float *b);
+extern float VectorInnerProduct(int dim, const float *a, const float *b);
+extern double VectorCosineDistance(int dim, const float *a, const float *b);
+extern double VectorNorm(int dim, const float *a);
+extern bool VectorNormalize(int dim, float *a);
+
+extern Datum vector_l2_squared_distance(PG_FUNCTION_ARGS);
+extern Datum vector_negative_inner_product(PG_FUNCTION_ARGS);
+
+/* ivfflat index access method */
+
+#define IVFFLAT_MAGIC_NUMBER	0x14FF1A7A
+#define IVFFLAT_VERSION			1
+#define IVFFLAT_PAGE_ID			0xFF84
+
+#define IVFFLAT_METAPAGE_BLKNO	0
+#define IVFFLAT_HEAD_BLKNO		1	/* first page of the list directory */
+
+#define IVFFLAT_DEFAULT_LISTS	100
+#define IVFFLAT_MIN_LISTS		1
+#define IVFFLAT_MAX_LISTS		32768
+#define IVFFLAT_DEFAULT_PROBES	1
+
+/* A list directory entry and an index tuple must each fit on one page */
+#define IVFFLAT_MAX_DIM			2000
+
+/* k-means trains on a reservoir sample of this many rows per list */
+#define IVFFLAT_SAMPLES_PER_LIST	50
+#define IVFFLAT_KMEANS_ITERATIONS	10
+
+/* Support functions */
+#define IVFFLAT_DISTANCE_PROC	1
+#define IVFFLAT_NORM_PROC		2
+
+typedef enum IvfflatMetric
+{
+	IVFFLAT_METRIC_L2,			/* squared euclidean distance */
+	IVFFLAT_METRIC_IP			/* negative inner product; cosine on normalized vectors */
+} IvfflatMetric;
+
+typedef struct IvfflatOptions
+{
+	int32		vl_len_;		/* varlena header (do not touch directly!) */
+	int			lists;			/* number of inverted lists */
+} IvfflatOptions;
+
+typedef struct IvfflatMetaPageData
+{
+	uint32		magicNumber;
+	uint32		version;
+	uint16		dimensions;
+	uint16		unused;
+	uint32		lists;
+} IvfflatMetaPageData;
+
+typedef IvfflatMetaPageData *IvfflatMetaPage;
+
+typedef struct IvfflatPageOpaqueData
+{
+	BlockNumber nextblkno;		/* next page of the same chain */
+	uint16		unused;
+	uint16		page_id;		/* for identification of ivfflat pages */
+} IvfflatPageOpaqueData;
+
+typedef IvfflatPageOpaqueData *IvfflatPageOpaque;
+
+/* One entry of the list directory: a centroid and the chain of pages holding its vectors */
+typedef struct IvfflatListData
+{
+	BlockNumber startPage;
+	BlockNumber insertPage;
+	Vector		center;			/* variable length, must be last */
+} IvfflatListData;
+
+typedef IvfflatListData *IvfflatList;
+
+#define IVFFLAT_LIST_SIZE(_dim)		(offsetof(IvfflatListData, center) + VECTOR_SIZE(_dim))
+
+#define IvfflatPageGetOpaque(page)	((IvfflatPageOpaque) PageGetSpecialPointer(page))
+#define IvfflatPageGetMeta(page)	((IvfflatMetaPage) PageGetContents(page))
+
+extern int	ivfflat_probes;
+extern relopt_kind ivfflat_relopt_kind;
+
+extern void IvfflatInit(void);
+extern void IvfflatInitPage(Page page);
+extern int	IvfflatGetLists(Relation index);
+extern void IvfflatGetMetaPageInfo(Relation index, int *lists, int *dimensions);
+extern IvfflatMetric IvfflatGetMetric(Relation index, bool *normalize);
+extern float IvfflatDistance(IvfflatMetric metric, int dim, const float *a, const float *b);
+
+extern IndexBuildResult *ivfflatbuild(Relation heap, Relation index, IndexInfo *indexInfo);
+extern void ivfflatbuildempty(Relation index);
+extern bool ivfflatinsert(Relation index, Datum *values, bool *isnull, ItemPointer heap_tid,
+						  Relation heap, IndexUniqueCheck checkUnique, bool indexUnchanged,
+						  IndexInfo *indexInfo);
+extern IndexBulkDeleteResult *ivfflatbulkdelete(IndexVacuumInfo *info, IndexBulkDeleteResult *stats,
+												IndexBulkDeleteCallback callback, void *callback_state);
+extern IndexBulkDeleteResult *ivfflatvacuumcleanup(IndexVacuumInfo *info, IndexBulkDeleteResult *stats);
+extern IndexScanDesc ivfflatbeginscan(Relation index, int nkeys, int norderbys);
+extern void ivfflatrescan(IndexScanDesc scan, ScanKey keys, int nkeys, ScanKey orderbys, int norderbys);
+extern bool ivfflatgettuple(IndexScanDesc scan, ScanDirection dir);
+extern void ivfflatendscan(IndexScanDesc scan);
+
+#endif							/* PGFLUXAI_H */
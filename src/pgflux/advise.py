@@ -0,0 +1,391 @@
+import contextlib
+import functools
+import json
+import re
+
+# Statements worth planning: pg_stat_statements keeps parameters as $n, which PREPARE accepts as they are.
+# The limit applies per database, among the requested databases (all when the array is empty).
+STATEMENTS_SQL = r"""
+    SELECT queryid, datname, query, calls, total_exec_time
+    FROM (SELECT s.queryid, d.datname, s.query, s.calls, s.total_exec_time,
+                 row_number() OVER (PARTITION BY s.dbid ORDER BY s.total_exec_time DESC) AS rank
+          FROM pg_stat_statements s
+          JOIN pg_database d ON d.oid = s.dbid
+          WHERE s.toplevel AND s.query ~* '^\s*(select|with|update|delete)\M'
+            AND s.query !~* '\m(pg_catalog|information_schema|pg_stat_statements)\M'
+            AND (cardinality(%s::text[]) = 0 OR d.datname = ANY(%s::text[]))) ranked
+    WHERE rank <= %s
+    ORDER BY total_exec_time DESC
+"""
+PARAMETER_RE = re.compile(r"\$(\d+)")
+STATEMENT_NAME = "pgflux_advise"
+
+# Every valid index of the user tables with its key columns by name (NULL for expression keys)
+INDEXES_SQL = """
+    SELECT n.nspname, t.relname, ic.relname, quote_ident(n.nspname) || '.' || quote_ident(ic.relname), am.amname,
+           ARRAY(SELECT a.attname::text
+                 FROM unnest(i.indkey::int2[]) WITH ORDINALITY k(attnum, position)
+                 LEFT JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+                 WHERE k.position <= i.indnkeyatts ORDER BY k.position),
+           array_to_string((i.indclass::oid[])[0:i.indnkeyatts - 1], ','),
+           coalesce(pg_get_expr(i.indexprs, i.indrelid), ''), coalesce(pg_get_expr(i.indpred, i.indrelid), ''),
+           i.indisunique OR i.indisprimary OR EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid),
+           pg_relation_size(i.indexrelid)
+    FROM pg_index i
+    JOIN pg_class ic ON ic.oid = i.indexrelid
+    JOIN pg_class t ON t.oid = i.indrelid
+    JOIN pg_namespace n ON n.oid = t.relnamespace
+    JOIN pg_am am ON am.oid = ic.relam
+    WHERE i.indisvalid AND n.nspname NOT IN ('pg_catalog', 'information_schema') AND n.nspname !~ '^pg_toast'
+"""
+INDEX_FIELDS = ("schema", "table", "name", "qualified", "method", "columns", "opclasses", "expressions", "predicate",
+                "constraint", "size")
+
+# Indexes no scan has used since the statistics were reset; those backing constraints are needed regardless
+UNUSED_SQL = """
+    SELECT s.schemaname, s.relname, s.indexrelname,
+           quote_ident(s.schemaname) || '.' || quote_ident(s.indexrelname), pg_relation_size(s.indexrelid)
+    FROM pg_stat_user_indexes s
+    JOIN pg_index i ON i.indexrelid = s.indexrelid
+    WHERE s.idx_scan = 0 AND i.indisvalid AND NOT i.indisunique AND NOT i.indisprimary AND NOT i.indisexclusion
+      AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = s.indexrelid)
+    ORDER BY pg_relation_size(s.indexrelid) DESC
+"""
+STATS_RESET_SQL = "SELECT stats_reset FROM pg_stat_database WHERE datname = current_database()"
+TABLE_SIZE_SQL = "SELECT pg_total_relation_size(format('%%I.%%I', %s::text, %s::text)::regclass)"
+
+HYPOPG = "hypopg"
+METHODS = ("auto", "hypopg", "rollback")
+MAX_INDEX_COLUMNS = 3
+MIN_COST_REDUCTION = 0.1  # a candidate has to cut some statement's estimated cost by at least this fraction
+LOCK_TIMEOUT_MS = 1000  # rollback builds give up rather than queue behind writers
+STATEMENT_TIMEOUT_MS = 60000
+
+SCAN_NODES = ("Seq Scan", "Index Scan", "Index Only Scan", "Bitmap Heap Scan")
+JOIN_CONDITIONS = ("Hash Cond", "Merge Cond", "Join Filter")
+IDENT = r'(?:"(?:[^"]|"")+"|[A-Za-z_][\w$]*)'
+COLUMN_REF_RE = re.compile(rf"(?<![\w.\"])({IDENT})\.({IDENT})(?![\w\"(])")
+STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+# Closing parentheses and casts between a column and its operator, as in "((o.status)::text = $1)"
+CLOSE_AND_CAST_RE = re.compile(r"^(?:\s*\)|::[\w.]+(?: varying| precision| with(?:out)? time zone)?(?:\[\])?)*")
+EQUALITY_AFTER_RE = re.compile(r"^\s*(?:=|IS NULL\b)")
+EQUALITY_BEFORE_RE = re.compile(r"(?<![<>!])=\s*(?:\(\s*)*$")
+RANGE_AFTER_RE = re.compile(r"^\s*(?:<=|>=|<(?!>)|>|~~)")
+RANGE_BEFORE_RE = re.compile(r"(?:<=|>=|<|(?<!<)>)\s*(?:\(\s*)*$")
+
+
+class AdviseError(Exception):
+    """
+    Raised when the statistics the advisor needs are not available.
+    """
+
+
+def _unquote(identifier):
+    if identifier.startswith('"'):
+        return identifier[1:-1].replace('""', '"')
+    return identifier
+
+
+def column_predicates(text):
+    """
+    Returns the (alias, column, kind) references of an EXPLAIN VERBOSE condition in order of appearance,
+    where kind is 'eq' for equality and IS NULL tests, 'range' for comparisons and LIKE, else 'other'.
+    """
+    text = STRING_LITERAL_RE.sub("''", text)
+    references = []
+    for match in COLUMN_REF_RE.finditer(text):
+        before, after = text[:match.start()], text[match.end():]
+        after = CLOSE_AND_CAST_RE.sub("", after)
+        if EQUALITY_AFTER_RE.match(after) or EQUALITY_BEFORE_RE.search(before):
+            kind = "eq"
+        elif RANGE_AFTER_RE.match(after) or RANGE_BEFORE_RE.search(before):
+            kind = "range"
+        else:
+            kind = "other"
+        references.append((_unquote(match.group(1)), _unquote(match.group(2)), kind))
+    return references
+
+
+def index_columns(predicates):
+    """
+    Orders the columns of one table's predicates for a btree: equality columns first, then one range column.
+    """
+    columns = []
+    for _, column, kind in predicates:
+        if kind == "eq" and column not in columns:
+            columns.append(column)
+    for _, column, kind in predicates:
+        if kind == "range" and column not in columns:
+            columns.append(column)
+            break
+    return tuple(columns[:MAX_INDEX_COLUMNS])
+
+
+def _walk(plan):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from _walk(child)
+
+
+def plan_relations(plan):
+    """
+    Maps the aliases of the tables a plan scans to (schema, table).
+    """
+    return {node.get("Alias", node["Relation Name"]): (node.get("Schema", "public"), node["Relation Name"])
+            for node in _walk(plan) if node.get("Node Type") in SCAN_NODES and "Relation Name" in node}
+
+
+def plan_candidates(plan):
+    """
+    Extracts candidate indexes, as (schema, table, columns), from the filters, join conditions and sort keys
+    of an EXPLAIN (FORMAT JSON, VERBOSE) plan.
+    """
+    relations = plan_relations(plan)
+    candidates = set()
+    equalities = {}
+
+    def add(alias, columns):
+        if alias in relations and columns:
+            candidates.add(relations[alias] + (tuple(columns[:MAX_INDEX_COLUMNS]),))
+
+    for node in _walk(plan):
+        if node.get("Node Type") in SCAN_NODES and "Relation Name" in node:
+            alias = node.get("Alias", node["Relation Name"])
+            predicates = [p for p in column_predicates(node.get("Filter", "")) if p[0] == alias]
+            add(alias, index_columns(predicates))
+            equalities[alias] = [column for _, column, kind in predicates if kind == "eq"]
+        for key in JOIN_CONDITIONS:
+            for alias, column, kind in column_predicates(node.get(key, "")):
+                if kind == "eq":
+                    add(alias, [column])
+
+    for node in _walk(plan):
+        if node.get("Node Type") not in ("Sort", "Incremental Sort"):
+            continue
+        keys = [column_predicates(key) for key in node.get("Sort Key", ())]
+        if not keys or any(len(refs) != 1 for refs in keys):
+            continue
+        aliases = {refs[0][0] for refs in keys}
+        # A btree serves a sort in either direction, but not one that mixes them
+        directions = {" DESC" in key for key in node["Sort Key"]}
+        if len(aliases) == 1 and len(directions) == 1:
+            alias = aliases.pop()
+            sort_columns = [refs[0][1] for refs in keys]
+            add(alias, sort_columns)
+            prefix = [column for column in equalities.get(alias, ()) if column not in sort_columns]
+            if prefix:
+                add(alias, prefix + sort_columns)
+    return candidates
+
+
+def covered(candidate, indexes):
+    """
+    Returns True if an existing plain btree index starts with the candidate's columns.
+    """
+    schema, table, columns = candidate
+    for index in indexes:
+        if (index["schema"], index["table"]) != (schema, table) or index["method"] != "btree":
+            continue
+        if not index["predicate"] and tuple(index["columns"][:len(columns)]) == columns:
+            return True
+    return False
+
+
+def redundant_indexes(indexes):
+    """
+    Returns (index, other, relation) for indexes that duplicate another one ('duplicate of') or whose keys lead
+    a wider btree index ('covered by'). Indexes backing constraints are never reported.
+    """
+    found = []
+    for index in indexes:
+        if index["constraint"] or None in index["columns"]:
+            continue
+        keys = (tuple(index["columns"]), index["opclasses"].split(","))
+        for other in indexes:
+            if other is index or (other["schema"], other["table"]) != (index["schema"], index["table"]):
+                continue
+            if (other["method"], other["expressions"], other["predicate"]) != \
+                    (index["method"], index["expressions"], index["predicate"]):
+                continue
+            other_keys = (tuple(other["columns"]), other["opclasses"].split(","))
+            if other_keys == keys:
+                # Of two identical indexes keep the constraint's, else the one whose name sorts first
+                if other["constraint"] or other["name"] < index["name"]:
+                    found.append((index, other, "duplicate of"))
+                    break
+            elif (index["method"] == "btree" and len(keys[0]) < len(other_keys[0])
+                  and other_keys[0][:len(keys[0])] == keys[0] and other_keys[1][:len(keys[1])] == keys[1]):
+                found.append((index, other, "covered by"))
+                break
+    return found
+
+
+def create_statement(qualified_table, quoted_columns):
+    return f"CREATE INDEX CONCURRENTLY ON {qualified_table} ({', '.join(quoted_columns)});"
+
+
+def drop_statement(qualified_index):
+    return f"DROP INDEX CONCURRENTLY {qualified_index};"
+
+
+def top_statements(cur, limit, databases=()):
+    cur.execute(STATEMENTS_SQL, (list(databases), list(databases), limit))
+    return [dict(zip(("queryid", "database", "query", "calls", "total_ms"), row)) for row in cur.fetchall()]
+
+
+def load_indexes(cur):
+    cur.execute(INDEXES_SQL)
+    return [dict(zip(INDEX_FIELDS, row)) for row in cur.fetchall()]
+
+
+def unused_indexes(cur):
+    cur.execute(UNUSED_SQL)
+    return [dict(zip(("schema", "table", "name", "qualified", "size"), row)) for row in cur.fetchall()]
+
+
+def choose_method(cur, method):
+    """
+    Resolves 'auto' to hypopg when the extension can be created, else to rollback-based builds.
+    """
+    if method == "rollback":
+        return method
+    cur.execute("SELECT 1 FROM pg_available_extensions WHERE name = %s", (HYPOPG,))
+    if cur.fetchone() is None:
+        if method == HYPOPG:
+            raise AdviseError(f"{HYPOPG} is not installed for this server.")
+        return "rollback"
+    cur.execute(f"CREATE EXTENSION IF NOT EXISTS {HYPOPG}")
+    return HYPOPG
+
+
+def quoted_names(cur, names):
+    cur.execute("SELECT quote_ident(name) FROM unnest(%s::text[]) WITH ORDINALITY n(name, position) "
+                "ORDER BY position", (list(names),))
+    return [row[0] for row in cur.fetchall()]
+
+
+@contextlib.contextmanager
+def planning(cur, setup=()):
+    """
+    Runs the setup statements, such as a trial CREATE INDEX, in a transaction that is rolled back afterwards,
+    and yields a function returning the generic plan of a normalized statement planned inside it, or None if
+    the statement cannot be planned. Yields None if the setup fails.
+    """
+    import psycopg2
+
+    cur.execute("BEGIN")
+    try:
+        cur.execute(f"SET LOCAL statement_timeout = {STATEMENT_TIMEOUT_MS}")
+        cur.execute(f"SET LOCAL lock_timeout = {LOCK_TIMEOUT_MS}")
+        # A generic plan does not depend on the NULLs passed for the parameters
+        cur.execute("SET LOCAL plan_cache_mode = force_generic_plan")
+        try:
+            for statement, params in setup:
+                cur.execute(statement, params)
+        except psycopg2.Error:
+            yield None
+        else:
+            yield functools.partial(_generic_plan, cur)
+    finally:
+        cur.execute("ROLLBACK")
+        # Prepared statements outlive the transaction
+        cur.execute("DEALLOCATE ALL")
+
+
+def _generic_plan(cur, query):
+    import psycopg2
+
+    parameters = max((int(n) for n in PARAMETER_RE.findall(query)), default=0)
+    arguments = f"({', '.join(['NULL'] * parameters)})" if parameters else ""
+    # A statement that fails to plan must not abort the transaction holding the trial index
+    cur.execute("SAVEPOINT pgflux_plan")
+    try:
+        cur.execute(f"PREPARE {STATEMENT_NAME} AS {query}")
+        cur.execute(f"EXPLAIN (FORMAT JSON, VERBOSE) EXECUTE {STATEMENT_NAME}{arguments}")
+        plan = cur.fetchone()[0]
+        cur.execute("RELEASE SAVEPOINT pgflux_plan")
+    except psycopg2.Error:
+        cur.execute("ROLLBACK TO SAVEPOINT pgflux_plan")
+        plan = None
+    cur.execute("DEALLOCATE ALL")
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"] if plan else None
+
+
+def _hypothetical_setup(method, definition):
+    if method == HYPOPG:
+        return [("SELECT hypopg_reset()", None), ("SELECT hypopg_create_index(%s)", (definition,))]
+    return [(definition, None)]
+
+
+def evaluate(cur, statements, max_build_bytes, method="auto", indexes=None, echo=print):
+    """
+    Plans each statement, collects candidate indexes from the plans and scores every candidate by how much
+    it lowers the estimated cost of the statements on its table, weighted by their total execution time.
+
+    Returns recommendations, best first, each with its CREATE INDEX CONCURRENTLY statement.
+    """
+    method = choose_method(cur, method)
+    indexes = load_indexes(cur) if indexes is None else indexes
+    planned = []
+    candidates = set()
+    with planning(cur) as generic_plan:
+        for statement in statements:
+            plan = generic_plan(statement["query"])
+            if plan is None:
+                continue
+            tables = set(plan_relations(plan).values())
+            planned.append((statement, plan["Total Cost"], tables))
+            candidates |= {c for c in plan_candidates(plan) if not covered(c, indexes)}
+
+    recommendations = []
+    sizes = {}
+    for schema, table, columns in sorted(candidates):
+        affected = [(statement, cost) for statement, cost, tables in planned if (schema, table) in tables and cost]
+        if not affected:
+            continue
+        if method == "rollback":
+            if (schema, table) not in sizes:
+                cur.execute(TABLE_SIZE_SQL, (schema, table))
+                sizes[(schema, table)] = cur.fetchone()[0]
+            if sizes[(schema, table)] > max_build_bytes:
+                echo(f"Skipping {schema}.{table} ({', '.join(columns)}): the table is too large to build "
+                     f"a trial index on; install {HYPOPG} to evaluate it.")
+                continue
+        quoted = quoted_names(cur, (schema, table) + columns)
+        table_name, column_names = f"{quoted[0]}.{quoted[1]}", quoted[2:]
+        definition = f"CREATE INDEX ON {table_name} ({', '.join(column_names)})"
+        improved, saved_ms, best = [], 0.0, 0.0
+        # The candidate is built once and every affected statement is planned against it
+        with planning(cur, _hypothetical_setup(method, definition)) as generic_plan:
+            for statement, cost in affected if generic_plan else ():
+                plan = generic_plan(statement["query"])
+                if plan is None or plan["Total Cost"] >= cost:
+                    continue
+                reduction = 1 - plan["Total Cost"] / cost
+                best = max(best, reduction)
+                saved_ms += statement["total_ms"] * reduction
+                improved.append({"queryid": statement["queryid"], "query": statement["query"],
+                                 "cost_before": cost, "cost_after": plan["Total Cost"], "reduction": reduction})
+        if method == HYPOPG:
+            cur.execute("SELECT hypopg_reset()")
+        if best >= MIN_COST_REDUCTION:
+            recommendations.append({"schema": schema, "table": table, "columns": list(columns),
+                                    "estimated_saved_ms": saved_ms, "statements": improved,
+                                    "sql": create_statement(table_name, column_names)})
+    return prune(sorted(recommendations, key=lambda r: r["estimated_saved_ms"], reverse=True))
+
+
+def prune(recommendations):
+    """
+    Drops a recommendation when a wider one on the same table, whose leading columns it is, saves as much.
+    """
+    kept = []
+    for recommendation in recommendations:
+        columns = recommendation["columns"]
+        if any((other["schema"], other["table"]) == (recommendation["schema"], recommendation["table"])
+               and other["columns"][:len(columns)] == columns for other in kept):
+            continue
+        kept.append(recommendation)
+    return kept
@@ -0,0 +1,131 @@
+import io
+import random
+import time
+
+from pgflux import bench, db
+from pgflux.stats import LatencyHistogram
+
+ANN_TABLE = "pgflux_ann"
+COPY_BATCH_ROWS = 10000
+# Operator and ivfflat opclass per distance metric
+METRICS = {
+    "l2": ("<->", "vector_l2_ops"),
+    "ip": ("<#>", "vector_ip_ops"),
+    "cosine": ("<=>", "vector_cosine_ops"),
+}
+CLUSTER_SPREAD = 0.1  # standard deviation of the generated points around their centre
+
+
+def generate_vectors(count, dimensions, clusters, seed=bench.DEFAULT_SEED):
+    """
+    Returns count vectors scattered around `clusters` random centres, the same ones for the same seed.
+
+    Real embeddings are clustered; uniform noise would make every list of an ivfflat index equally near.
+    """
+    rng = random.Random(seed)
+    centres = [[rng.uniform(-1, 1) for _ in range(dimensions)] for _ in range(clusters)]
+    return [[value + rng.gauss(0, CLUSTER_SPREAD) for value in rng.choice(centres)] for _ in range(count)]
+
+
+def vector_literal(values):
+    return "[" + ",".join(f"{value:.7g}" for value in values) + "]"
+
+
+def recall(found, truth):
+    """
+    Returns the fraction of the true nearest neighbours that a search found.
+    """
+    if not truth:
+        return 1.0
+    return len(set(found) & set(truth)) / len(truth)
+
+
+def default_lists(rows):
+    """
+    A list per thousand rows, the usual starting point for ivfflat.
+    """
+    return max(1, rows // 1000)
+
+
+def _load(cur, rows, dimensions, clusters):
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pgfluxai")
+    cur.execute(f"DROP TABLE IF EXISTS {ANN_TABLE}")
+    cur.execute(f"CREATE TABLE {ANN_TABLE} (id integer PRIMARY KEY, embedding vector({dimensions}))")
+    vectors = generate_vectors(rows, dimensions, clusters)
+    for start in range(0, rows, COPY_BATCH_ROWS):
+        batch = io.StringIO("".join(f"{start + offset}\t{vector_literal(vector)}\n"
+                                    for offset, vector in enumerate(vectors[start:start + COPY_BATCH_ROWS])))
+        cur.copy_expert(f"COPY {ANN_TABLE} (id, embedding) FROM STDIN", batch)
+    cur.execute(f"ANALYZE {ANN_TABLE}")
+
+
+def _search(cur, statement, queries):
+    """
+    Runs every query, returning the ids found per query and a histogram of the latencies.
+    """
+    histogram = LatencyHistogram()
+    results = []
+    for query in queries:
+        started = time.perf_counter()
+        cur.execute(statement, (query,))
+        ids = [row[0] for row in cur.fetchall()]
+        histogram.add(int((time.perf_counter() - started) * 1_000_000))
+        results.append(ids)
+    return results, histogram
+
+
+def _summary(histogram, elapsed):
+    return {
+        "qps": histogram.count / elapsed if elapsed else None,
+        "p50_ms": histogram.percentile(50),
+        "p95_ms": histogram.percentile(95),
+        "p99_ms": histogram.percentile(99),
+    }
+
+
+def run(port, rows, dimensions, queries, k, lists, probes, metric="l2", clusters=None, echo=print, **connect):
+    """
+    Loads generated vectors into the benchmark database, finds the exact k nearest neighbours of each query
+    with a sequential scan, then builds an ivfflat index and measures recall@k and latency per probe count.
+    """
+    operator, opclass = METRICS[metric]
+    clusters = clusters or max(1, lists)
+    query_literals = [vector_literal(v) for v in generate_vectors(queries, dimensions, clusters,
+                                                                  seed=bench.DEFAULT_SEED + 1)]
+    statement = f"SELECT id FROM {ANN_TABLE} ORDER BY embedding {operator} %s::vector LIMIT {int(k)}"
+    result = {"rows": rows, "dimensions": dimensions, "queries": queries, "k": k, "lists": lists,
+              "metric": metric, "points": []}
+
+    bench.ensure_database(port, **connect)
+    with db.connection(port, dbname=bench.BENCH_DB, **connect) as conn, conn.cursor() as cur:
+        try:
+            echo(f"Loading {rows} vectors of {dimensions} dimensions...")
+            _load(cur, rows, dimensions, clusters)
+
+            echo("Computing exact neighbours with a sequential scan...")
+            started = time.perf_counter()
+            truth, histogram = _search(cur, statement, query_literals)
+            result["exact"] = _summary(histogram, time.perf_counter() - started)
+
+            echo(f"Building ivfflat index with {lists} lists...")
+            started = time.perf_counter()
+            cur.execute(f"CREATE INDEX ON {ANN_TABLE} USING ivfflat (embedding {opclass}) WITH (lists = {int(lists)})")
+            result["build_seconds"] = time.perf_counter() - started
+
+            for count in probes:
+                cur.execute(f"SET pgfluxai.ivfflat_probes = {int(count)}")
+                cur.execute("EXPLAIN " + statement, (query_literals[0],))
+                if not any("Index Scan" in line for (line,) in cur.fetchall()):
+                    raise bench.BenchError("The planner did not use the ivfflat index.")
+                started = time.perf_counter()
+                found, histogram = _search(cur, statement, query_literals)
+                point = _summary(histogram, time.perf_counter() - started)
+                point["probes"] = count
+                point["recall"] = sum(recall(f, t) for f, t in zip(found, truth)) / len(truth)
+                result["points"].append(point)
+                echo(f"probes {count}: recall@{k} {point['recall']:.3f}, p95 {point['p95_ms']:.2f} ms")
+        finally:
+            if not conn.closed:
+                cur.execute("RESET ALL")
+                cur.execute(f"DROP TABLE IF EXISTS {ANN_TABLE}")
+    return result
@@ -0,0 +1,296 @@
+import glob
+import json
+import math
+import os
+import platform
+import re
+import statistics
+import tempfile
+import time
+
+from pgflux import db, instrument
+from pgflux.constants import BENCH_DIR
+from pgflux.stats import LatencyHistogram
+
+BENCH_DB = "pgflux_bench"
+DEFAULT_SEED = 42
+
+# Built-in pgbench workloads; 'custom' runs the given -f scripts against the same tables.
+PROFILES = {
+    "read-only": ["--builtin=select-only"],
+    "tpcb": ["--builtin=tpcb-like"],
+    "simple-update": ["--builtin=simple-update"],
+    "custom": [],
+}
+
+TPS_RE = re.compile(r"^tps = ([0-9.]+) \((?:without initial connection time|excluding connections establishing)\)", re.M)
+PROCESSED_RE = re.compile(r"^number of transactions actually processed: (\d+)", re.M)
+FAILED_RE = re.compile(r"^number of failed transactions: (\d+)", re.M)
+LATENCY_AVG_RE = re.compile(r"^latency average = ([0-9.]+) ms", re.M)
+
+# Non-default settings that describe the run; the rest of pg_settings is noise for comparisons.
+SETTINGS_SQL = """
+    SELECT name, setting || coalesce(unit, '')
+    FROM pg_settings
+    WHERE source NOT IN ('default', 'override', 'client', 'session')
+    ORDER BY name
+"""
+
+
+class BenchError(Exception):
+    """
+    Raised when a benchmark cannot be prepared or pgbench fails.
+    """
+
+
+def _read_latency_logs(log_prefix):
+    """
+    Streams pgbench's per-transaction logs (-l) into a histogram. Column 3 is the latency in microseconds.
+    """
+    histogram = LatencyHistogram()
+    for path in glob.glob(f"{log_prefix}.*"):
+        with open(path, "r") as f:
+            for line in f:
+                fields = line.split()
+                # Failed transactions log 'failed' or 'skipped' instead of a latency.
+                if len(fields) >= 3 and fields[2].isdigit():
+                    histogram.add(int(fields[2]))
+    return histogram
+
+
+def connection_args(port, host, user):
+    return ["-h", host, "-p", str(port), "-U", user]
+
+
+def ensure_database(port, **connect):
+    """
+    Creates the benchmark database unless it exists.
+    """
+    if db.query_one(port, "SELECT 1 FROM pg_database WHERE datname = %s", (BENCH_DB,), **connect) is None:
+        db.execute(port, f"CREATE DATABASE {BENCH_DB}", **connect)
+
+
+def current_scale(port, **connect):
+    """
+    Returns the scale factor the benchmark tables were initialized with, or None if they are missing.
+    """
+    row = db.query_one(port, "SELECT to_regclass('pgbench_branches') IS NOT NULL", dbname=BENCH_DB, **connect)
+    if not row or not row[0]:
+        return None
+    return db.query_one(port, "SELECT count(*) FROM pgbench_branches", dbname=BENCH_DB, **connect)[0]
+
+
+def initialize(pgbench, scale, port, host, user, **connect):
+    """
+    Loads the pgbench tables at the given scale unless they are already at that scale.
+    """
+    if current_scale(port, host=host, user=user, **connect) == scale:
+        return False
+    instrument.run(f"pgbench-init-s{scale}", [pgbench, "-i", "-q", "-s", str(scale)]
+                   + connection_args(port, host, user) + [BENCH_DB], check=True, capture_output=True, text=True)
+    return True
+
+
+def run_pgbench(pgbench, profile, scripts, clients, duration, port, host, user, seed=DEFAULT_SEED, threads=None):
+    """
+    Runs pgbench once and returns TPS, average latency and latency percentiles in milliseconds.
+    """
+    threads = threads or max(1, min(clients, os.cpu_count() or 1))
+    args = [pgbench, "-c", str(clients), "-j", str(threads), "-T", str(duration), f"--random-seed={seed}"]
+    args += PROFILES[profile]
+    for script in scripts:
+        args += ["-f", script]
+    if profile == "custom":
+        args.append("-n")  # custom scripts may not use the pgbench tables that would be vacuumed
+
+    with tempfile.TemporaryDirectory(prefix="pgflux-bench-") as log_dir:
+        log_prefix = os.path.join(log_dir, "pgbench_log")
+        args += ["-l", f"--log-prefix={log_prefix}"] + connection_args(port, host, user) + [BENCH_DB]
+        result = instrument.run(f"pgbench-c{clients}", args, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise BenchError(f"pgbench failed with exit code {result.returncode}: {result.stderr.strip()}")
+        histogram = _read_latency_logs(log_prefix)
+
+    tps = TPS_RE.search(result.stdout)
+    if not tps:
+        raise BenchError(f"Could not parse pgbench output:\n{result.stdout}")
+    processed = PROCESSED_RE.search(result.stdout)
+    failed = FAILED_RE.search(result.stdout)
+    latency = LATENCY_AVG_RE.search(result.stdout)
+    return {
+        "tps": float(tps.group(1)),
+        "transactions": int(processed.group(1)) if processed else histogram.count,
+        "failed": int(failed.group(1)) if failed else 0,
+        "latency_avg_ms": float(latency.group(1)) if latency else None,
+        "p50_ms": histogram.percentile(50),
+        "p95_ms": histogram.percentile(95),
+        "p99_ms": histogram.percentile(99),
+    }
+
+
+def snapshot_config(port, **connect):
+    """
+    Records the server version and every non-default setting, so results can be told apart later.
+    """
+    with db.connection(port, dbname=BENCH_DB, **connect) as conn, conn.cursor() as cur:
+        cur.execute("SHOW server_version")
+        server_version = cur.fetchone()[0]
+        cur.execute(SETTINGS_SQL)
+        settings = dict(cur.fetchall())
+    return {"server_version": server_version, "settings": settings}
+
+
+def new_result(version, profile, scripts, duration, runs, label=None, seed=DEFAULT_SEED):
+    return {
+        "label": label,
+        "version": version,
+        "profile": profile,
+        "scripts": [os.path.abspath(s) for s in scripts],
+        "duration": duration,
+        "runs": runs,
+        "seed": seed,
+        "host": platform.node(),
+        "started": time.time(),
+        "points": [],
+    }
+
+
+def save_result(result, bench_dir=BENCH_DIR):
+    """
+    Writes a result as JSON and returns its path.
+    """
+    os.makedirs(bench_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(result["started"]))
+    name = f"{result['version']}-{result['profile']}-{stamp}-{os.getpid()}"
+    if result.get("label"):
+        name += "-" + re.sub(r"[^A-Za-z0-9_.-]+", "_", result["label"])
+    path = os.path.join(bench_dir, name + ".json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+
+def list_results(bench_dir=BENCH_DIR, version=None, label=None):
+    """
+    Returns (path, result) pairs, oldest first, optionally filtered by version and label.
+    """
+    if not os.path.isdir(bench_dir):
+        return []
+    results = []
+    for name in os.listdir(bench_dir):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(bench_dir, name)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if (version and data.get("version") != version) or (label and data.get("label") != label):
+            continue
+        results.append((path, data))
+    return sorted(results, key=lambda item: item[1].get("started", 0))
+
+
+def load_result(ref, bench_dir=BENCH_DIR):
+    """
+    Loads a result given its path, a unique prefix of its file name, or its label.
+    """
+    if os.path.isfile(ref):
+        with open(ref, "r") as f:
+            return ref, json.load(f)
+    stored = list_results(bench_dir)
+    matches = [(p, r) for p, r in stored if os.path.basename(p).startswith(ref)]
+    matches = matches or [(p, r) for p, r in stored if r.get("label") == ref][-1:]
+    if len(matches) != 1:
+        raise ValueError(f"Benchmark result '{ref}' {'is ambiguous' if matches else 'not found'}.")
+    return matches[0]
+
+
+def _betacf(a, b, x):
+    # Continued fraction for the incomplete beta function (modified Lentz's method).
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1, a - 1
+    c, d = 1.0, 1 - qab * x / qap
+    d = 1 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 300):
+        m2 = 2 * m
+        for aa in (m * (b - m) * x / ((qam + m2) * (a + m2)), -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))):
+            d = 1 + aa * d
+            d = 1 / (d if abs(d) > tiny else tiny)
+            c = 1 + aa / c
+            c = c if abs(c) > tiny else tiny
+            h *= d * c
+        if abs(d * c - 1) < 3e-12:
+            break
+    return h
+
+
+def _betai(a, b, x):
+    """
+    Regularized incomplete beta function I_x(a, b).
+    """
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1 - x))
+    if x < (a + 1) / (a + b + 2):
+        return front * _betacf(a, b, x) / a
+    return 1 - front * _betacf(b, a, 1 - x) / b
+
+
+def welch_t_test(a, b):
+    """
+    Two-sided Welch's t-test for samples with unequal variances. Returns (t, df, p), or None with fewer than two values.
+    """
+    if len(a) < 2 or len(b) < 2:
+        return None
+    mean_a, mean_b = statistics.fmean(a), statistics.fmean(b)
+    se_a, se_b = statistics.variance(a) / len(a), statistics.variance(b) / len(b)
+    if se_a + se_b == 0:
+        return (0.0, float(len(a) + len(b) - 2), 1.0 if mean_a == mean_b else 0.0)
+    t = (mean_b - mean_a) / math.sqrt(se_a + se_b)
+    df = (se_a + se_b) ** 2 / (se_a ** 2 / (len(a) - 1) + se_b ** 2 / (len(b) - 1))
+    return t, df, _betai(df / 2, 0.5, df / (df + t * t))
+
+
+def _mean(runs, field):
+    values = [run[field] for run in runs if run.get(field) is not None]
+    return statistics.fmean(values) if values else None
+
+
+def compare(base, new, alpha=0.05):
+    """
+    Compares two results at every (scale, clients) point they share.
+
+    Returns dicts with mean TPS and p95 latency on both sides, the TPS change in
+    percent, the Welch p-value and whether the difference is significant at alpha.
+    """
+    base_points = {(p["scale"], p["clients"]): p["runs"] for p in base["points"]}
+    rows = []
+    for point in new["points"]:
+        key = (point["scale"], point["clients"])
+        if key not in base_points:
+            continue
+        old_runs, new_runs = base_points[key], point["runs"]
+        old_tps, new_tps = _mean(old_runs, "tps"), _mean(new_runs, "tps")
+        test = welch_t_test([r["tps"] for r in old_runs], [r["tps"] for r in new_runs])
+        p = test[2] if test else None
+        rows.append({
+            "scale": key[0], "clients": key[1],
+            "base_tps": old_tps, "new_tps": new_tps,
+            "change": (new_tps - old_tps) / old_tps * 100 if old_tps else None,
+            "base_p95_ms": _mean(old_runs, "p95_ms"), "new_p95_ms": _mean(new_runs, "p95_ms"),
+            "p_value": p, "significant": p is not None and p < alpha,
+        })
+    return rows
+
+
+def setting_differences(base, new):
+    """
+    Returns (name, base value, new value) for settings that differ between two results.
+    """
+    old, cur = base.get("settings", {}), new.get("settings", {})
+    return [(name, old.get(name), cur.get(name)) for name in sorted(set(old) | set(cur)) if old.get(name) != cur.get(name)]
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+
+from pgflux.constants import EXTENSION_DIR
+
+CONFIGURE_STAMP = ".pgflux-configure"
+FLAGS_STAMP = ".pgflux-flags"
+BUILD_INFO_FILE = ".pgflux-build.json"
+BUILD_PROFILES = ("default", "native", "lto", "pgo")
+# Merged clang profile; gcc reads its .gcda files straight from the profile directory
+PROFDATA_FILE = "default.profdata"
+# contrib modules pgflux itself relies on (top, restart --prewarm), built along with the server
+CONTRIB_MODULES = ("pg_stat_statements", "pg_buffercache", "pg_prewarm")
+# Files of the pgfluxai extension compiled with PGXS after the server is installed
+EXTENSION_SUFFIXES = (".c", ".h", ".sql", ".control", "Makefile")
+# Environment variables that configure bakes into the generated build files
+CONFIGURE_ENV_VARS = (
+    "CC", "CFLAGS", "CPP", "CPPFLAGS", "CXX", "CXXFLAGS", "LDFLAGS", "LDFLAGS_EX", "LDFLAGS_SL",
+    "LIBS", "LLVM_CONFIG", "PERL", "PKG_CONFIG_PATH", "PYTHON",
+)
+
+
+def configure_environment(env=None):
+    """
+    Returns the configure-relevant environment as sorted 'NAME=value' strings.
+    """
+    env = os.environ if env is None else env
+    return [f"{name}={env[name]}" for name in sorted(CONFIGURE_ENV_VARS) if name in env]
+
+
+def configure_fingerprint(build_dir, configure_args, env=None):
+    """
+    Hashes the configure arguments, the relevant environment and the configure script itself.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([list(configure_args), configure_environment(env)]).encode())
+    script = os.path.join(build_dir, "configure")
+    if os.path.exists(script):
+        with open(script, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def extension_fingerprint(extension_dir=EXTENSION_DIR):
+    """
+    Hashes the extension sources, so a cached install is not reused after they change. None without sources.
+    """
+    if not os.path.isdir(extension_dir):
+        return None
+    digest = hashlib.sha256()
+    for root, dirs, files in sorted(os.walk(extension_dir)):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith(EXTENSION_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, extension_dir).encode() + b"\0")
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def needs_configure(build_dir, fingerprint):
+    """
+    Returns False if the existing config.status was produced with the same fingerprint.
+    """
+    stamp = os.path.join(build_dir, CONFIGURE_STAMP)
+    if not (os.path.exists(os.path.join(build_dir, "config.status")) and os.path.exists(stamp)):
+        return True
+    with open(stamp, "r") as f:
+        return f.read().strip() != fingerprint
+
+
+def record_configure(build_dir, fingerprint):
+    """
+    Remembers the fingerprint of a successful configure run.
+    """
+    with open(os.path.join(build_dir, CONFIGURE_STAMP), "w") as f:
+        f.write(fingerprint)
+
+
+def snapshot_objects(build_dir):
+    """
+    Maps every object file below build_dir to its (inode, mtime) signature.
+    """
+    objects = {}
+    for root, dirs, files in os.walk(build_dir):
+        dirs[:] = [d for d in dirs if d != ".git"]
+        for name in files:
+            if name.endswith(".o"):
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                objects[path] = (st.st_ino, st.st_mtime_ns)
+    return objects
+
+
+def compare_objects(before, after):
+    """
+    Returns (rebuilt, reused) object counts between two snapshots.
+    """
+    rebuilt = sum(1 for path, signature in after.items() if before.get(path) != signature)
+    return rebuilt, len(after) - rebuilt
+
+
+def compiler_family(compiler):
+    """
+    Returns 'clang' or 'gcc' for a `cc --version` line.
+    """
+    return "clang" if "clang" in compiler.lower() else "gcc"
+
+
+def profile_flags(profile, compiler, debug_symbols=False, pgo_stage=None, pgo_dir=None):
+    """
+    Returns the (CFLAGS, LDFLAGS) lists for a build profile.
+
+    pgo builds twice: pgo_stage 'generate' for the instrumented build and 'use'
+    for the final one, which also gets LTO.
+    """
+    family = compiler_family(compiler)
+    cflags, ldflags = [], []
+    if profile != "default":
+        cflags += ["-O3", "-march=native"]
+    elif debug_symbols:
+        cflags.append("-O2")  # setting CFLAGS at all drops configure's default -O2
+
+    if profile == "lto" or (profile == "pgo" and pgo_stage == "use"):
+        lto = ["-flto=thin"] if family == "clang" else ["-flto=auto", "-ffat-lto-objects"]
+        cflags += lto
+        ldflags.append(lto[0])
+
+    if profile == "pgo" and pgo_stage == "generate":
+        cflags.append(f"-fprofile-generate={pgo_dir}")
+        ldflags.append(f"-fprofile-generate={pgo_dir}")
+    elif profile == "pgo" and family == "clang":
+        cflags.append(f"-fprofile-use={os.path.join(pgo_dir, PROFDATA_FILE)}")
+        ldflags.append(f"-fprofile-use={os.path.join(pgo_dir, PROFDATA_FILE)}")
+    elif profile == "pgo":
+        cflags += [f"-fprofile-use={pgo_dir}", "-fprofile-correction", "-Wno-missing-profile"]
+        ldflags.append(f"-fprofile-use={pgo_dir}")
+
+    if debug_symbols:
+        cflags += ["-g", "-fno-omit-frame-pointer"]
+    return cflags, ldflags
+
+
+def build_environment(cflags, ldflags, env=None):
+    """
+    Returns a copy of the environment with the profile flags appended to CFLAGS and LDFLAGS.
+    """
+    env = dict(os.environ if env is None else env)
+    for name, flags in (("CFLAGS", cflags), ("LDFLAGS", ldflags)):
+        if flags:
+            env[name] = " ".join(filter(None, [env.get(name, "")] + list(flags)))
+    return env
+
+
+def _flags_signature(env):
+    return json.dumps([env.get(name, "") for name in ("CC", "CFLAGS", "LDFLAGS")])
+
+
+def flags_changed(build_dir, env):
+    """
+    Returns True if objects in build_dir were compiled with different compiler flags.
+
+    make only tracks source and header changes, so switching profiles needs a
+    make clean even when configure is skipped or rerun.
+    """
+    try:
+        with open(os.path.join(build_dir, FLAGS_STAMP), "r") as f:
+            return f.read() != _flags_signature(env)
+    except OSError:
+        # Build directories from before flags were recorded used the plain environment.
+        return _flags_signature(env) != _flags_signature(os.environ) and bool(snapshot_objects(build_dir))
+
+
+def record_flags(build_dir, env):
+    with open(os.path.join(build_dir, FLAGS_STAMP), "w") as f:
+        f.write(_flags_signature(env))
+
+
+def write_build_info(install_prefix, info):
+    """
+    Records how an install was built (profile, flags, commit) next to its binaries.
+
+    The file is replaced rather than rewritten: a tree restored from the build cache may hardlink it to the
+    cached copy and to other installs.
+    """
+    path = os.path.join(install_prefix, BUILD_INFO_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(info, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def read_build_info(install_prefix):
+    try:
+        with open(os.path.join(install_prefix, BUILD_INFO_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
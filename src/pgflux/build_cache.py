@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import time
+
+from pgflux import instrument
+from pgflux.constants import BUILD_CACHE_DIR
+from pgflux.utils import clone_tree, parse_size, tree_size
+
+META_FILE = "meta.json"
+TREE_DIR = "tree"
+DEFAULT_MAX_SIZE = os.environ.get("PGFLUX_BUILD_CACHE_MAX_SIZE", "20G")
+
+
+def compiler_version(env=None):
+    """
+    Returns the first line of `$CC --version`, which identifies the compiler build.
+    """
+    cc = shlex.split((env or os.environ).get("CC", "cc"))
+    try:
+        result = instrument.run("compiler-version", cc + ["--version"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    lines = result.stdout.strip().splitlines()
+    return lines[0].strip() if lines else "unknown"
+
+
+def cache_key(commit, configure_args, compiler):
+    """
+    Computes the content address of a build from everything that affects its output.
+    """
+    payload = json.dumps({"commit": commit, "configure": list(configure_args), "compiler": compiler}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _entry_dir(key):
+    return os.path.join(BUILD_CACHE_DIR, key)
+
+
+def _read_meta(entry_dir):
+    try:
+        with open(os.path.join(entry_dir, META_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(entry_dir, meta):
+    tmp_path = os.path.join(entry_dir, META_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(entry_dir, META_FILE))
+
+
+def lookup(key):
+    """
+    Returns the metadata of the cached build for key, or None on a miss.
+    """
+    entry_dir = _entry_dir(key)
+    if not os.path.isdir(os.path.join(entry_dir, TREE_DIR)):
+        return None
+    return _read_meta(entry_dir)
+
+
+def restore(key, install_prefix, exclude=()):
+    """
+    Restores a cached install tree into install_prefix. Returns False on a cache miss.
+    """
+    meta = lookup(key)
+    if meta is None:
+        return False
+    clone_tree(os.path.join(_entry_dir(key), TREE_DIR), install_prefix, link=True, exclude=exclude)
+    meta["last_used"] = time.time()
+    _write_meta(_entry_dir(key), meta)
+    return True
+
+
+def store(key, install_prefix, meta, exclude=()):
+    """
+    Copies a freshly installed tree into the cache under key.
+
+    The entry is assembled in a temporary directory and renamed into place, so
+    concurrent installs never observe a half-written entry.
+    """
+    entry_dir = _entry_dir(key)
+    if lookup(key) is not None:
+        return
+    os.makedirs(BUILD_CACHE_DIR, exist_ok=True)
+    tmp_dir = f"{entry_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    clone_tree(install_prefix, os.path.join(tmp_dir, TREE_DIR), link=False, exclude=exclude)
+    now = time.time()
+    meta = dict(meta, key=key, created=now, last_used=now, size=tree_size(os.path.join(tmp_dir, TREE_DIR)))
+    _write_meta(tmp_dir, meta)
+    try:
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        # Another install stored the same key first.
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def list_entries():
+    """
+    Returns the metadata of all cached builds, most recently used first.
+    """
+    if not os.path.isdir(BUILD_CACHE_DIR):
+        return []
+    entries = []
+    for name in os.listdir(BUILD_CACHE_DIR):
+        entry_dir = os.path.join(BUILD_CACHE_DIR, name)
+        meta = _read_meta(entry_dir) if ".tmp-" not in name else None
+        if meta is not None:
+            entries.append(meta)
+    return sorted(entries, key=lambda m: m.get("last_used", 0), reverse=True)
+
+
+def prune(max_size=DEFAULT_MAX_SIZE):
+    """
+    Evicts least recently used builds until the cache fits into max_size.
+    Returns the metadata of the evicted entries.
+    """
+    limit = parse_size(max_size)
+    entries = list_entries()
+    total = sum(m.get("size", 0) for m in entries)
+    evicted = []
+    while entries and total > limit:
+        victim = entries.pop()
+        shutil.rmtree(_entry_dir(victim["key"]), ignore_errors=True)
+        total -= victim.get("size", 0)
+        evicted.append(victim)
+    return evicted
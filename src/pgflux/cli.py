@@ -1,13 +1,78 @@
+import importlib
+
 import click
-from pgflux.commands.init_command import init_cli
-from pgflux.commands.install_command import install_cli
-from pgflux.commands.start_command import start_cli
-from pgflux.commands.stop_command import stop_cli
-from pgflux.commands.status_command import status_cli
-from pgflux.commands.run_command import run_cli  # Import the run command
+
+# Built-in commands as "module:attribute"; a module is imported only when its command runs or help lists it.
+COMMANDS = {
+    "init": "pgflux.commands.init_command:init_cli",
+    "install": "pgflux.commands.install_command:install_cli",
+    "start": "pgflux.commands.start_command:start_cli",
+    "stop": "pgflux.commands.stop_command:stop_cli",
+    "restart": "pgflux.commands.restart_command:restart_cli",
+    "status": "pgflux.commands.status_command:status_cli",
+    "run": "pgflux.commands.run_command:run_cli",
+    "cache": "pgflux.commands.cache_command:cache_cli",
+    "report": "pgflux.commands.report_command:report_cli",
+    "tune": "pgflux.commands.tune_command:tune_cli",
+    "bench": "pgflux.commands.bench_command:bench_cli",
+    "logs": "pgflux.commands.logs_command:logs_cli",
+    "top": "pgflux.commands.top_command:top_cli",
+    "instances": "pgflux.commands.instances_command:instances_cli",
+    "load": "pgflux.commands.load_command:load_cli",
+    "snapshot": "pgflux.commands.snapshot_command:snapshot_cli",
+    "pool": "pgflux.commands.pool_command:pool_cli",
+    "replica": "pgflux.commands.replica_command:replica_cli",
+    "advise": "pgflux.commands.advise_command:advise_cli",
+    "maintain": "pgflux.commands.maintain_command:maintain_cli",
+}
+
+# Packages add subcommands by declaring entry points in this group, e.g.
+#   [project.entry-points."pgflux.commands"]
+#   mycmd = "mypackage.cli:mycmd_cli"
+PLUGIN_GROUP = "pgflux.commands"
+
+
+def plugin_commands():
+    """
+    Returns the entry points of installed plugin commands by name. Built-in names cannot be overridden.
+    """
+    # importlib.metadata scans every installed distribution, so this only runs for unknown names and help.
+    from importlib import metadata
+
+    try:
+        entry_points = metadata.entry_points(group=PLUGIN_GROUP)
+    except TypeError:  # Python < 3.10
+        entry_points = metadata.entry_points().get(PLUGIN_GROUP, [])
+    return {ep.name: ep for ep in entry_points if ep.name not in COMMANDS}
 
 
-@click.group()
+class LazyGroup(click.Group):
+    """
+    Click group that resolves subcommands from COMMANDS and plugin entry points on first use.
+    """
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(COMMANDS) | set(plugin_commands()))
+
+    def get_command(self, ctx, name):
+        command = super().get_command(ctx, name)
+        if command is not None:
+            return command
+        if name in COMMANDS:
+            module_name, attribute = COMMANDS[name].split(":")
+            command = getattr(importlib.import_module(module_name), attribute)
+        else:
+            entry_point = plugin_commands().get(name)
+            if entry_point is None:
+                return None
+            command = entry_point.load()
+            if not isinstance(command, click.Command):
+                raise click.ClickException(f"Plugin command '{name}' ({entry_point.value}) is not a click command.")
+        self.add_command(command, name)
+        return command
+
+
+@click.group(cls=LazyGroup)
 def pgflux_cli():
     """
     Main CLI group for PgFlux commands.
@@ -15,14 +80,5 @@ def pgflux_cli():
     pass
 
 
-# Registering commands
-pgflux_cli.add_command(init_cli, "init")
-pgflux_cli.add_command(install_cli, "install")
-pgflux_cli.add_command(start_cli, "start")
-pgflux_cli.add_command(stop_cli, "stop")
-pgflux_cli.add_command(status_cli, "status")
-pgflux_cli.add_command(run_cli, "run")  # Add the run command here
-
-
 if __name__ == "__main__":
     pgflux_cli()
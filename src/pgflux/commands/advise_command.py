@@ -0,0 +1,127 @@
+import click
+import json
+import sys
+
+from pgflux import advise, db, instrument, readiness, registry, top
+from pgflux.constants import DEFAULT_ADMIN_USER, DEFAULT_DBNAME, DEFAULT_SOCKET_DIR
+from pgflux.utils import format_size, parse_size
+
+
+@click.group(help="Recommend changes from the server's own statistics.")
+def advise_cli():
+    pass
+
+
+@advise_cli.command("indexes", help="Recommend missing indexes for the costliest statements and flag unused or redundant ones.")
+@click.option("--instance", "instance_name", default=None, help="Registered instance to analyze (default: the default instance).")
+@click.option("--u", "user", default=DEFAULT_ADMIN_USER, help=f"Role to connect as (default: {DEFAULT_ADMIN_USER}).")
+@click.option("--top", "limit", type=click.IntRange(1), default=20, show_default=True,
+              help="Statements by total execution time to analyze per database.")
+@click.option("--db", "databases", multiple=True, help="Only analyze these databases (repeatable).")
+@click.option("--method", type=click.Choice(advise.METHODS), default="auto", show_default=True,
+              help="How to try candidates: hypopg hypothetical indexes, or real ones built in a rolled-back "
+                   "transaction (auto: hypopg when available).")
+@click.option("--max-build-size", default="256M", show_default=True,
+              help="Largest table to build trial indexes on with the rollback method.")
+@click.option("--output", "-o", type=click.Path(dir_okay=False), default=None, help="Also write the SQL to this file.")
+@click.option("--json", "as_json", is_flag=True, help="Print the findings as JSON.")
+@instrument.instrumented("advise-indexes")
+def indexes_cli(instance_name, user, limit, databases, method, max_build_size, output, as_json):
+    """
+    Plans the top statements of pg_stat_statements, derives candidate indexes from their filters, join
+    conditions and sort keys, and keeps the candidates that lower the estimated cost. Indexes without scans
+    and indexes another one makes redundant are reported for removal.
+    """
+    try:
+        instance = registry.resolve(instance_name)
+        max_build_bytes = parse_size(max_build_size)
+    except (registry.RegistryError, ValueError) as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+    instrument.annotate(instance["version"])
+    pidinfo = readiness.read_pidfile(instance["data_dir"])
+    if not pidinfo or not readiness.process_alive(pidinfo["pid"]):
+        click.echo(f"PostgreSQL {instance['version']} is not running; start it first.")
+        sys.exit(1)
+    port = pidinfo["port"]
+    connect = dict(user=user, host=pidinfo["socket_dir"] or DEFAULT_SOCKET_DIR, version=instance["version"])
+    echo = click.echo if not as_json else lambda message: click.echo(message, err=True)
+
+    reports = []
+    try:
+        with db.connection(port, dbname=DEFAULT_DBNAME, **connect) as conn:
+            if not top.ensure_extension(conn):
+                click.echo(f"{top.EXTENSION} is not in shared_preload_libraries; add it with 'pgflux top' and "
+                           f"restart, then let the workload run before asking for advice.")
+                sys.exit(1)
+            with conn.cursor() as cur:
+                statements = advise.top_statements(cur, limit, databases)
+        by_database = {}
+        for statement in statements:
+            by_database.setdefault(statement["database"], []).append(statement)
+        for database in databases or sorted(by_database):
+            echo(f"Analyzing database {database}...")
+            with db.connection(port, dbname=database, **connect) as conn, conn.cursor() as cur:
+                indexes = advise.load_indexes(cur)
+                cur.execute(advise.STATS_RESET_SQL)
+                stats_reset = (cur.fetchone() or (None,))[0]
+                unused = advise.unused_indexes(cur)
+                dropped = {index["qualified"] for index in unused}
+                reports.append({
+                    "database": database,
+                    "statements": len(by_database.get(database, ())),
+                    "stats_reset": stats_reset.isoformat() if stats_reset else None,
+                    "missing": advise.evaluate(cur, by_database.get(database, []), max_build_bytes, method,
+                                               indexes, echo=echo),
+                    "unused": unused,
+                    # Unless the index that makes it redundant is about to go as unused
+                    "redundant": [dict(index, reason=f"{relation} {other['qualified']}")
+                                  for index, other, relation in advise.redundant_indexes(indexes)
+                                  if index["qualified"] not in dropped and other["qualified"] not in dropped],
+                })
+    except (db.DatabaseError, top.TopError, advise.AdviseError) as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        db.close_all(port)
+
+    if as_json:
+        click.echo(json.dumps(reports, indent=2, default=str))
+    else:
+        for line in script_lines(reports):
+            click.echo(line)
+    if output:
+        with open(output, "w") as f:
+            f.write("\n".join(script_lines(reports)) + "\n")
+        echo(f"Wrote {output}.")
+
+
+def script_lines(reports):
+    """
+    Renders the findings as a psql script: comments with the evidence, then the statements to run.
+    """
+    lines = ["-- CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block; run this with psql."]
+    for report in reports:
+        lines += ["", f"\\connect {report['database']}",
+                  f"-- {report['statements']} statement(s) analyzed"]
+        if report["missing"]:
+            lines.append("-- Missing indexes, by estimated execution time saved")
+        for recommendation in report["missing"]:
+            best = max(statement["reduction"] for statement in recommendation["statements"])
+            lines.append(f"-- saves ~{recommendation['estimated_saved_ms']:.0f} ms of recorded time over "
+                         f"{len(recommendation['statements'])} statement(s), cost up to {best * 100:.0f}% lower")
+            lines.append(recommendation["sql"])
+        if report["unused"]:
+            since = f"since {report['stats_reset']}" if report["stats_reset"] else "since statistics were reset"
+            lines.append(f"-- Unused indexes: no scans on this server {since}; check replicas before dropping")
+        for index in report["unused"]:
+            lines.append(f"-- {format_size(index['size'])} on {index['schema']}.{index['table']}")
+            lines.append(advise.drop_statement(index["qualified"]))
+        if report["redundant"]:
+            lines.append("-- Redundant indexes")
+        for index in report["redundant"]:
+            lines.append(f"-- {format_size(index['size'])}, {index['reason']}")
+            lines.append(advise.drop_statement(index["qualified"]))
+        if not (report["missing"] or report["unused"] or report["redundant"]):
+            lines.append("-- Nothing to change.")
+    return lines
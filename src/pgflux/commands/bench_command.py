@@ -0,0 +1,269 @@
+import click
+import datetime
+import os
+import subprocess
+import sys
+
+from pgflux import ann, bench, db, instrument, pool, readiness, registry, tune
+from pgflux.constants import DEFAULT_ADMIN_USER, DEFAULT_SOCKET_DIR
+
+
+def _int_list(value):
+    try:
+        numbers = [int(part) for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise click.BadParameter(f"'{value}' is not a comma-separated list of integers.")
+    if not numbers or min(numbers) < 1:
+        raise click.BadParameter(f"'{value}' must list positive integers.")
+    return numbers
+
+
+def _label(path, result):
+    started = datetime.datetime.fromtimestamp(result.get("started", 0)).strftime("%Y-%m-%d %H:%M:%S")
+    label = f" [{result['label']}]" if result.get("label") else ""
+    pooled = " via pool" if result.get("pool") else ""
+    return f"{os.path.basename(path)} ({result.get('version')} {result.get('profile')}{pooled}{label}, {started})"
+
+
+def _fmt(value, spec=".1f"):
+    return format(value, spec) if value is not None else "-"
+
+
+@click.group(help="Benchmark installed versions with pgbench and compare the results.")
+def bench_cli():
+    pass
+
+
+@bench_cli.command("run", help="Run a pgbench profile against one or more installed versions.")
+@click.option("--version", "versions", multiple=True,
+              help="Instance, or version of a single instance, to benchmark (repeatable; default: the default instance).")
+@click.option("--profile", type=click.Choice(sorted(bench.PROFILES)), default="tpcb", show_default=True, help="Workload.")
+@click.option("--script", "scripts", multiple=True, type=click.Path(exists=True, dir_okay=False),
+              help="pgbench script file for the custom profile (repeatable).")
+@click.option("--scale", default="10", show_default=True, help="Scale factor, or a comma-separated sweep (e.g. 1,10,100).")
+@click.option("--clients", default="1,4,16", show_default=True, help="Comma-separated client counts to ramp through.")
+@click.option("--duration", type=int, default=30, show_default=True, help="Seconds per run.")
+@click.option("--runs", type=int, default=3, show_default=True, help="Repetitions per point; compare needs at least 2.")
+@click.option("--warmup", type=int, default=0, show_default=True, help="Unrecorded seconds to run before each point.")
+@click.option("--label", default=None, help="Name for this result, e.g. the config or build being tested.")
+@click.option("--u", "user", default=DEFAULT_ADMIN_USER, help=f"Role to benchmark as (default: {DEFAULT_ADMIN_USER}).")
+@click.option("--pool", "through_pool", is_flag=True,
+              help="Run pgbench through the instance's running 'pgflux pool' instead of connecting directly.")
+@instrument.instrumented("bench")
+def run_cli(versions, profile, scripts, scale, clients, duration, runs, warmup, label, user, through_pool):
+    """
+    Runs every (scale, clients) point of the sweep `runs` times per version and stores one result per version.
+    """
+    scales, client_counts = _int_list(scale), _int_list(clients)
+    if profile == "custom" and not scripts:
+        click.echo("The custom profile needs at least one --script.")
+        sys.exit(1)
+    if profile != "custom" and scripts:
+        click.echo("--script is only used with --profile custom.")
+        sys.exit(1)
+
+    try:
+        instances = [registry.resolve(name) for name in versions] or [registry.resolve()]
+    except registry.RegistryError as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+
+    failed = False
+    for instance in instances:
+        version = instance["version"]
+        instrument.annotate(version)
+        try:
+            path = run_version(instance, profile, scripts, scales, client_counts, duration, runs, warmup, label, user,
+                               through_pool)
+            click.echo(f"Stored result {path}")
+        except (bench.BenchError, db.DatabaseError, subprocess.CalledProcessError, pool.PoolerError) as e:
+            detail = e.stderr.strip() if isinstance(e, subprocess.CalledProcessError) and e.stderr else e
+            click.echo(f"[{version}] Benchmark failed: {detail}")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+def run_version(instance, profile, scripts, scales, client_counts, duration, runs, warmup, label, user,
+                through_pool=False):
+    """
+    Benchmarks one running instance and returns the path of the stored result.
+
+    With through_pool, pgbench connects to the instance's pooler; setup still talks to the server directly.
+    """
+    version, data_dir = instance["version"], instance["data_dir"]
+    pgbench = os.path.join(instance["install_prefix"], "bin", "pgbench")
+    if not os.path.exists(pgbench):
+        raise bench.BenchError(f"pgbench not found at {pgbench}. Is PostgreSQL {version} installed?")
+    pidinfo = readiness.read_pidfile(data_dir)
+    if not pidinfo or not readiness.process_alive(pidinfo["pid"]):
+        raise bench.BenchError(f"PostgreSQL {version} is not running; start it first.")
+
+    port, host = pidinfo["port"], pidinfo["socket_dir"] or DEFAULT_SOCKET_DIR
+    connect = dict(host=host, user=user, version=version)
+    result = bench.new_result(version, profile, scripts, duration, runs, label)
+    bench_port, bench_host = port, host
+    if through_pool:
+        if not pool.running_pid(instance):
+            raise bench.BenchError(f"The pooler of '{instance['name']}' is not running; start it with 'pgflux pool start'.")
+        settings = pool.load_settings(instance)
+        bench_port, bench_host = settings["listen_port"], settings["listen_host"]
+        result["pool"] = {"pool_size": settings["pool_size"], "pool_sizes": settings["pool_sizes"]}
+    try:
+        bench.ensure_database(port, **connect)
+        result.update(bench.snapshot_config(port, **connect))
+        result["hardware"] = tune.detect_hardware(data_dir)
+
+        for scale in scales:
+            click.echo(f"[{version}] Initializing scale {scale}...")
+            bench.initialize(pgbench, scale, port, host, user, version=version)
+            # pgbench opens its own sessions; ours would only skew the client counts.
+            db.close_all(port)
+            for clients in client_counts:
+                if warmup:
+                    bench.run_pgbench(pgbench, profile, scripts, clients, warmup, bench_port, bench_host, user)
+                point = {"scale": scale, "clients": clients, "runs": []}
+                for index in range(runs):
+                    run = bench.run_pgbench(pgbench, profile, scripts, clients, duration, bench_port, bench_host,
+                                            user, seed=bench.DEFAULT_SEED + index)
+                    point["runs"].append(run)
+                    click.echo(f"[{version}] scale {scale} clients {clients} run {index + 1}/{runs}: "
+                               f"{run['tps']:.1f} tps, p95 {_fmt(run['p95_ms'], '.2f')} ms")
+                result["points"].append(point)
+    finally:
+        db.close_all(port)
+    return bench.save_result(result)
+
+
+@bench_cli.command("ann", help="Measure recall and latency of the pgfluxai ivfflat index against exact search.")
+@click.option("--version", "version", default=None, help="Instance, or version of a single instance (default: the default instance).")
+@click.option("--rows", type=int, default=100000, show_default=True, help="Generated vectors to index.")
+@click.option("--dimensions", type=click.IntRange(1, 2000), default=64, show_default=True, help="Vector dimensions.")
+@click.option("--queries", type=int, default=100, show_default=True, help="Query vectors to search for.")
+@click.option("-k", "k", type=int, default=10, show_default=True, help="Neighbours per query; recall is measured at k.")
+@click.option("--lists", type=int, default=None, help="ivfflat lists (default: one per 1000 rows).")
+@click.option("--probes", default="1,5,10,20", show_default=True, help="Comma-separated probe counts to measure.")
+@click.option("--metric", type=click.Choice(sorted(ann.METRICS)), default="l2", show_default=True, help="Distance metric.")
+@click.option("--u", "user", default=DEFAULT_ADMIN_USER, help=f"Role to benchmark as (default: {DEFAULT_ADMIN_USER}).")
+@instrument.instrumented("bench-ann")
+def ann_cli(version, rows, dimensions, queries, k, lists, probes, metric, user):
+    """
+    Loads clustered vectors, records the exact neighbours of each query, then builds the index and sweeps
+    pgfluxai.ivfflat_probes, reporting recall@k, queries per second and latency percentiles.
+    """
+    probe_counts = _int_list(probes)
+    lists = lists or ann.default_lists(rows)
+    try:
+        instance = registry.resolve(version)
+    except registry.RegistryError as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+    instrument.annotate(instance["version"])
+    pidinfo = readiness.read_pidfile(instance["data_dir"])
+    if not pidinfo or not readiness.process_alive(pidinfo["pid"]):
+        click.echo(f"PostgreSQL {instance['version']} is not running; start it first.")
+        sys.exit(1)
+
+    port, host = pidinfo["port"], pidinfo["socket_dir"] or DEFAULT_SOCKET_DIR
+    try:
+        result = ann.run(port, rows, dimensions, queries, k, lists, probe_counts, metric, echo=click.echo,
+                         host=host, user=user, version=instance["version"])
+    except (bench.BenchError, db.DatabaseError) as e:
+        click.echo(f"Benchmark failed: {e}")
+        sys.exit(1)
+    finally:
+        db.close_all(port)
+
+    exact = result["exact"]
+    click.echo(f"Index build: {result['build_seconds']:.1f}s for {rows} rows, {lists} lists")
+    click.echo(f"{'probes':>7} {'recall':>8} {'qps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    click.echo(f"{'exact':>7} {1:>8.3f} {_fmt(exact['qps']):>9} {_fmt(exact['p50_ms'], '.3f'):>9} "
+               f"{_fmt(exact['p95_ms'], '.3f'):>9} {_fmt(exact['p99_ms'], '.3f'):>9}")
+    for point in result["points"]:
+        click.echo(f"{point['probes']:>7} {point['recall']:>8.3f} {_fmt(point['qps']):>9} "
+                   f"{_fmt(point['p50_ms'], '.3f'):>9} {_fmt(point['p95_ms'], '.3f'):>9} {_fmt(point['p99_ms'], '.3f'):>9}")
+
+
+@bench_cli.command("list", help="List stored benchmark results.")
+@click.option("--version", default=None, help="Only show results for this version.")
+@click.option("--label", default=None, help="Only show results with this label.")
+def list_cli(version, label):
+    stored = bench.list_results(version=version, label=label)
+    for path, result in stored:
+        click.echo(_label(path, result))
+    if not stored:
+        click.echo("No benchmark results found.")
+
+
+@bench_cli.command("show", help="Show a stored result (default: the latest).")
+@click.argument("ref", required=False)
+def show_cli(ref):
+    if not ref:
+        stored = bench.list_results()
+        if not stored:
+            click.echo("No benchmark results found.")
+            return
+        path, result = stored[-1]
+    else:
+        try:
+            path, result = bench.load_result(ref)
+        except (OSError, ValueError) as e:
+            click.echo(f"Error: {e}")
+            sys.exit(1)
+    click.echo(f"Result {_label(path, result)}")
+    click.echo(f"Server {result.get('server_version')}, {result.get('duration')}s x {result.get('runs')} runs")
+    click.echo(f"{'scale':>6} {'clients':>8} {'tps':>12} {'avg ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for point in result["points"]:
+        for run in point["runs"]:
+            click.echo(f"{point['scale']:>6} {point['clients']:>8} {run['tps']:>12.1f} {_fmt(run['latency_avg_ms'], '.3f'):>9} "
+                       f"{_fmt(run['p50_ms'], '.3f'):>9} {_fmt(run['p95_ms'], '.3f'):>9} {_fmt(run['p99_ms'], '.3f'):>9}")
+
+
+@bench_cli.command("compare", help="Compare two results (default: the two most recent) with Welch's t-test.")
+@click.argument("refs", nargs=-1)
+@click.option("--alpha", type=float, default=0.05, show_default=True, help="Significance level.")
+@click.option("--fail-on-regression", is_flag=True, help="Exit with status 1 if TPS dropped significantly at any point.")
+def compare_cli(refs, alpha, fail_on_regression):
+    """
+    Reports per-point TPS changes and whether they are statistically significant.
+    """
+    try:
+        selected = [bench.load_result(ref) for ref in refs] if refs else bench.list_results()[-2:]
+    except (OSError, ValueError) as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+    if len(selected) != 2:
+        click.echo("Comparison needs exactly two results.")
+        sys.exit(1)
+
+    (base_path, base), (new_path, new) = selected
+    click.echo(f"Base: {_label(base_path, base)}")
+    click.echo(f"New:  {_label(new_path, new)}")
+    if base.get("profile") != new.get("profile"):
+        click.echo(f"Warning: comparing different profiles ({base.get('profile')} vs {new.get('profile')}).")
+    for name, old, cur in bench.setting_differences(base, new):
+        click.echo(f"  setting {name}: {old if old is not None else '(default)'} -> {cur if cur is not None else '(default)'}")
+
+    rows = bench.compare(base, new, alpha)
+    if not rows:
+        click.echo("The results share no (scale, clients) points.")
+        sys.exit(1)
+    click.echo(f"{'scale':>6} {'clients':>8} {'base tps':>12} {'new tps':>12} {'change':>9} {'p95 ms':>17} {'p-value':>9}")
+    regressions = 0
+    for row in rows:
+        verdict = ""
+        if row["significant"]:
+            verdict = "  faster" if row["change"] > 0 else "  SLOWER"
+            regressions += row["change"] < 0
+        p95 = f"{_fmt(row['base_p95_ms'], '.2f')} -> {_fmt(row['new_p95_ms'], '.2f')}"
+        click.echo(f"{row['scale']:>6} {row['clients']:>8} {row['base_tps']:>12.1f} {row['new_tps']:>12.1f} "
+                   f"{_fmt(row['change'], '+.1f'):>8}% {p95:>17} {_fmt(row['p_value'], '.4f'):>9}{verdict}")
+
+    if any(row["p_value"] is None for row in rows):
+        click.echo("Some points have fewer than two runs; their differences cannot be tested.")
+    if regressions:
+        click.echo(f"{regressions} point(s) are significantly slower (p < {alpha:g}).")
+        if fail_on_regression:
+            sys.exit(1)
+    else:
+        click.echo(f"No significant slowdowns (p < {alpha:g}).")
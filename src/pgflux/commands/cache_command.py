@@ -0,0 +1,52 @@
+import click
+import datetime
+
+from pgflux import build_cache
+from pgflux.utils import format_size
+
+
+@click.group(help="Manage the local cache of built PostgreSQL install trees.")
+def cache_cli():
+    """
+    Groups the build cache maintenance commands.
+    """
+    pass
+
+
+@cache_cli.command("list", help="List cached builds, most recently used first.")
+def cache_list_cli():
+    """
+    Prints one line per cached build with its size and last use.
+    """
+    entries = build_cache.list_entries()
+    if not entries:
+        click.echo("The build cache is empty.")
+        return
+
+    total = 0
+    for meta in entries:
+        last_used = datetime.datetime.fromtimestamp(meta.get("last_used", 0)).strftime("%Y-%m-%d %H:%M")
+        click.echo(f"{meta['key'][:12]}  {meta.get('version', '?'):<6} {meta.get('commit', '?')[:12]}  "
+                   f"{meta.get('profile', 'default'):<8}{format_size(meta.get('size', 0)):>8}  last used {last_used}")
+        total += meta.get("size", 0)
+    click.echo(f"{len(entries)} cached build(s), {format_size(total)} total.")
+
+
+@cache_cli.command("prune", help="Evict least recently used builds until the cache fits the size limit.")
+@click.option("--max-size", default=build_cache.DEFAULT_MAX_SIZE, show_default=True,
+              help="Maximum total size of the cache (e.g. 512M, 10G).")
+@click.option("--all", "prune_all", is_flag=True, help="Remove every cached build.")
+def cache_prune_cli(max_size, prune_all):
+    """
+    Applies size-based LRU eviction to the build cache.
+    """
+    try:
+        evicted = build_cache.prune(0 if prune_all else max_size)
+    except ValueError as e:
+        click.echo(str(e))
+        return
+
+    for meta in evicted:
+        click.echo(f"Evicted {meta['key'][:12]} ({meta.get('version', '?')}, {format_size(meta.get('size', 0))}).")
+    freed = sum(meta.get("size", 0) for meta in evicted)
+    click.echo(f"Evicted {len(evicted)} cached build(s), freed {format_size(freed)}.")
@@ -2,46 +2,53 @@ import click
 import os
 import subprocess
 
-INSTALL_PREFIX_TEMPLATE = "/usr/local/{version}"
-DATA_DIR_TEMPLATE = "{install_prefix}/data"
-PG_CTL_TEMPLATE = "{install_prefix}/bin/pg_ctl"
-CONFIG_FILE = "/usr/local/pgflux_installed_version.txt"
+from pgflux import db, instrument, registry, snapshot, templates, tune
 
-def detect_installed_version():
-    """
-    Reads the installed PostgreSQL version from the configuration file.
-    """
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as file:
-            return file.read().strip()
-    return None
-
-def write_installed_version(version):
-    """
-    Writes the installed PostgreSQL version to the configuration file.
-    """
-    try:
-        with open(CONFIG_FILE, "w") as file:
-            file.write(version)
-        click.echo(f"Installed version '{version}' recorded in {CONFIG_FILE}.")
-    except IOError as e:
-        click.echo(f"Error writing installed version to {CONFIG_FILE}: {e}")
-        raise
+DEFAULT_VERSION = "pg16"
 
 @click.command(help="Initialize the pgflux environment.")
 @click.option("--config", default="default.yaml", help="Path to the configuration file.")
 @click.option("--force-init", is_flag=True, help="Force reinitialization of the data directory if it exists.")
-def init_cli(config, force_init):
+@click.option("--p", "port", default=None, help="Port to write into postgresql.conf.")
+@click.option("-u", "user", default="postgres", help="Bootstrap superuser of the new cluster (default: postgres).")
+@click.option("--encoding", default="UTF8", help="Database encoding (default: UTF8).")
+@click.option("--locale", default=None, help="Cluster locale (default: no locale).")
+@click.option("-c", "--set", "overrides", multiple=True, help="Extra postgresql.conf setting as name=value (repeatable).")
+@click.option("--no-template", is_flag=True, help="Run initdb instead of cloning the cached template cluster.")
+@click.option("--tune", "tune_profile", type=click.Choice(tune.PROFILES), default=None,
+              help="Write hardware-aware settings for this workload profile (see 'pgflux tune').")
+@click.option("--instance", "instance_name", default=None, help="Registered instance to initialize (default: the default instance).")
+@click.option("--no-snapshot", is_flag=True, help="With --force-init, do not snapshot the existing cluster before removing it.")
+@instrument.instrumented("init")
+def init_cli(config, force_init, port, user, encoding, locale, overrides, no_template, tune_profile, instance_name,
+             no_snapshot):
     """
     Initializes the pgflux environment by checking and preparing PostgreSQL setup.
     """
-    version = detect_installed_version() or "pg16"
-    install_prefix = INSTALL_PREFIX_TEMPLATE.format(version=version)
-    pg_ctl = PG_CTL_TEMPLATE.format(install_prefix=install_prefix)
-    data_dir = DATA_DIR_TEMPLATE.format(install_prefix=install_prefix)
+    try:
+        instance = registry.resolve(instance_name) if instance_name else registry.get()
+    except registry.RegistryError as e:
+        click.echo(f"Error: {e}")
+        return
+    instance = instance or registry.new_instance(DEFAULT_VERSION, DEFAULT_VERSION)
+    version = instance["version"]
+    instrument.annotate(version)
+    install_prefix = instance["install_prefix"]
+    pg_ctl = registry.pg_ctl(instance)
+    data_dir = instance["data_dir"]
 
     click.echo(f"Initializing pgflux environment with config: {config}")
 
+    settings = {}
+    for override in overrides:
+        name, sep, value = override.partition("=")
+        if not sep or not name.strip():
+            click.echo(f"Invalid setting '{override}'. Use name=value.")
+            return
+        settings[name.strip()] = value.strip()
+    if port:
+        settings["port"] = port
+
     # Validate PostgreSQL binaries
     if not os.path.exists(pg_ctl):
         click.echo(f"Error: pg_ctl not found at {pg_ctl}. Is PostgreSQL {version} installed?")
@@ -52,8 +59,14 @@ def init_cli(config, force_init):
         if os.listdir(data_dir):
             if force_init:
                 click.echo(f"Data directory '{data_dir}' exists and is not empty. Forcing reinitialization.")
+                if not no_snapshot and os.path.isfile(os.path.join(data_dir, "PG_VERSION")):
+                    try:
+                        snapshot.snapshot_before_reinit(instance["name"], version, data_dir, echo=click.echo)
+                    except (db.DatabaseError, snapshot.SnapshotError, OSError) as e:
+                        click.echo(f"Could not snapshot the existing cluster: {e}. Use --no-snapshot to skip it.")
+                        return
                 try:
-                    subprocess.run(["rm", "-rf", data_dir], check=True)
+                    templates.remove_data_dir(data_dir)
                     os.makedirs(data_dir, exist_ok=True)
                 except Exception as e:
                     click.echo(f"Failed to clean and recreate data directory: {e}")
@@ -68,16 +81,32 @@ def init_cli(config, force_init):
         click.echo(f"Creating new data directory at '{data_dir}'...")
         os.makedirs(data_dir, exist_ok=True)
 
-    # Initialize PostgreSQL
+    # Initialize PostgreSQL from the pristine template cluster, creating it on first use
     try:
-        click.echo("Running initdb to initialize the database cluster...")
-        subprocess.run([os.path.join(install_prefix, "bin", "initdb"), "-D", data_dir, "--encoding=UTF8", "--no-locale"], check=True)
+        if no_template:
+            click.echo("Running initdb to initialize the database cluster...")
+        else:
+            click.echo("Cloning the template cluster (running initdb once if it is missing or stale)...")
+        templates.init_cluster(install_prefix, version, data_dir, encoding=encoding, locale=locale,
+                               username=user, use_template=not no_template)
+        if tune_profile:
+            # Included before the -c overrides so those still take precedence.
+            with instrument.phase("tune"):
+                tune.tune_cluster(data_dir, tune_profile)
+            click.echo(f"Wrote {tune.TUNE_FILE} for the {tune_profile} profile.")
+        templates.apply_overrides(data_dir, settings)
         click.echo("Database cluster initialized successfully.")
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, OSError) as e:
         click.echo(f"Error during initdb: {e}")
         return
 
-    # Write the installed version if initialization is successful
-    write_installed_version(version)
+    # Register the instance with the port it was initialized for
+    instance = dict(instance, port=registry.configured_port(data_dir), user=user)
+    try:
+        registry.register(instance)
+    except registry.RegistryError as e:
+        click.echo(f"Error registering instance '{instance['name']}': {e}")
+        return
+    click.echo(f"Instance '{instance['name']}' registered on port {instance['port']}.")
 
     click.echo(f"pgflux environment initialized successfully with config: {config}")
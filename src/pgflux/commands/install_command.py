@@ -1,54 +1,158 @@
 import click
 import subprocess
 import os
+import shutil
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pgflux import (build, build_cache, db, instrument, logs, pgo, readiness, registry, shutdown, snapshot, source,
+                    templates, tune)
+from pgflux.constants import EXTENSION_DIR, MIRROR_DIR, POSTGRES_GIT_URL
+from pgflux.jobs import JobServer
+from pgflux.utils import default_jobs
 
 POSTGRES_BRANCH_MAP = {
     "pg16": "REL_16_STABLE",
     "pg17": "REL_17_STABLE",
 }
 
-CONFIG_FILE = "/usr/local/pgai_installed_version.txt"
 INSTALL_PREFIX_TEMPLATE = "/usr/local/{version}"  # Default installation prefix
+BUILD_DIR_TEMPLATE = "/tmp/{version}_build"
+BUILD_LOG_TEMPLATE = "/tmp/{version}_build.log"
+EXTENSION_BUILD_TEMPLATE = "/tmp/{version}_pgfluxai_build"
+PGO_STAGING_TEMPLATE = "/tmp/{version}_pgo_install"
+PGO_PROFILE_DIR = ".pgflux-pgo"
+LOG_TAIL_LINES = 50  # Server log lines shown when the temporary start fails
+
+# Serializes fetches and worktree changes on the shared mirror
+_mirror_lock = threading.Lock()
 
 
-def parallel_build_args():
+class InstallError(Exception):
     """
-    Determine the number of CPUs for parallel build and return the `-j` argument.
+    Raised when installing a PostgreSQL version fails.
     """
-    cpu_count = os.cpu_count() or 1
-    return f"-j{cpu_count}"
 
 
-def write_installed_version(version):
+@click.command(help="Install PostgreSQL from source. Usage: pgflux install [version]... [options]")
+@click.argument("versions", nargs=-1, required=True)
+@click.option("--p", "port", default="5432", help="Port for PostgreSQL to listen on (default: 5432). Additional versions use the following ports.")
+@click.option("-d", "data_dir", default=None, help="Data directory for the database cluster (single version only).")
+@click.option("--clean", is_flag=True, help="Clean the build directory before rebuilding.")
+@click.option("--force-init", is_flag=True, help="Force reinitialization of the data directory if it exists.")
+@click.option("-u", "user", default="postgres", help="Default superuser for the PostgreSQL cluster (default: postgres).")
+@click.option("--prefix", "install_prefix", default=None, help="Installation prefix for PostgreSQL (default: /usr/local/{version}, single version only).")
+@click.option("--no-cache", "no_cache", is_flag=True, help="Always build from source and do not store the result in the build cache.")
+@click.option("--source", "source_path", default=POSTGRES_GIT_URL, help="Git URL, local mirror path or source tarball to install from.")
+@click.option("--depth", type=int, default=None, help="Fetch only the last N commits of the branch (shallow mirror).")
+@click.option("--filter", "filter_spec", default=None, help="Partial clone filter for the mirror, e.g. 'blob:none'.")
+@click.option("--offline", is_flag=True, help="Build from the existing mirror without fetching.")
+@click.option("-j", "--jobs", type=int, default=None, help="Total job slots shared by all builds (default: number of CPUs).")
+@click.option("--profile", "build_profile", type=click.Choice(build.BUILD_PROFILES), default="default",
+              help="Build profile: default (-O2), native (-O3 -march=native), lto (native + link-time optimization) "
+                   "or pgo (lto + profile-guided optimization from a training run).")
+@click.option("--pgo-workload", type=click.Path(exists=True, dir_okay=False), default=None,
+              help="SQL file to train PGO builds with (default: a pgbench TPC-B-like and read-only run).")
+@click.option("--debug-symbols", is_flag=True, help="Build with -g and frame pointers, for perf and gdb.")
+@click.option("--tune", "tune_profile", type=click.Choice(tune.PROFILES), default=None,
+              help="Write hardware-aware settings for this workload profile; memory is split between the versions.")
+@click.option("--name", default=None, help="Instance name to register (default: the version, single version only).")
+@click.option("--no-snapshot", is_flag=True, help="With --force-init, do not snapshot the existing cluster before removing it.")
+@click.option("--with-pgfluxai", is_flag=True,
+              help="Also build the pgfluxai vector extension; a failed extension build only warns.")
+def install_cli(versions, port, data_dir, clean, force_init, user, install_prefix, no_cache,
+                source_path, depth, filter_spec, offline, jobs, build_profile, pgo_workload, debug_symbols, tune_profile,
+                name, no_snapshot, with_pgfluxai):
     """
-    Writes the installed PostgreSQL version to the configuration file.
+    Install one or more PostgreSQL versions from source.
+
+    Several versions are built concurrently. All configure, make, install and
+    initdb phases draw from one jobserver, so the machine is kept busy without
+    being oversubscribed.
     """
+    unsupported = [v for v in versions if v not in POSTGRES_BRANCH_MAP]
+    if unsupported:
+        click.echo(f"Unsupported version '{unsupported[0]}'. Supported versions: {', '.join(POSTGRES_BRANCH_MAP.keys())}")
+        sys.exit(1)
+
+    if not port.isdigit():
+        click.echo("Invalid port specified. Please provide a numeric value.")
+        sys.exit(1)
+
+    versions = list(dict.fromkeys(versions))
+    concurrent = len(versions) > 1
+    if concurrent and (data_dir or install_prefix or name):
+        click.echo("The -d, --prefix and --name options can only be used when installing a single version.")
+        sys.exit(1)
+    if concurrent and source.is_tarball(source_path):
+        click.echo("A source tarball contains a single version; install one version at a time.")
+        sys.exit(1)
+
+    jobserver = JobServer(jobs or default_jobs())
+    if concurrent:
+        click.echo(f"Installing {', '.join(versions)} concurrently with {jobserver.slots} shared job slots.")
+
+    options = dict(clean=clean, force_init=force_init, user=user, no_cache=no_cache, source_path=source_path,
+                   depth=depth, filter_spec=filter_spec, offline=offline, tune_profile=tune_profile,
+                   clusters=len(versions), build_profile=build_profile, pgo_workload=pgo_workload,
+                   debug_symbols=debug_symbols, name=name, make_default=not concurrent,
+                   snapshot_first=not no_snapshot, with_pgfluxai=with_pgfluxai)
+    failed = []
     try:
-        with open(CONFIG_FILE, "w") as f:
-            f.write(version)
-        click.echo(f"Installed version '{version}' recorded in {CONFIG_FILE}.")
-    except IOError as e:
-        click.echo(f"Error writing installed version to {CONFIG_FILE}: {e}")
+        with ThreadPoolExecutor(max_workers=len(versions)) as pool:
+            futures = {
+                version: pool.submit(install_version, version, str(int(port) + index), data_dir, install_prefix,
+                                     jobserver, concurrent, **options)
+                for index, version in enumerate(versions)
+            }
+            for version, future in futures.items():
+                try:
+                    future.result()
+                except (InstallError, subprocess.CalledProcessError) as e:
+                    click.echo(f"[{version}] {e}" if concurrent else str(e))
+                    if concurrent:
+                        click.echo(f"[{version}] See {BUILD_LOG_TEMPLATE.format(version=version)} for the build output.")
+                    failed.append(version)
+    finally:
+        jobserver.close()
+
+    if failed:
+        click.echo(f"Installation failed for: {', '.join(failed)}")
         sys.exit(1)
 
 
-@click.command(help="Install PostgreSQL from source. Usage: pgflux install [version] [options]")
-@click.argument("version", required=True)
-@click.option("--p", "port", default="5432", help="Port for PostgreSQL to listen on (default: 5432).")
-@click.option("-d", "data_dir", default=None, help="Data directory for the database cluster.")
-@click.option("--clean", is_flag=True, help="Clean the build directory before rebuilding.")
-@click.option("--force-init", is_flag=True, help="Force reinitialization of the data directory if it exists.")
-@click.option("-u", "user", default="postgres", help="Default superuser for the PostgreSQL cluster (default: postgres).")
-@click.option("--prefix", "install_prefix", default=None, help="Installation prefix for PostgreSQL (default: /usr/local/{version}).")
-def install_cli(version, port, data_dir, clean, force_init, user, install_prefix):
+def install_version(version, port, data_dir, install_prefix, jobserver, concurrent=False, clean=False,
+                    force_init=False, user="postgres", no_cache=False, source_path=POSTGRES_GIT_URL,
+                    depth=None, filter_spec=None, offline=False, tune_profile=None, clusters=1,
+                    build_profile="default", pgo_workload=None, debug_symbols=False, name=None, make_default=True,
+                    snapshot_first=True, with_pgfluxai=False):
     """
-    Install PostgreSQL from source.
+    Builds, installs, initializes and registers a single PostgreSQL version.
+
+    When other versions are installed at the same time, progress lines are
+    prefixed with the version and tool output goes to a per-version log.
     """
-    if version not in POSTGRES_BRANCH_MAP:
-        click.echo(f"Unsupported version '{version}'. Supported versions: {', '.join(POSTGRES_BRANCH_MAP.keys())}")
-        sys.exit(1)
+    def echo(message):
+        click.echo(f"[{version}] {message}" if concurrent else message)
+
+    log = open(BUILD_LOG_TEMPLATE.format(version=version), "w") if concurrent else None
+    output = {"stdout": log, "stderr": subprocess.STDOUT} if log else {}
+    try:
+        with instrument.session("install", version):
+            _install_version(version, port, data_dir, install_prefix, jobserver, echo, output, clean, force_init,
+                             user, no_cache, source_path, depth, filter_spec, offline, tune_profile, clusters,
+                             build_profile, pgo_workload, debug_symbols, name, make_default, snapshot_first,
+                             with_pgfluxai)
+    finally:
+        if log:
+            log.close()
 
+
+def _install_version(version, port, data_dir, install_prefix, jobserver, echo, output, clean, force_init,
+                     user, no_cache, source_path, depth, filter_spec, offline, tune_profile=None, clusters=1,
+                     build_profile="default", pgo_workload=None, debug_symbols=False, name=None, make_default=True,
+                     snapshot_first=True, with_pgfluxai=False):
     branch = POSTGRES_BRANCH_MAP[version]
 
     if install_prefix is None:
@@ -60,104 +164,255 @@ def install_cli(version, port, data_dir, clean, force_init, user, install_prefix
     if data_dir is None:
         data_dir = os.path.join(install_prefix, "data")
 
-    click.echo(f"Installing PostgreSQL {version} from source...")
-    click.echo(f"Branch: {branch}")
-    click.echo(f"Install prefix: {install_prefix}")
-    click.echo(f"Data directory: {data_dir}")
-    click.echo(f"Port: {port}")
-    click.echo(f"Default superuser: {user}")
+    echo(f"Installing PostgreSQL {version} from source...")
+    echo(f"Branch: {branch}")
+    echo(f"Source: {source_path}")
+    echo(f"Install prefix: {install_prefix}")
+    echo(f"Data directory: {data_dir}")
+    echo(f"Port: {port}")
+    echo(f"Default superuser: {user}")
+    echo(f"Build profile: {build_profile}{' with debug symbols' if debug_symbols else ''}")
 
     # Automatically fix permissions if needed
     if not os.access(install_prefix, os.W_OK):
-        click.echo(f"Fixing permissions for directory '{install_prefix}'...")
+        echo(f"Fixing permissions for directory '{install_prefix}'...")
         try:
-            subprocess.run(["sudo", "mkdir", "-p", install_prefix], check=True)
-            subprocess.run(["sudo", "chown", "-R", f"{os.getlogin()}:{os.getlogin()}", install_prefix], check=True)
+            instrument.run("fix-permissions", ["sudo", "mkdir", "-p", install_prefix], check=True)
+            instrument.run("fix-permissions", ["sudo", "chown", "-R", f"{os.getlogin()}:{os.getlogin()}", install_prefix], check=True)
         except subprocess.CalledProcessError as e:
-            click.echo(f"Error fixing permissions for '{install_prefix}': {e}")
-            sys.exit(1)
+            raise InstallError(f"Error fixing permissions for '{install_prefix}': {e}")
 
-    # Prepare build directory
-    build_dir = f"/tmp/{version}_build"
-    if clean and os.path.exists(build_dir):
-        click.echo(f"Cleaning build directory: {build_dir}")
-        subprocess.run(["rm", "-rf", build_dir], check=True)
+    # Prepare build directory as a worktree of the shared mirror
+    build_dir = BUILD_DIR_TEMPLATE.format(version=version)
+    with _mirror_lock:
+        if clean and os.path.exists(build_dir):
+            echo(f"Cleaning build directory: {build_dir}")
+            source.remove_worktree(build_dir)
 
-    if not os.path.exists(build_dir):
-        click.echo("Cloning PostgreSQL source code...")
-        subprocess.run(["git", "clone", "https://github.com/postgres/postgres.git", build_dir], check=True)
+        if source.is_tarball(source_path):
+            echo(f"Extracting PostgreSQL source from {source_path}...")
+            commit = source.extract_tarball(source_path, build_dir)
+        else:
+            echo(f"Updating PostgreSQL mirror at {MIRROR_DIR} from {source_path}...")
+            try:
+                source.ensure_mirror(source_path, branch, depth=depth, filter_spec=filter_spec, offline=offline)
+            except RuntimeError as e:
+                raise InstallError(str(e))
+            echo(f"Checking out branch: {branch}")
+            commit = source.prepare_worktree(branch, build_dir)
 
-    click.echo(f"Checking out branch: {branch}")
-    subprocess.run(["git", "checkout", branch], cwd=build_dir, check=True)
+    # Reuse a cached install tree when commit, configure flags and compiler match
+    configure_args = [f"--prefix={install_prefix}", "--with-python"]
+    compiler = build_cache.compiler_version()
+    pgo_dir = os.path.join(build_dir, PGO_PROFILE_DIR)
+    env = build.build_environment(*build.profile_flags(build_profile, compiler, debug_symbols, "use", pgo_dir))
+    key_inputs = configure_args + build.configure_environment(env) + [f"contrib={','.join(build.CONTRIB_MODULES)}"]
+    extension = build.extension_fingerprint() if with_pgfluxai else None
+    if extension:
+        key_inputs.append(f"pgfluxai={extension}")
+    if build_profile == "pgo":
+        key_inputs.append(f"pgo-workload={pgo.workload_id(pgo_workload)}")
+    key = build_cache.cache_key(commit, key_inputs, compiler)
+    cache_exclude = []
+    if os.path.abspath(data_dir).startswith(os.path.abspath(install_prefix) + os.sep):
+        cache_exclude.append(os.path.relpath(data_dir, install_prefix))
 
-    # Configure the build
-    click.echo("Configuring PostgreSQL with Python support...")
-    subprocess.run(["./configure", f"--prefix={install_prefix}", "--with-python"], cwd=build_dir, check=True)
+    with instrument.phase("cache-restore"):
+        restored = not no_cache and build_cache.restore(key, install_prefix, exclude=cache_exclude)
+    if restored:
+        echo(f"Restored cached build {key[:12]} (commit {commit[:12]}) into {install_prefix}.")
+    else:
+        if build_profile == "pgo":
+            train_pgo(version, build_dir, pgo_dir, compiler, debug_symbols, pgo_workload, jobserver, echo, output)
 
-    # Build PostgreSQL
-    click.echo("Building PostgreSQL...")
-    subprocess.run(["make", parallel_build_args()], cwd=build_dir, check=True)
+        _build(build_dir, configure_args, env, jobserver, echo, output)
+        if with_pgfluxai and not install_extension(version, install_prefix, jobserver, echo, output):
+            # Do not cache a tree without the extension under a key that includes it
+            no_cache = True
+        build.write_build_info(install_prefix, {
+            "version": version,
+            "commit": commit,
+            "profile": build_profile,
+            "debug_symbols": debug_symbols,
+            "pgo_workload": pgo.workload_id(pgo_workload) if build_profile == "pgo" else None,
+            "compiler": compiler,
+            "cflags": env.get("CFLAGS", ""),
+            "ldflags": env.get("LDFLAGS", ""),
+        })
 
-    # Install PostgreSQL
-    click.echo("Installing PostgreSQL...")
-    subprocess.run(["make", parallel_build_args(), "install"], cwd=build_dir, check=True)
+        if not no_cache:
+            echo(f"Storing build {key[:12]} in the build cache...")
+            with instrument.phase("cache-store"):
+                build_cache.store(key, install_prefix, {
+                    "version": version,
+                    "branch": branch,
+                    "commit": commit,
+                    "configure": configure_args,
+                    "compiler": compiler,
+                    "profile": build_profile,
+                }, exclude=cache_exclude)
+            for evicted in build_cache.prune():
+                echo(f"Evicted cached build {evicted['key'][:12]} ({evicted.get('version')}).")
 
     # Handle data directory
     if os.path.exists(data_dir):
         if os.listdir(data_dir) and not force_init:
-            click.echo(f"Data directory '{data_dir}' exists and is not empty.")
-            click.echo("Use '--force-init' to reinitialize the data directory.")
-            sys.exit(1)
+            raise InstallError(f"Data directory '{data_dir}' exists and is not empty. "
+                               "Use '--force-init' to reinitialize the data directory.")
         else:
-            click.echo(f"Clearing existing data directory: {data_dir}")
-            subprocess.run(["rm", "-rf", data_dir], check=True)
+            if snapshot_first and os.path.isfile(os.path.join(data_dir, "PG_VERSION")):
+                try:
+                    snapshot.snapshot_before_reinit(name or version, version, data_dir, echo)
+                except (db.DatabaseError, snapshot.SnapshotError, OSError) as e:
+                    raise InstallError(f"Could not snapshot '{data_dir}' before reinitializing it: {e}. "
+                                       "Use --no-snapshot to skip the snapshot.")
+            echo(f"Clearing existing data directory: {data_dir}")
+            templates.remove_data_dir(data_dir)
     os.makedirs(data_dir, exist_ok=True)
 
-    # Initialize database cluster
-    initdb_path = os.path.join(install_prefix, "bin", "initdb")
-    click.echo("Initializing the database cluster...")
-    subprocess.run([initdb_path, "-D", data_dir, "--encoding=UTF8", "--no-locale", "--username=postgres"], check=True)
+    # Initialize database cluster from the template for these binaries
+    echo("Initializing the database cluster...")
+    with jobserver.slot():
+        templates.init_cluster(install_prefix, version, data_dir, username="postgres", **output)
 
     # Update postgresql.conf
-    postgresql_conf = os.path.join(data_dir, "postgresql.conf")
-    with open(postgresql_conf, "a") as conf:
-        conf.write(f"\nport = {port}\n")
+    templates.apply_overrides(data_dir, {"port": port, "shared_preload_libraries": "pg_stat_statements"})
+    if tune_profile:
+        with instrument.phase("tune"):
+            tune.tune_cluster(data_dir, tune_profile, clusters=clusters)
+        echo(f"Wrote {tune.TUNE_FILE} for the {tune_profile} profile.")
 
     # Start PostgreSQL temporarily for configuration
     pg_ctl_path = os.path.join(install_prefix, "bin", "pg_ctl")
     log_file = os.path.join(data_dir, "logfile")
 
-    click.echo("Starting PostgreSQL temporarily to configure the default superuser...")
+    echo("Starting PostgreSQL temporarily to configure the default superuser...")
     try:
-        subprocess.run([pg_ctl_path, "start", "-D", data_dir, "-l", log_file, "-w"], check=True)
+        readiness.start_server(pg_ctl_path, data_dir, log_file, phase="temp-start", **output)
 
         # Create superuser role if it doesn't exist
-        psql_path = os.path.join(install_prefix, "bin", "psql")
-        create_role_command = (
-            f"DO $$ BEGIN "
-            f"IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = '{user}') THEN "
-            f"CREATE ROLE {user} WITH LOGIN SUPERUSER PASSWORD '{user}'; "
-            f"END IF; END $$;"
-        )
-        subprocess.run(
-            [psql_path, "-U", "postgres", "-p", port, "-d", "postgres", "-c", create_role_command],
-            check=True,
-        )
-        click.echo(f"Superuser role '{user}' created successfully.")
-    except subprocess.CalledProcessError as e:
-        click.echo("Error configuring default superuser role.")
+        with instrument.phase("create-role"):
+            created = db.ensure_superuser(port, user, user, version=version)
+        db.close_all(port)
+        echo(f"Superuser role '{user}' {'created successfully' if created else 'already exists'}.")
+    except (subprocess.CalledProcessError, readiness.StartupError, db.DatabaseError) as e:
+        echo("Error configuring default superuser role.")
         if os.path.exists(log_file):
-            click.echo("PostgreSQL log output:")
-            with open(log_file, "r") as lf:
-                click.echo(lf.read())
+            echo(f"Last {LOG_TAIL_LINES} lines of {log_file}:")
+            for line in logs.tail(log_file, LOG_TAIL_LINES):
+                click.echo(line)
         else:
-            click.echo("No log file found.")
-        subprocess.run([pg_ctl_path, "stop", "-D", data_dir, "-m", "immediate"], check=True)
-        sys.exit(1)
+            echo("No log file found.")
+        instrument.run("temp-stop", [pg_ctl_path, "stop", "-D", data_dir, "-m", "immediate"], check=True, **output)
+        raise InstallError(f"Failed to configure PostgreSQL {version}: {e}")
 
-    subprocess.run([pg_ctl_path, "stop", "-D", data_dir, "-m", "immediate"], check=True)
+    instrument.run("temp-stop", [pg_ctl_path, "stop", "-D", data_dir, "-m", "immediate"], check=True, **output)
+
+    # Register the instance so the other commands find it
+    instance = registry.new_instance(name or version, version, install_prefix, data_dir, port, user)
+    try:
+        registry.register(instance, make_default)
+    except registry.RegistryError as e:
+        raise InstallError(str(e))
+    echo(f"Registered instance '{instance['name']}' in {registry.REGISTRY_FILE}.")
+    conflicts = registry.port_conflicts(instance)
+    if conflicts:
+        echo(f"Warning: port {port} is also configured for {', '.join(conflicts)}; only one can run at a time.")
 
-    # Record the installed version
-    write_installed_version(version)
+    echo(f"PostgreSQL installation and initialization complete at {install_prefix}.")
+
+
+def _build(build_dir, configure_args, env, jobserver, echo, output, stage=""):
+    """
+    Configures (when needed), builds and installs the tree in build_dir with the given environment.
+    """
+    # Configure the build, reusing config.status when nothing relevant changed
+    fingerprint = build.configure_fingerprint(build_dir, configure_args, env)
+    if build.needs_configure(build_dir, fingerprint):
+        echo("Configuring PostgreSQL with Python support...")
+        with jobserver.slot():
+            instrument.run(f"configure{stage}", ["./configure"] + configure_args, cwd=build_dir, check=True,
+                           env=env, **output)
+        build.record_configure(build_dir, fingerprint)
+    else:
+        echo("Configure flags and environment unchanged, reusing config.status.")
+
+    # Objects compiled with other flags (another profile) cannot be reused
+    if build.flags_changed(build_dir, env):
+        echo("Compiler flags changed, cleaning previous objects...")
+        with jobserver.slot():
+            instrument.run(f"make-clean{stage}", ["make", "clean"], cwd=build_dir, check=True, **output)
+    build.record_flags(build_dir, env)
+
+    # Build PostgreSQL, recompiling only what changed since the last checkout
+    echo("Building PostgreSQL...")
+    make_env = jobserver.make_env(env)
+    objects_before = build.snapshot_objects(build_dir)
+    with jobserver.slot():
+        instrument.run(f"make{stage}", ["make"], cwd=build_dir, check=True, env=make_env,
+                       pass_fds=jobserver.pass_fds, **output)
+    rebuilt, reused = build.compare_objects(objects_before, build.snapshot_objects(build_dir))
+    echo(f"Rebuilt {rebuilt} object(s), reused {reused}.")
+
+    # Install PostgreSQL
+    echo("Installing PostgreSQL...")
+    with jobserver.slot():
+        instrument.run(f"make-install{stage}", ["make", "install"], cwd=build_dir, check=True,
+                       env=make_env, pass_fds=jobserver.pass_fds, **output)
 
-    click.echo(f"\nPostgreSQL installation and initialization complete at {install_prefix}.")
+    # Build and install the contrib modules pgflux uses
+    for module in build.CONTRIB_MODULES:
+        module_dir = os.path.join(build_dir, "contrib", module)
+        if not os.path.isdir(module_dir):
+            continue
+        with jobserver.slot():
+            instrument.run(f"contrib-{module}{stage}", ["make", "install"], cwd=module_dir, check=True,
+                           env=make_env, pass_fds=jobserver.pass_fds, **output)
+
+
+def install_extension(version, install_prefix, jobserver, echo, output):
+    """
+    Compiles the pgfluxai extension with PGXS against the freshly installed server and installs it.
+    Returns whether it was installed; a failed build is reported but does not fail the server install.
+
+    The sources are copied to a per-version build directory, so concurrent installs do not share objects.
+    """
+    if not os.path.isdir(EXTENSION_DIR):
+        echo(f"pgfluxai sources not found at {EXTENSION_DIR}, skipping the extension.")
+        return False
+    extension_build_dir = EXTENSION_BUILD_TEMPLATE.format(version=version)
+    # Objects from a build against another server or profile would look newer than the copied sources
+    shutil.rmtree(extension_build_dir, ignore_errors=True)
+    shutil.copytree(EXTENSION_DIR, extension_build_dir)
+    pg_config = os.path.join(install_prefix, "bin", "pg_config")
+    echo("Building the pgfluxai extension...")
+    try:
+        with jobserver.slot():
+            instrument.run("extension", ["make", f"PG_CONFIG={pg_config}", "install"],
+                           cwd=os.path.join(extension_build_dir, "pgfluxai"), check=True, **output)
+    except (OSError, subprocess.CalledProcessError) as e:
+        echo(f"Warning: building the pgfluxai extension failed ({e}); PostgreSQL is installed without it.")
+        return False
+    return True
+
+
+def train_pgo(version, build_dir, pgo_dir, compiler, debug_symbols, workload, jobserver, echo, output):
+    """
+    Builds instrumented binaries into a staging prefix and collects profiles from a training run.
+    """
+    shutil.rmtree(pgo_dir, ignore_errors=True)
+    os.makedirs(pgo_dir)
+    staging = PGO_STAGING_TEMPLATE.format(version=version)
+    shutil.rmtree(staging, ignore_errors=True)
+    env = build.build_environment(*build.profile_flags("pgo", compiler, debug_symbols, "generate", pgo_dir))
+
+    echo("Building instrumented binaries for profile-guided optimization...")
+    _build(build_dir, [f"--prefix={staging}", "--with-python"], env, jobserver, echo, output, stage="-pgo-generate")
+    echo(f"Training on {'the workload in ' + workload if workload else 'pgbench'} to collect profiles...")
+    try:
+        with jobserver.slot():
+            pgo.train(os.path.join(staging, "bin"), pgo_dir, compiler, workload, **output)
+    except (RuntimeError, readiness.StartupError, shutdown.ShutdownError) as e:
+        raise InstallError(f"PGO training failed: {e}")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
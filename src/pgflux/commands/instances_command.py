@@ -0,0 +1,84 @@
+import click
+import os
+import sys
+
+from pgflux import registry
+
+
+def show_instances(instances):
+    """
+    Prints one line per registered instance; the default instance is marked with '*'.
+    """
+    if not instances:
+        click.echo("No PostgreSQL instances are registered.")
+        return
+    default = (registry.get() or {}).get("name")
+    click.echo(f"  {'name':<16} {'version':<8} {'port':>6} {'state':<14} {'pid':>8}  data directory")
+    for instance in instances:
+        state, pid = registry.state(instance)
+        marker = "*" if instance["name"] == default else " "
+        role = f" (replica of {instance['primary']})" if instance.get("primary") else ""
+        click.echo(f"{marker} {instance['name']:<16} {instance['version']:<8} {instance['port']:>6} {state:<14} "
+                   f"{pid or '-':>8}  {instance['data_dir']}{role}")
+
+
+@click.group(help="Manage the registry of PostgreSQL instances pgflux operates on.")
+def instances_cli():
+    pass
+
+
+@instances_cli.command("list", help="List registered instances and whether they are running.")
+def list_cli():
+    try:
+        show_instances(registry.instances())
+    except registry.RegistryError as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+
+
+@instances_cli.command("add", help="Register an existing cluster.")
+@click.argument("name")
+@click.option("--version", required=True, help="PostgreSQL version whose binaries run the cluster (e.g. pg16).")
+@click.option("--prefix", "install_prefix", default=None, help="Installation prefix (default: /usr/local/{version}).")
+@click.option("--d", "data_dir", default=None, help="Data directory (default: {prefix}/data).")
+@click.option("--p", "port", type=int, default=None, help="Port (default: read from postgresql.conf).")
+@click.option("--u", "user", default="postgres", help="Superuser of the cluster (default: postgres).")
+@click.option("--default", "make_default", is_flag=True, help="Make this the instance commands use by default.")
+def add_cli(name, version, install_prefix, data_dir, port, user, make_default):
+    instance = registry.new_instance(name, version, install_prefix, data_dir, port, user)
+    if not os.path.exists(registry.pg_ctl(instance)):
+        click.echo(f"Error: pg_ctl not found at {registry.pg_ctl(instance)}.")
+        sys.exit(1)
+    if not os.path.exists(os.path.join(instance["data_dir"], "PG_VERSION")):
+        click.echo(f"Error: {instance['data_dir']} is not an initialized data directory.")
+        sys.exit(1)
+    try:
+        registry.register(instance, make_default)
+    except registry.RegistryError as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+    click.echo(f"Registered instance '{name}' ({version}, port {instance['port']}, {instance['data_dir']}).")
+    conflicts = registry.port_conflicts(instance)
+    if conflicts:
+        click.echo(f"Warning: port {instance['port']} is also configured for {', '.join(conflicts)}.")
+
+
+@instances_cli.command("remove", help="Forget an instance; its installation and data are left in place.")
+@click.argument("name")
+def remove_cli(name):
+    if registry.unregister(name) is None:
+        click.echo(f"No instance named '{name}'.")
+        sys.exit(1)
+    click.echo(f"Removed instance '{name}' from the registry.")
+
+
+@instances_cli.command("default", help="Show or set the instance commands use when --instance is not given.")
+@click.argument("name", required=False)
+def default_cli(name):
+    try:
+        if name:
+            registry.set_default(name)
+        click.echo(f"Default instance: {registry.resolve()['name']}")
+    except registry.RegistryError as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
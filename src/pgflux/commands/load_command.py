@@ -0,0 +1,160 @@
+import click
+import concurrent.futures
+import sys
+import time
+
+from pgflux import db, instrument, load, readiness, registry
+from pgflux.constants import DEFAULT_ADMIN_USER, DEFAULT_DBNAME, DEFAULT_SOCKET_DIR
+
+MB = 1024 * 1024
+
+
+def _report(progress):
+    rows_per_second, mb_per_second = progress.rates()
+    percent = 100.0 * progress.read_bytes / progress.total_bytes if progress.total_bytes else 100.0
+    click.echo(f"  {percent:5.1f}%  {progress.lines:>12} rows  {progress.sent_bytes / MB:>10.1f} MB  "
+               f"{rows_per_second:>10.0f} rows/s  {mb_per_second:>7.1f} MB/s")
+
+
+@click.command(help="Bulk-load CSV/TSV files (optionally .gz) with COPY over parallel connections.")
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--table", default=None, help="Target table for every file (default: the file name, e.g. public.users.csv).")
+@click.option("--jobs", "-j", type=int, default=4, show_default=True, help="Parallel connections.")
+@click.option("--chunk-size", type=int, default=load.DEFAULT_CHUNK_SIZE // MB, show_default=True,
+              help="MB per chunk of an uncompressed file; 0 loads each file whole (needed for CSV with quoted newlines).")
+@click.option("--header", is_flag=True, help="The first line of every file is a header.")
+@click.option("--delimiter", default=None, help="Field delimiter (default: ',' for CSV, tab for TSV).")
+@click.option("--null", default=None, help="String that represents NULL (default: COPY's).")
+@click.option("--drop-indexes", is_flag=True, help="Drop non-unique secondary indexes during the load and rebuild them after.")
+@click.option("--unlogged", is_flag=True, help="Switch the tables to UNLOGGED during the load and back afterwards.")
+@click.option("--interval", type=float, default=2.0, show_default=True, help="Seconds between progress lines.")
+@click.option("--instance", "instance_name", default=None, help="Registered instance to load into (default: the default instance).")
+@click.option("--db", "dbname", default=DEFAULT_DBNAME, help=f"Database to load into (default: {DEFAULT_DBNAME}).")
+@click.option("--u", "user", default=DEFAULT_ADMIN_USER, help=f"Role to load as (default: {DEFAULT_ADMIN_USER}).")
+@instrument.instrumented("load")
+def load_cli(paths, table, jobs, chunk_size, header, delimiter, null, drop_indexes, unlogged, interval, instance_name,
+             dbname, user):
+    """
+    Splits large files into line-aligned byte ranges and streams each through COPY FROM STDIN, so memory use
+    stays flat however large the input is.
+    """
+    try:
+        instance = registry.resolve(instance_name)
+    except registry.RegistryError as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+    version = instance["version"]
+    instrument.annotate(version)
+    pidinfo = readiness.read_pidfile(instance["data_dir"])
+    if not pidinfo or not readiness.process_alive(pidinfo["pid"]):
+        click.echo(f"PostgreSQL {version} is not running; start it first.")
+        sys.exit(1)
+    port = pidinfo["port"]
+    connect = dict(user=user, dbname=dbname, host=pidinfo["socket_dir"] or DEFAULT_SOCKET_DIR)
+
+    try:
+        with instrument.phase("plan"):
+            chunks = load.plan(paths, table, chunk_size * MB, header)
+    except (OSError, load.LoadError) as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+    tables = sorted({chunk["table"] for chunk in chunks})
+    progress = load.Progress(sum(chunk["end"] - chunk["start"] for chunk in chunks))
+    click.echo(f"Loading {len(chunks)} chunks ({progress.total_bytes / MB:.1f} MB) into {', '.join(tables)} "
+               f"over {jobs} connections.")
+
+    dropped, unlogged_tables, failed = [], [], True
+    try:
+        with instrument.phase("prepare"), db.connection(port, version=version, **connect) as conn:
+            for name in tables:
+                if drop_indexes:
+                    for index, definition in load.secondary_indexes(conn, name):
+                        load.drop_index(conn, index)
+                        dropped.append(definition)
+                        click.echo(f"Dropped index {index}; it is rebuilt after the load.")
+                if unlogged and load.is_logged(conn, name):
+                    load.set_logged(conn, name, False)
+                    unlogged_tables.append(name)
+        db.close_all(port)
+
+        progress.started = time.monotonic()
+        loader = load.Loader(lambda: db.connect(port, **connect), progress, delimiter, null)
+        try:
+            with instrument.phase("copy"):
+                failed = not copy_chunks(loader, chunks, jobs, interval)
+        finally:
+            loader.close()
+        if not failed:
+            elapsed = max(time.monotonic() - progress.started, 1e-9)
+            click.echo(f"Loaded {progress.rows} rows ({progress.sent_bytes / MB:.1f} MB) in {elapsed:.1f}s: "
+                       f"{progress.rows / elapsed:.0f} rows/s, {progress.sent_bytes / MB / elapsed:.1f} MB/s.")
+    except db.DatabaseError as e:
+        click.echo(f"Error preparing {', '.join(tables)}: {e}")
+    finally:
+        db.close_all(port)
+        # Tables are switched back and indexes rebuilt even after a failed or interrupted load; committed
+        # chunks stay.
+        restored = restore(port, version, connect, unlogged_tables, dropped, jobs)
+    if failed or not restored:
+        sys.exit(1)
+
+
+def copy_chunks(loader, chunks, jobs, interval):
+    """
+    Loads all chunks on `jobs` threads, printing progress every interval. Stops at the first failure and
+    returns False; chunks already committed are not rolled back.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        pending = {pool.submit(loader.load_chunk, chunk) for chunk in chunks}
+        try:
+            while pending:
+                done, pending = concurrent.futures.wait(pending, timeout=interval,
+                                                        return_when=concurrent.futures.FIRST_EXCEPTION)
+                for future in done:
+                    if future.exception():
+                        raise future.exception()
+                _report(loader.progress)
+        except (db.DatabaseError, load.LoadError, OSError) as e:
+            click.echo(f"Load failed: {e}")
+            click.echo(f"{loader.progress.chunks} of {len(chunks)} chunks were committed before the failure.")
+            return False
+        finally:
+            for future in pending:
+                future.cancel()
+    return True
+
+
+def restore(port, version, connect, unlogged_tables, definitions, jobs):
+    """
+    Switches tables back to LOGGED and rebuilds the dropped indexes in parallel. Returns False on failure.
+    """
+    ok = True
+    if unlogged_tables:
+        try:
+            with instrument.phase("restore"), db.connection(port, version=version, **connect) as conn:
+                for name in unlogged_tables:
+                    click.echo(f"Switching {name} back to LOGGED...")
+                    load.set_logged(conn, name, True)
+        except db.DatabaseError as e:
+            click.echo(f"Failed to switch {', '.join(unlogged_tables)} back to LOGGED: {e}")
+            ok = False
+        finally:
+            db.close_all(port)
+
+    if not definitions:
+        return ok
+    click.echo(f"Rebuilding {len(definitions)} indexes...")
+    loader = load.Loader(lambda: db.connect(port, **connect), None)
+    try:
+        with instrument.phase("rebuild"), \
+                concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(jobs, len(definitions)))) as pool:
+            futures = {pool.submit(loader.execute, definition): definition for definition in definitions}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                except (db.DatabaseError, load.LoadError) as e:
+                    click.echo(f"Failed to rebuild index ({e}); run it by hand:\n  {futures[future]};")
+                    ok = False
+    finally:
+        loader.close()
+    return ok
@@ -0,0 +1,116 @@
+import click
+import os
+import time
+
+from pgflux import logs, readiness, registry
+
+
+def _fmt(value):
+    return f"{value:.2f}" if value is not None else "-"
+
+
+def print_report(stats, top, sort):
+    """
+    Prints the slowest statement fingerprints followed by checkpoint, autovacuum, lock and error summaries.
+    """
+    statements = logs.top_statements(stats, top, sort)
+    if statements:
+        click.echo(f"{'calls':>8} {'total ms':>12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}  query")
+        for entry in statements:
+            p50, p95, p99 = logs.percentiles(entry)
+            click.echo(f"{entry['count']:>8} {entry['total_ms']:>12.1f} {_fmt(p50):>9} {_fmt(p95):>9} {_fmt(p99):>9} "
+                       f"{entry['max_ms']:>9.2f}  {entry['query'][:120]}")
+    else:
+        click.echo("No statement durations logged. Set log_min_duration_statement to record slow queries.")
+    if stats.unattributed_durations:
+        click.echo(f"{stats.unattributed_durations} duration lines had no statement text (log_duration without "
+                   "log_min_duration_statement).")
+
+    checkpoints = stats.checkpoints
+    if checkpoints["completed"] or checkpoints["started"]:
+        reasons = ", ".join(f"{reason} {count}" for reason, count in sorted(checkpoints["started"].items()))
+        click.echo(f"Checkpoints: {checkpoints['completed']} completed, {checkpoints['buffers']} buffers written, "
+                   f"{checkpoints['total_seconds']:.1f}s total" + (f" (started: {reasons})" if reasons else ""))
+    if checkpoints["too_frequent"]:
+        click.echo(f"  {checkpoints['too_frequent']} 'checkpoints are occurring too frequently' warnings; "
+                   "consider raising max_wal_size.")
+
+    if stats.autovacuum:
+        click.echo("Autovacuum (most time first):")
+        busiest = sorted(stats.autovacuum.items(), key=lambda item: item[1]["seconds"], reverse=True)[:top]
+        for table, entry in busiest:
+            click.echo(f"  {table}: {entry['vacuum']} vacuum, {entry['analyze']} analyze, {entry['seconds']:.1f}s")
+
+    locks = stats.locks
+    if locks["waits"] or locks["deadlocks"] or locks["timeouts"]:
+        waits = ", ".join(f"{mode} {count}" for mode, count in sorted(locks["waits"].items()))
+        click.echo(f"Lock waits: {waits or 'none'}; longest {locks['max_wait_ms']:.0f} ms, "
+                   f"{locks['deadlocks']} deadlocks, {locks['timeouts']} lock timeouts")
+    if stats.levels:
+        click.echo("Errors: " + ", ".join(f"{level} {count}" for level, count in sorted(stats.levels.items())))
+
+
+@click.command(help="Summarize slow queries, checkpoints, autovacuum and lock waits from the server log.")
+@click.option("--d", "data_dir", default=None, help="Data directory whose logfile to read (default: the instance's).")
+@click.option("--instance", "instance_name", default=None, help="Registered instance whose log to read (default: the default instance).")
+@click.option("--file", "log_file", default=None, type=click.Path(dir_okay=False), help="Log file to read instead.")
+@click.option("--reset", is_flag=True, help="Discard the saved offset and aggregates and rescan from the start.")
+@click.option("--follow", "-f", is_flag=True, help="Keep reading as the log grows and print a summary periodically.")
+@click.option("--interval", type=float, default=10.0, help="Seconds between summaries in follow mode (default: 10).")
+@click.option("--top", type=int, default=10, help="Number of statements and tables to show (default: 10).")
+@click.option("--sort", type=click.Choice(["total", "count", "mean", "p95"]), default="total",
+              help="Order statements by total time, calls, mean or p95 latency (default: total).")
+def logs_cli(data_dir, instance_name, log_file, reset, follow, interval, top, sort):
+    """
+    Reads the log from where the previous run stopped and reports the accumulated aggregates.
+    """
+    if not log_file:
+        if not data_dir:
+            try:
+                data_dir = registry.resolve(instance_name)["data_dir"]
+            except registry.RegistryError as e:
+                click.echo(f"Error: {e} Use --d or --file.")
+                return
+        log_file = os.path.join(data_dir, "logfile")
+    if not os.path.isfile(log_file):
+        click.echo(f"Error: Log file not found at {log_file}.")
+        return
+
+    state = {"inode": None, "offset": 0, "pending": None, "stats": logs.LogStats()} if reset else logs.load_state(log_file)
+    try:
+        scanned = logs.scan(log_file, state)
+    except OSError as e:
+        click.echo(f"Error reading {log_file}: {e}")
+        return
+    logs.save_state(log_file, state)
+    click.echo(f"Read {scanned} new bytes of {log_file}.")
+    print_report(state["stats"], top, sort)
+    if follow:
+        follow_log(log_file, state, interval, top, sort)
+
+
+def follow_log(log_file, state, interval, top, sort):
+    """
+    Scans new lines as they are written; memory stays bounded by the LogStats caps.
+    """
+    watcher = readiness.DirectoryWatcher([os.path.dirname(os.path.abspath(log_file))])
+    analyzer = logs.LogAnalyzer(state["stats"])
+    next_report = time.monotonic() + interval
+    click.echo("Following the log; press Ctrl-C to stop.")
+    try:
+        while True:
+            watcher.wait(max(next_report - time.monotonic(), 0))
+            try:
+                logs.scan(log_file, state, analyzer)
+            except FileNotFoundError:
+                continue  # rotated away; the next file is picked up when it appears
+            if time.monotonic() >= next_report:
+                logs.save_state(log_file, state)
+                click.echo(f"--- {time.strftime('%H:%M:%S')} ---")
+                print_report(state["stats"], top, sort)
+                next_report = time.monotonic() + interval
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        logs.save_state(log_file, state)
@@ -0,0 +1,137 @@
+import click
+import json
+import sys
+
+from pgflux import db, instrument, maintain, readiness, registry
+from pgflux.constants import DEFAULT_ADMIN_USER, DEFAULT_DBNAME, DEFAULT_SOCKET_DIR
+from pgflux.utils import format_size, parse_size
+
+
+@click.command(help="Vacuum, analyze and reindex what needs it most, throttled and within a time budget.")
+@click.option("--instance", "instance_name", default=None, help="Registered instance to maintain (default: the default instance).")
+@click.option("--u", "user", default=DEFAULT_ADMIN_USER, help=f"Role to connect as (default: {DEFAULT_ADMIN_USER}).")
+@click.option("--db", "databases", multiple=True, help="Only maintain these databases (repeatable; default: all).")
+@click.option("--jobs", "-j", type=click.IntRange(1), default=2, show_default=True,
+              help="Connections working on different tables at once.")
+@click.option("--parallel", type=click.IntRange(0), default=None,
+              help="Parallel workers per VACUUM for its indexes (PostgreSQL 13+; default: the server decides).")
+@click.option("--cost-limit", type=click.IntRange(1, 10000), default=200, show_default=True,
+              help="vacuum_cost_limit: work done before each throttling pause. Does not apply to REINDEX.")
+@click.option("--cost-delay", type=click.FloatRange(0, 100), default=2.0, show_default=True,
+              help="vacuum_cost_delay in milliseconds; 0 disables throttling.")
+@click.option("--budget", type=click.FloatRange(0, min_open=True), default=None,
+              help="Minutes to work for; no task starts after that and running VACUUMs stop (default: no limit).")
+@click.option("--dead-ratio", type=click.FloatRange(0, 1), default=maintain.DEFAULT_THRESHOLDS["dead_ratio"],
+              show_default=True, help="Dead share of a table's tuples that calls for VACUUM.")
+@click.option("--index-bloat", type=click.FloatRange(0, 1),
+              default=maintain.DEFAULT_THRESHOLDS["index_bloat_ratio"], show_default=True,
+              help="Estimated bloat share of an index that calls for REINDEX.")
+@click.option("--min-index-bloat", default="8M", show_default=True, help="Smallest estimated bloat worth a REINDEX.")
+@click.option("--no-reindex", is_flag=True, help="Only vacuum and analyze.")
+@click.option("--dry-run", is_flag=True, help="Show the ranked plan without running it.")
+@click.option("--json", "as_json", is_flag=True, help="Print the plan or results as JSON.")
+@instrument.instrumented("maintain")
+def maintain_cli(instance_name, user, databases, jobs, parallel, cost_limit, cost_delay, budget, dead_ratio,
+                 index_bloat, min_index_bloat, no_reindex, dry_run, as_json):
+    """
+    Estimates dead tuples, stale statistics and btree bloat from pg_stat_user_tables, pg_class and pg_stats,
+    ranks the resulting VACUUM, ANALYZE and REINDEX CONCURRENTLY tasks by the space or rows they concern,
+    and runs them largest first, reporting the time spent and bytes reclaimed per object.
+    """
+    try:
+        instance = registry.resolve(instance_name)
+        thresholds = {"dead_ratio": dead_ratio, "index_bloat_ratio": index_bloat,
+                      "min_index_bloat": parse_size(min_index_bloat)}
+    except (registry.RegistryError, ValueError) as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+    instrument.annotate(instance["version"])
+    pidinfo = readiness.read_pidfile(instance["data_dir"])
+    if not pidinfo or not readiness.process_alive(pidinfo["pid"]):
+        click.echo(f"PostgreSQL {instance['version']} is not running; start it first.")
+        sys.exit(1)
+    port = pidinfo["port"]
+    host = pidinfo["socket_dir"] or DEFAULT_SOCKET_DIR
+    echo = click.echo if not as_json else lambda message: click.echo(message, err=True)
+
+    tasks = []
+    bloated = []
+    try:
+        if not databases:
+            databases = [row[0] for row in db.query(port, maintain.DATABASES_SQL, user=user,
+                                                    dbname=DEFAULT_DBNAME, host=host,
+                                                    version=instance["version"])]
+        for database in databases:
+            with db.connection(port, user=user, dbname=database, host=host, version=instance["version"]) as conn:
+                with conn.cursor() as cur:
+                    found, tables, _ = maintain.collect(cur, database, thresholds, reindex=not no_reindex)
+            tasks += found
+            bloated += [dict(table, database=database) for table in maintain.bloated_tables(tables)]
+    except (db.DatabaseError, maintain.MaintainError) as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        db.close_all(port)
+    tasks.sort(key=lambda task: task["score"], reverse=True)
+
+    if dry_run or not tasks:
+        if as_json:
+            click.echo(json.dumps({"tasks": tasks, "bloated_tables": bloated}, indent=2, default=str))
+        else:
+            _print_plan(tasks, bloated)
+        return
+
+    def connect(database):
+        try:
+            return db.connect(port, user=user, dbname=database, host=host, autocommit=True)
+        except db.DatabaseError as e:
+            raise maintain.MaintainError(f"Could not connect to {database}: {e}") from e
+
+    # Tasks on the same table share a queue and so a connection
+    echo(f"Running {len(tasks)} task(s) on {min(jobs, len(maintain.table_queues(tasks)))} connection(s)"
+         + (f" within {budget:g} minute(s)." if budget else "."))
+    runner = maintain.Runner(connect, jobs=jobs, parallel=parallel, cost_delay=cost_delay, cost_limit=cost_limit,
+                             budget=budget * 60 if budget else None,
+                             report=None if as_json else lambda result: click.echo(_result_line(result)))
+    results = runner.run(tasks)
+    if as_json:
+        click.echo(json.dumps(results, indent=2, default=str))
+    else:
+        done = [result for result in results if result["status"] == "done"]
+        click.echo(f"{len(done)} of {len(results)} task(s) done in {sum(r['seconds'] for r in results):.1f}s of "
+                   f"connection time, {format_size(sum(r['reclaimed'] for r in done))} reclaimed.")
+        _print_bloated(bloated)
+    if any(result["status"] == "failed" for result in results):
+        sys.exit(1)
+
+
+def _statement(task):
+    return "VACUUM (ANALYZE)" if task["kind"] == "vacuum" and task["analyze"] else task["kind"].upper()
+
+
+def _print_plan(tasks, bloated):
+    if not tasks:
+        click.echo("Nothing needs maintenance.")
+    for number, task in enumerate(tasks, 1):
+        click.echo(f"{number:3}. [{task['database']}] {_statement(task)} {task['object']} "
+                   f"({format_size(task['size'])}): {task['reason']}")
+    _print_bloated(bloated)
+
+
+def _print_bloated(bloated):
+    if bloated:
+        click.echo("Tables with heap bloat VACUUM cannot return to the OS (VACUUM FULL or pg_repack rewrite them):")
+    for table in bloated:
+        click.echo(f"  [{table['database']}] {table['qualified']}: ~{format_size(table['bloat_bytes'])} "
+                   f"({table['bloat_ratio'] * 100:.0f}%) of {format_size(table['size'])}")
+
+
+def _result_line(result):
+    line = f"[{result['database']}] {_statement(result)} {result['object']}: "
+    if result["status"] == "done":
+        line += (f"{result['seconds']:.1f}s, {format_size(result['size_before'])} -> "
+                 f"{format_size(result['size_after'])} ({format_size(result['reclaimed'])} reclaimed)")
+        if result["kind"] == "vacuum":
+            line += f", {result['dead_tuples']} dead tuples before"
+        return line
+    return line + f"{result['status']}: {result['error']}"
@@ -0,0 +1,101 @@
+import click
+import json
+import os
+import sys
+
+from pgflux import pool, registry
+
+
+def _resolve(instance_name):
+    try:
+        return registry.resolve(instance_name)
+    except registry.RegistryError as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+
+
+def _pool_sizes(values):
+    sizes = {}
+    for value in values:
+        name, _, size = value.rpartition("=")
+        if not name or not size.isdigit() or int(size) < 1:
+            raise click.BadParameter(f"'{value}' is not DATABASE=SIZE or DATABASE/USER=SIZE.")
+        sizes[name] = int(size)
+    return sizes
+
+
+@click.group(help="Run a transaction-pooling proxy in front of an instance.")
+def pool_cli():
+    pass
+
+
+@pool_cli.command("start", help="Start the pooler; given options are saved and reused by later starts.")
+@click.option("--instance", "instance_name", default=None, help="Registered instance to pool (default: the default instance).")
+@click.option("--listen", "listen_host", default=None, help="Address to accept clients on (default: 127.0.0.1; other addresses need --auth).")
+@click.option("--port", "listen_port", type=int, default=None, help="Port to accept clients on (default: server port + 1000).")
+@click.option("--admin-port", type=int, default=None, help="Port of the stats endpoint (default: server port + 2000).")
+@click.option("--pool-size", type=click.IntRange(1), default=None,
+              help="Server connections per database and user (default: 20).")
+@click.option("--pool", "pool_sizes", multiple=True,
+              help="Pool size for one database or database/user, e.g. app=50 or app/reporting=5 (repeatable).")
+@click.option("--max-clients", "max_client_conn", type=click.IntRange(1), default=None,
+              help="Client connections accepted in total (default: 1000).")
+@click.option("--wait-timeout", "query_wait_timeout", type=float, default=None,
+              help="Seconds a client may queue for a server connection (default: 30).")
+@click.option("--idle-timeout", "server_idle_timeout", type=float, default=None,
+              help="Seconds before an unused server connection is closed (default: 600).")
+@click.option("--auth", type=click.Choice(pool.AUTH_METHODS), default=None, help="Client authentication (default: trust).")
+@click.option("--auth-file", type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Passwords as \'"user" "password"\' lines, for client auth and for logging in to the server.')
+def start_cli(instance_name, pool_sizes, **options):
+    instance = _resolve(instance_name)
+    try:
+        settings = pool.load_settings(instance)
+        settings.update({name: value for name, value in options.items() if value is not None})
+        if options["auth_file"]:
+            settings["auth_file"] = os.path.abspath(options["auth_file"])
+        settings["pool_sizes"] = dict(settings["pool_sizes"], **_pool_sizes(pool_sizes))
+        pool.check_settings(settings)
+        pool.save_settings(instance, settings)
+        pool.start_pooler(instance, echo=click.echo)
+    except (pool.PoolerError, OSError) as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+
+
+@pool_cli.command("stop", help="Stop the pooler after running transactions finish.")
+@click.option("--instance", "instance_name", default=None, help="Registered instance (default: the default instance).")
+def stop_cli(instance_name):
+    instance = _resolve(instance_name)
+    if not pool.stop_pooler(instance, echo=click.echo):
+        click.echo(f"Pooler of '{instance['name']}' is not running.")
+
+
+@pool_cli.command("status", help="Show clients, server connections and queueing per pool.")
+@click.option("--instance", "instance_name", default=None, help="Registered instance (default: the default instance).")
+@click.option("--json", "as_json", is_flag=True, help="Print the raw stats as JSON.")
+def status_cli(instance_name, as_json):
+    instance = _resolve(instance_name)
+    if not pool.running_pid(instance):
+        click.echo(f"Pooler of '{instance['name']}' is not running.")
+        sys.exit(1)
+    try:
+        stats = pool.fetch_stats(instance)
+    except pool.PoolerError as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+    if as_json:
+        click.echo(json.dumps(stats, indent=2))
+        return
+    click.echo(f"Pooler pid {stats['pid']} on {stats['listen']} -> {stats['server']}, up {stats['uptime']:.0f}s, "
+               f"{stats['clients']}/{stats['max_client_conn']} clients")
+    if not stats["pools"]:
+        click.echo("No pools yet; they are created on the first connection.")
+        return
+    click.echo(f"{'database/user':<28} {'size':>5} {'clients':>8} {'active':>7} {'idle':>5} {'waiting':>8} "
+               f"{'xacts':>10} {'avg wait ms':>12} {'max wait ms':>12} {'timeouts':>9}")
+    for entry in stats["pools"]:
+        average = entry["wait_seconds"] * 1000 / entry["acquires"] if entry["acquires"] else 0.0
+        click.echo(f"{entry['database'] + '/' + entry['user']:<28} {entry['size']:>5} {entry['clients']:>8} "
+                   f"{entry['active']:>7} {entry['idle']:>5} {entry['waiting']:>8} {entry['transactions']:>10} "
+                   f"{average:>12.2f} {entry['max_wait_seconds'] * 1000:>12.2f} {entry['timeouts']:>9}")
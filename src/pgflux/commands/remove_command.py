@@ -1,53 +1,52 @@
 import click
-import subprocess
 import os
 import sys
 
-CONFIG_FILE = "/usr/local/pgflux_installed_version.txt"
-
-def detect_installed_version():
-    """
-    Reads the installed PostgreSQL version from the configuration file.
-    """
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as file:
-            return file.read().strip()
-    return None
+from pgflux import instrument, registry, shutdown
 
 @click.command(help="Remove the installed PostgreSQL version.")
 @click.argument("version", required=False)
+@instrument.instrumented("remove")
 def remove_cli(version):
     if not version:
         # Detect installed version if not specified
-        version = detect_installed_version()
+        instance = registry.get()
+        version = instance["version"] if instance else None
         if not version:
             click.echo("No PostgreSQL version specified and no installed version detected.")
             sys.exit(1)
 
+    instrument.annotate(version)
     install_prefix = f"/usr/local/{version}"
 
     if not os.path.exists(install_prefix):
         click.echo(f"No PostgreSQL installation found at {install_prefix}.")
         sys.exit(1)
 
-    # Stop PostgreSQL if running
+    # Stop every cluster running from this installation
     pg_ctl_path = os.path.join(install_prefix, "bin", "pg_ctl")
-    data_dir = os.path.join(install_prefix, "data")
-    if os.path.exists(pg_ctl_path) and os.path.exists(data_dir):
-        click.echo("Stopping PostgreSQL server before removal...")
+    users = [i for i in registry.instances() if i["install_prefix"] == os.path.abspath(install_prefix)]
+    data_dirs = list(dict.fromkeys([os.path.join(install_prefix, "data")] + [i["data_dir"] for i in users]))
+    for data_dir in data_dirs:
+        if not (os.path.exists(pg_ctl_path) and os.path.exists(data_dir)):
+            continue
+        click.echo(f"Stopping PostgreSQL server for {data_dir} before removal...")
         try:
-            subprocess.run([pg_ctl_path, "stop", "-D", data_dir, "-m", "fast"], check=True)
-            click.echo("PostgreSQL server stopped successfully.")
-        except subprocess.CalledProcessError:
-            click.echo("Failed to stop PostgreSQL server. It may not be running.")
+            if shutdown.stop_server(data_dir, "fast", echo=click.echo):
+                click.echo("PostgreSQL server stopped successfully.")
+            else:
+                click.echo("PostgreSQL server is not running.")
+        except shutdown.ShutdownError as e:
+            click.echo(f"Failed to stop PostgreSQL server. {e}")
 
     # Remove PostgreSQL installation
     click.echo(f"Removing PostgreSQL installation at {install_prefix}...")
     try:
-        subprocess.run(["rm", "-rf", install_prefix], check=True)
-        # Remove the configuration file if the removed version matches
-        if version == detect_installed_version():
-            os.remove(CONFIG_FILE)
+        instrument.run("remove-install", ["rm", "-rf", install_prefix], check=True)
+        # Forget the instances that ran from the removed installation
+        for instance in users:
+            registry.unregister(instance["name"])
+            click.echo(f"Removed instance '{instance['name']}' from the registry.")
         click.echo("PostgreSQL removed successfully.")
     except Exception as e:
         click.echo(f"Error removing PostgreSQL: {e}")
@@ -0,0 +1,157 @@
+import click
+import os
+import sys
+
+from pgflux import db, instrument, readiness, registry, replica, shutdown, templates
+from pgflux.utils import format_size
+
+
+def _resolve(instance_name):
+    try:
+        return registry.resolve(instance_name)
+    except registry.RegistryError as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+
+
+def _seconds(value):
+    return f"{value:.3f}s" if value is not None else "-"
+
+
+def _bytes(value):
+    return format_size(value) if value is not None else "-"
+
+
+@click.group(help="Create and remove local streaming read replicas of an instance.")
+def replica_cli():
+    pass
+
+
+@replica_cli.command("add", help="Clone a running instance into a hot standby and register it.")
+@click.argument("name")
+@click.option("--instance", "primary_name", default=None, help="Primary to replicate (default: the default instance).")
+@click.option("--p", "port", type=int, default=None, help="Port of the replica (default: the first free one above the primary's).")
+@click.option("--d", "data_dir", default=None, help="Data directory of the replica (default: {primary data dir}_{name}).")
+@click.option("--u", "user", default=None, help="Role to stream as; needs REPLICATION (default: the primary's superuser).")
+@click.option("--timeout", type=float, default=60.0, help="Seconds to wait for the replica to accept connections (default: 60).")
+@click.option("--no-start", is_flag=True, help="Register the replica without starting it.")
+@instrument.instrumented("replica-add")
+def add_cli(name, primary_name, port, data_dir, user, timeout, no_start):
+    """
+    Runs pg_basebackup with a dedicated replication slot, sets the replica's port and registers it as an
+    instance, so start, stop and the other commands (including --all) operate on it like any other.
+    """
+    primary = _resolve(primary_name)
+    instrument.annotate(primary["version"])
+    if name in registry.load()["instances"]:
+        click.echo(f"Error: an instance named '{name}' already exists.")
+        sys.exit(1)
+    instances = registry.instances()
+    port = port or replica.next_free_port(primary, instances)
+    data_dir = os.path.abspath(data_dir or f"{primary['data_dir']}_{name}")
+
+    click.echo(f"Cloning '{primary['name']}' into {data_dir} (slot {replica.slot_name(name)})...")
+    try:
+        instance = replica.create(primary, name, port, data_dir, user, instances)
+        try:
+            registry.register(instance)
+        except (registry.RegistryError, OSError):
+            replica.discard(primary, instance)
+            raise
+    except (replica.ReplicaError, registry.RegistryError, OSError, db.DatabaseError) as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        db.close_all()
+    click.echo(f"Replica '{name}' of '{primary['name']}' registered on port {port}.")
+    conflicts = registry.port_conflicts(instance)
+    if conflicts:
+        click.echo(f"Warning: port {port} is also configured for {', '.join(conflicts)}.")
+
+    if no_start:
+        return
+    try:
+        elapsed = readiness.start_server(registry.pg_ctl(instance), data_dir, os.path.join(data_dir, "logfile"),
+                                         timeout=timeout)
+    except readiness.StartupError as e:
+        click.echo(f"Failed to start replica '{name}'. {e}")
+        for line in e.log_lines:
+            click.echo(f"  {line}")
+        sys.exit(1)
+    click.echo(f"Replica '{name}' streaming from '{primary['name']}' (ready in {elapsed:.3f}s).")
+
+
+@replica_cli.command("remove", help="Stop a replica, drop its slot on the primary and unregister it.")
+@click.argument("name")
+@click.option("--keep-data", is_flag=True, help="Leave the replica's data directory in place.")
+@instrument.instrumented("replica-remove")
+def remove_cli(name, keep_data):
+    instance = _resolve(name)
+    if instance["name"] != name or not instance.get("primary"):
+        click.echo(f"Error: '{name}' is not a replica.")
+        sys.exit(1)
+    instrument.annotate(instance["version"])
+
+    try:
+        if shutdown.stop_server(instance["data_dir"], "fast", echo=click.echo):
+            click.echo(f"Replica '{name}' stopped.")
+    except shutdown.ShutdownError as e:
+        click.echo(f"Failed to stop replica '{name}'. {e}")
+        sys.exit(1)
+
+    primary = registry.get(instance["primary"])
+    try:
+        dropped = primary is not None and replica.drop_slot(primary, instance["slot"])
+    except db.DatabaseError as e:
+        click.echo(f"Error dropping slot {instance['slot']}: {e}")
+        sys.exit(1)
+    finally:
+        db.close_all()
+    if not dropped:
+        # An abandoned slot makes the primary keep WAL forever
+        click.echo(f"Warning: the primary is not running; drop slot {instance['slot']} on it with "
+                   f"pg_drop_replication_slot('{instance['slot']}').")
+
+    registry.unregister(name)
+    if not keep_data and os.path.isdir(instance["data_dir"]):
+        templates.remove_data_dir(instance["data_dir"])
+    click.echo(f"Replica '{name}' removed.")
+
+
+@replica_cli.command("list", help="List replicas with their state and byte and time lag from pg_stat_replication.")
+@click.option("--instance", "primary_name", default=None, help="Only list replicas of this primary.")
+def list_cli(primary_name):
+    instances = registry.instances()
+    primaries = [_resolve(primary_name)] if primary_name else [i for i in instances if not i.get("primary")]
+    rows = []
+    for primary in primaries:
+        standbys = replica.replicas(primary, instances)
+        if not standbys:
+            continue
+        try:
+            slots = replica.lag(primary)
+        except db.DatabaseError as e:
+            click.echo(f"Error reading replication state of '{primary['name']}': {e}")
+            slots = None
+        finally:
+            db.close_all(primary["port"])
+        for standby in standbys:
+            rows.append((primary, standby, (slots or {}).get(standby["slot"]), slots is None))
+    if not rows:
+        click.echo("No replicas are registered.")
+        return
+
+    click.echo(f"{'name':<16} {'primary':<16} {'port':>6} {'state':<12} {'sent lag':>9} {'replay lag':>11} "
+               f"{'write':>8} {'flush':>8} {'replay':>8} {'retained':>9}")
+    for primary, standby, slot, primary_down in rows:
+        if primary_down:
+            state = "primary down"
+        elif slot is None:
+            state = "no slot"
+        else:
+            state = slot["state"] or ("detached" if not slot["active"] else "starting")
+        slot = slot or {}
+        click.echo(f"{standby['name']:<16} {primary['name']:<16} {standby['port']:>6} {state:<12} "
+                   f"{_bytes(slot.get('sent_bytes')):>9} {_bytes(slot.get('replay_bytes')):>11} "
+                   f"{_seconds(slot.get('write_lag')):>8} {_seconds(slot.get('flush_lag')):>8} "
+                   f"{_seconds(slot.get('replay_lag')):>8} {_bytes(slot.get('retained_bytes')):>9}")
@@ -0,0 +1,82 @@
+import click
+import datetime
+import os
+import sys
+
+from pgflux import instrument
+
+
+def _label(path, report):
+    started = datetime.datetime.fromtimestamp(report.get("started", 0)).strftime("%Y-%m-%d %H:%M:%S")
+    return f"{os.path.basename(path)} ({report.get('command')} {report.get('version') or ''}, {started})"
+
+
+def _seconds(value):
+    return f"{value:>10.3f}" if value is not None else f"{'-':>10}"
+
+
+def _show(path, report):
+    click.echo(f"Report {_label(path, report)}")
+    click.echo(f"{'phase':<20} {'count':>5} {'wall s':>10} {'cpu s':>10} {'peak rss':>10}")
+    for name, agg in instrument.summarize(report).items():
+        click.echo(f"{name:<20} {agg['count']:>5} {agg['wall']:>10.3f} {agg['cpu']:>10.3f} {agg['max_rss_kb'] // 1024:>8}MB")
+    click.echo(f"{'total':<20} {'':>5} {report.get('wall', 0):>10.3f}")
+
+
+@click.command(help="Show or compare the per-phase timing reports written by pgflux commands.")
+@click.argument("reports", nargs=-1)
+@click.option("--compare", is_flag=True, help="Compare two reports (default: the two most recent matching reports).")
+@click.option("--list", "list_only", is_flag=True, help="List the stored reports.")
+@click.option("--command", "command_name", default=None, help="Only consider reports of this command (e.g. install).")
+@click.option("--version", default=None, help="Only consider reports for this PostgreSQL version (e.g. pg16).")
+@click.option("--threshold", type=float, default=10.0, show_default=True,
+              help="Percent slowdown of a phase that is flagged as a regression.")
+@click.option("--fail-on-regression", is_flag=True, help="Exit with status 1 if a regression is found.")
+def report_cli(reports, compare, list_only, command_name, version, threshold, fail_on_regression):
+    """
+    Prints timing reports, or a phase-by-phase comparison of two of them.
+    """
+    stored = instrument.list_reports(command=command_name, version=version)
+    if list_only:
+        for path, report in stored:
+            click.echo(_label(path, report))
+        if not stored:
+            click.echo("No reports found.")
+        return
+
+    try:
+        selected = [instrument.load_report(ref) for ref in reports]
+    except (OSError, ValueError) as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+
+    if not compare:
+        for path, report in selected or stored[-1:]:
+            _show(path, report)
+        if not selected and not stored:
+            click.echo("No reports found. Reports are written by install, init, start, stop and restart.")
+        return
+
+    if not selected:
+        selected = stored[-2:]
+    if len(selected) != 2:
+        click.echo("Comparison needs exactly two reports.")
+        sys.exit(1)
+
+    (base_path, base), (new_path, new) = selected
+    click.echo(f"Base: {_label(base_path, base)}")
+    click.echo(f"New:  {_label(new_path, new)}")
+    click.echo(f"{'phase':<20} {'base s':>10} {'new s':>10} {'change':>9}")
+    regressions = []
+    for name, old, cur, change, regressed in instrument.compare(base, new, threshold):
+        pct = f"{change:>+8.1f}%" if change is not None else f"{'n/a':>9}"
+        click.echo(f"{name:<20} {_seconds(old)} {_seconds(cur)} {pct}{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+
+    if regressions:
+        click.echo(f"{len(regressions)} phase(s) regressed by more than {threshold:g}%: {', '.join(regressions)}")
+        if fail_on_regression:
+            sys.exit(1)
+    else:
+        click.echo("No regressions found.")
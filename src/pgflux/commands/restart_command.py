@@ -1,15 +1,127 @@
 import click
 import os
 import subprocess
-from pgflux.constants import PG_CTL
 
+from pgflux import db, instrument, prewarm, readiness, registry, settings, shutdown
+from pgflux.constants import DEFAULT_ADMIN_USER, DEFAULT_DBNAME, DEFAULT_SOCKET_DIR
 
-@click.command(help="Restart the PostgreSQL server.")
-@click.option("--p", "port", default="5432", help="Port for PostgreSQL to listen on.")
-def restart_cli(port):
+
+@click.command(help="Apply configuration changes, reloading instead of restarting when possible.")
+@click.option("--p", "port", default=None, help="Port on which PostgreSQL is running (default: read from postmaster.pid).")
+@click.option("--u", "user", default=DEFAULT_ADMIN_USER, help=f"Superuser to connect as (default: {DEFAULT_ADMIN_USER}).")
+@click.option("--force", is_flag=True, help="Always do a full restart, even if a reload would suffice.")
+@click.option("--prewarm", "warm", is_flag=True, help="After a full restart, load the hottest relations back into shared_buffers.")
+@click.option("--prewarm-db", default=DEFAULT_DBNAME, help=f"Database whose relations to prewarm (default: {DEFAULT_DBNAME}).")
+@click.option("--prewarm-limit", type=int, default=prewarm.DEFAULT_LIMIT,
+              help=f"Number of tables (plus their indexes) to prewarm (default: {prewarm.DEFAULT_LIMIT}).")
+@click.option("--timeout", type=float, default=60.0, help="Seconds to wait for the server to accept connections (default: 60).")
+@click.option("--instance", "instance_name", default=None, help="Registered instance to restart (default: the default instance).")
+@instrument.instrumented("restart")
+def restart_cli(port, user, force, warm, prewarm_db, prewarm_limit, timeout, instance_name):
+    """
+    Compares the configuration files with the running settings and reloads, or restarts only if a
+    postmaster-context parameter changed.
+    """
     try:
-        subprocess.run([PG_CTL, "stop", "-D", "/usr/local/pg16/data", "-m", "fast"], check=True)
-        subprocess.run([PG_CTL, "start", "-D", "/usr/local/pg16/data", "-l", "/usr/local/pg16/data/logfile", "-w"], check=True)
-        click.echo(f"PostgreSQL restarted successfully on port {port}.")
-    except subprocess.CalledProcessError as e:
+        instance = registry.resolve(instance_name)
+    except registry.RegistryError as e:
+        click.echo(f"Error: {e}")
+        return
+    version = instance["version"]
+    instrument.annotate(version)
+    data_dir = instance["data_dir"]
+    pg_ctl = registry.pg_ctl(instance)
+    log_file = os.path.join(data_dir, "logfile")
+
+    click.echo(f"Restarting PostgreSQL {version}...")
+
+    if not os.path.exists(pg_ctl):
+        click.echo(f"Error: pg_ctl not found at {pg_ctl}. Is PostgreSQL {version} installed?")
+        return
+
+    pidinfo = readiness.read_pidfile(data_dir)
+    if not pidinfo or not readiness.process_alive(pidinfo["pid"]):
+        click.echo("PostgreSQL is not running; starting it.")
+        start_server(pg_ctl, data_dir, log_file, timeout)
+        return
+
+    port = port or pidinfo["port"]
+    connect = dict(user=user, host=pidinfo["socket_dir"] or DEFAULT_SOCKET_DIR, version=version)
+    try:
+        with instrument.phase("config-diff"), db.connection(port, **connect) as conn:
+            changes = settings.pending_changes(conn)
+            already_pending = settings.pending_restart(conn)
+
+        rejected = settings.invalid(changes)
+        if rejected:
+            click.echo("The configuration files contain invalid entries; fix them first:")
+            for change in rejected:
+                click.echo(f"  {change['location']}: {change['name']}: {change['error']}")
+            return
+
+        for change in changes:
+            click.echo(f"  {settings.format_change(change)}")
+        needs_restart = settings.requires_restart(changes)
+        if already_pending:
+            click.echo(f"  Already waiting for a restart: {', '.join(already_pending)}")
+
+        if not (force or needs_restart or already_pending):
+            if not changes:
+                click.echo("No configuration changes to apply.")
+                return
+            with instrument.phase("reload"), db.connection(port, **connect) as conn:
+                settings.reload(conn)
+            click.echo(f"Reloaded configuration; {len(changes)} change(s) applied without a restart.")
+            return
+
+        if needs_restart:
+            click.echo(f"Full restart required by: {', '.join(c['name'] for c in needs_restart)}")
+
+        hot = []
+        if warm:
+            with instrument.phase("prewarm-capture"), db.connection(port, **dict(connect, dbname=prewarm_db)) as conn:
+                hot = prewarm.hottest_relations(conn, prewarm_limit)
+    except db.DatabaseError as e:
+        click.echo(f"Failed to compare configuration with the running server. Error: {e}")
+        return
+    finally:
+        db.close_all(port)
+
+    try:
+        shutdown.stop_server(data_dir, "fast", echo=click.echo)
+    except shutdown.ShutdownError as e:
         click.echo(f"Failed to restart PostgreSQL. {e}")
+        return
+    if not start_server(pg_ctl, data_dir, log_file, timeout):
+        return
+
+    if hot:
+        try:
+            with instrument.phase("prewarm"), db.connection(port, **dict(connect, dbname=prewarm_db)) as conn:
+                blocks = prewarm.prewarm(conn, hot)
+            if blocks is None:
+                click.echo("pg_prewarm is not available on this server; skipped prewarming.")
+            else:
+                click.echo(f"Prewarmed {len(hot)} relations ({blocks} blocks) in {prewarm_db}.")
+        except db.DatabaseError as e:
+            click.echo(f"Failed to prewarm relations. Error: {e}")
+        finally:
+            db.close_all(port)
+
+
+def start_server(pg_ctl, data_dir, log_file, timeout):
+    """
+    Starts the server and reports how long it took to accept connections. Returns False on failure.
+    """
+    try:
+        elapsed = readiness.start_server(pg_ctl, data_dir, log_file, timeout=timeout)
+    except readiness.StartupError as e:
+        click.echo(f"Failed to start PostgreSQL. {e}")
+        for line in e.log_lines:
+            click.echo(f"  {line}")
+        return False
+    except subprocess.CalledProcessError as e:
+        click.echo(f"Failed to start PostgreSQL. {e}")
+        return False
+    click.echo(f"PostgreSQL restarted successfully (ready in {elapsed:.3f}s).")
+    return True
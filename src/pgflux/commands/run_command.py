@@ -2,9 +2,10 @@ import click
 import os
 import subprocess
 
+from pgflux import instrument, registry
+
 DEFAULT_PORT = "5432"
 DEFAULT_USER = "postgres"
-CONFIG_FILE = "/usr/local/pgflux_installed_version.txt"
 INSTALL_PREFIX_TEMPLATE = "/usr/local/{version}"
 
 
@@ -19,8 +20,8 @@ def run_cli(database, port, user, version):
     """
     if not version:
         try:
-            version = detect_installed_version()
-        except RuntimeError as e:
+            version = registry.resolve()["version"]
+        except registry.RegistryError as e:
             click.echo(str(e))
             return
 
@@ -35,7 +36,7 @@ def run_cli(database, port, user, version):
     click.echo(f"Connecting to database '{database}' on port {port} as user '{user}'...")
 
     try:
-        subprocess.run([psql_path, "-U", user, "-p", port, "-d", database], check=True)
+        instrument.run("psql", [psql_path, "-U", user, "-p", port, "-d", database], check=True)
     except subprocess.CalledProcessError as e:
         click.echo("Failed to connect to the PostgreSQL server. Check the error below:")
         click.echo(e.stderr.decode() if e.stderr else "Unknown error.")
@@ -43,15 +44,5 @@ def run_cli(database, port, user, version):
         click.echo(f"Error: psql command not found at {psql_path}. Ensure PostgreSQL is installed and accessible.")
 
 
-def detect_installed_version():
-    """
-    Reads the installed PostgreSQL version from the configuration file.
-    """
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as file:
-            return file.read().strip()
-    raise RuntimeError("No installed PostgreSQL version found. Please install using 'pgflux install'.")
-
-
 if __name__ == "__main__":
     run_cli()
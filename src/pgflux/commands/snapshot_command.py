@@ -0,0 +1,117 @@
+import click
+import datetime
+import os
+import sys
+
+from pgflux import db, instrument, readiness, registry, snapshot
+from pgflux.utils import format_size
+
+
+def _resolve(instance_name):
+    try:
+        return registry.resolve(instance_name)
+    except registry.RegistryError as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+
+
+@click.group(help="Take and restore deduplicated, compressed snapshots of data directories.")
+def snapshot_cli():
+    pass
+
+
+@snapshot_cli.command("create", help="Snapshot an instance's data directory; running servers are snapshotted online.")
+@click.option("--instance", "instance_name", default=None, help="Registered instance to snapshot (default: the default instance).")
+@click.option("--label", default=None, help="Name to restore the snapshot by.")
+@click.option("--jobs", "-j", type=int, default=None, help="Compression threads (default: one per CPU).")
+@click.option("--level", type=click.IntRange(0, 9), default=snapshot.DEFAULT_LEVEL, show_default=True,
+              help="zlib compression level.")
+@instrument.instrumented("snapshot")
+def create_cli(instance_name, label, jobs, level):
+    instance = _resolve(instance_name)
+    instrument.annotate(instance["version"])
+    if not os.path.isfile(os.path.join(instance["data_dir"], "PG_VERSION")):
+        click.echo(f"Error: {instance['data_dir']} is not an initialized data directory.")
+        sys.exit(1)
+    try:
+        snapshot.take_snapshot(instance["name"], instance["version"], instance["data_dir"],
+                               instance.get("user", "postgres"), label, jobs, level, echo=click.echo)
+    except (db.DatabaseError, snapshot.SnapshotError, OSError) as e:
+        click.echo(f"Snapshot failed: {e}")
+        sys.exit(1)
+
+
+@snapshot_cli.command("list", help="List snapshots, oldest first.")
+@click.option("--instance", "instance_name", default=None, help="Only show snapshots of this instance.")
+def list_cli(instance_name):
+    manifests = snapshot.Store().manifests(instance_name)
+    if not manifests:
+        click.echo("No snapshots found.")
+        return
+    click.echo(f"{'instance':<16} {'id':<20} {'version':<8} {'mode':<8} {'size':>8} {'stored':>8}  created / label")
+    for manifest in manifests:
+        created = datetime.datetime.fromtimestamp(manifest["created"]).strftime("%Y-%m-%d %H:%M:%S")
+        click.echo(f"{manifest['instance']:<16} {manifest['id']:<20} {manifest['version']:<8} "
+                   f"{'online' if manifest['online'] else 'offline':<8} {format_size(manifest['size']):>8} "
+                   f"{format_size(manifest['stored']):>8}  {created}"
+                   + (f" {manifest['label']}" if manifest.get("label") else ""))
+
+
+@snapshot_cli.command("restore", help="Replace an instance's data directory with a snapshot (default: the latest).")
+@click.argument("ref", required=False)
+@click.option("--instance", "instance_name", default=None, help="Registered instance to restore (default: the default instance).")
+@click.option("--jobs", "-j", type=int, default=None, help="Decompression threads (default: one per CPU).")
+@click.option("--force", is_flag=True, help="Overwrite a non-empty data directory.")
+@instrument.instrumented("snapshot-restore")
+def restore_cli(ref, instance_name, jobs, force):
+    """
+    The server must be stopped. The snapshot is restored next to the data directory and swapped in, so a
+    failed restore leaves the current directory untouched.
+    """
+    instance = _resolve(instance_name)
+    instrument.annotate(instance["version"])
+    data_dir = instance["data_dir"]
+    store = snapshot.Store()
+    try:
+        manifest = store.load_manifest(instance["name"], ref)
+    except snapshot.SnapshotError as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+    if manifest["version"] != instance["version"]:
+        click.echo(f"Error: snapshot {manifest['id']} is of {manifest['version']}, but the instance runs "
+                   f"{instance['version']}.")
+        sys.exit(1)
+    pidinfo = readiness.read_pidfile(data_dir)
+    if pidinfo and readiness.process_alive(pidinfo["pid"]):
+        click.echo(f"PostgreSQL is running on {data_dir}; stop it first.")
+        sys.exit(1)
+    if os.path.isdir(data_dir) and os.listdir(data_dir) and not force:
+        click.echo(f"Data directory '{data_dir}' is not empty. Use '--force' to replace it "
+                   f"(take a snapshot first to keep its current state).")
+        sys.exit(1)
+
+    click.echo(f"Restoring snapshot {manifest['id']} into {data_dir}...")
+    try:
+        with instrument.phase("snapshot-restore"):
+            written = snapshot.replace_data_dir(store, manifest, data_dir, jobs)
+    except (OSError, snapshot.SnapshotError) as e:
+        click.echo(f"Restore failed: {e}")
+        sys.exit(1)
+    click.echo(f"Restored {format_size(written)}." + (" The server replays the snapshot's WAL on its next start."
+                                                      if manifest["online"] else ""))
+
+
+@snapshot_cli.command("delete", help="Delete a snapshot and the chunks no other snapshot uses.")
+@click.argument("ref")
+@click.option("--instance", "instance_name", default=None, help="Instance the snapshot belongs to (default: the default instance).")
+def delete_cli(ref, instance_name):
+    instance = _resolve(instance_name)
+    store = snapshot.Store()
+    try:
+        manifest = store.load_manifest(instance["name"], ref)
+    except snapshot.SnapshotError as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+    store.delete(manifest)
+    removed, freed = store.gc()
+    click.echo(f"Deleted snapshot {manifest['id']}; freed {removed} chunks ({format_size(freed)}).")
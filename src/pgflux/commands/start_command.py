@@ -1,50 +1,47 @@
 import click
 import os
 import subprocess
+import sys
+import time
 
-DEFAULT_PORT = "5432"
-DEFAULT_USER = "postgres"
-INSTALL_PREFIX_TEMPLATE = "/usr/local/{version}"
-DATA_DIR_TEMPLATE = "{install_prefix}/data"
-PG_CTL_TEMPLATE = "{install_prefix}/bin/pg_ctl"
-PSQL_TEMPLATE = "{install_prefix}/bin/psql"
-CONFIG_FILE = "/usr/local/pgflux_installed_version.txt"
-
+from pgflux import db, instrument, pool, readiness, registry
 
-def detect_installed_version():
-    """
-    Reads the installed PostgreSQL version from the configuration file.
-    """
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as file:
-            return file.read().strip()
-    raise RuntimeError("No installed PostgreSQL version found. Please install using 'pgflux install'.")
+DEFAULT_USER = "postgres"
 
 
 @click.command(help="Start the PostgreSQL server.")
-@click.option("--p", "port", default=DEFAULT_PORT, help=f"Port for PostgreSQL to listen on (default: {DEFAULT_PORT}).")
+@click.option("--p", "port", default=None, help="Port of the server, for ensuring the superuser (default: the instance's port).")
 @click.option("--u", "user", default=DEFAULT_USER, help=f"Database superuser to ensure exists (default: {DEFAULT_USER}).")
 @click.option("--d", "data_dir", default=None, help="Custom data directory for PostgreSQL.")
-def start_cli(port, user, data_dir):
+@click.option("--timeout", type=float, default=60.0, help="Seconds to wait for the server to accept connections (default: 60).")
+@click.option("--instance", "instance_name", default=None, help="Registered instance to start (default: the default instance).")
+@click.option("--all", "start_all", is_flag=True, help="Start every registered instance concurrently.")
+@click.option("--pool", "with_pool", is_flag=True, help="Also start the transaction pooler ('pgflux pool') in front of it.")
+@instrument.instrumented("start")
+def start_cli(port, user, data_dir, timeout, instance_name, start_all, with_pool):
     """
     Start the PostgreSQL server using the installed version or custom options.
     """
+    if start_all:
+        start_instances(registry.instances(), timeout, with_pool)
+        return
+
     try:
-        version = detect_installed_version()
-    except RuntimeError as e:
+        instance = registry.resolve(instance_name)
+    except registry.RegistryError as e:
         click.echo(str(e))
         return
-
-    install_prefix = INSTALL_PREFIX_TEMPLATE.format(version=version)
-    pg_ctl = PG_CTL_TEMPLATE.format(install_prefix=install_prefix)
-    psql = PSQL_TEMPLATE.format(install_prefix=install_prefix)
+    version = instance["version"]
+    instrument.annotate(version)
+    pg_ctl = registry.pg_ctl(instance)
+    port = port or str(instance["port"])
 
     # Use custom data directory if provided
     if not data_dir:
-        data_dir = DATA_DIR_TEMPLATE.format(install_prefix=install_prefix)
+        data_dir = instance["data_dir"]
 
     if not os.path.exists(pg_ctl):
-        click.echo(f"Error: pg_ctl not found at {pg_ctl}. Is PostgreSQL {version} installed correctly?")
+        click.echo(f"Error: pg_ctl not found at {pg_ctl}. Is PostgreSQL {version} installed?")
         return
 
     if not os.path.exists(data_dir):
@@ -53,43 +50,104 @@ def start_cli(port, user, data_dir):
 
     click.echo(f"Starting PostgreSQL {version} on port {port}...")
 
+    log_file = os.path.join(data_dir, "logfile")
     try:
-        subprocess.run([pg_ctl, "start", "-D", data_dir, "-l", os.path.join(data_dir, "logfile"), "-w"], check=True)
-        click.echo(f"PostgreSQL {version} started successfully.")
+        elapsed = readiness.start_server(pg_ctl, data_dir, log_file, timeout=timeout)
+        click.echo(f"PostgreSQL {version} started successfully (ready in {elapsed:.3f}s).")
 
         # Ensure the superuser exists
         click.echo(f"Ensuring superuser role '{user}' exists...")
-        create_superuser(psql, user, port)
+        create_superuser(user, port, version)
 
+        if with_pool:
+            start_pool(instance)
+
+    except readiness.StartupError as e:
+        click.echo(f"Failed to start PostgreSQL {version}. {e}")
+        for line in e.log_lines:
+            click.echo(f"  {line}")
+        click.echo(f"Check the logfile at {log_file} for more details.")
     except subprocess.CalledProcessError as e:
         click.echo(f"Failed to start PostgreSQL {version}. Error: {e}")
-        click.echo(f"Check the logfile at {os.path.join(data_dir, 'logfile')} for more details.")
+        click.echo(f"Check the logfile at {log_file} for more details.")
     except FileNotFoundError:
         click.echo(f"Error: Required PostgreSQL binaries not found. Ensure PostgreSQL is installed and accessible.")
 
 
-def create_superuser(psql, user, port):
+def start_pool(instance):
+    """
+    Starts the instance's pooler after its server; a pooler failure leaves the server running.
+    """
+    try:
+        pool.start_pooler(instance, echo=click.echo)
+    except (pool.PoolerError, OSError) as e:
+        click.echo(f"Failed to start the pooler. {e}")
+
+
+def start_instance(instance, timeout, with_pool=False):
+    """
+    Starts one instance unless it is already running. Returns the seconds until it accepted connections, or None.
+    """
+    pidinfo = readiness.read_pidfile(instance["data_dir"])
+    if pidinfo and readiness.process_alive(pidinfo["pid"]):
+        elapsed = None
+    else:
+        elapsed = readiness.start_server(registry.pg_ctl(instance), instance["data_dir"],
+                                         os.path.join(instance["data_dir"], "logfile"), timeout=timeout,
+                                         capture_output=True, text=True)
+    if with_pool:
+        pool.start_pooler(instance, echo=lambda message: click.echo(f"[{instance['name']}] {message}"))
+    return elapsed
+
+
+def start_instances(instances, timeout, with_pool=False):
+    """
+    Starts all instances at once, printing each result as it completes.
+    """
+    if not instances:
+        click.echo("No PostgreSQL instances are registered.")
+        return
+    # fleet brings in asyncio, which single-instance runs do not need
+    from pgflux import fleet
+
+    click.echo(f"Starting {len(instances)} instance(s)...")
+
+    def report(outcome):
+        name, error = outcome["instance"]["name"], outcome["error"]
+        if error is None:
+            status = "already running" if outcome["result"] is None else f"ready in {outcome['result']:.3f}s"
+            click.echo(f"[{name}] {status}")
+            return
+        if isinstance(error, subprocess.CalledProcessError) and error.stderr:
+            error = error.stderr.strip()
+        click.echo(f"[{name}] failed: {error}")
+        for line in getattr(error, "log_lines", []):
+            click.echo(f"[{name}]   {line}")
+
+    started = time.monotonic()
+    outcomes = fleet.run_all("start", instances, lambda instance: start_instance(instance, timeout, with_pool),
+                             report=report)
+    failed = [outcome["instance"]["name"] for outcome in outcomes if outcome["error"] is not None]
+    click.echo(f"{len(outcomes) - len(failed)} of {len(outcomes)} instance(s) running after "
+               f"{time.monotonic() - started:.1f}s.")
+    if failed:
+        click.echo(f"Failed to start: {', '.join(failed)}")
+        sys.exit(1)
+
+
+def create_superuser(user, port, version=None):
     """
     Ensure the specified superuser role exists in PostgreSQL.
     """
     try:
-        result = subprocess.run(
-            [psql, "-U", user, "-p", port, "-d", "postgres", "-c", "\\du"],
-            capture_output=True,
-            text=True
-        )
-        if user not in result.stdout:
-            click.echo(f"Superuser '{user}' does not exist. Creating...")
-            create_role_command = f"CREATE ROLE {user} WITH SUPERUSER LOGIN PASSWORD 'pgflux';"
-            subprocess.run(
-                [psql, "-U", user, "-p", port, "-d", "postgres", "-c", create_role_command],
-                check=True
-            )
+        with instrument.phase("create-role"):
+            created = db.ensure_superuser(port, user, "pgflux", version=version)
+        if created:
             click.echo(f"Superuser role '{user}' created successfully.")
         else:
             click.echo(f"Superuser role '{user}' already exists.")
-    except subprocess.CalledProcessError as e:
-        click.echo(f"Failed to ensure superuser role. Error: {e.stderr if e.stderr else 'Unknown error'}")
+    except db.DatabaseError as e:
+        click.echo(f"Failed to ensure superuser role. Error: {e}")
 
 
 if __name__ == "__main__":
@@ -1,34 +1,43 @@
 import click
 import subprocess
 import os
+import sys
+import time
 
-CONFIG_FILE = "/usr/local/pgflux_installed_version.txt"
-INSTALL_PREFIX_TEMPLATE = "/usr/local/{version}"
-DATA_DIR_TEMPLATE = "{install_prefix}/data"
-PG_CTL_TEMPLATE = "{install_prefix}/bin/pg_ctl"
+from pgflux import db, instrument, metrics, procfs, readiness, registry
+from pgflux.commands.instances_command import show_instances
+from pgflux.constants import DEFAULT_ADMIN_USER, DEFAULT_SOCKET_DIR
+
+METRICS_SAMPLE_SECONDS = 1.0
 
-def detect_installed_version():
-    """
-    Reads the installed PostgreSQL version from the configuration file.
-    """
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as file:
-            return file.read().strip()
-    return None
 
 @click.command(help="Check the status of the PostgreSQL server.")
 @click.option("--p", "port", default=None, help="Port on which PostgreSQL is running (optional).")
-def status_cli(port):
+@click.option("--metrics", "show_metrics", is_flag=True, help="Show connection, throughput, cache, checkpoint and replication metrics.")
+@click.option("--watch", type=float, default=None, help="Refresh metrics every N seconds until interrupted (implies --metrics).")
+@click.option("--u", "user", default=DEFAULT_ADMIN_USER, help=f"Role to connect as for metrics (default: {DEFAULT_ADMIN_USER}).")
+@click.option("--instance", "instance_name", default=None, help="Registered instance to check (default: the default instance).")
+@click.option("--all", "show_all", is_flag=True, help="Show a one-line status for every registered instance.")
+def status_cli(port, show_metrics, watch, user, instance_name, show_all):
     """
     Checks the status of the PostgreSQL server. Optionally checks the specified port.
     """
-    version = detect_installed_version()
-    if not version:
-        click.echo("Error: No PostgreSQL version is currently installed.")
+    if show_all:
+        try:
+            show_instances(registry.instances())
+        except registry.RegistryError as e:
+            click.echo(f"Error: {e}")
+            sys.exit(1)
         return
 
-    install_prefix = INSTALL_PREFIX_TEMPLATE.format(version=version)
-    pg_ctl = PG_CTL_TEMPLATE.format(install_prefix=install_prefix)
+    try:
+        instance = registry.resolve(instance_name)
+    except registry.RegistryError as e:
+        click.echo(f"Error: {e}")
+        return
+    version = instance["version"]
+    data_dir = instance["data_dir"]
+    pg_ctl = registry.pg_ctl(instance)
 
     if not os.path.exists(pg_ctl):
         click.echo(f"Error: pg_ctl not found at {pg_ctl}. Is PostgreSQL {version} installed?")
@@ -36,7 +45,7 @@ def status_cli(port):
 
     # Check PostgreSQL status
     try:
-        result = subprocess.run([pg_ctl, "status", "-D", DATA_DIR_TEMPLATE.format(install_prefix=install_prefix)],
+        result = instrument.run("status", [pg_ctl, "status", "-D", data_dir],
                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
         if result.returncode == 0:
             click.echo(f"PostgreSQL {version} is running.")
@@ -54,14 +63,52 @@ def status_cli(port):
             return
 
         click.echo(f"Checking for processes using port {port}...")
-        try:
-            result = subprocess.run(["lsof", "-i", f":{port}"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            if result.returncode == 0 and result.stdout:
-                click.echo(f"Processes are using port {port}:")
-                click.echo(result.stdout.strip())
-            else:
-                click.echo(f"No processes found using port {port}.")
-        except subprocess.CalledProcessError as e:
-            click.echo(f"Failed to check port usage. Error: {e.stderr.decode().strip()}")
+        users, unreadable = procfs.port_users(port)
+        if users:
+            click.echo(f"Processes are using port {port}:")
+            for entry in users:
+                click.echo(f"  {entry['pid']:>7}  {entry['name']:<16} {entry['proto']:<5} {entry['state']:<12} "
+                           f"{procfs.format_endpoint(entry['local'])} -> {procfs.format_endpoint(entry['remote'])}")
+        else:
+            click.echo(f"No processes found using port {port}.")
+        if unreadable:
+            click.echo(f"Note: {unreadable} processes could not be inspected; run as root for complete results.")
+
+    if show_metrics or watch:
+        show_server_metrics(data_dir, port, user, version, watch)
 
     click.echo("Status check completed.")
+
+
+def show_server_metrics(data_dir, port, user, version, watch=None):
+    """
+    Prints server metrics over a single connection, refreshing every `watch` seconds if given.
+    """
+    pidinfo = readiness.read_pidfile(data_dir) or {}
+    port = port or pidinfo.get("port")
+    if not port:
+        click.echo("Cannot collect metrics: the server is not running and no port was given.")
+        return
+    host = pidinfo.get("socket_dir") or DEFAULT_SOCKET_DIR
+
+    try:
+        with db.connection(port, user=user, host=host, version=version) as conn:
+            previous = metrics.sample(conn)
+            if not watch:
+                time.sleep(METRICS_SAMPLE_SECONDS)
+            while True:
+                if watch:
+                    time.sleep(watch)
+                current = metrics.sample(conn)
+                click.echo(f"\nMetrics for PostgreSQL {version} on port {port} at {time.strftime('%H:%M:%S')}:")
+                for line in metrics.format_snapshot(current, metrics.rates(previous, current)):
+                    click.echo(f"  {line}")
+                if not watch:
+                    break
+                previous = current
+    except KeyboardInterrupt:
+        pass
+    except db.DatabaseError as e:
+        click.echo(f"Failed to collect metrics. Error: {e}")
+    finally:
+        db.close_all(port)
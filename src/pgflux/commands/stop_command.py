@@ -1,37 +1,44 @@
 import click
 import subprocess
 import os
+import sys
+import time
 
-CONFIG_FILE = "/usr/local/pgflux_installed_version.txt"
-INSTALL_PREFIX_TEMPLATE = "/usr/local/{version}"
-DATA_DIR_TEMPLATE = "{install_prefix}/data"
-PG_CTL_TEMPLATE = "{install_prefix}/bin/pg_ctl"
-
-
-def detect_installed_version():
-    """
-    Reads the installed PostgreSQL version from the configuration file.
-    """
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as file:
-            return file.read().strip()
-    return None
+from pgflux import db, instrument, pool, readiness, registry, shutdown
+from pgflux.constants import DEFAULT_SOCKET_DIR
 
 
 @click.command(help="Stop the PostgreSQL server.")
 @click.option("--p", "port", default=None, help="Port on which PostgreSQL is running (optional).")
-def stop_cli(port):
+@click.option("--mode", type=click.Choice(shutdown.MODES), default="smart",
+              help="First shutdown mode to try; slower modes escalate to the next one on timeout (default: smart).")
+@click.option("--smart-timeout", type=float, default=shutdown.DEFAULT_TIMEOUTS["smart"],
+              help="Seconds to wait for clients to disconnect in smart mode.")
+@click.option("--fast-timeout", type=float, default=shutdown.DEFAULT_TIMEOUTS["fast"],
+              help="Seconds to wait for a fast shutdown before escalating to immediate.")
+@click.option("--immediate-timeout", type=float, default=shutdown.DEFAULT_TIMEOUTS["immediate"],
+              help="Seconds to wait for an immediate shutdown.")
+@click.option("--instance", "instance_name", default=None, help="Registered instance to stop (default: the default instance).")
+@click.option("--all", "stop_all", is_flag=True, help="Stop every registered instance concurrently.")
+@instrument.instrumented("stop")
+def stop_cli(port, mode, smart_timeout, fast_timeout, immediate_timeout, instance_name, stop_all):
     """
     Stops the PostgreSQL server. Optionally ensures no processes are using the specified port.
     """
-    version = detect_installed_version()
-    if not version:
-        click.echo("Error: No PostgreSQL version is currently installed.")
+    timeouts = {"smart": smart_timeout, "fast": fast_timeout, "immediate": immediate_timeout}
+    if stop_all:
+        stop_instances(registry.instances(), mode, timeouts)
         return
 
-    install_prefix = INSTALL_PREFIX_TEMPLATE.format(version=version)
-    data_dir = DATA_DIR_TEMPLATE.format(install_prefix=install_prefix)
-    pg_ctl = PG_CTL_TEMPLATE.format(install_prefix=install_prefix)
+    try:
+        instance = registry.resolve(instance_name)
+    except registry.RegistryError as e:
+        click.echo(f"Error: {e}")
+        return
+    version = instance["version"]
+    instrument.annotate(version)
+    data_dir = instance["data_dir"]
+    pg_ctl = registry.pg_ctl(instance)
 
     click.echo(f"Stopping PostgreSQL server for version {version}...")
 
@@ -39,27 +46,91 @@ def stop_cli(port):
         click.echo(f"Error: pg_ctl not found at {pg_ctl}. Is PostgreSQL {version} installed?")
         return
 
-    # Attempt to stop PostgreSQL using pg_ctl
+    # The pooler goes first: it lets its transactions finish and would otherwise hold server sessions open
+    pool.stop_pooler(instance, echo=click.echo)
+
+    pidinfo = readiness.read_pidfile(data_dir)
+    if pidinfo and mode == "smart":
+        report_sessions(pidinfo, version)
+
     try:
-        subprocess.run([pg_ctl, "stop", "-D", data_dir, "-m", "fast"], check=True)
-        click.echo("PostgreSQL server stopped successfully.")
-    except subprocess.CalledProcessError:
-        click.echo("Failed to stop PostgreSQL server. Ensure it is running.")
+        stopped_by = shutdown.stop_server(data_dir, mode, timeouts, echo=click.echo)
+        if stopped_by:
+            click.echo(f"PostgreSQL server stopped successfully ({stopped_by} shutdown).")
+        else:
+            click.echo("PostgreSQL server is not running.")
+    except shutdown.ShutdownError as e:
+        click.echo(f"Failed to stop PostgreSQL server. {e}")
 
     # Optionally clean up any processes bound to the specified port
-    if port:
+    if port and not port.isdigit():
+        click.echo("Invalid port specified. Please provide a numeric value.")
+    elif port:
         click.echo(f"Ensuring no processes are using port {port}...")
         try:
-            result = subprocess.run(["sudo", "lsof", "-i", f":{port}"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if result.returncode == 0:
-                processes = result.stdout.decode().strip().split("\n")
-                for process in processes[1:]:
-                    pid = process.split()[1]
-                    subprocess.run(["sudo", "kill", "-9", pid], check=True)
-                click.echo(f"Cleared processes using port {port}.")
+            cleared = shutdown.clear_port(port, echo=click.echo)
+            if cleared:
+                click.echo(f"Cleared {len(cleared)} processes using port {port}: {', '.join(map(str, cleared))}.")
             else:
                 click.echo(f"No processes found using port {port}.")
         except subprocess.CalledProcessError as e:
             click.echo(f"Failed to clear processes on port {port}. Error: {e}")
 
     click.echo("PostgreSQL stop operation completed.")
+
+
+def stop_instances(instances, mode, timeouts):
+    """
+    Stops all instances at once, printing each result as it completes.
+    """
+    if not instances:
+        click.echo("No PostgreSQL instances are registered.")
+        return
+    # fleet brings in asyncio, which single-instance runs do not need
+    from pgflux import fleet
+
+    click.echo(f"Stopping {len(instances)} instance(s)...")
+
+    def stop(instance):
+        name = instance["name"]
+
+        def echo(message):
+            click.echo(f"[{name}] {message}")
+
+        pool.stop_pooler(instance, echo=echo)
+        return shutdown.stop_server(instance["data_dir"], mode, timeouts, echo=echo)
+
+    def report(outcome):
+        name, error = outcome["instance"]["name"], outcome["error"]
+        if error is not None:
+            click.echo(f"[{name}] failed: {error}")
+        elif outcome["result"]:
+            click.echo(f"[{name}] stopped ({outcome['result']} shutdown) in {outcome['elapsed']:.1f}s")
+        else:
+            click.echo(f"[{name}] not running")
+
+    started = time.monotonic()
+    outcomes = fleet.run_all("stop", instances, stop, report=report)
+    failed = [outcome["instance"]["name"] for outcome in outcomes if outcome["error"] is not None]
+    click.echo(f"{len(outcomes) - len(failed)} of {len(outcomes)} instance(s) down after "
+               f"{time.monotonic() - started:.1f}s.")
+    if failed:
+        click.echo(f"Failed to stop: {', '.join(failed)}")
+        sys.exit(1)
+
+
+def report_sessions(pidinfo, version):
+    """
+    Prints how many client sessions a smart shutdown will wait for, then releases the connection.
+    """
+    try:
+        row = db.query_one(
+            pidinfo["port"],
+            "SELECT count(*) FROM pg_stat_activity WHERE backend_type = 'client backend' AND pid <> pg_backend_pid()",
+            host=pidinfo["socket_dir"] or DEFAULT_SOCKET_DIR, version=version,
+        )
+        click.echo(f"{row[0]} client session(s) connected.")
+    except db.DatabaseError:
+        pass
+    finally:
+        db.close_all(pidinfo["port"])
@@ -0,0 +1,122 @@
+import click
+import collections
+import shutil
+import sys
+import time
+
+from pgflux import db, readiness, registry, top
+from pgflux.constants import DEFAULT_ADMIN_USER, DEFAULT_SOCKET_DIR
+
+
+def _show(lines, clear):
+    if clear:
+        click.clear()
+    for line in lines:
+        click.echo(line)
+
+
+@click.command(help="Show the busiest statements and wait events, refreshed every interval.")
+@click.option("--interval", type=float, default=5.0, help="Seconds per refresh (default: 5).")
+@click.option("--wait-sample", type=float, default=0.5,
+              help="Seconds between pg_stat_activity wait-event samples within an interval (default: 0.5).")
+@click.option("--sort", type=click.Choice(top.SORT_KEYS), default="total",
+              help="Order statements by total time, calls or blocks read/written (default: total).")
+@click.option("--limit", type=int, default=None, help="Statements to show (default: fit the terminal).")
+@click.option("--iterations", "-n", type=int, default=None, help="Stop after this many intervals.")
+@click.option("--output", "-o", default=None, type=click.Path(dir_okay=False),
+              help="Write the last --window intervals to this file as JSON lines on exit.")
+@click.option("--window", type=int, default=60, help="Intervals kept for --output (default: 60).")
+@click.option("--load", "load_file", default=None, type=click.Path(exists=True, dir_okay=False),
+              help="Summarize a file written by --output instead of sampling.")
+@click.option("--instance", "instance_name", default=None, help="Registered instance to watch (default: the default instance).")
+@click.option("--p", "port", default=None, help="Port of the server (default: from postmaster.pid).")
+@click.option("--u", "user", default=DEFAULT_ADMIN_USER, help=f"Role to connect as (default: {DEFAULT_ADMIN_USER}).")
+@click.option("--yes", "-y", "assume_yes", is_flag=True, help="Add pg_stat_statements to shared_preload_libraries without asking.")
+def top_cli(interval, wait_sample, sort, limit, iterations, output, window, load_file, instance_name, port, user,
+            assume_yes):
+    """
+    Samples pg_stat_statements and pg_stat_activity over one connection and shows per-interval deltas.
+    """
+    rows_available = max(shutil.get_terminal_size().lines - 14, 5)
+    limit = limit or rows_available
+    if load_file:
+        show_recorded(load_file, sort, limit)
+        return
+
+    try:
+        instance = registry.resolve(instance_name)
+    except registry.RegistryError as e:
+        click.echo(f"Error: {e}")
+        return
+    version = instance["version"]
+    pidinfo = readiness.read_pidfile(instance["data_dir"]) or {}
+    port = port or pidinfo.get("port")
+    if not port:
+        click.echo(f"PostgreSQL {version} is not running and no port was given.")
+        return
+    host = pidinfo.get("socket_dir") or DEFAULT_SOCKET_DIR
+
+    records = collections.deque(maxlen=window)
+    try:
+        with db.connection(port, user=user, host=host, version=version) as conn:
+            if not prepare(conn, assume_yes):
+                return
+            texts = top.QueryTexts()
+            previous = top.sample_statements(conn)
+            started = time.monotonic()
+            count = 0
+            interactive = sys.stdout.isatty()
+            while iterations is None or count < iterations:
+                waits, samples = top.sample_interval(conn, interval, wait_sample)
+                current = top.sample_statements(conn)
+                now = time.monotonic()
+                deltas = top.statement_deltas(previous, current)
+                rows = top.top_deltas(deltas, limit, sort)
+                names = texts.lookup(conn, [key[2] for key, _ in rows])
+                header = f"pgflux top - PostgreSQL {version} on port {port} - {time.strftime('%H:%M:%S')} - sort: {sort}"
+                _show([header, ""] + top.format_view(rows, waits, samples, now - started, names,
+                                                     shutil.get_terminal_size().columns), interactive)
+                records.append(top.interval_record(time.time(), now - started, deltas, waits, samples, names, limit))
+                previous, started = current, now
+                count += 1
+    except KeyboardInterrupt:
+        pass
+    except (db.DatabaseError, top.TopError) as e:
+        click.echo(f"Error: {e}")
+    finally:
+        db.close_all(port)
+        if output and records:
+            top.write_window(output, records)
+            click.echo(f"Wrote {len(records)} interval(s) to {output}.")
+
+
+def prepare(conn, assume_yes):
+    """
+    Checks that pg_stat_statements is usable, offering to preload it if it is not.
+    """
+    if top.ensure_extension(conn):
+        return True
+    click.echo(f"{top.EXTENSION} is not in shared_preload_libraries.")
+    if not assume_yes and not click.confirm("Add it with ALTER SYSTEM?", default=True):
+        return False
+    top.ensure_extension(conn, configure=True)
+    click.echo("Added. Run 'pgflux restart' to load it, then run 'pgflux top' again.")
+    return False
+
+
+def show_recorded(path, sort, limit):
+    """
+    Prints the totals of a recorded window.
+    """
+    records = top.read_window(path)
+    if not records:
+        click.echo(f"No intervals recorded in {path}.")
+        return
+    statements, waits, elapsed = top.summarize_window(records)
+    rows = top.top_deltas(statements, limit, sort)
+    texts = {key[2]: delta["query"] for key, delta in rows}
+    click.echo(f"{len(records)} interval(s) recorded in {path}, from "
+               f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(records[0]['time'] - records[0]['elapsed']))}")
+    click.echo("Wait events are averaged per interval; statements only include each interval's top entries.")
+    for line in top.format_view(rows, waits, 1, elapsed, texts, shutil.get_terminal_size().columns):
+        click.echo(line)
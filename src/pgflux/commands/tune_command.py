@@ -0,0 +1,50 @@
+import click
+import os
+
+from pgflux import registry, tune
+
+
+@click.command(help="Generate hardware-aware settings into a postgresql.conf include file.")
+@click.option("--profile", type=click.Choice(tune.PROFILES), default="mixed", help="Workload profile (default: mixed).")
+@click.option("--d", "data_dir", default=None, help="Data directory of the cluster to tune (default: the instance's).")
+@click.option("--instance", "instance_name", default=None, help="Registered instance to tune (default: the default instance).")
+@click.option("--max-connections", type=int, default=tune.DEFAULT_MAX_CONNECTIONS,
+              help=f"max_connections to size work_mem for (default: {tune.DEFAULT_MAX_CONNECTIONS}).")
+@click.option("--clusters", type=int, default=1, help="Number of clusters sharing this host's memory (default: 1).")
+@click.option("--dry-run", is_flag=True, help="Only show the proposed changes.")
+@click.option("--yes", "-y", "assume_yes", is_flag=True, help="Apply without asking for confirmation.")
+def tune_cli(profile, data_dir, instance_name, max_connections, clusters, dry_run, assume_yes):
+    """
+    Shows a diff of the proposed tuning include file and writes it after confirmation.
+    """
+    if not data_dir:
+        try:
+            data_dir = registry.resolve(instance_name)["data_dir"]
+        except registry.RegistryError as e:
+            click.echo(f"Error: {e} Use --d to pick a data directory.")
+            return
+
+    if not os.path.exists(os.path.join(data_dir, "postgresql.conf")):
+        click.echo(f"Error: No postgresql.conf in {data_dir}. Is the cluster initialized?")
+        return
+
+    hardware = tune.detect_hardware(data_dir)
+    click.echo(f"Detected {hardware['cpus']} CPUs, {tune.format_memory(hardware['memory'])} memory, "
+               f"{hardware['storage']} storage.")
+    contents = tune.render(tune.recommend(hardware, profile, max_connections, clusters), hardware, profile, clusters)
+
+    changes = tune.diff(data_dir, contents)
+    if not changes:
+        click.echo("Settings are already up to date.")
+        return
+    click.echo(changes)
+
+    if dry_run:
+        return
+    if not assume_yes and not click.confirm("Apply these settings?", default=False):
+        click.echo("No changes written.")
+        return
+
+    tune.apply(data_dir, contents)
+    click.echo(f"Wrote {os.path.join(data_dir, tune.TUNE_FILE)}. Run 'pgflux restart' to apply it "
+               "(it reloads when no restart-only setting changed).")
@@ -4,3 +4,41 @@ INSTALL_PREFIX = f"/usr/local/{DEFAULT_VERSION}"
 BIN_PATH = os.path.join(INSTALL_PREFIX, "bin")
 PG_CTL = os.path.join(BIN_PATH, "pg_ctl")
 DATA_DIR = os.path.join(INSTALL_PREFIX, "data")
+
+# Local state kept between runs (build cache, mirrors, reports, ...)
+CACHE_DIR = os.environ.get("PGFLUX_CACHE_DIR", os.path.expanduser("~/.cache/pgflux"))
+BUILD_CACHE_DIR = os.path.join(CACHE_DIR, "builds")
+
+# PostgreSQL sources: one shared bare mirror, one git worktree per version
+POSTGRES_GIT_URL = os.environ.get("PGFLUX_POSTGRES_GIT_URL", "https://github.com/postgres/postgres.git")
+MIRROR_DIR = os.path.join(CACHE_DIR, "postgres.git")
+
+# Per-phase timing reports written by the lifecycle commands
+REPORTS_DIR = os.path.join(CACHE_DIR, "reports")
+
+# Pristine initdb output per version/encoding/locale, cloned by init
+TEMPLATES_DIR = os.path.join(CACHE_DIR, "templates")
+
+# Connection defaults for clusters built by pgflux (socket directory is the compiled-in /tmp)
+DEFAULT_SOCKET_DIR = "/tmp"
+DEFAULT_ADMIN_USER = "postgres"
+DEFAULT_DBNAME = "postgres"
+
+# Benchmark results recorded by 'pgflux bench run'
+BENCH_DIR = os.path.join(CACHE_DIR, "bench")
+
+# Saved read offsets and aggregates of 'pgflux logs', one file per server log
+LOGS_DIR = os.path.join(CACHE_DIR, "logs")
+
+# Every cluster pgflux manages: name, version, install prefix, data directory and port
+REGISTRY_FILE = os.environ.get("PGFLUX_REGISTRY", "/usr/local/pgflux_instances.json")
+
+# Content-addressed chunks and manifests of 'pgflux snapshot'
+SNAPSHOTS_DIR = os.environ.get("PGFLUX_SNAPSHOT_DIR", os.path.join(CACHE_DIR, "snapshots"))
+
+# Sources of the pgfluxai extension that install builds against every version
+EXTENSION_DIR = os.environ.get("PGFLUX_EXTENSION_DIR", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "extension"))
+
+# Settings, pid and log files of the transaction pooler of 'pgflux pool', one directory per instance
+POOL_DIR = os.path.join(CACHE_DIR, "pool")
@@ -0,0 +1,135 @@
+import contextlib
+import threading
+
+from pgflux.constants import DEFAULT_ADMIN_USER, DEFAULT_DBNAME, DEFAULT_SOCKET_DIR
+
+CONNECT_TIMEOUT = 5
+MAX_POOL_SIZE = 4
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class DatabaseError(Exception):
+    """
+    Raised for connection and query failures, so callers need not import psycopg2.
+    """
+
+
+def _pool(port, user, dbname, host, version):
+    # psycopg2 is imported on first use to keep commands that never connect fast to start.
+    from psycopg2 import pool
+
+    key = (version, str(port), user, dbname, host)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = pool.ThreadedConnectionPool(
+                0, MAX_POOL_SIZE, host=host, port=str(port), user=user, dbname=dbname,
+                connect_timeout=CONNECT_TIMEOUT, application_name="pgflux",
+            )
+        return _pools[key]
+
+
+@contextlib.contextmanager
+def connection(port, user=DEFAULT_ADMIN_USER, dbname=DEFAULT_DBNAME, host=DEFAULT_SOCKET_DIR, version=None,
+               autocommit=True):
+    """
+    Lends a pooled connection to the server on port, keyed by version, port, user and database.
+    """
+    import psycopg2
+
+    try:
+        conn_pool = _pool(port, user, dbname, host, version)
+        conn = conn_pool.getconn()
+    except psycopg2.Error as e:
+        raise DatabaseError(str(e).strip()) from e
+
+    broken = False
+    try:
+        conn.autocommit = autocommit
+        yield conn
+        if not autocommit:
+            conn.commit()
+    except psycopg2.Error as e:
+        broken = conn.closed != 0
+        if not broken and not autocommit:
+            conn.rollback()
+        raise DatabaseError(str(e).strip()) from e
+    except BaseException:
+        if conn.closed == 0 and not autocommit:
+            conn.rollback()
+        raise
+    finally:
+        conn_pool.putconn(conn, close=broken or conn.closed != 0)
+
+
+def connect(port, user=DEFAULT_ADMIN_USER, dbname=DEFAULT_DBNAME, host=DEFAULT_SOCKET_DIR, autocommit=False):
+    """
+    Opens an unpooled connection, for work that needs more sessions than the pool lends, such as parallel
+    loads. The caller closes it.
+    """
+    import psycopg2
+
+    try:
+        conn = psycopg2.connect(host=host, port=str(port), user=user, dbname=dbname,
+                                connect_timeout=CONNECT_TIMEOUT, application_name="pgflux")
+    except psycopg2.Error as e:
+        raise DatabaseError(str(e).strip()) from e
+    conn.autocommit = autocommit
+    return conn
+
+
+def query(port, sql, params=None, **kwargs):
+    """
+    Runs a query and returns all rows as tuples.
+    """
+    with connection(port, **kwargs) as conn, conn.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.fetchall() if cur.description else []
+
+
+def query_one(port, sql, params=None, **kwargs):
+    """
+    Runs a query and returns its first row, or None.
+    """
+    rows = query(port, sql, params, **kwargs)
+    return rows[0] if rows else None
+
+
+def execute(port, sql, params=None, **kwargs):
+    """
+    Runs a statement that returns no rows, such as DDL.
+    """
+    with connection(port, **kwargs) as conn, conn.cursor() as cur:
+        cur.execute(sql, params)
+
+
+def close_all(port=None):
+    """
+    Closes pooled connections, for all servers or only the one on port.
+
+    Call this before stopping a server so idle pooled sessions do not hold up a smart shutdown.
+    """
+    with _pools_lock:
+        for key in [k for k in _pools if port is None or k[1] == str(port)]:
+            _pools.pop(key).closeall()
+
+
+def role_exists(port, role, **kwargs):
+    """
+    Returns True if a role with exactly this name exists.
+    """
+    return query_one(port, "SELECT 1 FROM pg_roles WHERE rolname = %s", (role,), **kwargs) is not None
+
+
+def ensure_superuser(port, role, password, **kwargs):
+    """
+    Creates a login superuser unless the role already exists. Returns True if it was created.
+    """
+    from psycopg2 import sql
+
+    if role_exists(port, role, **kwargs):
+        return False
+    statement = sql.SQL("CREATE ROLE {} WITH LOGIN SUPERUSER PASSWORD %s").format(sql.Identifier(role))
+    execute(port, statement, (password,), **kwargs)
+    return True
@@ -0,0 +1,48 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pgflux import instrument
+
+# Instances handled at once; starting and stopping mostly waits, so this can exceed the CPU count.
+DEFAULT_CONCURRENCY = 32
+
+
+async def _run_one(executor, command, instance, action):
+    started = time.monotonic()
+
+    def call():
+        # Each instance gets its own report, like a single-instance command run.
+        with instrument.session(command, instance["version"]):
+            return action(instance)
+
+    try:
+        result, error = await asyncio.get_running_loop().run_in_executor(executor, call), None
+    except Exception as e:  # one broken cluster must not stop the others
+        result, error = None, e
+    return {"instance": instance, "result": result, "error": error, "elapsed": time.monotonic() - started}
+
+
+async def _run_all(command, instances, action, concurrency, report):
+    # A dedicated pool: the loop's default executor is sized for CPU work and would queue instances.
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(instances)))) as executor:
+        tasks = [asyncio.create_task(_run_one(executor, command, instance, action)) for instance in instances]
+        outcomes = []
+        for next_done in asyncio.as_completed(tasks):
+            outcome = await next_done
+            if report:
+                report(outcome)
+            outcomes.append(outcome)
+    return outcomes
+
+
+def run_all(command, instances, action, concurrency=DEFAULT_CONCURRENCY, report=None):
+    """
+    Runs action(instance) for every instance concurrently on an asyncio event loop.
+
+    The blocking lifecycle steps run in worker threads; report(outcome) is called
+    as each instance finishes, so results stream back in completion order and
+    the whole run takes about as long as the slowest instance. Returns the
+    outcomes, dicts with instance, result, error and elapsed.
+    """
+    return asyncio.run(_run_all(command, instances, action, concurrency, report))
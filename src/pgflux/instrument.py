@@ -0,0 +1,287 @@
+import contextlib
+import functools
+import json
+import os
+import platform
+import resource
+import subprocess
+import threading
+import time
+
+from pgflux.constants import REPORTS_DIR
+
+MAX_REPORTS = 200
+
+_local = threading.local()
+
+
+class Report:
+    """
+    Collects the phases of one command run for one PostgreSQL version.
+    """
+
+    def __init__(self, command, version=None):
+        self.command = command
+        self.version = version
+        self.started = time.time()
+        self.finished = None
+        self.phases = []
+
+    def add(self, name, wall, cpu_user, cpu_sys, max_rss_kb, returncode=None, argv=None):
+        self.phases.append({
+            "phase": name,
+            "argv": argv,
+            "wall": round(wall, 6),
+            "cpu_user": round(cpu_user, 6),
+            "cpu_sys": round(cpu_sys, 6),
+            "max_rss_kb": max_rss_kb,
+            "returncode": returncode,
+        })
+
+    def to_dict(self):
+        return {
+            "command": self.command,
+            "version": self.version,
+            "host": platform.node(),
+            "started": self.started,
+            "finished": self.finished,
+            "wall": round((self.finished or time.time()) - self.started, 6),
+            "phases": self.phases,
+        }
+
+    def write(self, reports_dir=REPORTS_DIR):
+        """
+        Writes the report as JSON and returns its path.
+        """
+        os.makedirs(reports_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(self.started))
+        path = os.path.join(reports_dir, f"{self.command}-{self.version or 'none'}-{stamp}-{os.getpid()}.json")
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        _prune_reports(reports_dir)
+        return path
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0.0
+
+
+def _prune_reports(reports_dir):
+    # Another command finishing at the same time may prune the same reports first
+    paths = sorted((os.path.join(reports_dir, name) for name in os.listdir(reports_dir) if name.endswith(".json")),
+                   key=_mtime)
+    for path in paths[:-MAX_REPORTS]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def current():
+    """
+    Returns the report of the session active in this thread, if any.
+    """
+    return getattr(_local, "report", None)
+
+
+@contextlib.contextmanager
+def session(command, version=None, write=True):
+    """
+    Records every instrumented phase run in this thread into one report.
+    """
+    report = Report(command, version)
+    previous = current()
+    _local.report = report
+    try:
+        yield report
+    finally:
+        _local.report = previous
+        report.finished = time.time()
+        if write and report.phases:
+            report.write()
+
+
+def instrumented(command):
+    """
+    Decorator running a command function inside a reporting session.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with session(command):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def annotate(version):
+    """
+    Sets the PostgreSQL version of the active report once a command has resolved it.
+    """
+    report = current()
+    if report is not None:
+        report.version = version
+
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    Times an in-process phase. CPU time is that of the calling thread.
+    """
+    start_wall = time.perf_counter()
+    start_cpu = time.thread_time()
+    try:
+        yield
+    finally:
+        report = current()
+        if report is not None:
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            report.add(name, time.perf_counter() - start_wall, time.thread_time() - start_cpu, 0.0, rss)
+
+
+def _exit_code(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _communicate(proc, input):
+    results = {}
+
+    def drain(name, stream):
+        results[name] = stream.read()
+        stream.close()
+
+    threads = [threading.Thread(target=drain, args=(name, stream), daemon=True)
+               for name, stream in (("stdout", proc.stdout), ("stderr", proc.stderr)) if stream is not None]
+    for thread in threads:
+        thread.start()
+    if proc.stdin is not None:
+        try:
+            if input is not None:
+                proc.stdin.write(input)
+        except BrokenPipeError:
+            pass
+        finally:
+            proc.stdin.close()
+    for thread in threads:
+        thread.join()
+    return results.get("stdout"), results.get("stderr")
+
+
+def run(name, args, check=False, capture_output=False, input=None, timeout=None, **kwargs):
+    """
+    Drop-in replacement for subprocess.run that records the command as a phase.
+
+    The child is reaped with wait4(), so wall time, CPU time and peak RSS
+    belong to this command alone even when several run concurrently.
+    """
+    if capture_output:
+        kwargs["stdout"] = kwargs["stderr"] = subprocess.PIPE
+    if input is not None:
+        kwargs["stdin"] = subprocess.PIPE
+
+    start = time.perf_counter()
+    timed_out = threading.Event()
+    with subprocess.Popen(args, **kwargs) as proc:
+        timer = None
+        if timeout is not None:
+            def expire():
+                timed_out.set()
+                proc.kill()
+            timer = threading.Timer(timeout, expire)
+            timer.start()
+        try:
+            stdout, stderr = _communicate(proc, input)
+            _, status, usage = os.wait4(proc.pid, 0)
+        finally:
+            if timer is not None:
+                timer.cancel()
+        proc.returncode = _exit_code(status)
+    wall = time.perf_counter() - start
+
+    report = current()
+    if report is not None:
+        report.add(name, wall, usage.ru_utime, usage.ru_stime, usage.ru_maxrss, proc.returncode,
+                   [str(a) for a in args] if isinstance(args, (list, tuple)) else str(args))
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(args, timeout, output=stdout, stderr=stderr)
+    completed = subprocess.CompletedProcess(args, proc.returncode, stdout, stderr)
+    if check:
+        completed.check_returncode()
+    return completed
+
+
+def list_reports(reports_dir=REPORTS_DIR, command=None, version=None):
+    """
+    Returns (path, report) pairs, oldest first, optionally filtered by command and version.
+    """
+    if not os.path.isdir(reports_dir):
+        return []
+    reports = []
+    for name in os.listdir(reports_dir):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(reports_dir, name)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if (command and data.get("command") != command) or (version and data.get("version") != version):
+            continue
+        reports.append((path, data))
+    return sorted(reports, key=lambda item: item[1].get("started", 0))
+
+
+def load_report(ref, reports_dir=REPORTS_DIR):
+    """
+    Loads a report given its path or a unique prefix of its file name.
+    """
+    if os.path.isfile(ref):
+        path = ref
+    else:
+        matches = [name for name in os.listdir(reports_dir) if name.startswith(ref)] if os.path.isdir(reports_dir) else []
+        if len(matches) != 1:
+            raise ValueError(f"Report '{ref}' {'is ambiguous' if matches else 'not found'}.")
+        path = os.path.join(reports_dir, matches[0])
+    with open(path, "r") as f:
+        return path, json.load(f)
+
+
+def summarize(report):
+    """
+    Aggregates a report's phases by name: total wall/CPU time, peak RSS and count.
+    """
+    summary = {}
+    for entry in report.get("phases", []):
+        agg = summary.setdefault(entry["phase"], {"wall": 0.0, "cpu": 0.0, "max_rss_kb": 0, "count": 0})
+        agg["wall"] += entry["wall"]
+        agg["cpu"] += entry["cpu_user"] + entry["cpu_sys"]
+        agg["max_rss_kb"] = max(agg["max_rss_kb"], entry["max_rss_kb"] or 0)
+        agg["count"] += 1
+    return summary
+
+
+def compare(base, new, threshold=10.0, min_seconds=0.05):
+    """
+    Compares two reports phase by phase.
+
+    Returns rows of (phase, base_wall, new_wall, percent_change, regressed). A
+    phase regresses when it is more than threshold percent and min_seconds slower.
+    """
+    base_summary, new_summary = summarize(base), summarize(new)
+    rows = []
+    for name in list(dict.fromkeys(list(base_summary) + list(new_summary))):
+        old = base_summary.get(name, {}).get("wall")
+        cur = new_summary.get(name, {}).get("wall")
+        if old is None or cur is None:
+            rows.append((name, old, cur, None, False))
+            continue
+        change = (cur - old) / old * 100 if old else 0.0
+        rows.append((name, old, cur, change, change > threshold and cur - old > min_seconds))
+    return rows
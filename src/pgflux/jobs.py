@@ -0,0 +1,69 @@
+import contextlib
+import os
+import select
+
+from pgflux.utils import default_jobs
+
+
+class JobServer:
+    """
+    A GNU make compatible jobserver that bounds the total number of concurrent build jobs.
+
+    The pipe holds one token per job slot. Every phase, including each
+    top-level make, holds a token while it runs, and make borrows further
+    tokens from the same pipe for its parallel recipes. Builds of several
+    versions therefore share one global budget instead of each assuming
+    the whole machine.
+    """
+
+    def __init__(self, slots=None):
+        self.slots = max(1, slots or default_jobs())
+        self._read_fd, self._write_fd = os.pipe()
+        os.write(self._write_fd, b"+" * self.slots)
+
+    def acquire(self):
+        """
+        Blocks until a job slot is free and returns its token.
+        """
+        while True:
+            # make switches the shared pipe to non-blocking mode, so wait for a token explicitly.
+            select.select([self._read_fd], [], [])
+            try:
+                token = os.read(self._read_fd, 1)
+            except BlockingIOError:
+                continue
+            if token:
+                return token
+
+    def release(self, token=b"+"):
+        """
+        Returns a job slot to the pool.
+        """
+        os.write(self._write_fd, token)
+
+    @contextlib.contextmanager
+    def slot(self):
+        """
+        Holds one job slot for the duration of the block.
+        """
+        token = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(token)
+
+    @property
+    def pass_fds(self):
+        return (self._read_fd, self._write_fd)
+
+    def make_env(self, env=None):
+        """
+        Returns an environment that makes `make` join this jobserver as a client.
+        """
+        env = dict(os.environ if env is None else env)
+        env["MAKEFLAGS"] = f"-j --jobserver-auth={self._read_fd},{self._write_fd}"
+        return env
+
+    def close(self):
+        os.close(self._read_fd)
+        os.close(self._write_fd)
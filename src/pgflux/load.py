@@ -0,0 +1,305 @@
+import gzip
+import os
+import threading
+import time
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+# Bytes handed to COPY per read; memory use per connection stays at about this much regardless of file size.
+READ_SIZE = 1024 * 1024
+EXTENSIONS = {".csv": "csv", ".tsv": "text", ".txt": "text"}
+
+SECONDARY_INDEXES_SQL = """
+SELECT i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid)
+FROM pg_index i
+WHERE i.indrelid = %s::regclass
+  AND NOT i.indisunique
+  AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+ORDER BY 1
+"""
+PERSISTENCE_SQL = "SELECT relpersistence FROM pg_class WHERE oid = %s::regclass"
+
+
+class LoadError(Exception):
+    """
+    Raised when the input cannot be planned or a chunk fails to load.
+    """
+
+
+def _split_extension(path):
+    name = os.path.basename(path)
+    compressed = name.endswith(".gz")
+    if compressed:
+        name = name[:-3]
+    stem, ext = os.path.splitext(name)
+    return stem, ext.lower(), compressed
+
+
+def find_files(paths):
+    """
+    Expands directories to the CSV/TSV files they contain (optionally gzip'd) and returns the sorted file list.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in names
+                             if _split_extension(name)[1] in EXTENSIONS)
+        else:
+            files.append(path)
+    return sorted(set(files))
+
+
+def table_for(path):
+    """
+    Derives the target table from a file name: 'public.users.csv.gz' loads into public.users.
+    """
+    return _split_extension(path)[0]
+
+
+def file_format(path):
+    """
+    Returns the COPY format for a file: csv for .csv, PostgreSQL's tab-separated text format otherwise.
+    """
+    return EXTENSIONS.get(_split_extension(path)[1], "csv")
+
+
+def split(path, chunk_size, header=False):
+    """
+    Splits an uncompressed file into (start, end) byte ranges of about chunk_size that begin and end on line
+    boundaries. The header line, if any, is left out of the first range.
+
+    Only the bytes around each boundary are read, so planning is cheap for any file size. A quoted CSV field
+    containing a newline can straddle a boundary; load such files with chunk_size 0 (one range per file).
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        start = len(f.readline()) if header else 0
+        if not chunk_size or size - start <= chunk_size:
+            return [(start, size)] if size > start else []
+        ranges = []
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+        return ranges
+
+
+def plan(paths, table=None, chunk_size=DEFAULT_CHUNK_SIZE, header=False):
+    """
+    Returns the chunks to load, largest first so the long ones start early and the workers finish together.
+
+    Gzip'd files cannot be split by offset and become a single chunk each.
+    """
+    files = find_files(paths)
+    if not files:
+        raise LoadError("No .csv, .tsv or .txt files (optionally .gz) found.")
+    chunks = []
+    for path in files:
+        if not os.path.isfile(path):
+            raise LoadError(f"{path} is not a file.")
+        common = {"path": path, "table": table or table_for(path), "format": file_format(path)}
+        if _split_extension(path)[2]:
+            chunks.append(dict(common, start=0, end=os.path.getsize(path), compressed=True, header=header))
+            continue
+        for start, end in split(path, chunk_size, header):
+            chunks.append(dict(common, start=start, end=end, compressed=False, header=False))
+    chunks.sort(key=lambda chunk: chunk["end"] - chunk["start"], reverse=True)
+    return chunks
+
+
+class Progress:
+    """
+    Thread-safe totals of the bytes read from disk, bytes sent to the server and lines sent.
+    """
+
+    def __init__(self, total_bytes=0):
+        self.total_bytes = total_bytes
+        self.read_bytes = 0
+        self.sent_bytes = 0
+        self.lines = 0
+        self.rows = 0
+        self.chunks = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, read_bytes, sent_bytes, lines):
+        with self._lock:
+            self.read_bytes += read_bytes
+            self.sent_bytes += sent_bytes
+            self.lines += lines
+
+    def chunk_done(self, rows):
+        with self._lock:
+            self.rows += rows
+            self.chunks += 1
+
+    def rates(self):
+        """
+        Returns (lines per second, MB sent per second) since the load started.
+        """
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return self.lines / elapsed, self.sent_bytes / elapsed / (1024 * 1024)
+
+
+class ChunkReader:
+    """
+    File-like view of one chunk for cursor.copy_expert, which pulls it READ_SIZE bytes at a time.
+    """
+
+    def __init__(self, chunk, progress):
+        self.progress = progress
+        self._raw = open(chunk["path"], "rb")
+        self._raw.seek(chunk["start"])
+        self._remaining = chunk["end"] - chunk["start"]
+        self._stream = gzip.GzipFile(fileobj=self._raw) if chunk["compressed"] else None
+        self.lines = 0
+        if self._stream and chunk["header"]:
+            self._stream.readline()
+
+    def read(self, size=READ_SIZE):
+        position = self._raw.tell()
+        if self._stream:
+            data = self._stream.read(size)
+        else:
+            data = self._raw.read(min(size, self._remaining))
+            self._remaining -= len(data)
+        lines = data.count(b"\n")
+        self.lines += lines
+        self.progress.add(self._raw.tell() - position, len(data), lines)
+        return data
+
+    def close(self):
+        self._raw.close()
+
+
+def identifier(table):
+    """
+    Quotes a possibly schema-qualified table name such as 'public.users'.
+    """
+    from psycopg2 import sql
+
+    return sql.Identifier(*table.split("."))
+
+
+def copy_statement(table, fmt, delimiter=None, null=None):
+    """
+    Builds COPY ... FROM STDIN for a possibly schema-qualified table name.
+    """
+    from psycopg2 import sql
+
+    options = [sql.SQL("FORMAT {}").format(sql.SQL(fmt))]
+    if delimiter is not None:
+        options.append(sql.SQL("DELIMITER {}").format(sql.Literal(delimiter)))
+    if null is not None:
+        options.append(sql.SQL("NULL {}").format(sql.Literal(null)))
+    return sql.SQL("COPY {} FROM STDIN WITH ({})").format(
+        identifier(table), sql.SQL(", ").join(options))
+
+
+class Loader:
+    """
+    Streams chunks through COPY, one connection per worker thread, each chunk in its own transaction.
+    """
+
+    def __init__(self, connect, progress, delimiter=None, null=None):
+        self.connect = connect
+        self.progress = progress
+        self.delimiter = delimiter
+        self.null = null
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn.closed:
+            conn = self.connect()
+            with conn.cursor() as cur:
+                # A server crash can lose the last few commits, which a bulk load that is rerun anyway can afford.
+                cur.execute("SET synchronous_commit = off")
+            conn.commit()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def load_chunk(self, chunk):
+        """
+        Loads one chunk and returns the number of rows the server reported.
+        """
+        import psycopg2
+
+        conn = self._connection()
+        reader = ChunkReader(chunk, self.progress)
+        try:
+            statement = copy_statement(chunk["table"], chunk["format"], self.delimiter, self.null)
+            with conn.cursor() as cur:
+                cur.copy_expert(statement, reader, size=READ_SIZE)
+                rows = cur.rowcount if cur.rowcount >= 0 else reader.lines
+            conn.commit()
+        except psycopg2.Error as e:
+            if not conn.closed:
+                conn.rollback()
+            raise LoadError(f"{chunk['path']} bytes {chunk['start']}-{chunk['end']}: {str(e).strip()}") from e
+        finally:
+            reader.close()
+        self.progress.chunk_done(rows)
+        return rows
+
+    def execute(self, statement):
+        """
+        Runs a statement, such as CREATE INDEX, on this worker's connection.
+        """
+        import psycopg2
+
+        conn = self._connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(statement)
+            conn.commit()
+        except psycopg2.Error as e:
+            if not conn.closed:
+                conn.rollback()
+            raise LoadError(str(e).strip()) from e
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+def secondary_indexes(conn, table):
+    """
+    Returns (name, definition) of the indexes on table that back no constraint and are not unique, i.e.
+    those that can be dropped for a load and rebuilt afterwards without changing what the load accepts.
+    """
+    with conn.cursor() as cur:
+        cur.execute(SECONDARY_INDEXES_SQL, (identifier(table).as_string(conn),))
+        return cur.fetchall()
+
+
+def drop_index(conn, name):
+    with conn.cursor() as cur:
+        # regclass output is already a quoted, schema-qualified name where needed.
+        cur.execute(f"DROP INDEX {name}")
+
+
+def is_logged(conn, table):
+    with conn.cursor() as cur:
+        cur.execute(PERSISTENCE_SQL, (identifier(table).as_string(conn),))
+        return cur.fetchone()[0] == "p"
+
+
+def set_logged(conn, table, logged):
+    """
+    Switches a table between LOGGED and UNLOGGED. Both directions rewrite the table; SET LOGGED also
+    writes its whole contents to the WAL.
+    """
+    from psycopg2 import sql
+
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("ALTER TABLE {} SET {}").format(
+            identifier(table), sql.SQL("LOGGED" if logged else "UNLOGGED")))
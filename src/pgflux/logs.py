@@ -0,0 +1,343 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import time
+
+from pgflux.constants import LOGS_DIR
+from pgflux.stats import LatencyHistogram
+
+# Files with more unread data than this are scanned through mmap instead of buffered reads.
+MMAP_THRESHOLD = 8 * 1024 * 1024
+READ_CHUNK = 1024 * 1024
+# Bounds that keep memory flat however long the log or follow session is.
+MAX_FINGERPRINTS = 2000
+MAX_TABLES = 1000
+MAX_ENTRY_LINES = 200
+MAX_ENTRY_CHARS = 16384
+MAX_LINE_BYTES = 65536
+# An entry at the end of the log may still get continuation lines; it is only counted once the next entry
+# starts, the file rotates, or the file has not changed for this long.
+PENDING_QUIET_SECONDS = 5
+QUERY_SAMPLE_CHARS = 300
+
+LEVELS = ("LOG", "ERROR", "WARNING", "FATAL", "PANIC", "DETAIL", "HINT", "STATEMENT", "CONTEXT", "NOTICE",
+          "INFO", "DEBUG", "DEBUG1", "DEBUG2", "DEBUG3", "DEBUG4", "DEBUG5", "LOCATION", "QUERY")
+HEADER_RE = re.compile(r"^.*?\b(" + "|".join(LEVELS) + r"):  (.*)$")
+DURATION_RE = re.compile(r"^duration: ([0-9.]+) ms(?:\s+(statement|execute [^:]*|parse [^:]*|bind [^:]*|plan):\s*(.*))?$",
+                         re.S)
+QUERY_TEXT_RE = re.compile(r"^\s*Query Text: (.*?)(?:\n\s*\S[^\n]*:|\Z)", re.S | re.M)
+CHECKPOINT_START_RE = re.compile(r"^(checkpoint|restartpoint) starting: (.*)$")
+CHECKPOINT_DONE_RE = re.compile(r"^(checkpoint|restartpoint) complete: wrote (\d+) buffers.*?total=([0-9.]+) s", re.S)
+AUTOVACUUM_RE = re.compile(r'^automatic (vacuum|analyze)(?: to prevent wraparound)? of table "([^"]+)"')
+ELAPSED_RE = re.compile(r"elapsed: ([0-9.]+) s")
+LOCK_WAIT_RE = re.compile(r"^process \d+ (still waiting for|acquired) (\S+) on .+? after ([0-9.]+) ms")
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+PARAM_RE = re.compile(r"\$\d+")
+NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+ROWS_RE = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """
+    Replaces literals and parameters with '?' and collapses value lists, so equal statements share a fingerprint.
+    """
+    query = STRING_RE.sub("?", query)
+    query = PARAM_RE.sub("?", query)
+    query = NUMBER_RE.sub("?", query)
+    query = SPACE_RE.sub(" ", query).strip().rstrip(";").strip()
+    query = LIST_RE.sub("(...)", query)
+    return ROWS_RE.sub("(...)", query)
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.lower().encode()).hexdigest()[:16]
+
+
+def _evict(table, limit, weight):
+    # Like pg_stat_statements: drop the least significant entry instead of growing without bound.
+    if len(table) > limit:
+        del table[min(table, key=lambda key: weight(table[key]))]
+
+
+class LogStats:
+    """
+    Aggregates of everything scanned from one log: statements, checkpoints, autovacuum, locks and errors.
+    """
+
+    def __init__(self):
+        self.statements = {}
+        self.checkpoints = {"started": {}, "completed": 0, "total_seconds": 0.0, "buffers": 0, "too_frequent": 0}
+        self.autovacuum = {}
+        self.locks = {"waits": {}, "max_wait_ms": 0.0, "deadlocks": 0, "timeouts": 0}
+        self.levels = {}
+        self.unattributed_durations = 0
+
+    def add_duration(self, millis, query):
+        normalized = normalize_query(query)
+        key = fingerprint(normalized)
+        entry = self.statements.get(key)
+        if entry is None:
+            entry = self.statements[key] = {"query": normalized[:QUERY_SAMPLE_CHARS], "count": 0, "total_ms": 0.0,
+                                            "max_ms": 0.0, "histogram": LatencyHistogram()}
+        entry["count"] += 1
+        entry["total_ms"] += millis
+        entry["max_ms"] = max(entry["max_ms"], millis)
+        entry["histogram"].add(millis * 1000)
+        _evict(self.statements, MAX_FINGERPRINTS, lambda e: e["total_ms"])
+
+    def add_autovacuum(self, kind, table, seconds):
+        entry = self.autovacuum.setdefault(table, {"vacuum": 0, "analyze": 0, "seconds": 0.0})
+        entry[kind] += 1
+        entry["seconds"] += seconds
+        _evict(self.autovacuum, MAX_TABLES, lambda e: e["seconds"])
+
+    def to_dict(self):
+        statements = {key: dict(entry, histogram=entry["histogram"].to_dict()) for key, entry in self.statements.items()}
+        return {"statements": statements, "checkpoints": self.checkpoints, "autovacuum": self.autovacuum,
+                "locks": self.locks, "levels": self.levels, "unattributed_durations": self.unattributed_durations}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.statements = {key: dict(entry, histogram=LatencyHistogram.from_dict(entry["histogram"]))
+                            for key, entry in data.get("statements", {}).items()}
+        stats.checkpoints.update(data.get("checkpoints", {}))
+        stats.autovacuum = data.get("autovacuum", {})
+        stats.locks.update(data.get("locks", {}))
+        stats.levels = data.get("levels", {})
+        stats.unattributed_durations = data.get("unattributed_durations", 0)
+        return stats
+
+
+class LogAnalyzer:
+    """
+    Groups log lines into entries (a header plus tab-indented continuation lines) and folds them into LogStats.
+    """
+
+    def __init__(self, stats=None):
+        self.stats = stats or LogStats()
+        self._level = None
+        self._lines = []
+        self._chars = 0
+
+    def feed(self, line):
+        if line[:1] == "\t":
+            if self._level and len(self._lines) < MAX_ENTRY_LINES and self._chars < MAX_ENTRY_CHARS:
+                self._lines.append(line[1:])
+                self._chars += len(line)
+            return
+        self.flush()
+        match = HEADER_RE.match(line)
+        if match:
+            self._level, self._lines, self._chars = match.group(1), [match.group(2)], len(line)
+
+    def pending(self):
+        """
+        Returns the entry still open for continuation lines, in a form that can be saved with the offset.
+        """
+        return {"level": self._level, "lines": self._lines, "chars": self._chars} if self._level else None
+
+    def restore(self, pending):
+        if pending:
+            self._level, self._lines, self._chars = pending["level"], list(pending["lines"]), pending["chars"]
+        else:
+            self._level, self._lines, self._chars = None, [], 0
+
+    def flush(self):
+        if self._level:
+            self._handle(self._level, "\n".join(self._lines))
+        self._level, self._lines, self._chars = None, [], 0
+
+    def _handle(self, level, message):
+        stats = self.stats
+        if level in ("ERROR", "WARNING", "FATAL", "PANIC"):
+            stats.levels[level] = stats.levels.get(level, 0) + 1
+            if message.startswith("deadlock detected"):
+                stats.locks["deadlocks"] += 1
+            elif message.startswith("canceling statement due to lock timeout"):
+                stats.locks["timeouts"] += 1
+            elif message.startswith("checkpoints are occurring too frequently"):
+                stats.checkpoints["too_frequent"] += 1
+            return
+        if level != "LOG":
+            return
+
+        match = DURATION_RE.match(message)
+        if match:
+            millis, kind, text = float(match.group(1)), match.group(2), match.group(3)
+            if kind == "plan":
+                # auto_explain: the statement is in the plan's 'Query Text:' line
+                query = QUERY_TEXT_RE.search(text or "")
+                text = query.group(1) if query else None
+            elif kind and kind.startswith(("parse", "bind")):
+                return  # the execute phase of the same statement is logged separately
+            if text:
+                stats.add_duration(millis, text)
+            else:
+                stats.unattributed_durations += 1
+            return
+
+        match = CHECKPOINT_DONE_RE.match(message)
+        if match:
+            stats.checkpoints["completed"] += 1
+            stats.checkpoints["buffers"] += int(match.group(2))
+            stats.checkpoints["total_seconds"] += float(match.group(3))
+            return
+        match = CHECKPOINT_START_RE.match(message)
+        if match:
+            for reason in match.group(2).split():
+                stats.checkpoints["started"][reason] = stats.checkpoints["started"].get(reason, 0) + 1
+            return
+
+        match = AUTOVACUUM_RE.match(message)
+        if match:
+            elapsed = ELAPSED_RE.search(message)
+            stats.add_autovacuum(match.group(1), match.group(2), float(elapsed.group(1)) if elapsed else 0.0)
+            return
+
+        match = LOCK_WAIT_RE.match(message)
+        if match:
+            waits = stats.locks["waits"]
+            if match.group(1) == "still waiting for":
+                waits[match.group(2)] = waits.get(match.group(2), 0) + 1
+            stats.locks["max_wait_ms"] = max(stats.locks["max_wait_ms"], float(match.group(3)))
+
+
+def _complete_lines(f, offset, size):
+    """
+    Yields (line, end offset) for every complete line between offset and size.
+
+    Large unread regions are scanned through mmap; a trailing partial line is
+    left for the next scan.
+    """
+    if size - offset > MMAP_THRESHOLD:
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+            pos = offset
+            while pos < size:
+                end = mm.find(b"\n", pos, size)
+                if end < 0:
+                    return
+                yield mm[pos:min(end, pos + MAX_LINE_BYTES)], end + 1
+                pos = end + 1
+        return
+
+    f.seek(offset)
+    pos = offset
+    while pos < size:
+        line = f.readline(min(MAX_LINE_BYTES, size - pos))
+        if not line:
+            return
+        if not line.endswith(b"\n"):
+            if len(line) < MAX_LINE_BYTES and pos + len(line) >= size:
+                return  # partial line still being written
+            # Overlong line: keep its head and skip the rest
+            rest = f.readline()
+            while rest and not rest.endswith(b"\n"):
+                rest = f.readline(READ_CHUNK)
+            if not rest:
+                return
+            pos = f.tell()
+            yield line, pos
+            continue
+        pos += len(line)
+        yield line, pos
+
+
+def _state_path(log_file, logs_dir):
+    return os.path.join(logs_dir, hashlib.sha1(os.path.abspath(log_file).encode()).hexdigest()[:16] + ".json")
+
+
+def load_state(log_file, logs_dir=LOGS_DIR):
+    """
+    Returns the saved offset, pending entry and aggregates for log_file, reset if the file was rotated or
+    truncated.
+    """
+    try:
+        with open(_state_path(log_file, logs_dir), "r") as f:
+            state = json.load(f)
+        st = os.stat(log_file)
+        if state.get("inode") == st.st_ino and state.get("offset", 0) <= st.st_size:
+            return {"inode": st.st_ino, "offset": state["offset"], "pending": state.get("pending"),
+                    "stats": LogStats.from_dict(state["stats"])}
+    except (OSError, ValueError, KeyError):
+        pass
+    return {"inode": None, "offset": 0, "pending": None, "stats": LogStats()}
+
+
+def save_state(log_file, state, logs_dir=LOGS_DIR):
+    os.makedirs(logs_dir, exist_ok=True)
+    path = _state_path(log_file, logs_dir)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"path": os.path.abspath(log_file), "inode": state["inode"], "offset": state["offset"],
+                   "pending": state.get("pending"), "stats": state["stats"].to_dict()}, f)
+    os.replace(path + ".tmp", path)
+
+
+def scan(log_file, state, analyzer=None):
+    """
+    Feeds the lines appended since state['offset'] to the analyzer and advances the offset.
+
+    The last entry stays in state['pending'] while more continuation lines can still be appended to it.
+    Returns the number of bytes scanned.
+    """
+    analyzer = analyzer or LogAnalyzer(state["stats"])
+    analyzer.restore(state.get("pending"))
+    with open(log_file, "rb") as f:
+        st = os.fstat(f.fileno())
+        if state["inode"] != st.st_ino or state["offset"] > st.st_size:
+            # New or rotated file: the old one's last entry is complete; start over
+            analyzer.flush()
+            state.update(inode=st.st_ino, offset=0)
+        start = state["offset"]
+        for line, end in _complete_lines(f, start, st.st_size):
+            analyzer.feed(line.decode("utf-8", errors="replace").rstrip("\n"))
+            state["offset"] = end
+        if state["offset"] < st.st_size:
+            # A new entry is being written after the pending one
+            f.seek(state["offset"])
+            complete = f.read(1) != b"\t"
+        else:
+            complete = time.time() - st.st_mtime >= PENDING_QUIET_SECONDS
+    if complete:
+        analyzer.flush()
+    state["pending"] = analyzer.pending()
+    return state["offset"] - start
+
+
+def percentiles(entry):
+    histogram = entry["histogram"]
+    return histogram.percentile(50), histogram.percentile(95), histogram.percentile(99)
+
+
+def top_statements(stats, limit=10, sort="total"):
+    """
+    Returns the statement aggregates ordered by total time, count, mean or p95.
+    """
+    keys = {
+        "total": lambda e: e["total_ms"],
+        "count": lambda e: e["count"],
+        "mean": lambda e: e["total_ms"] / e["count"],
+        "p95": lambda e: e["histogram"].percentile(95) or 0,
+    }
+    return sorted(stats.statements.values(), key=keys[sort], reverse=True)[:limit]
+
+
+def tail(log_file, lines=50):
+    """
+    Returns the last lines of a file without reading all of it.
+    """
+    with open(log_file, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        while pos > 0 and data.count(b"\n") <= lines:
+            step = min(READ_CHUNK, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    return [line.decode("utf-8", errors="replace") for line in data.splitlines()[-lines:]]
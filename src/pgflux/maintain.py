@@ -0,0 +1,314 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DATABASES_SQL = "SELECT datname FROM pg_database WHERE datallowconn AND NOT datistemplate ORDER BY datname"
+
+# Heap statistics plus the average row width pg_stats saw, from which the expected size is estimated
+TABLES_SQL = """
+    SELECT s.schemaname, s.relname, quote_ident(s.schemaname) || '.' || quote_ident(s.relname),
+           c.relpages, c.reltuples, s.n_live_tup, s.n_dead_tup, s.n_mod_since_analyze,
+           greatest(s.last_vacuum, s.last_autovacuum) IS NULL, greatest(s.last_analyze, s.last_autoanalyze) IS NULL,
+           pg_table_size(c.oid),
+           coalesce((SELECT option_value::int FROM pg_options_to_table(c.reloptions)
+                     WHERE option_name = 'fillfactor'), 100),
+           (SELECT sum((1 - st.null_frac) * st.avg_width) FROM pg_stats st
+            WHERE st.schemaname = s.schemaname AND st.tablename = s.relname AND NOT st.inherited)
+    FROM pg_stat_user_tables s
+    JOIN pg_class c ON c.oid = s.relid
+    WHERE c.relkind IN ('r', 'm')
+"""
+TABLE_FIELDS = ("schema", "name", "qualified", "relpages", "reltuples", "live_tuples", "dead_tuples", "modified",
+                "never_vacuumed", "never_analyzed", "size", "fillfactor", "row_width")
+
+# Valid btree indexes with the average width of the columns they store, key and INCLUDE alike
+INDEXES_SQL = """
+    SELECT n.nspname, t.relname, quote_ident(n.nspname) || '.' || quote_ident(t.relname),
+           quote_ident(n.nspname) || '.' || quote_ident(ic.relname), ic.relpages, ic.reltuples,
+           pg_relation_size(ic.oid),
+           coalesce((SELECT option_value::int FROM pg_options_to_table(ic.reloptions)
+                     WHERE option_name = 'fillfactor'), 90),
+           (SELECT sum((1 - st.null_frac) * st.avg_width) FROM pg_attribute a
+            JOIN pg_stats st ON st.schemaname = n.nspname AND st.tablename = t.relname AND st.attname = a.attname
+                            AND NOT st.inherited
+            WHERE a.attrelid = t.oid AND a.attnum = ANY (i.indkey::int2[])),
+           i.indexprs IS NULL AND NOT (0 = ANY (i.indkey::int2[]))
+    FROM pg_index i
+    JOIN pg_class ic ON ic.oid = i.indexrelid
+    JOIN pg_class t ON t.oid = i.indrelid
+    JOIN pg_namespace n ON n.oid = t.relnamespace
+    JOIN pg_am am ON am.oid = ic.relam
+    WHERE am.amname = 'btree' AND i.indisvalid AND ic.relpages > 0
+      AND n.nspname NOT IN ('pg_catalog', 'information_schema') AND n.nspname !~ '^pg_toast'
+"""
+INDEX_FIELDS = ("schema", "table_name", "table", "qualified", "relpages", "reltuples", "size", "fillfactor",
+                "row_width", "plain")
+SIZE_SQL = {"table": "SELECT pg_table_size(%s::regclass)", "index": "SELECT pg_relation_size(%s::regclass)"}
+
+# On-disk layout used by the estimates (8-byte alignment, as on 64-bit platforms)
+MAXALIGN = 8
+PAGE_HEADER = 24
+ITEM_ID = 4
+HEAP_TUPLE_HEADER = 24
+INDEX_TUPLE_HEADER = 8
+BTREE_SPECIAL = 16
+
+DEFAULT_THRESHOLDS = {
+    "dead_ratio": 0.1,  # dead share of all tuples that makes a table worth vacuuming
+    "min_dead_tuples": 1000,
+    "analyze_ratio": 0.1,  # modified share of rows since the last analyze, as autovacuum_analyze_scale_factor
+    "min_modified": 1000,
+    "index_bloat_ratio": 0.3,
+    "min_index_bloat": 8 * 1024 * 1024,
+    "table_bloat_ratio": 0.3,  # reported only: VACUUM cannot give the space back, VACUUM FULL locks the table
+}
+# Assumed REINDEX speed; a rebuild that would not finish inside the time budget is not started, since an
+# interrupted REINDEX CONCURRENTLY leaves an invalid copy of the index behind
+REINDEX_BYTES_PER_SECOND = 32 * 1024 * 1024
+LOCK_TIMEOUT_MS = 5000
+
+
+class MaintainError(Exception):
+    """
+    Raised when a maintenance task fails.
+    """
+
+
+def _align(size):
+    return int(math.ceil(size / MAXALIGN) * MAXALIGN)
+
+
+def _bloat(relpages, expected_pages, block_size):
+    actual = relpages * block_size
+    bloat = max(0, relpages - expected_pages) * block_size
+    return bloat, bloat / actual if actual else 0.0
+
+
+def estimate_table(table, block_size):
+    """
+    Adds dead-tuple ratio, estimated dead bytes and heap bloat to a table row.
+
+    The expected heap size is what reltuples rows of the average width would take at the fillfactor; the
+    bloat estimate is unknown (None) until the table has been analyzed.
+    """
+    live, dead = table["live_tuples"], table["dead_tuples"]
+    table = dict(table, dead_ratio=dead / (live + dead) if live + dead else 0.0, bloat_bytes=None, bloat_ratio=None)
+    if table["row_width"] is not None and table["reltuples"] >= 0:
+        tuple_bytes = HEAP_TUPLE_HEADER + _align(float(table["row_width"])) + ITEM_ID
+        per_page = max(1, int((block_size - PAGE_HEADER) * table["fillfactor"] / 100 // tuple_bytes))
+        expected = math.ceil(table["reltuples"] / per_page)
+        table["bloat_bytes"], table["bloat_ratio"] = _bloat(table["relpages"], expected, block_size)
+    else:
+        tuple_bytes = table["relpages"] * block_size / (live + dead) if live + dead else 0
+    table["dead_bytes"] = int(dead * tuple_bytes)
+    table["modified_bytes"] = int(table["modified"] * tuple_bytes)
+    return table
+
+
+def estimate_index(index, block_size):
+    """
+    Adds estimated bloat to a btree index row: its size against the leaf pages reltuples entries of the
+    average width need at the fillfactor, plus the metapage. Expression indexes have no column statistics.
+    """
+    index = dict(index, bloat_bytes=None, bloat_ratio=None)
+    if not index["plain"] or index["row_width"] is None or index["reltuples"] < 0:
+        return index
+    tuple_bytes = INDEX_TUPLE_HEADER + _align(float(index["row_width"])) + ITEM_ID
+    usable = (block_size - PAGE_HEADER - BTREE_SPECIAL) * index["fillfactor"] / 100
+    per_page = max(1, int(usable // tuple_bytes))
+    expected = math.ceil(index["reltuples"] / per_page) + 1
+    index["bloat_bytes"], index["bloat_ratio"] = _bloat(index["relpages"], expected, block_size)
+    return index
+
+
+def plan_tasks(database, tables, indexes, thresholds=None, reindex=True):
+    """
+    Ranks the maintenance a database needs, largest expected gain first. VACUUM is scored by the bytes of
+    dead tuples it frees for reuse, ANALYZE by the bytes of rows changed since the last one, REINDEX by
+    the estimated bloat it removes.
+    """
+    thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+    tasks = []
+    for table in tables:
+        vacuum = (table["dead_tuples"] >= thresholds["min_dead_tuples"]
+                  and table["dead_ratio"] >= thresholds["dead_ratio"])
+        analyze = table["never_analyzed"] and table["live_tuples"] > 0 or (
+            table["modified"] >= thresholds["min_modified"]
+            and table["modified"] >= thresholds["analyze_ratio"] * max(table["reltuples"], 0))
+        if not (vacuum or analyze):
+            continue
+        reasons = []
+        if vacuum:
+            reasons.append(f"{table['dead_ratio'] * 100:.0f}% dead tuples")
+        if analyze:
+            reasons.append("never analyzed" if table["never_analyzed"] else f"{table['modified']} rows changed")
+        tasks.append({"database": database, "kind": "vacuum" if vacuum else "analyze", "analyze": analyze,
+                      "object": table["qualified"], "table": table["qualified"], "size": table["size"],
+                      "dead_tuples": table["dead_tuples"],
+                      "score": table["dead_bytes"] if vacuum else table["modified_bytes"],
+                      "reason": ", ".join(reasons)})
+    for index in indexes if reindex else ():
+        if index["bloat_bytes"] is None or index["bloat_bytes"] < thresholds["min_index_bloat"]:
+            continue
+        if index["bloat_ratio"] < thresholds["index_bloat_ratio"]:
+            continue
+        tasks.append({"database": database, "kind": "reindex", "analyze": False, "object": index["qualified"],
+                      "table": index["table"], "size": index["size"], "dead_tuples": None,
+                      "score": index["bloat_bytes"],
+                      "reason": f"~{index['bloat_ratio'] * 100:.0f}% bloat"})
+    return sorted(tasks, key=lambda task: task["score"], reverse=True)
+
+
+def bloated_tables(tables, thresholds=None):
+    """
+    Returns the tables whose heap is bloated beyond what VACUUM can give back to the operating system.
+    """
+    ratio = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))["table_bloat_ratio"]
+    return [t for t in tables if t["bloat_ratio"] is not None and t["bloat_ratio"] >= ratio]
+
+
+def task_statement(task, parallel=None, server_version=0):
+    """
+    Returns the SQL of a task. PARALLEL (PostgreSQL 13+) sets the workers that vacuum the indexes.
+    """
+    if task["kind"] == "reindex":
+        return f"REINDEX INDEX CONCURRENTLY {task['object']}"
+    if task["kind"] == "analyze":
+        return f"ANALYZE {task['object']}"
+    options = []
+    if task["analyze"]:
+        options.append("ANALYZE")
+    if parallel is not None and server_version >= 130000:
+        options.append(f"PARALLEL {int(parallel)}")
+    return f"VACUUM ({', '.join(options)}) {task['object']}" if options else f"VACUUM {task['object']}"
+
+
+def table_queues(tasks):
+    """
+    Groups ranked tasks into one queue per table, ordered by each table's best task, so the same table is
+    never worked on by two connections at once (their locks would conflict).
+    """
+    queues = {}
+    for task in tasks:
+        queues.setdefault((task["database"], task["table"]), []).append(task)
+    return list(queues.values())
+
+
+def collect(cur, database, thresholds=None, reindex=True):
+    """
+    Reads table and index statistics of the connected database and returns (tasks, tables, indexes).
+    """
+    import psycopg2
+
+    try:
+        cur.execute("SHOW block_size")
+        block_size = int(cur.fetchone()[0])
+        cur.execute(TABLES_SQL)
+        tables = [estimate_table(dict(zip(TABLE_FIELDS, row)), block_size) for row in cur.fetchall()]
+        cur.execute(INDEXES_SQL)
+        indexes = [estimate_index(dict(zip(INDEX_FIELDS, row)), block_size) for row in cur.fetchall()]
+    except psycopg2.Error as e:
+        raise MaintainError(f"Could not read statistics of {database}: {str(e).strip()}") from e
+    return plan_tasks(database, tables, indexes, thresholds, reindex), tables, indexes
+
+
+class Runner:
+    """
+    Works through table queues on a bounded number of connections, with vacuum cost throttling and a
+    deadline after which no new task starts. connect(database) returns an autocommit connection and raises
+    MaintainError when it cannot.
+    """
+
+    def __init__(self, connect, jobs=2, parallel=None, cost_delay=None, cost_limit=None, budget=None,
+                 report=None):
+        self.connect = connect
+        self.jobs = max(1, jobs)
+        self.parallel = parallel
+        self.cost_delay = cost_delay
+        self.cost_limit = cost_limit
+        self.deadline = time.monotonic() + budget if budget else None
+        self.report = report
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        return self.deadline - time.monotonic() if self.deadline is not None else None
+
+    def run(self, tasks):
+        """
+        Runs all tasks and returns one result per task, grouped by table queue in queue order; the report
+        callback sees them as they finish.
+        """
+        results = []
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            for queue_results in pool.map(self._run_queue, table_queues(tasks)):
+                results.extend(queue_results)
+        return results
+
+    def _run_queue(self, queue):
+        results = []
+        conn = database = None
+        try:
+            for task in queue:
+                remaining = self.remaining()
+                if remaining is not None and (remaining <= 0 or task["kind"] == "reindex"
+                                              and task["size"] / REINDEX_BYTES_PER_SECOND > remaining):
+                    result = dict(task, status="deferred", seconds=0.0, reclaimed=0,
+                                  error="does not fit in the time budget")
+                else:
+                    try:
+                        if database != task["database"]:
+                            if conn is not None:
+                                conn.close()
+                            conn, database = None, None
+                            conn, database = self.connect(task["database"]), task["database"]
+                        result = self._run_task(conn, task)
+                    except MaintainError as e:
+                        result = dict(task, status="failed", seconds=0.0, reclaimed=0, error=str(e))
+                results.append(result)
+                if self.report:
+                    with self._lock:
+                        self.report(result)
+        finally:
+            if conn is not None:
+                conn.close()
+        return results
+
+    def _run_task(self, conn, task):
+        import psycopg2
+
+        statement = task_statement(task, self.parallel, conn.server_version)
+        kind = "index" if task["kind"] == "reindex" else "table"
+        started = time.monotonic()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(SIZE_SQL[kind], (task["object"],))
+                before = cur.fetchone()[0]
+                if self.cost_delay is not None:
+                    cur.execute("SET vacuum_cost_delay = %s", (self.cost_delay,))
+                if self.cost_limit is not None:
+                    cur.execute("SET vacuum_cost_limit = %s", (self.cost_limit,))
+                cur.execute(f"SET lock_timeout = {LOCK_TIMEOUT_MS}")
+                remaining = self.remaining()
+                if remaining is not None and remaining <= 0:
+                    # The budget ran out while connecting and measuring; 0 would mean no timeout at all
+                    return dict(task, status="deferred", seconds=time.monotonic() - started, reclaimed=0,
+                                error="does not fit in the time budget")
+                # VACUUM and ANALYZE are cancelled at the deadline; REINDEX was only started if it fits
+                if remaining is not None and task["kind"] != "reindex":
+                    timeout = max(int(remaining * 1000), 1)
+                else:
+                    timeout = 0
+                cur.execute(f"SET statement_timeout = {timeout}")
+                cur.execute(statement)
+                cur.execute(SIZE_SQL[kind], (task["object"],))
+                after = cur.fetchone()[0]
+            return dict(task, status="done", statement=statement, seconds=time.monotonic() - started,
+                        size_before=before, size_after=after, reclaimed=before - after, error=None)
+        except psycopg2.Error as e:
+            error = str(e).strip()
+            if task["kind"] == "reindex":
+                error += (f" (an invalid copy named like {task['object']}_ccnew may be left behind; "
+                          f"drop it with DROP INDEX CONCURRENTLY)")
+            return dict(task, status="failed", statement=statement, seconds=time.monotonic() - started,
+                        reclaimed=0, error=error)
@@ -0,0 +1,146 @@
+CONNECTIONS_SQL = """
+    SELECT coalesce(state, 'unknown'), count(*)
+    FROM pg_stat_activity
+    WHERE backend_type = 'client backend'
+    GROUP BY 1
+"""
+
+DATABASE_SQL = """
+    SELECT extract(epoch FROM clock_timestamp()),
+           coalesce(sum(xact_commit), 0), coalesce(sum(xact_rollback), 0),
+           coalesce(sum(blks_hit), 0), coalesce(sum(blks_read), 0),
+           coalesce(sum(tup_returned), 0), coalesce(sum(tup_inserted + tup_updated + tup_deleted), 0),
+           coalesce(sum(deadlocks), 0), coalesce(sum(temp_bytes), 0)
+    FROM pg_stat_database
+"""
+
+# pg_stat_checkpointer split the checkpoint counters out of pg_stat_bgwriter in PostgreSQL 17.
+CHECKPOINTER_SQL = """
+    SELECT num_timed, num_requested, write_time, sync_time, buffers_written
+    FROM pg_stat_checkpointer
+"""
+BGWRITER_SQL = """
+    SELECT checkpoints_timed, checkpoints_req, checkpoint_write_time, checkpoint_sync_time, buffers_checkpoint
+    FROM pg_stat_bgwriter
+"""
+
+PRIMARY_LAG_SQL = """
+    SELECT application_name, coalesce(host(client_addr), 'local'), state,
+           pg_wal_lsn_diff(pg_current_wal_lsn(), replay_lsn),
+           extract(epoch FROM replay_lag)
+    FROM pg_stat_replication
+    ORDER BY application_name
+"""
+STANDBY_LAG_SQL = """
+    SELECT pg_wal_lsn_diff(pg_last_wal_receive_lsn(), pg_last_wal_replay_lsn()),
+           extract(epoch FROM clock_timestamp() - pg_last_xact_replay_timestamp())
+"""
+
+DATABASE_FIELDS = ("time", "commits", "rollbacks", "blks_hit", "blks_read", "tup_read", "tup_written",
+                   "deadlocks", "temp_bytes")
+CHECKPOINT_FIELDS = ("timed", "requested", "write_ms", "sync_ms", "buffers")
+
+
+def _hit_ratio(hit, read):
+    return hit / (hit + read) if hit + read else None
+
+
+def sample(conn):
+    """
+    Collects one snapshot of server statistics over an open connection.
+    """
+    with conn.cursor() as cur:
+        cur.execute(CONNECTIONS_SQL)
+        connections = dict(cur.fetchall())
+
+        cur.execute(DATABASE_SQL)
+        database = {name: float(value) for name, value in zip(DATABASE_FIELDS, cur.fetchone())}
+
+        cur.execute(CHECKPOINTER_SQL if conn.server_version >= 170000 else BGWRITER_SQL)
+        checkpoints = {name: float(value) for name, value in zip(CHECKPOINT_FIELDS, cur.fetchone())}
+
+        cur.execute("SELECT pg_is_in_recovery()")
+        in_recovery = cur.fetchone()[0]
+        if in_recovery:
+            cur.execute(STANDBY_LAG_SQL)
+            lag_bytes, lag_seconds = cur.fetchone()
+            replication = [{"name": "upstream", "client": "", "state": "standby",
+                            "lag_bytes": lag_bytes, "lag_seconds": lag_seconds}]
+        else:
+            cur.execute(PRIMARY_LAG_SQL)
+            replication = [{"name": name, "client": client, "state": state,
+                            "lag_bytes": lag_bytes, "lag_seconds": lag_seconds}
+                           for name, client, state, lag_bytes, lag_seconds in cur.fetchall()]
+
+    return {
+        "connections": connections,
+        "database": database,
+        "checkpoints": checkpoints,
+        "in_recovery": in_recovery,
+        "replication": replication,
+        "hit_ratio": _hit_ratio(database["blks_hit"], database["blks_read"]),
+    }
+
+
+def rates(previous, current):
+    """
+    Computes per-second rates and the interval hit ratio between two snapshots.
+    """
+    before, after = previous["database"], current["database"]
+    elapsed = after["time"] - before["time"]
+    if elapsed <= 0:
+        return None
+
+    def per_second(field, source="database"):
+        return max(current[source][field] - previous[source][field], 0) / elapsed
+
+    return {
+        "interval": elapsed,
+        "tps": per_second("commits") + per_second("rollbacks"),
+        "commits": per_second("commits"),
+        "rollbacks": per_second("rollbacks"),
+        "tup_read": per_second("tup_read"),
+        "tup_written": per_second("tup_written"),
+        "hit_ratio": _hit_ratio(after["blks_hit"] - before["blks_hit"], after["blks_read"] - before["blks_read"]),
+        "checkpoints": (per_second("timed", "checkpoints") + per_second("requested", "checkpoints")) * elapsed,
+        "checkpoint_buffers": per_second("buffers", "checkpoints"),
+    }
+
+
+def format_ratio(ratio):
+    return "n/a" if ratio is None else f"{ratio * 100:.2f}%"
+
+
+def format_snapshot(snapshot, delta=None):
+    """
+    Renders a snapshot, and the rates since the previous one if given, as lines of text.
+    """
+    connections = snapshot["connections"]
+    states = ", ".join(f"{state} {count}" for state, count in sorted(connections.items())) or "none"
+    lines = [f"Connections: {sum(connections.values())} ({states})"]
+
+    if delta:
+        lines.append(f"TPS: {delta['tps']:.1f} (commit {delta['commits']:.1f}/s, rollback {delta['rollbacks']:.1f}/s)"
+                     f" over {delta['interval']:.1f}s")
+        lines.append(f"Rows: {delta['tup_read']:.0f} read/s, {delta['tup_written']:.0f} written/s")
+        lines.append(f"Cache hit ratio: {format_ratio(delta['hit_ratio'])} interval, "
+                     f"{format_ratio(snapshot['hit_ratio'])} since stats reset")
+    else:
+        lines.append(f"Cache hit ratio: {format_ratio(snapshot['hit_ratio'])} since stats reset")
+
+    checkpoints = snapshot["checkpoints"]
+    lines.append(f"Checkpoints: {checkpoints['timed']:.0f} timed, {checkpoints['requested']:.0f} requested, "
+                 f"{checkpoints['buffers']:.0f} buffers written, "
+                 f"write {checkpoints['write_ms'] / 1000:.1f}s, sync {checkpoints['sync_ms'] / 1000:.1f}s")
+    if delta and delta["checkpoints"]:
+        lines.append(f"  {delta['checkpoints']:.0f} checkpoint(s) this interval, "
+                     f"{delta['checkpoint_buffers']:.0f} buffers/s")
+
+    if not snapshot["replication"]:
+        lines.append("Replication: no standbys connected")
+    for replica in snapshot["replication"]:
+        lag_bytes = "n/a" if replica["lag_bytes"] is None else f"{float(replica['lag_bytes']):.0f} bytes"
+        lag_seconds = "n/a" if replica["lag_seconds"] is None else f"{float(replica['lag_seconds']):.3f}s"
+        client = f" ({replica['client']})" if replica["client"] else ""
+        lines.append(f"Replication {replica['name']}{client} [{replica['state']}]: lag {lag_bytes}, {lag_seconds}")
+    return lines
@@ -0,0 +1,81 @@
+import glob
+import hashlib
+import os
+import shutil
+import socket
+import tempfile
+
+from pgflux import build, instrument, readiness, shutdown, templates
+
+TRAINING_SCALE = 10
+TRAINING_SECONDS = 60
+# Bump when the built-in training workload changes, so cached PGO builds are not reused.
+BUILTIN_WORKLOAD = "pgbench-tpcb-select-v1"
+
+
+def workload_id(workload=None):
+    """
+    Identifies the training workload for the build cache key: a content hash for SQL files.
+    """
+    if not workload:
+        return BUILTIN_WORKLOAD
+    with open(workload, "rb") as f:
+        return "sql-" + hashlib.sha256(f.read()).hexdigest()
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _llvm_profdata():
+    tool = os.environ.get("LLVM_PROFDATA") or shutil.which("llvm-profdata")
+    if not tool:
+        raise RuntimeError("llvm-profdata is required to merge clang PGO profiles; set LLVM_PROFDATA or add it to PATH.")
+    return tool
+
+
+def train(bin_dir, profile_dir, compiler, workload=None, duration=TRAINING_SECONDS, **run_kwargs):
+    """
+    Runs a representative workload on a throwaway cluster of instrumented binaries.
+
+    The cluster lives in a temporary directory and listens only on a private
+    socket. Without a workload file, pgbench runs a TPC-B-like and a read-only
+    phase. Profiles are flushed when the server shuts down; clang's raw
+    profiles are then merged for -fprofile-use.
+    """
+    cpus = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory(prefix="pgflux-pgo-") as work_dir:
+        data_dir = os.path.join(work_dir, "data")
+        log_file = os.path.join(work_dir, "logfile")
+        port = _free_port()
+        instrument.run("pgo-initdb", [os.path.join(bin_dir, "initdb"), "-D", data_dir, "-U", "postgres", "-A", "trust", "-N"],
+                       check=True, **run_kwargs)
+        templates.apply_overrides(data_dir, {"port": port, "listen_addresses": "", "unix_socket_directories": work_dir})
+        readiness.start_server(os.path.join(bin_dir, "pg_ctl"), data_dir, log_file, phase="pgo-start", **run_kwargs)
+
+        conn_args = ["-h", work_dir, "-p", str(port), "-U", "postgres"]
+        try:
+            if workload:
+                instrument.run("pgo-workload", [os.path.join(bin_dir, "psql"), "-X", "-q", "-f", workload]
+                               + conn_args + ["postgres"], check=True, **run_kwargs)
+            else:
+                pgbench = os.path.join(bin_dir, "pgbench")
+                instrument.run("pgo-pgbench-init", [pgbench, "-i", "-q", "-s", str(TRAINING_SCALE)] + conn_args + ["postgres"],
+                               check=True, **run_kwargs)
+                for name, builtin in (("pgo-pgbench-tpcb", "tpcb-like"), ("pgo-pgbench-select", "select-only")):
+                    instrument.run(name, [pgbench, f"--builtin={builtin}", "-c", str(cpus * 2), "-j", str(cpus),
+                                          "-T", str(max(duration // 2, 1))] + conn_args + ["postgres"],
+                                   check=True, **run_kwargs)
+        finally:
+            shutdown.stop_server(data_dir, "fast", echo=lambda message: None)
+
+    if build.compiler_family(compiler) == "clang":
+        raw = glob.glob(os.path.join(profile_dir, "*.profraw"))
+        if not raw:
+            raise RuntimeError(f"The training run wrote no profiles to {profile_dir}.")
+        instrument.run("pgo-merge", [_llvm_profdata(), "merge", f"-output={os.path.join(profile_dir, build.PROFDATA_FILE)}"]
+                       + raw, check=True, **run_kwargs)
+    elif not glob.glob(os.path.join(profile_dir, "**", "*.gcda"), recursive=True):
+        raise RuntimeError(f"The training run wrote no profiles to {profile_dir}.")
@@ -0,0 +1,232 @@
+import base64
+import hashlib
+import hmac
+import os
+import struct
+
+# Startup packet codes
+PROTOCOL_VERSION = 196608  # 3.0
+CANCEL_REQUEST_CODE = 80877102
+SSL_REQUEST_CODE = 80877103
+GSSENC_REQUEST_CODE = 80877104
+
+# Authentication request codes of the 'R' message
+AUTH_OK = 0
+AUTH_CLEARTEXT = 3
+AUTH_MD5 = 5
+AUTH_SASL = 10
+AUTH_SASL_CONTINUE = 11
+AUTH_SASL_FINAL = 12
+
+SCRAM_MECHANISM = "SCRAM-SHA-256"
+SCRAM_ITERATIONS = 4096
+SCRAM_NONCE_BYTES = 18
+
+MAX_STARTUP_LENGTH = 10000  # the server rejects longer startup packets too
+
+
+class ProtocolError(Exception):
+    """
+    Raised for malformed or unexpected protocol messages and failed authentication exchanges.
+    """
+
+
+async def read_message(reader):
+    """
+    Reads one typed message and returns (type byte, payload).
+    """
+    header = await reader.readexactly(5)
+    length = struct.unpack("!I", header[1:])[0]
+    if length < 4:
+        raise ProtocolError(f"invalid message length {length}")
+    return header[:1], await reader.readexactly(length - 4)
+
+
+async def read_startup(reader):
+    """
+    Reads an untyped startup-phase packet and returns (code, payload): a protocol version or a request code.
+    """
+    length, code = struct.unpack("!II", await reader.readexactly(8))
+    if not 8 <= length <= MAX_STARTUP_LENGTH:
+        raise ProtocolError(f"invalid startup packet length {length}")
+    return code, await reader.readexactly(length - 8)
+
+
+def message(kind, payload=b""):
+    return kind + struct.pack("!I", len(payload) + 4) + payload
+
+
+def _cstring(text):
+    return text.encode() + b"\0"
+
+
+def startup_message(params):
+    payload = b"".join(_cstring(name) + _cstring(value) for name, value in params.items()) + b"\0"
+    return struct.pack("!II", len(payload) + 8, PROTOCOL_VERSION) + payload
+
+
+def startup_params(payload):
+    """
+    Parses the name/value pairs of a startup message.
+    """
+    fields = payload.split(b"\0")
+    return {fields[i].decode(): fields[i + 1].decode() for i in range(0, len(fields) - 1, 2) if fields[i]}
+
+
+def cancel_request(pid, key):
+    return struct.pack("!IIII", 16, CANCEL_REQUEST_CODE, pid, key)
+
+
+def auth_request(code, data=b""):
+    return message(b"R", struct.pack("!I", code) + data)
+
+
+def parameter_status(name, value):
+    return message(b"S", _cstring(name) + _cstring(value))
+
+
+def backend_key_data(pid, key):
+    return message(b"K", struct.pack("!II", pid, key))
+
+
+def ready_for_query(status=b"I"):
+    return message(b"Z", status)
+
+
+def error_response(text, code="08P01", severity="FATAL"):
+    fields = [b"S" + _cstring(severity), b"V" + _cstring(severity), b"C" + _cstring(code), b"M" + _cstring(text)]
+    return message(b"E", b"".join(fields) + b"\0")
+
+
+def error_fields(payload):
+    """
+    Maps the field codes of an ErrorResponse or NoticeResponse to their text.
+    """
+    return {field[:1].decode(): field[1:].decode(errors="replace") for field in payload.split(b"\0") if field}
+
+
+def password_message(text):
+    return message(b"p", _cstring(text))
+
+
+def sasl_initial_response(mechanism, data):
+    return message(b"p", _cstring(mechanism) + struct.pack("!i", len(data)) + data)
+
+
+def sasl_response(data):
+    return message(b"p", data)
+
+
+def parse_sasl_initial_response(payload):
+    """
+    Returns (mechanism, client-first-message) of a SASLInitialResponse.
+    """
+    end = payload.index(b"\0")
+    length = struct.unpack("!i", payload[end + 1:end + 5])[0]
+    return payload[:end].decode(), payload[end + 5:end + 5 + length] if length >= 0 else b""
+
+
+def md5_password(user, password, salt):
+    """
+    Returns the response to AuthenticationMD5Password: md5(md5(password + user) + salt), hex, prefixed 'md5'.
+    """
+    inner = hashlib.md5((password + user).encode()).hexdigest()
+    return "md5" + hashlib.md5(inner.encode() + salt).hexdigest()
+
+
+def _nonce():
+    return base64.b64encode(os.urandom(SCRAM_NONCE_BYTES)).decode()
+
+
+def _scram_attributes(text):
+    return dict(part.split("=", 1) for part in text.split(",") if "=" in part)
+
+
+def _scram_keys(password, salt, iterations):
+    salted = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+    client_key = hmac.new(salted, b"Client Key", hashlib.sha256).digest()
+    server_key = hmac.new(salted, b"Server Key", hashlib.sha256).digest()
+    return client_key, hashlib.sha256(client_key).digest(), server_key
+
+
+def _xor(a, b):
+    return bytes(x ^ y for x, y in zip(a, b))
+
+
+class ScramClient:
+    """
+    Client side of SCRAM-SHA-256 without channel binding, as libpq does it over plain connections.
+    """
+
+    def __init__(self, password):
+        self.password = password
+        self.nonce = _nonce()
+        self.client_first_bare = f"n=,r={self.nonce}"
+        self.server_signature = None
+
+    def first_message(self):
+        return ("n,," + self.client_first_bare).encode()
+
+    def final_message(self, server_first):
+        server_first = server_first.decode()
+        attributes = _scram_attributes(server_first)
+        if not attributes.get("r", "").startswith(self.nonce):
+            raise ProtocolError("SCRAM server nonce does not extend the client nonce")
+        client_key, stored_key, server_key = _scram_keys(self.password, base64.b64decode(attributes["s"]),
+                                                         int(attributes["i"]))
+        without_proof = f"c=biws,r={attributes['r']}"
+        auth_message = f"{self.client_first_bare},{server_first},{without_proof}".encode()
+        proof = _xor(client_key, hmac.new(stored_key, auth_message, hashlib.sha256).digest())
+        self.server_signature = hmac.new(server_key, auth_message, hashlib.sha256).digest()
+        return f"{without_proof},p={base64.b64encode(proof).decode()}".encode()
+
+    def verify(self, server_final):
+        """
+        Checks the server's signature, which proves it knows the password too.
+        """
+        signature = _scram_attributes(server_final.decode()).get("v", "")
+        if not hmac.compare_digest(base64.b64decode(signature), self.server_signature or b""):
+            raise ProtocolError("SCRAM server signature does not match")
+
+
+class ScramServer:
+    """
+    Server side of SCRAM-SHA-256 against a known password; a fresh salt is drawn per exchange.
+    """
+
+    def __init__(self, password, iterations=SCRAM_ITERATIONS):
+        self.password = password
+        self.iterations = iterations
+        self.salt = os.urandom(16)
+        self.client_first_bare = None
+        self.server_first = None
+
+    def first_message(self, client_first):
+        client_first = client_first.decode()
+        if not client_first.startswith(("n,", "y,")):
+            raise ProtocolError("SCRAM channel binding is not supported")
+        self.client_first_bare = client_first.split(",", 2)[2]
+        client_nonce = _scram_attributes(self.client_first_bare).get("r")
+        if not client_nonce:
+            raise ProtocolError("SCRAM client nonce missing")
+        self.server_first = (f"r={client_nonce}{_nonce()},s={base64.b64encode(self.salt).decode()},"
+                             f"i={self.iterations}")
+        return self.server_first.encode()
+
+    def final_message(self, client_final):
+        """
+        Verifies the client's proof and returns the server-final message.
+        """
+        client_final = client_final.decode()
+        without_proof, _, proof = client_final.rpartition(",p=")
+        attributes = _scram_attributes(without_proof)
+        if attributes.get("r") != _scram_attributes(self.server_first)["r"]:
+            raise ProtocolError("SCRAM nonce mismatch")
+        _, stored_key, server_key = _scram_keys(self.password, self.salt, self.iterations)
+        auth_message = f"{self.client_first_bare},{self.server_first},{without_proof}".encode()
+        signature = hmac.new(stored_key, auth_message, hashlib.sha256).digest()
+        recovered = _xor(base64.b64decode(proof), signature)
+        if not hmac.compare_digest(hashlib.sha256(recovered).digest(), stored_key):
+            raise ProtocolError("SCRAM proof does not match")
+        server_signature = hmac.new(server_key, auth_message, hashlib.sha256).digest()
+        return f"v={base64.b64encode(server_signature).decode()}".encode()
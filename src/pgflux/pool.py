@@ -0,0 +1,174 @@
+import ipaddress
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from pgflux import readiness, shutdown
+from pgflux.constants import DEFAULT_SOCKET_DIR, POOL_DIR
+
+# Listen and admin ports default to offsets from the server port, so every instance gets its own
+# (5432 -> 6432 and 7432)
+LISTEN_PORT_OFFSET = 1000
+ADMIN_PORT_OFFSET = 2000
+AUTH_METHODS = ("trust", "md5", "scram-sha-256")
+DEFAULT_SETTINGS = {
+    "listen_host": "127.0.0.1",
+    "pool_size": 20,
+    "pool_sizes": {},
+    "max_client_conn": 1000,
+    "query_wait_timeout": 30.0,
+    "server_idle_timeout": 600.0,
+    "auth": "trust",
+    "auth_file": None,
+}
+START_TIMEOUT = 10.0
+STOP_TIMEOUT = 15.0  # covers the pooler's own grace period for running transactions
+POLL_INTERVAL = 0.05
+STATS_TIMEOUT = 5.0
+
+
+class PoolerError(Exception):
+    """
+    Raised when the pooler cannot be started, stopped or reached.
+    """
+
+
+def pool_dir(instance):
+    return os.path.join(POOL_DIR, instance["name"])
+
+
+def _path(instance, name):
+    return os.path.join(pool_dir(instance), name)
+
+
+def load_settings(instance):
+    """
+    Returns the pooler settings last saved for the instance, filled in with the defaults.
+    """
+    settings = dict(DEFAULT_SETTINGS, listen_port=instance["port"] + LISTEN_PORT_OFFSET,
+                    admin_port=instance["port"] + ADMIN_PORT_OFFSET)
+    try:
+        with open(_path(instance, "pool.json"), "r") as f:
+            settings.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        raise PoolerError(f"Cannot read the pool settings of '{instance['name']}': {e}")
+    return settings
+
+
+def save_settings(instance, settings):
+    os.makedirs(pool_dir(instance), exist_ok=True)
+    path = _path(instance, "pool.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(settings, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def check_settings(settings):
+    """
+    Refuses settings that would let anyone who can reach the listen address in without a password.
+    """
+    if settings["auth"] != "trust" and not settings["auth_file"]:
+        raise PoolerError(f"--auth {settings['auth']} needs an --auth-file with the passwords.")
+    if settings["auth"] == "trust" and not is_loopback(settings["listen_host"]):
+        raise PoolerError(f"Listening on {settings['listen_host']} needs --auth md5 or scram-sha-256; "
+                          f"trust is only allowed on loopback addresses.")
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def running_pid(instance):
+    """
+    Returns the pid of the instance's pooler, or None if it is not running.
+    """
+    try:
+        with open(_path(instance, "pooler.pid"), "r") as f:
+            pid = int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+    return pid if readiness.process_alive(pid) else None
+
+
+def start_pooler(instance, echo=print):
+    """
+    Starts the pooler in front of a running instance with its saved settings. Returns its pid.
+    """
+    pid = running_pid(instance)
+    if pid:
+        echo(f"Pooler of '{instance['name']}' is already running (pid {pid}).")
+        return pid
+    pidinfo = readiness.read_pidfile(instance["data_dir"])
+    if not pidinfo or not readiness.process_alive(pidinfo["pid"]):
+        raise PoolerError(f"PostgreSQL instance '{instance['name']}' is not running; start it first.")
+
+    settings = load_settings(instance)
+    check_settings(settings)
+    config = dict(settings, server_host=pidinfo["socket_dir"] or DEFAULT_SOCKET_DIR,
+                  server_port=pidinfo["port"] or instance["port"], pid_file=_path(instance, "pooler.pid"))
+    os.makedirs(pool_dir(instance), exist_ok=True)
+    with open(_path(instance, "config.json"), "w") as f:
+        json.dump(config, f, indent=2)
+    try:
+        os.unlink(config["pid_file"])
+    except FileNotFoundError:
+        pass
+
+    log_file = _path(instance, "pooler.log")
+    with open(log_file, "a") as log:
+        process = subprocess.Popen([sys.executable, "-m", "pgflux.pooler", _path(instance, "config.json")],
+                                   stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                                   start_new_session=True)
+    # The pid file is written once both ports are bound
+    deadline = time.monotonic() + START_TIMEOUT
+    while not os.path.exists(config["pid_file"]):
+        if process.poll() is not None:
+            raise PoolerError(f"The pooler exited with code {process.returncode}; see {log_file}.")
+        if time.monotonic() > deadline:
+            process.kill()
+            raise PoolerError(f"The pooler did not start within {START_TIMEOUT:g}s; see {log_file}.")
+        time.sleep(POLL_INTERVAL)
+    echo(f"Pooler of '{instance['name']}' listening on {settings['listen_host']}:{settings['listen_port']} "
+         f"(pool size {settings['pool_size']}, stats on 127.0.0.1:{settings['admin_port']}).")
+    return process.pid
+
+
+def stop_pooler(instance, echo=print):
+    """
+    Stops the instance's pooler, letting running transactions finish first. Returns whether one was running.
+    """
+    pid = running_pid(instance)
+    if not pid:
+        return False
+    os.kill(pid, signal.SIGTERM)
+    if not shutdown.wait_for_exit(pid, STOP_TIMEOUT):
+        echo(f"Pooler of '{instance['name']}' did not exit within {STOP_TIMEOUT:g}s; killing it.")
+        os.kill(pid, signal.SIGKILL)
+        shutdown.wait_for_exit(pid, STOP_TIMEOUT)
+    echo(f"Pooler of '{instance['name']}' stopped.")
+    return True
+
+
+def fetch_stats(instance):
+    """
+    Reads the pooler's stats from its admin endpoint.
+    """
+    # urllib is only needed here, not by the start/stop paths that import this module
+    from urllib import error, request
+
+    settings = load_settings(instance)
+    try:
+        with request.urlopen(f"http://127.0.0.1:{settings['admin_port']}/stats", timeout=STATS_TIMEOUT) as response:
+            return json.load(response)
+    except (error.URLError, OSError, ValueError) as e:
+        raise PoolerError(f"Cannot read stats from the pooler of '{instance['name']}': {e}")
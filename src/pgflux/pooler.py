@@ -0,0 +1,564 @@
+import asyncio
+import collections
+import json
+import os
+import secrets
+import signal
+import struct
+import sys
+import time
+
+from pgflux import pgwire
+
+# Run as `python -m pgflux.pooler <config.json>` by `pgflux pool start`. A client is given a server connection
+# when it sends a query and gives it back once the server reports the transaction finished (ReadyForQuery with
+# status idle), so many clients share few backends. Session state (SET, named prepared statements, advisory
+# locks, LISTEN) does not carry over between transactions, as with any transaction pooler.
+
+CONNECT_TIMEOUT = 5.0
+JANITOR_INTERVAL = 5.0  # seconds between sweeps for idle server connections
+SHUTDOWN_GRACE = 10.0  # seconds running transactions get to finish on SIGTERM
+ADMIN_HOST = "127.0.0.1"
+
+# Client messages that the server answers with exactly one ReadyForQuery: Query, Sync and FunctionCall
+SYNC_MESSAGES = (b"Q", b"S", b"F")
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no server connection frees up within query_wait_timeout.
+    """
+
+
+class ServerError(Exception):
+    """
+    Raised when the server refuses a connection; keeps its ErrorResponse to pass on to the client.
+    """
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.fields = pgwire.error_fields(payload)
+        super().__init__(self.fields.get("M", "server error"))
+
+
+def read_auth_file(path):
+    """
+    Reads a userlist in the PgBouncer format: one '"user" "password"' pair per line.
+    """
+    passwords = {}
+    if not path:
+        return passwords
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith(";") or line.startswith("#"):
+                continue
+            fields = line.split('"')
+            if len(fields) >= 4:
+                passwords[fields[1]] = fields[3]
+    return passwords
+
+
+class ServerConnection:
+    """
+    An authenticated connection to the server, with the parameters and cancel key it reported at startup.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.params = {}
+        self.backend_key = None
+        self.last_used = time.monotonic()
+
+    @classmethod
+    async def open(cls, host, port, user, database, password=None, timeout=CONNECT_TIMEOUT):
+        reader, writer = await asyncio.wait_for(_open(host, port), timeout)
+        conn = cls(reader, writer)
+        try:
+            writer.write(pgwire.startup_message({"user": user, "database": database,
+                                                 "application_name": "pgflux pool"}))
+            await asyncio.wait_for(conn._startup(user, password), timeout)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    async def _startup(self, user, password):
+        scram = None
+        while True:
+            kind, payload = await pgwire.read_message(self.reader)
+            if kind == b"R":
+                code = struct.unpack("!I", payload[:4])[0]
+                if code == pgwire.AUTH_OK:
+                    continue
+                if code in (pgwire.AUTH_CLEARTEXT, pgwire.AUTH_MD5, pgwire.AUTH_SASL) and password is None:
+                    raise pgwire.ProtocolError(f"the server asks for a password for '{user}', "
+                                               f"but the auth file has none")
+                if code == pgwire.AUTH_CLEARTEXT:
+                    self.writer.write(pgwire.password_message(password))
+                elif code == pgwire.AUTH_MD5:
+                    self.writer.write(pgwire.password_message(pgwire.md5_password(user, password, payload[4:8])))
+                elif code == pgwire.AUTH_SASL:
+                    if pgwire.SCRAM_MECHANISM.encode() not in payload[4:].split(b"\0"):
+                        raise pgwire.ProtocolError("the server offers no supported SASL mechanism")
+                    scram = pgwire.ScramClient(password)
+                    self.writer.write(pgwire.sasl_initial_response(pgwire.SCRAM_MECHANISM, scram.first_message()))
+                elif code == pgwire.AUTH_SASL_CONTINUE and scram:
+                    self.writer.write(pgwire.sasl_response(scram.final_message(payload[4:])))
+                elif code == pgwire.AUTH_SASL_FINAL and scram:
+                    scram.verify(payload[4:])
+                else:
+                    raise pgwire.ProtocolError(f"unsupported authentication request {code}")
+                await self.writer.drain()
+            elif kind == b"S":
+                name, value = payload.split(b"\0")[:2]
+                self.params[name.decode()] = value.decode()
+            elif kind == b"K":
+                self.backend_key = struct.unpack("!II", payload)
+            elif kind == b"E":
+                raise ServerError(payload)
+            elif kind == b"Z":
+                return
+
+    @property
+    def closed(self):
+        return self.writer.is_closing() or self.reader.at_eof()
+
+    def close(self):
+        if not self.writer.is_closing():
+            self.writer.close()
+
+
+async def _open(host, port):
+    if host.startswith("/"):
+        return await asyncio.open_unix_connection(os.path.join(host, f".s.PGSQL.{port}"))
+    return await asyncio.open_connection(host, port)
+
+
+class Pool:
+    """
+    Server connections for one (database, user) pair, at most `size` of them; clients queue for a free one.
+    """
+
+    def __init__(self, database, user, size, connect):
+        self.database = database
+        self.user = user
+        self.size = size
+        self._connect = connect
+        self.idle = collections.deque()
+        self.opened = 0  # open connections plus those being opened
+        self.waiters = collections.deque()
+        self.params = None
+        self.clients = 0
+        self.counters = {"acquires": 0, "transactions": 0, "queries": 0, "waits": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0,
+                         "timeouts": 0, "server_connects": 0}
+
+    async def acquire(self, timeout):
+        started = time.monotonic()
+        try:
+            return await self._acquire(timeout)
+        finally:
+            waited = time.monotonic() - started
+            self.counters["acquires"] += 1
+            self.counters["wait_seconds"] += waited
+            self.counters["max_wait_seconds"] = max(self.counters["max_wait_seconds"], waited)
+
+    async def _acquire(self, timeout):
+        while self.idle:
+            # Most recently used first: its backend has the warmest caches
+            conn = self.idle.pop()
+            if not conn.closed:
+                return conn
+            conn.close()
+            self.opened -= 1
+        if self.opened < self.size:
+            self.opened += 1
+            return await self._open()
+
+        self.counters["waits"] += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        # asyncio.wait, unlike wait_for, never loses a connection handed over just as the timeout fires
+        done, _ = await asyncio.wait({waiter}, timeout=timeout)
+        if not done:
+            waiter.cancel()
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            self.counters["timeouts"] += 1
+            raise PoolTimeout(f"no server connection for {self.database}/{self.user} within {timeout:g}s")
+        conn = waiter.result()
+        # None hands over a free slot instead of a connection
+        return conn if conn is not None else await self._open()
+
+    async def _open(self):
+        try:
+            conn = await self._connect(self.database, self.user)
+        except BaseException:
+            self.opened -= 1
+            self._hand_over_slots()
+            raise
+        self.counters["server_connects"] += 1
+        if self.params is None:
+            self.params = dict(conn.params)
+        return conn
+
+    def release(self, conn, reusable=True):
+        """
+        Returns a connection between transactions, handing it straight to the longest waiting client.
+        """
+        if not reusable or conn.closed:
+            conn.close()
+            self.opened -= 1
+            self._hand_over_slots()
+            return
+        conn.last_used = time.monotonic()
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(conn)
+                return
+        self.idle.append(conn)
+
+    def _hand_over_slots(self):
+        while self.waiters and self.opened < self.size:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.opened += 1
+                waiter.set_result(None)
+
+    def close_idle(self, max_idle):
+        """
+        Closes connections idle for longer than max_idle seconds; all of them with max_idle 0.
+        """
+        now = time.monotonic()
+        for conn in [c for c in self.idle if now - c.last_used >= max_idle or c.closed]:
+            self.idle.remove(conn)
+            conn.close()
+            self.opened -= 1
+
+    def stats(self):
+        return dict(self.counters, database=self.database, user=self.user, size=self.size, clients=self.clients,
+                    servers=self.opened, idle=len(self.idle), active=self.opened - len(self.idle),
+                    waiting=len(self.waiters))
+
+
+class ClientSession:
+    """
+    One client connection: startup and authentication, then transactions relayed to pooled servers.
+    """
+
+    def __init__(self, pooler, reader, writer):
+        self.pooler = pooler
+        self.reader = reader
+        self.writer = writer
+        self.pool = None
+        self.server = None
+        self.relay = None
+        self.pending = 0  # ReadyForQuery messages the attached server still owes
+        self.unsynced = 0  # messages forwarded since the last one answered by a ReadyForQuery
+        self.key = (secrets.randbits(31), secrets.randbits(31))
+
+    async def run(self):
+        try:
+            params = await self._startup()
+            if params is None:
+                return
+            await self._login(params)
+            await self._serve()
+        except (asyncio.IncompleteReadError, ConnectionError, pgwire.ProtocolError):
+            pass
+        finally:
+            self._detach(reusable=False)
+            if self.pool is not None:
+                self.pool.clients -= 1
+            self.pooler.sessions.pop(self.key, None)
+            self.writer.close()
+
+    async def _startup(self):
+        while True:
+            code, payload = await pgwire.read_startup(self.reader)
+            if code in (pgwire.SSL_REQUEST_CODE, pgwire.GSSENC_REQUEST_CODE):
+                self.writer.write(b"N")
+                await self.writer.drain()
+            elif code == pgwire.CANCEL_REQUEST_CODE:
+                await self.pooler.cancel(struct.unpack("!II", payload[:8]))
+                return None
+            elif code == pgwire.PROTOCOL_VERSION:
+                return pgwire.startup_params(payload)
+            else:
+                await self._fail(f"unsupported frontend protocol {code >> 16}.{code & 0xFFFF}", "0A000")
+                return None
+
+    async def _fail(self, text, code="08P01"):
+        self.writer.write(pgwire.error_response(text, code))
+        await self.writer.drain()
+
+    async def _login(self, params):
+        pooler = self.pooler
+        user = params.get("user", "")
+        database = params.get("database") or user
+        if pooler.closing:
+            await self._fail("the pooler is shutting down", "57P01")
+            raise ConnectionError
+        if len(pooler.sessions) >= pooler.config["max_client_conn"]:
+            await self._fail("no more connections allowed (max_client_conn)", "53300")
+            raise ConnectionError
+        await self._authenticate(user)
+
+        self.pool = pooler.pool(database, user)
+        self.pool.clients += 1
+        if self.pool.params is None:
+            # The first client of a pool learns the server parameters, and whether the database exists
+            server = await self._acquire()
+            self.pool.release(server)
+
+        self.writer.write(pgwire.auth_request(pgwire.AUTH_OK))
+        for name, value in self.pool.params.items():
+            self.writer.write(pgwire.parameter_status(name, value))
+        self.writer.write(pgwire.backend_key_data(*self.key) + pgwire.ready_for_query())
+        await self.writer.drain()
+        pooler.sessions[self.key] = self
+
+    async def _authenticate(self, user):
+        method = self.pooler.config["auth"]
+        if method == "trust":
+            return
+        password = self.pooler.passwords.get(user)
+        if method == "md5":
+            salt = os.urandom(4)
+            self.writer.write(pgwire.auth_request(pgwire.AUTH_MD5, salt))
+            await self.writer.drain()
+            kind, payload = await pgwire.read_message(self.reader)
+            answer = payload.rstrip(b"\0").decode(errors="replace")
+            ok = kind == b"p" and password is not None and answer == pgwire.md5_password(user, password, salt)
+        else:
+            self.writer.write(pgwire.auth_request(pgwire.AUTH_SASL, pgwire.SCRAM_MECHANISM.encode() + b"\0\0"))
+            await self.writer.drain()
+            # Without a password the exchange still runs to the end, so a missing user looks like a wrong one
+            scram = pgwire.ScramServer(password if password is not None else secrets.token_hex(16))
+            try:
+                kind, payload = await pgwire.read_message(self.reader)
+                _, client_first = pgwire.parse_sasl_initial_response(payload)
+                self.writer.write(pgwire.auth_request(pgwire.AUTH_SASL_CONTINUE, scram.first_message(client_first)))
+                await self.writer.drain()
+                kind, payload = await pgwire.read_message(self.reader)
+                server_final = scram.final_message(payload)
+                ok = password is not None
+            except (pgwire.ProtocolError, ValueError, IndexError, struct.error):
+                ok = False
+            if ok:
+                self.writer.write(pgwire.auth_request(pgwire.AUTH_SASL_FINAL, server_final))
+        if not ok:
+            await self._fail(f'password authentication failed for user "{user}"', "28P01")
+            raise ConnectionError
+
+    async def _acquire(self):
+        try:
+            return await self.pool.acquire(self.pooler.config["query_wait_timeout"])
+        except PoolTimeout:
+            await self._fail("query_wait_timeout")
+            raise ConnectionError
+        except ServerError as e:
+            self.writer.write(pgwire.message(b"E", e.payload))
+            await self.writer.drain()
+            raise ConnectionError
+        except (OSError, asyncio.TimeoutError, pgwire.ProtocolError, asyncio.IncompleteReadError) as e:
+            await self._fail(f"could not connect to the server: {e or type(e).__name__}", "08006")
+            raise ConnectionError
+
+    async def _serve(self):
+        while True:
+            kind, payload = await pgwire.read_message(self.reader)
+            if kind == b"X":
+                return
+            if self.server is None:
+                self.server = await self._acquire()
+                self.relay = asyncio.create_task(self._relay(self.server))
+            if kind in SYNC_MESSAGES:
+                self.pending += 1
+                self.unsynced = 0
+                self.pool.counters["queries"] += 1
+            else:
+                # Parse, Bind, Execute and the like belong to the next Sync, whoever holds the server then
+                self.unsynced += 1
+            server = self.server
+            server.writer.write(pgwire.message(kind, payload))
+            await server.writer.drain()
+
+    async def _relay(self, server):
+        """
+        Copies server messages to the client and releases the server once its transaction is over.
+        """
+        try:
+            while True:
+                kind, payload = await pgwire.read_message(server.reader)
+                self.writer.write(pgwire.message(kind, payload))
+                if kind == b"Z":
+                    self.pending -= 1
+                    if self.pending <= 0 and self.unsynced == 0 and payload == b"I":
+                        self.pool.counters["transactions"] += 1
+                        self.server, self.relay, self.pending = None, None, 0
+                        self.pool.release(server)
+                        await self.writer.drain()
+                        return
+                await self.writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, pgwire.ProtocolError):
+            if self.server is server:
+                self.writer.write(pgwire.error_response("server connection closed unexpectedly", "08006"))
+                self._detach(reusable=False)
+                self.writer.close()
+
+    def _detach(self, reusable):
+        if self.server is None:
+            return
+        server, relay = self.server, self.relay
+        self.server, self.relay, self.pending, self.unsynced = None, None, 0, 0
+        if relay is not None and relay is not asyncio.current_task():
+            relay.cancel()
+        self.pool.release(server, reusable)
+
+
+class Pooler:
+    """
+    Accepts clients on the listen address, keeps one Pool per (database, user) and serves stats on the
+    admin address.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.passwords = read_auth_file(config.get("auth_file"))
+        self.pools = {}
+        self.sessions = {}
+        self.closing = False
+        self.started = time.time()
+        self._stop = None
+
+    def pool_size(self, database, user):
+        sizes = self.config.get("pool_sizes", {})
+        return sizes.get(f"{database}/{user}") or sizes.get(database) or self.config["pool_size"]
+
+    def pool(self, database, user):
+        key = (database, user)
+        if key not in self.pools:
+            self.pools[key] = Pool(database, user, self.pool_size(database, user), self.connect_server)
+        return self.pools[key]
+
+    async def connect_server(self, database, user):
+        return await ServerConnection.open(self.config["server_host"], self.config["server_port"], user, database,
+                                           self.passwords.get(user))
+
+    async def cancel(self, key):
+        """
+        Forwards a client's cancel request to the backend currently running its transaction.
+        """
+        session = self.sessions.get(key)
+        if session is None or session.server is None or session.server.backend_key is None:
+            return
+        try:
+            _, writer = await asyncio.wait_for(_open(self.config["server_host"], self.config["server_port"]),
+                                               CONNECT_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            return
+        writer.write(pgwire.cancel_request(*session.server.backend_key))
+        await writer.drain()
+        writer.close()
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "uptime": time.time() - self.started,
+            "listen": f"{self.config['listen_host']}:{self.config['listen_port']}",
+            "server": f"{self.config['server_host']}:{self.config['server_port']}",
+            "clients": len(self.sessions),
+            "max_client_conn": self.config["max_client_conn"],
+            "pools": [pool.stats() for pool in self.pools.values()],
+        }
+
+    async def handle_client(self, reader, writer):
+        await ClientSession(self, reader, writer).run()
+
+    async def handle_admin(self, reader, writer):
+        """
+        Answers 'GET /stats' with the stats as JSON; a minimal HTTP/1.0 endpoint for `pgflux pool status`.
+        """
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), CONNECT_TIMEOUT)
+            parts = request.split(b"\r\n", 1)[0].split()
+            if len(parts) >= 2 and parts[0] == b"GET" and parts[1] in (b"/", b"/stats"):
+                status, body = "200 OK", json.dumps(self.stats(), indent=2).encode()
+            else:
+                status, body = "404 Not Found", b'{"error": "not found"}'
+            writer.write(f"HTTP/1.0 {status}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _janitor(self):
+        while True:
+            await asyncio.sleep(JANITOR_INTERVAL)
+            for pool in self.pools.values():
+                pool.close_idle(self.config["server_idle_timeout"])
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    async def serve(self, ready=None):
+        """
+        Runs until stop() or SIGTERM/SIGINT, then lets running transactions finish for SHUTDOWN_GRACE seconds.
+        """
+        self._stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        if ready is None:
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.add_signal_handler(sig, self.stop)
+        listener = await asyncio.start_server(self.handle_client, self.config["listen_host"],
+                                              self.config["listen_port"])
+        admin = await asyncio.start_server(self.handle_admin, ADMIN_HOST, self.config["admin_port"])
+        janitor = asyncio.create_task(self._janitor())
+        if self.config.get("pid_file"):
+            with open(self.config["pid_file"], "w") as f:
+                f.write(f"{os.getpid()}\n")
+        if ready is None:
+            print(f"pgflux pool {os.getpid()} listening on {self.config['listen_host']}:{self.config['listen_port']}, "
+                  f"serving {self.config['server_host']}:{self.config['server_port']}", flush=True)
+        else:
+            ready.set_result((listener.sockets[0].getsockname()[1], admin.sockets[0].getsockname()[1]))
+        try:
+            await self._stop.wait()
+        finally:
+            self.closing = True
+            listener.close()
+            janitor.cancel()
+            deadline = time.monotonic() + SHUTDOWN_GRACE
+            while any(s.server is not None for s in self.sessions.values()) and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+            for session in list(self.sessions.values()):
+                session.writer.close()
+            for pool in self.pools.values():
+                pool.close_idle(0)
+            admin.close()
+            if self.config.get("pid_file"):
+                try:
+                    os.unlink(self.config["pid_file"])
+                except FileNotFoundError:
+                    pass
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print("usage: python -m pgflux.pooler <config.json>", file=sys.stderr)
+        return 2
+    with open(argv[0], "r") as f:
+        config = json.load(f)
+    asyncio.run(Pooler(config).serve())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
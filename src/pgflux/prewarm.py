@@ -0,0 +1,64 @@
+DEFAULT_LIMIT = 20
+
+# With pg_buffercache installed, rank by what is actually cached right now.
+BUFFERCACHE_SQL = """
+    SELECT c.oid
+    FROM pg_buffercache b
+    JOIN pg_class c ON pg_relation_filenode(c.oid) = b.relfilenode
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE b.reldatabase = (SELECT oid FROM pg_database WHERE datname = current_database())
+      AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+    GROUP BY c.oid
+    ORDER BY count(*) DESC
+    LIMIT %s
+"""
+
+# Otherwise fall back to block access counts, which survive the restart anyway.
+STATIO_SQL = """
+    SELECT relid
+    FROM pg_statio_user_tables
+    ORDER BY coalesce(heap_blks_hit, 0) + coalesce(heap_blks_read, 0)
+           + coalesce(idx_blks_hit, 0) + coalesce(idx_blks_read, 0) DESC
+    LIMIT %s
+"""
+INDEXES_SQL = "SELECT indexrelid FROM pg_index WHERE indrelid = ANY(%s::oid[])"
+
+
+def _has_extension(cur, name):
+    cur.execute("SELECT 1 FROM pg_extension WHERE extname = %s", (name,))
+    return cur.fetchone() is not None
+
+
+def hottest_relations(conn, limit=DEFAULT_LIMIT):
+    """
+    Returns the oids of the most used tables and their indexes in the connected database.
+
+    Call this before shutting down; relation oids are stable across restarts.
+    """
+    with conn.cursor() as cur:
+        cur.execute(BUFFERCACHE_SQL if _has_extension(cur, "pg_buffercache") else STATIO_SQL, (limit,))
+        oids = [row[0] for row in cur.fetchall()]
+        if oids:
+            cur.execute(INDEXES_SQL, (oids,))
+            oids += [row[0] for row in cur.fetchall() if row[0] not in oids]
+    return oids
+
+
+def prewarm(conn, oids):
+    """
+    Loads the given relations into shared_buffers with pg_prewarm. Returns the number of blocks read.
+
+    Returns None if the pg_prewarm extension is not available on this server.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_prewarm'")
+        if cur.fetchone() is None:
+            return None
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_prewarm")
+        blocks = 0
+        for oid in oids:
+            # The relation may have been dropped while the server was down.
+            cur.execute("SELECT pg_prewarm(c.oid) FROM pg_class c WHERE c.oid = %s", (oid,))
+            row = cur.fetchone()
+            blocks += row[0] if row else 0
+    return blocks
@@ -0,0 +1,138 @@
+import os
+import socket
+
+PROC_DIR = "/proc"
+TCP_TABLES = (("tcp", "net/tcp", socket.AF_INET), ("tcp6", "net/tcp6", socket.AF_INET6))
+TCP_STATES = {
+    "01": "ESTABLISHED", "02": "SYN_SENT", "03": "SYN_RECV", "04": "FIN_WAIT1",
+    "05": "FIN_WAIT2", "06": "TIME_WAIT", "07": "CLOSE", "08": "CLOSE_WAIT",
+    "09": "LAST_ACK", "0A": "LISTEN", "0B": "CLOSING",
+}
+
+
+def decode_address(value, family):
+    """
+    Decodes a /proc/net/tcp address such as '0100007F:1538' into (host, port).
+
+    The kernel prints each 32-bit word of the address in host (little-endian) byte order.
+    """
+    host_hex, port_hex = value.split(":")
+    raw = bytes.fromhex(host_hex)
+    raw = b"".join(raw[i:i + 4][::-1] for i in range(0, len(raw), 4))
+    return socket.inet_ntop(family, raw), int(port_hex, 16)
+
+
+def tcp_sockets(port=None, proc_dir=PROC_DIR):
+    """
+    Returns the TCP sockets from /proc/net/tcp{,6}, optionally only those whose local port is port.
+    """
+    sockets = []
+    for proto, table, family in TCP_TABLES:
+        try:
+            with open(os.path.join(proc_dir, table), "r") as f:
+                next(f, None)  # header
+                lines = f.readlines()
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 10:
+                continue
+            local = decode_address(fields[1], family)
+            if port is not None and local[1] != int(port):
+                continue
+            sockets.append({
+                "proto": proto,
+                "local": local,
+                "remote": decode_address(fields[2], family),
+                "state": TCP_STATES.get(fields[3], fields[3]),
+                "inode": int(fields[9]),
+            })
+    return sockets
+
+
+def _process_name(pid, proc_dir):
+    try:
+        with open(os.path.join(proc_dir, str(pid), "comm"), "r") as f:
+            return f.read().strip()
+    except OSError:
+        return "?"
+
+
+def socket_owners(inodes, proc_dir=PROC_DIR):
+    """
+    Maps socket inodes to the pids holding them by scanning /proc/<pid>/fd.
+
+    Returns (owners, unreadable), where owners maps inode -> set of pids and
+    unreadable counts processes whose fds could not be inspected (other users,
+    unless running as root).
+    """
+    wanted = {f"socket:[{inode}]": inode for inode in inodes if inode}
+    owners = {}
+    unreadable = 0
+    if not wanted:
+        return owners, unreadable
+    for entry in os.listdir(proc_dir):
+        if not entry.isdigit():
+            continue
+        fd_dir = os.path.join(proc_dir, entry, "fd")
+        try:
+            fds = os.listdir(fd_dir)
+        except PermissionError:
+            unreadable += 1
+            continue
+        except OSError:
+            continue  # exited while scanning
+        for fd in fds:
+            try:
+                target = os.readlink(os.path.join(fd_dir, fd))
+            except OSError:
+                continue
+            if target in wanted:
+                owners.setdefault(wanted[target], set()).add(int(entry))
+    return owners, unreadable
+
+
+def port_users(port, proc_dir=PROC_DIR):
+    """
+    Lists the processes holding TCP sockets on the local port, like `lsof -i :port`.
+
+    Returns (users, unreadable): one dict per (pid, socket) with pid, name,
+    proto, state, local and remote, plus the count of processes that could not
+    be inspected.
+    """
+    sockets = tcp_sockets(port, proc_dir)
+    owners, unreadable = socket_owners([s["inode"] for s in sockets], proc_dir)
+    users = []
+    for sock in sockets:
+        for pid in sorted(owners.get(sock["inode"], ())):
+            users.append(dict(sock, pid=pid, name=_process_name(pid, proc_dir)))
+    return sorted(users, key=lambda u: (u["pid"], u["proto"])), unreadable
+
+
+def format_endpoint(endpoint):
+    host, port = endpoint
+    return f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+
+
+def children(pid, proc_dir=PROC_DIR):
+    """
+    Returns (pid, command line) for the direct children of pid, read from /proc/<pid>/stat.
+    """
+    found = []
+    for entry in os.listdir(proc_dir):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(os.path.join(proc_dir, entry, "stat"), "r") as f:
+                stat = f.read()
+            # The command name may contain spaces and parentheses; fields resume after the last ')'.
+            ppid = int(stat[stat.rindex(")") + 2:].split()[1])
+            if ppid != pid:
+                continue
+            with open(os.path.join(proc_dir, entry, "cmdline"), "rb") as f:
+                cmdline = f.read().replace(b"\0", b" ").decode(errors="replace").strip()
+        except (OSError, ValueError, IndexError):
+            continue
+        found.append((int(entry), cmdline))
+    return found
@@ -0,0 +1,230 @@
+import os
+import select
+import socket
+import struct
+import time
+
+from pgflux import instrument
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+POLL_INTERVAL = 0.05
+PROTOCOL_VERSION = 196608  # 3.0
+SQLSTATE_CANNOT_CONNECT_NOW = "57P03"
+# Line numbers (1-based) of postmaster.pid, see LOCK_FILE_LINE_* in miscadmin.h
+PID_LINE_PID = 1
+PID_LINE_PORT = 4
+PID_LINE_SOCKET_DIR = 5
+PID_LINE_LISTEN_ADDR = 6
+PID_LINE_STATUS = 8
+LOG_FAILURE_MARKERS = ("FATAL:", "PANIC:")
+# FATAL messages caused by clients connecting too early rather than by the server failing
+CLIENT_FATAL_MESSAGES = (
+    "the database system is starting up",
+    "the database system is not yet accepting connections",
+    "authentication failed",
+    "does not exist",
+    "no pg_hba.conf entry",
+)
+
+
+class StartupError(Exception):
+    """
+    Raised when the server aborts or does not become ready in time.
+    """
+
+    def __init__(self, message, log_lines=()):
+        super().__init__(message)
+        self.log_lines = list(log_lines)
+
+
+class DirectoryWatcher:
+    """
+    Wakes up on changes to the watched directories via inotify, or polls where it is unavailable.
+    """
+
+    def __init__(self, paths):
+        # ctypes is imported here so commands that only read postmaster.pid start faster.
+        import ctypes
+        import ctypes.util
+
+        self._fd = None
+        libc_name = ctypes.util.find_library("c")
+        try:
+            libc = ctypes.CDLL(libc_name, use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return
+        if fd < 0:
+            return
+        for path in paths:
+            if os.path.isdir(path):
+                libc.inotify_add_watch(fd, os.fsencode(path), WATCH_MASK)
+        self._fd = fd
+
+    def wait(self, timeout):
+        if self._fd is None:
+            time.sleep(min(timeout, POLL_INTERVAL))
+            return
+        ready, _, _ = select.select([self._fd], [], [], max(timeout, 0))
+        if ready:
+            try:
+                while os.read(self._fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def read_pidfile(data_dir):
+    """
+    Parses postmaster.pid into a dict, or returns None if it is missing or incomplete.
+    """
+    try:
+        with open(os.path.join(data_dir, "postmaster.pid"), "r") as f:
+            lines = f.read().split("\n")
+    except OSError:
+        return None
+    if len(lines) < PID_LINE_PORT or not lines[0].strip().isdigit():
+        return None
+
+    def line(number):
+        return lines[number - 1].strip() if len(lines) >= number else ""
+
+    return {
+        "pid": int(line(PID_LINE_PID)),
+        "port": int(line(PID_LINE_PORT)) if line(PID_LINE_PORT).isdigit() else None,
+        "socket_dir": line(PID_LINE_SOCKET_DIR),
+        "listen_addr": line(PID_LINE_LISTEN_ADDR),
+        "status": line(PID_LINE_STATUS),
+    }
+
+
+def process_alive(pid):
+    """
+    Returns True if pid exists and has not exited; zombies awaiting their parent count as exited.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            stat = f.read()
+        return stat[stat.rindex(")") + 2:stat.rindex(")") + 3] != "Z"
+    except (OSError, ValueError):
+        return True
+
+
+def handshake(pidinfo, user="postgres", timeout=2.0):
+    """
+    Sends one startup packet and reports whether the server accepts connections.
+
+    Like PQping, any answer other than 'the database system is starting up'
+    (including authentication requests and errors) means the server is up.
+    """
+    if pidinfo.get("socket_dir"):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = os.path.join(pidinfo["socket_dir"], f".s.PGSQL.{pidinfo['port']}")
+    else:
+        host = pidinfo.get("listen_addr") or "localhost"
+        host = "localhost" if host in ("*", "0.0.0.0", "::") else host.split(",")[0].strip()
+        sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+        address = (host, pidinfo["port"])
+    sock.settimeout(timeout)
+    try:
+        sock.connect(address)
+        params = b"user\0" + user.encode() + b"\0database\0postgres\0\0"
+        sock.sendall(struct.pack("!II", 8 + len(params), PROTOCOL_VERSION) + params)
+        kind = sock.recv(1)
+        if kind == b"E":
+            length = struct.unpack("!I", sock.recv(4))[0]
+            body = b""
+            while len(body) < length - 4:
+                chunk = sock.recv(length - 4 - len(body))
+                if not chunk:
+                    break
+                body += chunk
+            fields = {f[:1]: f[1:] for f in body.split(b"\0") if f}
+            return fields.get(b"C", b"").decode() != SQLSTATE_CANNOT_CONNECT_NOW
+        return kind != b""
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def _log_failures(log_file, offset):
+    try:
+        with open(log_file, "r", errors="replace") as f:
+            f.seek(offset)
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    return [line for line in lines
+            if any(marker in line for marker in LOG_FAILURE_MARKERS)
+            and not ("FATAL:" in line and any(message in line for message in CLIENT_FATAL_MESSAGES))]
+
+
+def wait_until_ready(data_dir, log_file, log_offset=0, timeout=60.0, user="postgres"):
+    """
+    Blocks until the server on data_dir accepts connections and returns the seconds waited.
+
+    Instead of polling on a fixed interval, the watcher wakes on inotify events
+    for postmaster.pid, the socket directory and the log, checks the pid
+    file's status line and confirms with a single protocol handshake.
+    """
+    start = time.perf_counter()
+    deadline = start + timeout
+    watch_dirs = {data_dir, os.path.dirname(os.path.abspath(log_file))}
+    watcher = DirectoryWatcher(watch_dirs)
+    seen_pid = None
+    try:
+        while True:
+            failures = _log_failures(log_file, log_offset)
+            if failures:
+                raise StartupError("PostgreSQL aborted during startup.", failures)
+
+            pidinfo = read_pidfile(data_dir)
+            if pidinfo:
+                seen_pid = pidinfo["pid"]
+                if pidinfo["socket_dir"] and pidinfo["socket_dir"] not in watch_dirs:
+                    watcher.close()
+                    watch_dirs.add(pidinfo["socket_dir"])
+                    watcher = DirectoryWatcher(watch_dirs)
+                if pidinfo["status"] in ("ready", "standby") and handshake(pidinfo, user):
+                    return time.perf_counter() - start
+            elif seen_pid is not None and not process_alive(seen_pid):
+                raise StartupError("PostgreSQL exited during startup.", _log_failures(log_file, log_offset))
+
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise StartupError(f"PostgreSQL did not become ready within {timeout:g} seconds.",
+                                   _log_failures(log_file, log_offset))
+            # Pid file status changes are in-place writes; still re-check periodically for the handshake.
+            watcher.wait(min(remaining, 0.5))
+    finally:
+        watcher.close()
+
+
+def start_server(pg_ctl, data_dir, log_file, timeout=60.0, user="postgres", phase="start", **run_kwargs):
+    """
+    Launches the server without pg_ctl's polling wait and returns the time until it is ready.
+    """
+    log_offset = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+    instrument.run(phase, [pg_ctl, "start", "-D", data_dir, "-l", log_file, "-W"], check=True, **run_kwargs)
+    with instrument.phase("wait-ready"):
+        return wait_until_ready(data_dir, log_file, log_offset, timeout, user)
@@ -0,0 +1,193 @@
+import contextlib
+import fcntl
+import json
+import os
+import re
+import threading
+
+from pgflux import readiness
+from pgflux.constants import DEFAULT_ADMIN_USER, REGISTRY_FILE
+
+# Single-version state files written before the registry existed (install and the other commands disagreed).
+LEGACY_VERSION_FILES = ("/usr/local/pgflux_installed_version.txt", "/usr/local/pgai_installed_version.txt")
+INSTALL_PREFIX_TEMPLATE = "/usr/local/{version}"
+DATA_DIR_TEMPLATE = "{install_prefix}/data"
+DEFAULT_PORT = 5432
+PORT_RE = re.compile(r"^\s*port\s*=\s*'?(\d+)'?", re.M)
+
+# Serializes read-modify-write cycles between threads; the file lock covers other processes.
+_lock = threading.Lock()
+
+
+class RegistryError(Exception):
+    """
+    Raised when an instance cannot be found or registered.
+    """
+
+
+def configured_port(data_dir):
+    """
+    Returns the port the cluster's configuration files set last, or the default port.
+    """
+    port = DEFAULT_PORT
+    for name in ("postgresql.conf", "postgresql.auto.conf"):
+        try:
+            with open(os.path.join(data_dir, name), "r") as f:
+                found = PORT_RE.findall(f.read())
+        except OSError:
+            continue
+        if found:
+            port = int(found[-1])
+    return port
+
+
+def new_instance(name, version, install_prefix=None, data_dir=None, port=None, user=DEFAULT_ADMIN_USER):
+    install_prefix = install_prefix or INSTALL_PREFIX_TEMPLATE.format(version=version)
+    data_dir = data_dir or DATA_DIR_TEMPLATE.format(install_prefix=install_prefix)
+    return {
+        "name": name,
+        "version": version,
+        "install_prefix": os.path.abspath(install_prefix),
+        "data_dir": os.path.abspath(data_dir),
+        "port": int(port) if port else configured_port(data_dir),
+        "user": user,
+    }
+
+
+def _migrate_legacy():
+    registry = {"default": None, "instances": {}}
+    for path in LEGACY_VERSION_FILES:
+        try:
+            with open(path, "r") as f:
+                version = f.read().strip()
+        except OSError:
+            continue
+        if version and version not in registry["instances"]:
+            registry["instances"][version] = new_instance(version, version)
+            registry["default"] = registry["default"] or version
+    return registry
+
+
+def _read(path):
+    try:
+        with open(path, "r") as f:
+            registry = json.load(f)
+    except FileNotFoundError:
+        return _migrate_legacy()
+    except ValueError as e:
+        raise RegistryError(f"The instance registry {path} is corrupt: {e}")
+    registry.setdefault("default", None)
+    registry.setdefault("instances", {})
+    return registry
+
+
+@contextlib.contextmanager
+def _update(path):
+    """
+    Yields the registry for modification under an exclusive lock and writes it back atomically.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with _lock, open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        registry = _read(path)
+        yield registry
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(registry, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+
+def load(path=REGISTRY_FILE):
+    return _read(path)
+
+
+def instances(path=REGISTRY_FILE):
+    """
+    Returns all registered instances ordered by name.
+    """
+    registry = _read(path)
+    return [registry["instances"][name] for name in sorted(registry["instances"])]
+
+
+def get(name=None, path=REGISTRY_FILE):
+    """
+    Returns the named instance, or the default one without a name; None if there is no match.
+
+    A name that is not registered also matches the only instance of that version.
+    """
+    registry = _read(path)
+    name = name or registry["default"]
+    if name in registry["instances"]:
+        return registry["instances"][name]
+    by_version = [instance for instance in registry["instances"].values() if instance["version"] == name]
+    return by_version[0] if len(by_version) == 1 else None
+
+
+def resolve(name=None, path=REGISTRY_FILE):
+    """
+    Like get(), but raises RegistryError with a message suitable for the user.
+    """
+    instance = get(name, path)
+    if instance is not None:
+        return instance
+    if name:
+        raise RegistryError(f"No instance named '{name}'. See 'pgflux instances list'.")
+    raise RegistryError("No PostgreSQL instance is registered. Install one with 'pgflux install'.")
+
+
+def register(instance, make_default=False, path=REGISTRY_FILE):
+    """
+    Adds or replaces an instance. Another instance may not use the same data directory.
+    """
+    with _update(path) as registry:
+        for other in registry["instances"].values():
+            if other["name"] != instance["name"] and other["data_dir"] == instance["data_dir"]:
+                raise RegistryError(f"Instance '{other['name']}' already uses {instance['data_dir']}.")
+        registry["instances"][instance["name"]] = instance
+        if make_default or not registry["default"]:
+            registry["default"] = instance["name"]
+    return instance
+
+
+def port_conflicts(instance, path=REGISTRY_FILE):
+    """
+    Returns the names of other instances configured for the same port; only one of them can run at a time.
+    """
+    return [other["name"] for other in instances(path)
+            if other["name"] != instance["name"] and other["port"] == instance["port"]]
+
+
+def unregister(name, path=REGISTRY_FILE):
+    """
+    Removes an instance from the registry (its files are left alone). Returns it, or None if unknown.
+    """
+    with _update(path) as registry:
+        instance = registry["instances"].pop(name, None)
+        if registry["default"] == name:
+            registry["default"] = min(registry["instances"], default=None)
+    return instance
+
+
+def set_default(name, path=REGISTRY_FILE):
+    with _update(path) as registry:
+        if name not in registry["instances"]:
+            raise RegistryError(f"No instance named '{name}'.")
+        registry["default"] = name
+
+
+def pg_ctl(instance):
+    return os.path.join(instance["install_prefix"], "bin", "pg_ctl")
+
+
+def state(instance):
+    """
+    Returns (state, pid) for an instance from its postmaster.pid, without running pg_ctl.
+    """
+    if not os.path.isdir(instance["data_dir"]):
+        return "missing", None
+    pidinfo = readiness.read_pidfile(instance["data_dir"])
+    if not pidinfo:
+        return "stopped", None
+    if not readiness.process_alive(pidinfo["pid"]):
+        return "stale pidfile", pidinfo["pid"]
+    return pidinfo["status"] or "running", pidinfo["pid"]
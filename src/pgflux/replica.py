@@ -0,0 +1,166 @@
+import os
+import re
+import shutil
+
+from pgflux import db, instrument, readiness, registry
+from pgflux.constants import DEFAULT_SOCKET_DIR
+
+# Every standby streams through its own physical slot, so the primary keeps the WAL it has not received
+SLOT_PREFIX = "pgflux_replica_"
+MAX_SLOT_NAME = 63
+
+# Per slot: whether a standby is attached, how far behind it is in bytes of WAL and in time, and how much
+# WAL the slot holds back on the primary. Time lags are NULL once the standby has caught up and gone idle.
+LAG_SQL = r"""
+    SELECT s.slot_name, s.active, r.state, r.sync_state, r.client_addr,
+           pg_wal_lsn_diff(pg_current_wal_lsn(), r.sent_lsn)::bigint,
+           pg_wal_lsn_diff(pg_current_wal_lsn(), r.flush_lsn)::bigint,
+           pg_wal_lsn_diff(pg_current_wal_lsn(), r.replay_lsn)::bigint,
+           extract(epoch FROM r.write_lag)::float8,
+           extract(epoch FROM r.flush_lag)::float8,
+           extract(epoch FROM r.replay_lag)::float8,
+           pg_wal_lsn_diff(pg_current_wal_lsn(), s.restart_lsn)::bigint
+    FROM pg_replication_slots s
+    LEFT JOIN pg_stat_replication r ON r.pid = s.active_pid
+    WHERE s.slot_type = 'physical' AND s.slot_name LIKE 'pgflux\_replica\_%'
+"""
+LAG_FIELDS = ("slot", "active", "state", "sync_state", "client_addr", "sent_bytes", "flush_bytes", "replay_bytes",
+              "write_lag", "flush_lag", "replay_lag", "retained_bytes")
+
+
+class ReplicaError(Exception):
+    """
+    Raised when a standby cannot be created or removed.
+    """
+
+
+def slot_name(name):
+    """
+    Returns the replication slot of a replica; slot names allow only lower-case letters, digits and '_'.
+    """
+    return (SLOT_PREFIX + re.sub(r"[^a-z0-9_]", "_", name.lower()))[:MAX_SLOT_NAME]
+
+
+def replicas(primary, instances):
+    """
+    Returns the registered standbys of a primary.
+    """
+    return [instance for instance in instances if instance.get("primary") == primary["name"]]
+
+
+def next_free_port(primary, instances):
+    """
+    Returns the first port above the primary's that no registered instance is configured for.
+    """
+    taken = {instance["port"] for instance in instances}
+    port = primary["port"] + 1
+    while port in taken:
+        port += 1
+    return port
+
+
+def basebackup_args(pg_basebackup, pidinfo, user, data_dir, slot):
+    """
+    Builds the pg_basebackup command that clones a running primary into a standby data directory.
+    """
+    return [
+        pg_basebackup, "-h", pidinfo["socket_dir"] or DEFAULT_SOCKET_DIR, "-p", str(pidinfo["port"]), "-U", user,
+        "-D", data_dir,
+        "-X", "stream",  # the WAL written during the copy comes along, so the standby is consistent at once
+        "-R",  # standby.signal and primary_conninfo
+        "-C", "-S", slot,
+        "--checkpoint=fast",
+        "--no-password",
+    ]
+
+
+def write_standby_settings(data_dir, port):
+    """
+    Sets the standby's port in postgresql.auto.conf, which -R also writes and which is read last.
+    """
+    with open(os.path.join(data_dir, "postgresql.auto.conf"), "a") as conf:
+        conf.write(f"\n# Added by pgflux replica\nport = {int(port)}\n")
+
+
+def _running_pidinfo(instance):
+    pidinfo = readiness.read_pidfile(instance["data_dir"])
+    if not pidinfo or not readiness.process_alive(pidinfo["pid"]):
+        return None
+    return pidinfo
+
+
+def create(primary, name, port, data_dir, user=None, instances=()):
+    """
+    Clones a running primary with pg_basebackup into data_dir as a hot standby streaming through its own
+    slot, and returns the registry entry for it (not yet registered or started).
+
+    The slot may not belong to another registered instance or already exist on the primary: different
+    names can map to the same slot, and pg_basebackup -C would fail on it.
+    """
+    if primary.get("primary"):
+        raise ReplicaError(f"'{primary['name']}' is itself a replica of '{primary['primary']}'; "
+                           f"add replicas to the primary instead.")
+    pidinfo = _running_pidinfo(primary)
+    if pidinfo is None:
+        raise ReplicaError(f"The primary '{primary['name']}' is not running; start it first.")
+    if os.path.exists(data_dir) and os.listdir(data_dir):
+        raise ReplicaError(f"{data_dir} exists and is not empty.")
+    pg_basebackup = os.path.join(primary["install_prefix"], "bin", "pg_basebackup")
+    if not os.path.exists(pg_basebackup):
+        raise ReplicaError(f"pg_basebackup not found at {pg_basebackup}.")
+
+    user = user or primary.get("user") or "postgres"
+    slot = slot_name(name)
+    owners = [instance["name"] for instance in instances if instance.get("slot") == slot]
+    if owners:
+        raise ReplicaError(f"Slot {slot} already belongs to replica '{owners[0]}'; choose another name.")
+    if db.query_one(pidinfo["port"], "SELECT 1 FROM pg_replication_slots WHERE slot_name = %s", (slot,),
+                    host=pidinfo["socket_dir"] or DEFAULT_SOCKET_DIR, user=user, version=primary["version"]):
+        raise ReplicaError(f"Slot {slot} already exists on '{primary['name']}'; drop it or choose another name.")
+
+    result = instrument.run("basebackup", basebackup_args(pg_basebackup, pidinfo, user, data_dir, slot),
+                            capture_output=True, text=True)
+    instance = dict(registry.new_instance(name, primary["version"], primary["install_prefix"], data_dir, port, user),
+                    primary=primary["name"], slot=slot)
+    if result.returncode != 0:
+        # -C creates the slot before copying; the slot did not exist before, so it is this run's to drop
+        discard(primary, instance)
+        raise ReplicaError(f"pg_basebackup failed with exit code {result.returncode}: {result.stderr.strip()}")
+    write_standby_settings(data_dir, port)
+    return instance
+
+
+def discard(primary, instance):
+    """
+    Removes what create() made for a replica that is not registered: its data directory and its slot.
+    """
+    shutil.rmtree(instance["data_dir"], ignore_errors=True)
+    try:
+        drop_slot(primary, instance["slot"], instance.get("user"))
+    except db.DatabaseError:
+        pass
+
+
+def drop_slot(primary, slot, user=None):
+    """
+    Drops a replica's slot on the primary so it stops retaining WAL. Returns False if the primary is down.
+    """
+    pidinfo = _running_pidinfo(primary)
+    if pidinfo is None:
+        return False
+    db.execute(pidinfo["port"], "SELECT pg_drop_replication_slot(slot_name) FROM pg_replication_slots "
+               "WHERE slot_name = %s", (slot,), host=pidinfo["socket_dir"] or DEFAULT_SOCKET_DIR,
+               user=user or primary.get("user") or "postgres", version=primary["version"])
+    return True
+
+
+def lag(primary, user=None):
+    """
+    Returns the replication state of the primary's pgflux slots by slot name, or None if it is not running.
+    """
+    pidinfo = _running_pidinfo(primary)
+    if pidinfo is None:
+        return None
+    rows = db.query(pidinfo["port"], LAG_SQL, host=pidinfo["socket_dir"] or DEFAULT_SOCKET_DIR,
+                    user=user or primary.get("user") or "postgres", version=primary["version"])
+    return {row[0]: dict(zip(LAG_FIELDS, row)) for row in rows}
@@ -0,0 +1,122 @@
+import re
+
+# The last entry for each parameter in the configuration files wins, as in the server.
+FILE_SETTINGS_SQL = """
+    SELECT DISTINCT ON (lower(f.name)) lower(f.name), f.setting, f.sourcefile, f.sourceline, f.error,
+           s.setting, s.unit, s.vartype, s.context, s.source
+    FROM pg_file_settings f
+    LEFT JOIN pg_settings s ON s.name = lower(f.name)
+    ORDER BY lower(f.name), f.seqno DESC
+"""
+
+# Parameters set from a file that no longer appears there revert to their default on reload.
+REMOVED_SETTINGS_SQL = """
+    SELECT s.name, s.setting, s.boot_val, s.unit, s.vartype, s.context
+    FROM pg_settings s
+    WHERE s.source = 'configuration file'
+      AND NOT EXISTS (SELECT 1 FROM pg_file_settings f WHERE lower(f.name) = s.name)
+"""
+
+PENDING_RESTART_SQL = "SELECT name FROM pg_settings WHERE pending_restart ORDER BY name"
+
+# pg_file_settings.error for a changed postmaster-context parameter, as opposed to a rejected value.
+NOT_APPLIED_ERROR = "setting could not be applied"
+
+# Sources a configuration file entry can override; values from the command line or ALTER ROLE win anyway.
+FILE_SOURCES = ("default", "configuration file")
+UNIT_FACTORS = {
+    "b": 1, "kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3, "tb": 1024 ** 4,
+    "us": 0.001, "ms": 1, "s": 1000, "min": 60000, "h": 3600000, "d": 86400000,
+}
+BOOL_VALUES = {"on": True, "true": True, "yes": True, "1": True,
+               "off": False, "false": False, "no": False, "0": False}
+VALUE_RE = re.compile(r"^\s*(-?[0-9.]+(?:e[-+]?[0-9]+)?)\s*([a-z]*)\s*$", re.IGNORECASE)
+
+
+def _unit_factor(unit):
+    """
+    Returns the size in bytes or milliseconds of a unit such as '8kB' or 'ms', or None if unknown.
+    """
+    match = re.match(r"^([0-9]*)([a-z]+)$", (unit or "").lower())
+    if not match or match.group(2) not in UNIT_FACTORS:
+        return None
+    return int(match.group(1) or 1) * UNIT_FACTORS[match.group(2)]
+
+
+def normalize(value, unit, vartype):
+    """
+    Converts a configuration value to the form pg_settings reports, so that '128MB' equals '16384' (8kB).
+    """
+    value = (value or "").strip()
+    if vartype == "bool":
+        return BOOL_VALUES.get(value.lower(), value.lower())
+    if vartype in ("integer", "real"):
+        match = VALUE_RE.match(value)
+        if not match:
+            return value
+        number = float(match.group(1))
+        if match.group(2):
+            given, base = _unit_factor(match.group(2)), _unit_factor(unit)
+            if given and base:
+                number = number * given / base
+        return round(number) if vartype == "integer" else number
+    return value.lower() if vartype == "enum" else value
+
+
+def pending_changes(conn):
+    """
+    Compares the configuration files with the running settings.
+
+    Returns one dict per parameter that would change on reload, with its name,
+    current and pending values, context and where it is set.
+    """
+    changes = []
+    with conn.cursor() as cur:
+        cur.execute(FILE_SETTINGS_SQL)
+        for name, pending, sourcefile, sourceline, error, current, unit, vartype, context, source in cur.fetchall():
+            if source is not None and source not in FILE_SOURCES:
+                continue
+            if error is None and normalize(pending, unit, vartype) == normalize(current, None, vartype):
+                continue
+            changes.append({"name": name, "current": current, "pending": pending, "unit": unit,
+                            "context": context, "location": f"{sourcefile}:{sourceline}", "error": error})
+
+        cur.execute(REMOVED_SETTINGS_SQL)
+        for name, current, default, unit, vartype, context in cur.fetchall():
+            if normalize(default, None, vartype) != normalize(current, None, vartype):
+                changes.append({"name": name, "current": current, "pending": default, "unit": unit,
+                                "context": context, "location": "(removed, reverts to default)", "error": None})
+    return sorted(changes, key=lambda c: c["name"])
+
+
+def pending_restart(conn):
+    """
+    Returns the parameters whose new values the server has read but can only apply on restart.
+    """
+    with conn.cursor() as cur:
+        cur.execute(PENDING_RESTART_SQL)
+        return [row[0] for row in cur.fetchall()]
+
+
+def requires_restart(changes):
+    """
+    Returns the changes that only take effect when the server restarts.
+    """
+    return [c for c in changes if c["context"] == "postmaster"]
+
+
+def invalid(changes):
+    """
+    Returns the entries the server rejects (bad values or unknown parameters), which would also break a restart.
+    """
+    return [c for c in changes if c["error"] and c["error"] != NOT_APPLIED_ERROR]
+
+
+def reload(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_reload_conf()")
+
+
+def format_change(change):
+    unit = f" ({change['unit']})" if change["unit"] else ""
+    return f"{change['name']}: {change['current']} -> {change['pending']}{unit} [{change['context']}] {change['location']}"
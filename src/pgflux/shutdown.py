@@ -0,0 +1,155 @@
+import os
+import select
+import signal
+import time
+
+from pgflux import instrument, procfs, readiness
+
+# pg_ctl stop -m <mode> sends exactly these signals to the postmaster.
+MODE_SIGNALS = {"smart": signal.SIGTERM, "fast": signal.SIGINT, "immediate": signal.SIGQUIT}
+MODES = ("smart", "fast", "immediate")
+DEFAULT_TIMEOUTS = {"smart": 10.0, "fast": 20.0, "immediate": 10.0}
+PROGRESS_INTERVAL = 1.0
+POLL_INTERVAL = 0.05
+PORT_KILL_GRACE = 3.0
+
+# Process titles of postmaster children that are not client sessions.
+AUX_PROCESS_TITLES = (
+    "checkpointer", "background writer", "walwriter", "autovacuum launcher", "autovacuum worker",
+    "logical replication launcher", "logical replication", "archiver", "stats collector", "walreceiver",
+    "walsummarizer", "startup", "io worker", "parallel worker", "slotsync worker",
+)
+
+
+class ShutdownError(Exception):
+    """
+    Raised when the server is still running after every allowed shutdown mode.
+    """
+
+
+def backend_pids(postmaster_pid):
+    """
+    Returns the pids of the postmaster's children that serve client sessions.
+    """
+    backends = []
+    for pid, title in procfs.children(postmaster_pid):
+        name = title.split(":", 1)[1].strip() if ":" in title else title
+        # With cluster_name set, titles read "postgres: <cluster_name>: checkpointer"
+        _, separator, unprefixed = name.partition(": ")
+        if separator and unprefixed.startswith(AUX_PROCESS_TITLES):
+            name = unprefixed
+        if not name.startswith(AUX_PROCESS_TITLES):
+            backends.append(pid)
+    return backends
+
+
+def wait_for_exit(pid, timeout, on_progress=None):
+    """
+    Waits up to timeout seconds for pid to exit and returns whether it did.
+
+    Uses a pidfd so the wait wakes on exit instead of polling; on_progress is
+    called about once per PROGRESS_INTERVAL while waiting.
+    """
+    deadline = time.monotonic() + timeout
+    try:
+        pidfd = os.pidfd_open(pid)
+    except ProcessLookupError:
+        return True
+    except (AttributeError, OSError):
+        pidfd = None
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if pidfd is not None:
+                ready, _, _ = select.select([pidfd], [], [], min(remaining, PROGRESS_INTERVAL))
+                if ready:
+                    return True
+            else:
+                next_progress = time.monotonic() + min(remaining, PROGRESS_INTERVAL)
+                while time.monotonic() < next_progress:
+                    if not readiness.process_alive(pid):
+                        return True
+                    time.sleep(POLL_INTERVAL)
+            if on_progress:
+                on_progress()
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+
+
+def stop_server(data_dir, first_mode="smart", timeouts=None, echo=print):
+    """
+    Stops the server on data_dir, escalating smart -> fast -> immediate.
+
+    Each mode gets its own timeout so the total shutdown time is bounded.
+    Returns the mode that stopped the server, or None if it was not running.
+    """
+    timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+    pidinfo = readiness.read_pidfile(data_dir)
+    if not pidinfo or not readiness.process_alive(pidinfo["pid"]):
+        return None
+    postmaster = pidinfo["pid"]
+
+    for mode in MODES[MODES.index(first_mode):]:
+        echo(f"Sending {mode} shutdown request (timeout {timeouts[mode]:g}s)...")
+        last_count = [None]
+
+        def report_drain():
+            count = len(backend_pids(postmaster))
+            if count != last_count[0]:
+                echo(f"  waiting for {count} backend(s) to finish...")
+                last_count[0] = count
+
+        with instrument.phase(f"stop-{mode}"):
+            try:
+                os.kill(postmaster, MODE_SIGNALS[mode])
+            except ProcessLookupError:
+                return mode
+            if wait_for_exit(postmaster, timeouts[mode], report_drain if mode == "smart" else None):
+                return mode
+        echo(f"Server still running after {mode} shutdown.")
+    raise ShutdownError(f"PostgreSQL (pid {postmaster}) did not stop after {mode} shutdown.")
+
+
+def _signal_all(pids, sig):
+    """
+    Signals pids directly and returns those we lack permission for.
+    """
+    denied = []
+    for pid in pids:
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            denied.append(pid)
+    return denied
+
+
+def clear_port(port, grace=PORT_KILL_GRACE, echo=print):
+    """
+    Terminates every process holding a TCP socket on port: SIGTERM, then SIGKILL after grace seconds.
+
+    Signals are sent in-process; processes owned by other users are handled by
+    a single `sudo kill` covering all of them. Returns the pids that were signalled.
+    """
+    users, unreadable = procfs.port_users(port)
+    pids = sorted({u["pid"] for u in users} - {os.getpid()})
+    if unreadable:
+        echo(f"Note: {unreadable} processes could not be inspected; run as root to find all port holders.")
+    if not pids:
+        return []
+
+    denied = _signal_all(pids, signal.SIGTERM)
+    deadline = time.monotonic() + grace
+    survivors = [pid for pid in pids if pid not in denied]
+    while survivors and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        survivors = [pid for pid in survivors if readiness.process_alive(pid)]
+    denied = sorted(set(denied) | set(_signal_all(survivors, signal.SIGKILL)))
+
+    if denied:
+        instrument.run("kill", ["sudo", "kill", "-9"] + [str(pid) for pid in denied], check=True)
+    return pids
@@ -0,0 +1,396 @@
+import contextlib
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import stat
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from pgflux import db, instrument, readiness, templates
+from pgflux.constants import DEFAULT_SOCKET_DIR, SNAPSHOTS_DIR
+from pgflux.utils import default_jobs, format_size
+
+# Files are stored as content-addressed chunks of this size; an unchanged 1 GB relation segment is 128
+# chunks that the previous snapshot already holds.
+CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_LEVEL = 1
+CHUNKS_DIR = "chunks"
+MANIFESTS_DIR = "manifests"
+LOCK_FILE = "lock"
+SLOT_PREFIX = "pgflux_snapshot_"
+
+# Never copied: the server's lock file and options, which describe a process rather than the cluster.
+ALWAYS_EXCLUDED = {"postmaster.pid", "postmaster.opts"}
+# Skipped while the server runs, as pg_basebackup does; the directories are kept but their contents are
+# recreated on startup. pg_wal is copied separately after the backup has stopped.
+ONLINE_EXCLUDED_CONTENTS = {"pg_wal", "pg_replslot", "pg_dynshmem", "pg_notify", "pg_serial", "pg_snapshots",
+                            "pg_stat_tmp", "pg_subtrans"}
+ONLINE_EXCLUDED_FILES = {"backup_label", "tablespace_map"}
+WAL_FILE_RE = re.compile(r"^[0-9A-F]{24}(\.partial)?$|^[0-9A-F]{8}\.history$")
+
+
+class SnapshotError(Exception):
+    """
+    Raised when a snapshot cannot be taken, found or restored.
+    """
+
+
+class Store:
+    """
+    Content-addressed chunk store shared by every snapshot, plus one JSON manifest per snapshot.
+    """
+
+    def __init__(self, root=SNAPSHOTS_DIR):
+        self.root = root
+
+    @contextlib.contextmanager
+    def lock(self, exclusive=False):
+        """
+        Holds the store lock: shared while a snapshot adds chunks and its manifest, exclusive while gc
+        decides which chunks are unreferenced.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    def chunk_path(self, digest):
+        return os.path.join(self.root, CHUNKS_DIR, digest[:2], digest)
+
+    def put(self, data, level=DEFAULT_LEVEL):
+        """
+        Stores a chunk unless it is already present. Returns (digest, compressed bytes written, 0 if deduplicated).
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        payload = zlib.compress(data, level)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+        return digest, len(payload)
+
+    def get(self, digest):
+        with open(self.chunk_path(digest), "rb") as f:
+            return zlib.decompress(f.read())
+
+    def _manifest_dir(self, name):
+        return os.path.join(self.root, MANIFESTS_DIR, name)
+
+    def new_id(self, name):
+        """
+        Returns a timestamp id for a new snapshot of name, suffixed if one was taken within the same second.
+        """
+        base = candidate = time.strftime("%Y%m%dT%H%M%S")
+        suffix = 1
+        while os.path.exists(os.path.join(self._manifest_dir(name), f"{candidate}.json")):
+            suffix += 1
+            candidate = f"{base}-{suffix}"
+        return candidate
+
+    def save_manifest(self, manifest):
+        directory = self._manifest_dir(manifest["instance"])
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{manifest['id']}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+        return path
+
+    def manifests(self, name=None):
+        """
+        Returns the manifests of one instance, or of all, oldest first.
+        """
+        base = os.path.join(self.root, MANIFESTS_DIR)
+        names = [name] if name else (sorted(os.listdir(base)) if os.path.isdir(base) else [])
+        found = []
+        for instance in names:
+            directory = self._manifest_dir(instance)
+            if not os.path.isdir(directory):
+                continue
+            for entry in sorted(os.listdir(directory)):
+                if entry.endswith(".json"):
+                    with open(os.path.join(directory, entry), "r") as f:
+                        found.append(json.load(f))
+        return sorted(found, key=lambda m: m["created"])
+
+    def load_manifest(self, name, ref=None):
+        """
+        Returns the snapshot of instance name with id ref (or the latest one).
+        """
+        manifests = self.manifests(name)
+        if not manifests:
+            raise SnapshotError(f"Instance '{name}' has no snapshots.")
+        if ref in (None, "latest"):
+            return manifests[-1]
+        matches = [m for m in manifests if m["id"] == ref or m.get("label") == ref]
+        if not matches:
+            raise SnapshotError(f"No snapshot '{ref}' of instance '{name}'.")
+        return matches[-1]
+
+    def delete(self, manifest):
+        os.remove(os.path.join(self._manifest_dir(manifest["instance"]), f"{manifest['id']}.json"))
+
+    def gc(self):
+        """
+        Removes chunks no manifest references. Returns (chunks removed, bytes freed).
+
+        Runs under the exclusive store lock, so chunks a snapshot in progress has stored or deduplicated
+        against, and its temporary files, are never seen as unreferenced.
+        """
+        with self.lock(exclusive=True):
+            referenced = {digest for manifest in self.manifests() for entry in manifest["files"]
+                          for digest in entry["chunks"]}
+            removed = freed = 0
+            for root, _, files in os.walk(os.path.join(self.root, CHUNKS_DIR)):
+                for name in files:
+                    if name not in referenced:
+                        path = os.path.join(root, name)
+                        freed += os.path.getsize(path)
+                        os.remove(path)
+                        removed += 1
+        return removed, freed
+
+
+def walk(data_dir, online):
+    """
+    Lists the directories, regular files (path, size, mode) and symlinks of a data directory, relative to it.
+    """
+    dirs, files, links = [], [], []
+    for root, subdirs, names in os.walk(data_dir):
+        rel_root = os.path.relpath(root, data_dir)
+        for name in list(subdirs):
+            if name.startswith("pgsql_tmp"):
+                subdirs.remove(name)
+            elif os.path.islink(os.path.join(root, name)):
+                subdirs.remove(name)
+                names.append(name)
+        skip_contents = online and rel_root in ONLINE_EXCLUDED_CONTENTS
+        if rel_root != ".":
+            dirs.append((rel_root, stat.S_IMODE(os.stat(root).st_mode)))
+        if skip_contents:
+            subdirs[:] = []
+            continue
+        for name in names:
+            rel = os.path.normpath(os.path.join(rel_root, name))
+            if rel in ALWAYS_EXCLUDED or (online and rel in ONLINE_EXCLUDED_FILES) or name.startswith("pgsql_tmp"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.lstat(path)
+            except FileNotFoundError:
+                continue  # dropped while we were walking
+            if stat.S_ISLNK(st.st_mode):
+                links.append((rel, os.readlink(path)))
+            elif stat.S_ISREG(st.st_mode):
+                files.append((rel, st.st_size, stat.S_IMODE(st.st_mode)))
+    return dirs, files, links
+
+
+def _store_chunk(store, path, offset, length, level, totals):
+    try:
+        with open(path, "rb") as f:
+            data = os.pread(f.fileno(), length, offset)
+    except FileNotFoundError:
+        return None
+    digest, written = store.put(data, level)
+    totals.append((len(data), written))
+    return digest, len(data)
+
+
+def store_files(store, data_dir, files, jobs=None, level=DEFAULT_LEVEL, chunk_size=CHUNK_SIZE):
+    """
+    Hashes and compresses every chunk of files on a thread pool (hashlib and zlib release the GIL).
+    Returns the file entries of the manifest and (bytes read, compressed bytes newly stored).
+
+    A file that shrinks or disappears while it is read is stored as found; WAL replay repairs relation files
+    changed during an online snapshot.
+    """
+    totals = []
+    entries = []
+    with ThreadPoolExecutor(max_workers=max(1, jobs or default_jobs())) as pool:
+        for rel, size, mode in files:
+            path = os.path.join(data_dir, rel)
+            offsets = range(0, size, chunk_size) if size else []
+            futures = [pool.submit(_store_chunk, store, path, offset, chunk_size, level, totals) for offset in offsets]
+            entries.append((rel, mode, futures))
+        manifest_files = []
+        for rel, mode, futures in entries:
+            results = [future.result() for future in futures]
+            if any(result is None for result in results):
+                continue
+            # Chunks are placed by index on restore, so only trailing ones past a shrunken end are dropped.
+            while results and not results[-1][1]:
+                results.pop()
+            size = (len(results) - 1) * chunk_size + results[-1][1] if results else 0
+            manifest_files.append({"path": rel, "mode": mode, "size": size,
+                                   "chunks": [digest for digest, _ in results]})
+    return manifest_files, (sum(read for read, _ in totals), sum(written for _, written in totals))
+
+
+def _server_version_num(cur):
+    cur.execute("SHOW server_version_num")
+    return int(cur.fetchone()[0])
+
+
+def create(store, name, version, data_dir, connect=None, label=None, jobs=None, level=DEFAULT_LEVEL,
+           chunk_size=CHUNK_SIZE, echo=print):
+    """
+    Snapshots a data directory and returns the saved manifest.
+
+    With connect (a callable returning an autocommit connection) the server is running: a temporary
+    physical replication slot keeps the WAL written during the copy, pg_backup_start/pg_backup_stop (or
+    their pre-15 names) bracket the data files, and pg_wal is copied after the backup stops. Without it the
+    server must be stopped and the directory is copied as is.
+
+    The store lock is held in shared mode until the manifest is saved, keeping gc away from the chunks.
+    """
+    with store.lock():
+        manifest = {"id": store.new_id(name), "instance": name, "version": version, "data_dir": data_dir,
+                    "label": label, "created": time.time(), "online": connect is not None,
+                    "chunk_size": chunk_size, "backup_label": None, "tablespace_map": None}
+        started = time.monotonic()
+        if connect is None:
+            with instrument.phase("snapshot-copy"):
+                dirs, files, links = walk(data_dir, online=False)
+                manifest["files"], totals = store_files(store, data_dir, files, jobs, level, chunk_size)
+        else:
+            dirs, links, manifest["files"], totals = _create_online(store, manifest, data_dir, connect, jobs,
+                                                                    level, chunk_size, echo)
+
+        tablespaces = [rel for rel, _ in links if rel.startswith("pg_tblspc" + os.sep)]
+        if tablespaces:
+            echo(f"Warning: tablespaces outside the data directory are not included: {', '.join(tablespaces)}")
+        manifest.update(dirs=dirs, links=links, size=totals[0], stored=totals[1],
+                        elapsed=round(time.monotonic() - started, 3))
+        store.save_manifest(manifest)
+    return manifest
+
+
+def take_snapshot(name, version, data_dir, user="postgres", label=None, jobs=None, level=DEFAULT_LEVEL,
+                  echo=print):
+    """
+    Snapshots a data directory online if its server is running, else offline. Returns the manifest.
+    """
+    pidinfo = readiness.read_pidfile(data_dir)
+    connect = None
+    if pidinfo and readiness.process_alive(pidinfo["pid"]):
+        connect = functools.partial(db.connect, pidinfo["port"], user=user,
+                                    host=pidinfo["socket_dir"] or DEFAULT_SOCKET_DIR, autocommit=True)
+    manifest = create(Store(), name, version, data_dir, connect, label, jobs, level, echo=echo)
+    echo(f"Snapshot {manifest['id']} of '{name}' ({'online' if manifest['online'] else 'offline'}): "
+         f"{format_size(manifest['size'])} read, {format_size(manifest['stored'])} newly stored "
+         f"in {manifest['elapsed']:.1f}s.")
+    return manifest
+
+
+def snapshot_before_reinit(name, version, data_dir, echo=print):
+    """
+    Snapshots a cluster that --force-init is about to remove and tells how to get it back.
+    """
+    manifest = take_snapshot(name, version, data_dir, label="before force-init", echo=echo)
+    echo(f"Undo with: pgflux snapshot restore {manifest['id']} --instance {name} --force")
+    return manifest
+
+
+def _create_online(store, manifest, data_dir, connect, jobs, level, chunk_size, echo):
+    slot = f"{SLOT_PREFIX}{os.getpid()}"
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            modern = _server_version_num(cur) >= 150000
+            # Temporary: the slot goes away with this session even if we crash.
+            cur.execute("SELECT pg_create_physical_replication_slot(%s, true, true)", (slot,))
+            echo("Starting the backup (fast checkpoint)...")
+            with instrument.phase("backup-start"):
+                if modern:
+                    cur.execute("SELECT pg_backup_start(%s, true)", (f"pgflux {manifest['id']}",))
+                else:
+                    cur.execute("SELECT pg_start_backup(%s, true, false)", (f"pgflux {manifest['id']}",))
+            try:
+                with instrument.phase("snapshot-copy"):
+                    dirs, files, links = walk(data_dir, online=True)
+                    entries, (read, written) = store_files(store, data_dir, files, jobs, level, chunk_size)
+            finally:
+                with instrument.phase("backup-stop"):
+                    stop = "pg_backup_stop(false)" if modern else "pg_stop_backup(false, false)"
+                    cur.execute(f"SELECT labelfile, spcmapfile FROM {stop}")
+                    manifest["backup_label"], manifest["tablespace_map"] = cur.fetchone()
+
+            wal_dir = os.path.join(data_dir, "pg_wal")
+            wal = [(os.path.join("pg_wal", name), os.path.getsize(os.path.join(wal_dir, name)), 0o600)
+                   for name in sorted(os.listdir(wal_dir)) if WAL_FILE_RE.match(name)]
+            with instrument.phase("snapshot-wal"):
+                wal_entries, (wal_read, wal_written) = store_files(store, data_dir, wal, jobs, level, chunk_size)
+    finally:
+        conn.close()
+    return dirs, links, entries + wal_entries, (read + wal_read, written + wal_written)
+
+
+def _restore_chunk(store, path, offset, digest):
+    data = store.get(digest)
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        os.pwrite(fd, data, offset)
+    finally:
+        os.close(fd)
+    return len(data)
+
+
+def restore(store, manifest, data_dir, jobs=None, chunk_size=CHUNK_SIZE):
+    """
+    Recreates the snapshot in data_dir, which must not exist, decompressing chunks on a thread pool.
+    Returns the number of bytes written.
+    """
+    if os.path.exists(data_dir):
+        raise SnapshotError(f"{data_dir} already exists.")
+    os.makedirs(data_dir, mode=0o700)
+    for rel, mode in manifest["dirs"]:
+        os.makedirs(os.path.join(data_dir, rel), exist_ok=True)
+        os.chmod(os.path.join(data_dir, rel), mode)
+    for rel, target in manifest["links"]:
+        os.symlink(target, os.path.join(data_dir, rel))
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs or default_jobs())) as pool:
+        futures = []
+        for entry in manifest["files"]:
+            path = os.path.join(data_dir, entry["path"])
+            with open(path, "wb") as f:
+                f.truncate(entry["size"])
+            os.chmod(path, entry["mode"])
+            futures.extend(pool.submit(_restore_chunk, store, path, index * chunk_size, digest)
+                           for index, digest in enumerate(entry["chunks"]))
+        written = sum(future.result() for future in futures)
+
+    for name in ("backup_label", "tablespace_map"):
+        if manifest.get(name):
+            with open(os.path.join(data_dir, name), "w") as f:
+                f.write(manifest[name])
+    os.sync()
+    return written
+
+
+def replace_data_dir(store, manifest, data_dir, jobs=None):
+    """
+    Restores into a sibling directory and swaps it in, so a failed restore leaves the old directory intact.
+    """
+    staging = f"{data_dir.rstrip(os.sep)}.restore-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    try:
+        written = restore(store, manifest, staging, jobs, manifest.get("chunk_size", CHUNK_SIZE))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    if os.path.exists(data_dir):
+        templates.remove_data_dir(data_dir)
+    os.rename(staging, data_dir)
+    return written
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import shutil
+import tarfile
+
+from pgflux import instrument
+from pgflux.constants import MIRROR_DIR
+
+TARBALL_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+SOURCE_MARKER = ".pgflux-source"
+
+
+def is_tarball(source):
+    """
+    Returns True if source names a local source tarball rather than a git repository.
+    """
+    return source.endswith(TARBALL_SUFFIXES) and os.path.isfile(source)
+
+
+def _git(args, cwd=None, capture=False):
+    return instrument.run(f"git-{args[0]}", ["git"] + args, cwd=cwd, check=True, capture_output=capture, text=capture)
+
+
+def _branch_ref(branch):
+    return f"+refs/heads/{branch}:refs/heads/{branch}"
+
+
+def _fetch_args(depth, filter_spec):
+    args = []
+    if depth:
+        args.append(f"--depth={depth}")
+    if filter_spec:
+        args.append(f"--filter={filter_spec}")
+    return args
+
+
+def ensure_mirror(source, branch, mirror_dir=MIRROR_DIR, depth=None, filter_spec=None, offline=False):
+    """
+    Makes sure the shared bare mirror contains an up-to-date copy of branch.
+
+    source is a git URL or the path of an existing mirror, which allows fully
+    offline installs. With offline set the mirror is used as is and never fetched.
+    """
+    if os.path.isdir(mirror_dir):
+        if offline:
+            return mirror_dir
+        _git(["remote", "set-url", "origin", source], cwd=mirror_dir)
+        _git(["fetch", "--no-tags"] + _fetch_args(depth, filter_spec) + ["origin", _branch_ref(branch)], cwd=mirror_dir)
+        return mirror_dir
+
+    if offline and not os.path.exists(source):
+        raise RuntimeError(f"No mirror at {mirror_dir} and '{source}' is not a local path; cannot install offline.")
+
+    os.makedirs(os.path.dirname(mirror_dir), exist_ok=True)
+    _git(["clone", "--bare", "--no-tags", "--single-branch", "--branch", branch]
+         + _fetch_args(depth, filter_spec) + [source, mirror_dir])
+    return mirror_dir
+
+
+def is_worktree(build_dir):
+    """
+    Returns True if build_dir is a linked worktree (its .git is a file, not a directory).
+    """
+    return os.path.isfile(os.path.join(build_dir, ".git"))
+
+
+def prepare_worktree(branch, build_dir, mirror_dir=MIRROR_DIR):
+    """
+    Checks out branch into build_dir as a worktree of the shared mirror.
+
+    An existing worktree is switched in place so that unchanged files keep
+    their timestamps and make only rebuilds what the checkout touched.
+    """
+    if os.path.isdir(os.path.join(build_dir, ".git")):
+        # Full clone left behind by older pgflux releases: move it to the mirror's commit like a worktree.
+        _git(["fetch", "--no-tags", mirror_dir, f"refs/heads/{branch}"], cwd=build_dir)
+        _git(["checkout", "--detach", "FETCH_HEAD"], cwd=build_dir)
+    elif is_worktree(build_dir):
+        _git(["checkout", "--detach", f"refs/heads/{branch}"], cwd=build_dir)
+    else:
+        if os.path.exists(build_dir):
+            shutil.rmtree(build_dir)
+        _git(["worktree", "prune"], cwd=mirror_dir)
+        _git(["worktree", "add", "--detach", build_dir, f"refs/heads/{branch}"], cwd=mirror_dir)
+    return resolve_commit(build_dir)
+
+
+def remove_worktree(build_dir, mirror_dir=MIRROR_DIR):
+    """
+    Removes a build directory. The shared mirror and its history are kept.
+    """
+    if is_worktree(build_dir) and os.path.isdir(mirror_dir):
+        _git(["worktree", "remove", "--force", build_dir], cwd=mirror_dir)
+    elif os.path.exists(build_dir):
+        shutil.rmtree(build_dir)
+    if os.path.isdir(mirror_dir):
+        _git(["worktree", "prune"], cwd=mirror_dir)
+
+
+def resolve_commit(build_dir):
+    """
+    Returns the commit checked out in build_dir, or the tarball digest for extracted sources.
+    """
+    marker = os.path.join(build_dir, SOURCE_MARKER)
+    if os.path.exists(marker):
+        with open(marker, "r") as f:
+            return f.read().strip()
+    return _git(["rev-parse", "HEAD"], cwd=build_dir, capture=True).stdout.strip()
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_tarball(tarball, build_dir, mirror_dir=MIRROR_DIR):
+    """
+    Unpacks a PostgreSQL source tarball into build_dir, stripping its top-level directory.
+
+    Extraction is skipped when build_dir already holds the same tarball, so
+    repeated offline installs keep their build products.
+    """
+    source_id = "tarball:" + _file_digest(tarball)
+    if os.path.exists(os.path.join(build_dir, SOURCE_MARKER)) and resolve_commit(build_dir) == source_id:
+        return source_id
+
+    remove_worktree(build_dir, mirror_dir)
+    os.makedirs(build_dir)
+    with tarfile.open(tarball) as tar:
+        members = tar.getmembers()
+        top_dirs = {m.name.split("/", 1)[0] for m in members}
+        strip = top_dirs.pop() + "/" if len(top_dirs) == 1 else ""
+        for member in members:
+            if strip and member.name.startswith(strip):
+                member.name = member.name[len(strip):]
+            elif strip:
+                continue
+            if not member.name or member.name.startswith("/") or ".." in member.name.split("/"):
+                continue
+            tar.extract(member, build_dir)
+    with open(os.path.join(build_dir, SOURCE_MARKER), "w") as f:
+        f.write(source_id)
+    return source_id
@@ -0,0 +1,42 @@
+import math
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram (1% resolution), so percentiles need constant memory per run.
+    """
+
+    RATIO = math.log(1.01)
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+
+    def add(self, micros):
+        bucket = int(math.log(max(micros, 1)) / self.RATIO)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+
+    def percentile(self, pct):
+        """
+        Returns the pct-th percentile in milliseconds, or None if empty.
+        """
+        if not self.count:
+            return None
+        rank = math.ceil(self.count * pct / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return math.exp((bucket + 0.5) * self.RATIO) / 1000
+        return None
+
+    def to_dict(self):
+        return {"count": self.count, "buckets": {str(k): v for k, v in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.count = data.get("count", 0)
+        histogram.buckets = {int(k): v for k, v in data.get("buckets", {}).items()}
+        return histogram
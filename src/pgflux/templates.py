@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import shutil
+
+from pgflux import instrument
+from pgflux.constants import TEMPLATES_DIR
+from pgflux.utils import clone_tree, default_jobs
+
+META_FILE = "meta.json"
+DATA_SUBDIR = "data"
+# Files whose content determines what initdb produces
+FINGERPRINT_FILES = (os.path.join("bin", "postgres"), os.path.join("bin", "initdb"),
+                     os.path.join("share", "postgres.bki"))
+
+
+def binaries_fingerprint(install_prefix):
+    """
+    Hashes the server binaries and the bootstrap catalog of an installation.
+    """
+    digest = hashlib.sha256()
+    for rel_path in FINGERPRINT_FILES:
+        path = os.path.join(install_prefix, rel_path)
+        if not os.path.exists(path):
+            continue
+        digest.update(rel_path.encode())
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _initdb_args(encoding, locale, username):
+    args = [f"--encoding={encoding}", f"--username={username}"]
+    args.append(f"--locale={locale}" if locale else "--no-locale")
+    return args
+
+
+def _read_meta(entry_dir):
+    try:
+        with open(os.path.join(entry_dir, META_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def ensure_template(install_prefix, version, encoding="UTF8", locale=None, username="postgres", **run_kwargs):
+    """
+    Returns the data directory of a pristine cluster for these settings, running initdb on a miss.
+
+    Templates built from other binaries of the same version and settings
+    are removed, so a rebuilt server never clones a stale catalog.
+    """
+    fingerprint = binaries_fingerprint(install_prefix)
+    settings = {"version": version, "encoding": encoding, "locale": locale, "username": username}
+    key = hashlib.sha256(json.dumps(dict(settings, binaries=fingerprint), sort_keys=True).encode()).hexdigest()
+    entry_dir = os.path.join(TEMPLATES_DIR, key)
+    if os.path.isdir(os.path.join(entry_dir, DATA_SUBDIR)) and _read_meta(entry_dir):
+        return os.path.join(entry_dir, DATA_SUBDIR)
+
+    os.makedirs(TEMPLATES_DIR, exist_ok=True)
+    for name in os.listdir(TEMPLATES_DIR):
+        meta = _read_meta(os.path.join(TEMPLATES_DIR, name))
+        if meta and meta.get("settings") == settings and meta.get("binaries") != fingerprint:
+            shutil.rmtree(os.path.join(TEMPLATES_DIR, name), ignore_errors=True)
+
+    tmp_dir = f"{entry_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    instrument.run("initdb", [os.path.join(install_prefix, "bin", "initdb"), "-D", os.path.join(tmp_dir, DATA_SUBDIR)]
+                   + _initdb_args(encoding, locale, username), check=True, **run_kwargs)
+    with open(os.path.join(tmp_dir, META_FILE), "w") as f:
+        json.dump({"settings": settings, "binaries": fingerprint, "install_prefix": install_prefix}, f, indent=2)
+    try:
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        # A concurrent init created the same template first.
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return os.path.join(entry_dir, DATA_SUBDIR)
+
+
+def clone_cluster(template_data_dir, data_dir):
+    """
+    Copies a template cluster into data_dir using reflinks, or a parallel copy where unsupported.
+    """
+    with instrument.phase("clone-template"):
+        clone_tree(template_data_dir, data_dir, link=False, workers=min(8, default_jobs()))
+    os.chmod(data_dir, 0o700)
+
+
+def init_cluster(install_prefix, version, data_dir, encoding="UTF8", locale=None, username="postgres",
+                 use_template=True, **run_kwargs):
+    """
+    Creates a new cluster in data_dir, cloning a cached template unless use_template is false.
+    """
+    if not use_template:
+        instrument.run("initdb", [os.path.join(install_prefix, "bin", "initdb"), "-D", data_dir]
+                       + _initdb_args(encoding, locale, username), check=True, **run_kwargs)
+        return
+    template = ensure_template(install_prefix, version, encoding, locale, username, **run_kwargs)
+    clone_cluster(template, data_dir)
+
+
+def _quote(value):
+    value = str(value)
+    if value.replace(".", "", 1).isdigit():
+        return value
+    return "'" + value.replace("'", "''") + "'"
+
+
+def apply_overrides(data_dir, settings):
+    """
+    Appends parameter overrides (e.g. the port) to the cluster's postgresql.conf.
+    """
+    if not settings:
+        return
+    with open(os.path.join(data_dir, "postgresql.conf"), "a") as conf:
+        conf.write("\n# Added by pgflux\n")
+        for name, value in settings.items():
+            conf.write(f"{name} = {_quote(value)}\n")
+
+
+def remove_data_dir(data_dir):
+    """
+    Deletes a data directory in-process instead of spawning rm -rf.
+    """
+    with instrument.phase("remove-data-dir"):
+        shutil.rmtree(data_dir)
@@ -0,0 +1,115 @@
+import json
+import unittest
+
+from pgflux import advise
+
+# EXPLAIN (FORMAT JSON, VERBOSE) of
+#   SELECT * FROM orders o JOIN customers c ON c.id = o.customer_id
+#   WHERE o.status = $1 AND o.created_at > $2 ORDER BY o.created_at
+PLAN = {
+    "Node Type": "Sort", "Total Cost": 1200.0, "Sort Key": ["o.created_at"],
+    "Plans": [{
+        "Node Type": "Hash Join", "Hash Cond": "(o.customer_id = c.id)",
+        "Plans": [
+            {"Node Type": "Seq Scan", "Relation Name": "orders", "Schema": "public", "Alias": "o",
+             "Filter": "((o.created_at > $2) AND ((o.status)::text = 'it''s o.x'::text))"},
+            {"Node Type": "Hash", "Plans": [
+                {"Node Type": "Seq Scan", "Relation Name": "customers", "Schema": "public", "Alias": "c"}]},
+        ],
+    }],
+}
+
+
+def index(name, columns, constraint=False, method="btree", opclasses=None):
+    return {"schema": "public", "table": "orders", "name": name, "qualified": f"public.{name}", "method": method,
+            "columns": columns, "opclasses": opclasses or ",".join(["3124"] * len(columns)), "expressions": "",
+            "predicate": "", "constraint": constraint, "size": 8192}
+
+
+class PlanningCursor:
+    """
+    Answers the advisor's queries; plans get cheaper while a trial index is built in the open transaction.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.result = None
+        self.trial = False
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+        if sql.startswith("CREATE INDEX"):
+            self.trial = True
+        elif sql == "ROLLBACK":
+            self.trial = False
+        elif sql.startswith("SELECT quote_ident"):
+            self.result = [(name,) for name in params[0]]
+        elif sql.startswith("SELECT pg_total_relation_size"):
+            self.result = [(8192,)]
+        elif sql.startswith("EXPLAIN"):
+            self.result = [(json.dumps([{"Plan": dict(PLAN, **{"Total Cost": 600.0 if self.trial else 1200.0})}]),)]
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+
+class TestAdvise(unittest.TestCase):
+
+    def test_column_predicates(self):
+        """Test that column references are classified as equality, range or other, ignoring string literals."""
+        self.assertEqual(advise.column_predicates(PLAN["Plans"][0]["Plans"][0]["Filter"]),
+                         [("o", "created_at", "range"), ("o", "status", "eq")])
+        self.assertEqual(advise.column_predicates('(lower(("C"."E-mail")::text) ~~ $1)'), [("C", "E-mail", "range")])
+        self.assertEqual(advise.column_predicates("(o.customer_id = c.id)"),
+                         [("o", "customer_id", "eq"), ("c", "id", "eq")])
+
+    def test_plan_candidates(self):
+        """Test that filters, join conditions and sort keys yield btree-ordered candidates."""
+        self.assertEqual(advise.plan_candidates(PLAN), {
+            ("public", "orders", ("status", "created_at")),
+            ("public", "orders", ("customer_id",)),
+            ("public", "customers", ("id",)),
+            ("public", "orders", ("created_at",)),
+        })
+        self.assertEqual(advise.plan_relations(PLAN), {"o": ("public", "orders"), "c": ("public", "customers")})
+
+    def test_covered_and_redundant(self):
+        """Test that existing leading columns cover candidates and that duplicate and prefix indexes are found."""
+        indexes = [index("orders_pkey", ["id"], constraint=True), index("orders_status_idx", ["status"]),
+                   index("orders_status_created_idx", ["status", "created_at"]),
+                   index("orders_status_created_idx2", ["status", "created_at"]),
+                   index("orders_status_hash", ["status"], method="hash")]
+        self.assertTrue(advise.covered(("public", "orders", ("status", "created_at")), indexes))
+        self.assertFalse(advise.covered(("public", "orders", ("created_at",)), indexes))
+        found = {(i["name"], other["name"], relation) for i, other, relation in advise.redundant_indexes(indexes)}
+        self.assertEqual(found, {("orders_status_idx", "orders_status_created_idx", "covered by"),
+                                 ("orders_status_created_idx2", "orders_status_created_idx", "duplicate of")})
+
+    def test_prune_and_statements(self):
+        """Test that a recommendation led by a better one is dropped and the generated SQL."""
+        wide = {"schema": "public", "table": "orders", "columns": ["status", "created_at"]}
+        narrow = {"schema": "public", "table": "orders", "columns": ["status"]}
+        self.assertEqual(advise.prune([wide, narrow]), [wide])
+        self.assertEqual(advise.prune([narrow, wide]), [narrow, wide])
+        self.assertEqual(advise.create_statement("public.orders", ["status", '"createdAt"']),
+                         'CREATE INDEX CONCURRENTLY ON public.orders (status, "createdAt");')
+        self.assertEqual(advise.drop_statement("public.orders_status_idx"),
+                         "DROP INDEX CONCURRENTLY public.orders_status_idx;")
+
+    def test_rollback_builds_each_candidate_once(self):
+        """Test that the rollback method builds a trial index once per candidate for all its statements."""
+        cur = PlanningCursor()
+        statements = [{"queryid": n, "database": "app", "query": f"SELECT {n} FROM orders WHERE status = $1",
+                       "calls": 1, "total_ms": 100.0} for n in (1, 2)]
+        found = advise.evaluate(cur, statements, 1 << 30, method="rollback", indexes=[], echo=lambda message: None)
+        builds = [sql for sql in cur.statements if sql.startswith("CREATE INDEX")]
+        self.assertEqual(len(builds), 4)
+        self.assertEqual((cur.statements.count("BEGIN"), cur.statements.count("ROLLBACK")), (5, 5))
+        self.assertEqual({len(r["statements"]) for r in found}, {2})
+
+
+if __name__ == "__main__":
+    unittest.main()
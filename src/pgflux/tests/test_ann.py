@@ -0,0 +1,51 @@
+import contextlib
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from pgflux import ann
+from pgflux.commands import install_command
+
+
+class TestAnn(unittest.TestCase):
+
+    def test_generate_vectors(self):
+        """Test that generated vectors are deterministic per seed and have the requested shape."""
+        first = ann.generate_vectors(50, 8, 4, seed=1)
+        self.assertEqual(first, ann.generate_vectors(50, 8, 4, seed=1))
+        self.assertNotEqual(first, ann.generate_vectors(50, 8, 4, seed=2))
+        self.assertEqual((len(first), {len(v) for v in first}), (50, {8}))
+
+    def test_vector_literal_and_recall(self):
+        """Test the vector text format and recall of partially matching neighbour lists."""
+        self.assertEqual(ann.vector_literal([1.0, -0.5, 1e-8]), "[1,-0.5,1e-08]")
+        self.assertEqual(ann.recall([3, 1, 9], [1, 2, 3, 4]), 0.5)
+        self.assertEqual(ann.recall([], []), 1.0)
+        self.assertEqual(ann.default_lists(250000), 250)
+        self.assertEqual(ann.default_lists(10), 1)
+
+    def test_failed_extension_build_only_warns(self):
+        """Test that pgfluxai builds from a clean copy and that a failing make only warns."""
+        class JobServer:
+            def slot(self):
+                return contextlib.nullcontext()
+
+        failure = subprocess.CalledProcessError(2, ["make", "install"])
+        messages = []
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(install_command, "EXTENSION_BUILD_TEMPLATE", os.path.join(tmp, "{version}")), \
+                mock.patch.object(install_command.instrument, "run", side_effect=failure):
+            # Objects of an earlier build must not be reused against a different server
+            stale = os.path.join(tmp, "pg16", "src", "ivfflat.o")
+            os.makedirs(os.path.dirname(stale))
+            open(stale, "w").close()
+            installed = install_command.install_extension("pg16", tmp, JobServer(), messages.append, {})
+            self.assertFalse(os.path.exists(stale))
+        self.assertFalse(installed)
+        self.assertTrue(messages[-1].startswith("Warning: building the pgfluxai extension failed"))
+
+
+if __name__ == "__main__":
+    unittest.main()
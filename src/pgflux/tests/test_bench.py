@@ -0,0 +1,51 @@
+import tempfile
+import unittest
+
+from pgflux import bench
+
+
+def _result(version, tps_by_clients, settings=None):
+    result = bench.new_result(version, "tpcb", [], 10, 3)
+    result["settings"] = settings or {}
+    result["points"] = [{"scale": 10, "clients": clients, "runs": [{"tps": tps, "p95_ms": 2.0} for tps in values]}
+                        for clients, values in tps_by_clients.items()]
+    return result
+
+
+class TestBench(unittest.TestCase):
+
+    def test_welch_t_test(self):
+        """Test the Welch t-test p-value against a known reference value."""
+        t, df, p = bench.welch_t_test([1, 2, 3, 4, 5], [2, 4, 6, 8, 10])
+        self.assertAlmostEqual(t, 1.8974, places=4)
+        self.assertAlmostEqual(df, 5.8824, places=4)
+        self.assertAlmostEqual(p, 0.10753, places=4)
+        self.assertIsNone(bench.welch_t_test([1.0], [2.0, 3.0]))
+
+    def test_latency_histogram(self):
+        """Test that percentiles from the log-bucketed histogram are within its 1% resolution."""
+        histogram = bench.LatencyHistogram()
+        for micros in range(1000, 1001000, 1000):
+            histogram.add(micros)
+        self.assertAlmostEqual(histogram.percentile(50), 500, delta=5)
+        self.assertAlmostEqual(histogram.percentile(99), 990, delta=10)
+
+    def test_compare_and_store(self):
+        """Test that only consistent differences are significant and results round-trip through the store."""
+        base = _result("pg16", {1: [1000, 1010, 990], 8: [5000, 5100, 4900]}, {"work_mem": "4096kB"})
+        new = _result("pg17", {1: [1005, 995, 1012], 8: [5600, 5650, 5580]}, {"work_mem": "65536kB"})
+        rows = {row["clients"]: row for row in bench.compare(base, new)}
+        self.assertFalse(rows[1]["significant"])
+        self.assertTrue(rows[8]["significant"])
+        self.assertGreater(rows[8]["change"], 10)
+        self.assertEqual(bench.setting_differences(base, new), [("work_mem", "4096kB", "65536kB")])
+
+        with tempfile.TemporaryDirectory() as bench_dir:
+            new["label"] = "big work_mem"
+            path = bench.save_result(new, bench_dir)
+            self.assertEqual([p for p, _ in bench.list_results(bench_dir, version="pg17")], [path])
+            self.assertEqual(bench.load_result("big work_mem", bench_dir)[0], path)
+
+
+if __name__ == "__main__":
+    unittest.main()
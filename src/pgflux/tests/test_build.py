@@ -0,0 +1,93 @@
+import os
+import select
+import tempfile
+import unittest
+
+from pgflux import build
+from pgflux.jobs import JobServer
+
+
+class TestBuild(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.build_dir = self.tmp.name
+        with open(os.path.join(self.build_dir, "configure"), "w") as f:
+            f.write("#!/bin/sh\n")
+
+    def test_configure_fingerprint(self):
+        """Test that arguments and relevant environment change the fingerprint."""
+        args = ["--prefix=/usr/local/pg16"]
+        base = build.configure_fingerprint(self.build_dir, args, env={"CFLAGS": "-O2", "HOME": "/root"})
+        self.assertEqual(base, build.configure_fingerprint(self.build_dir, args, env={"CFLAGS": "-O2"}))
+        self.assertNotEqual(base, build.configure_fingerprint(self.build_dir, args, env={"CFLAGS": "-O3"}))
+        self.assertNotEqual(base, build.configure_fingerprint(self.build_dir, args + ["--with-python"],
+                                                              env={"CFLAGS": "-O2"}))
+
+    def test_needs_configure(self):
+        """Test that configure is skipped only for a matching config.status."""
+        fingerprint = build.configure_fingerprint(self.build_dir, [], env={})
+        self.assertTrue(build.needs_configure(self.build_dir, fingerprint))
+        open(os.path.join(self.build_dir, "config.status"), "w").close()
+        build.record_configure(self.build_dir, fingerprint)
+        self.assertFalse(build.needs_configure(self.build_dir, fingerprint))
+        self.assertTrue(build.needs_configure(self.build_dir, "other"))
+
+    def test_compare_objects(self):
+        """Test counting rebuilt and reused object files."""
+        for name in ("a.o", "b.o"):
+            open(os.path.join(self.build_dir, name), "w").close()
+        before = build.snapshot_objects(self.build_dir)
+        os.utime(os.path.join(self.build_dir, "a.o"), ns=(0, 10 ** 9))
+        open(os.path.join(self.build_dir, "c.o"), "w").close()
+        self.assertEqual(build.compare_objects(before, build.snapshot_objects(self.build_dir)), (2, 1))
+
+    def test_jobserver_bounds_slots(self):
+        """Test that the jobserver hands out exactly its configured number of slots."""
+        jobserver = JobServer(3)
+        self.addCleanup(jobserver.close)
+        tokens = [jobserver.acquire() for _ in range(3)]
+        self.assertEqual(select.select([jobserver.pass_fds[0]], [], [], 0)[0], [])
+        jobserver.release(tokens.pop())
+        with jobserver.slot():
+            self.assertEqual(select.select([jobserver.pass_fds[0]], [], [], 0)[0], [])
+        self.assertIn(f"--jobserver-auth={jobserver.pass_fds[0]},{jobserver.pass_fds[1]}",
+                      jobserver.make_env({})["MAKEFLAGS"])
+
+    def test_profile_flags(self):
+        """Test the compiler flags of each build profile for gcc and clang."""
+        gcc, clang = "gcc (Debian 12.2.0-14) 12.2.0", "clang version 16.0.6"
+        self.assertEqual(build.profile_flags("default", gcc), ([], []))
+        self.assertEqual(build.profile_flags("default", gcc, debug_symbols=True)[0][0], "-O2")
+        self.assertIn("-flto=thin", build.profile_flags("lto", clang)[1])
+        cflags, ldflags = build.profile_flags("pgo", gcc, pgo_stage="generate", pgo_dir="/p")
+        self.assertIn("-fprofile-generate=/p", cflags)
+        self.assertNotIn("-flto=auto", cflags)
+        cflags, _ = build.profile_flags("pgo", clang, pgo_stage="use", pgo_dir="/p")
+        self.assertIn(f"-fprofile-use=/p/{build.PROFDATA_FILE}", cflags)
+        env = build.build_environment(["-O3"], [], env={"CFLAGS": "-pipe"})
+        self.assertEqual(env["CFLAGS"], "-pipe -O3")
+
+    def test_flags_changed(self):
+        """Test that switching compiler flags is detected once objects exist."""
+        open(os.path.join(self.build_dir, "a.o"), "w").close()
+        native = build.build_environment(["-O3", "-march=native"], [], env={})
+        self.assertTrue(build.flags_changed(self.build_dir, native))
+        build.record_flags(self.build_dir, native)
+        self.assertFalse(build.flags_changed(self.build_dir, native))
+        self.assertTrue(build.flags_changed(self.build_dir, {}))
+
+    def test_build_info_does_not_write_through_hardlinks(self):
+        """Test that rewriting build info leaves a hardlinked copy, such as the cached one, unchanged."""
+        build.write_build_info(self.build_dir, {"profile": "default"})
+        cached = os.path.join(self.build_dir, "cached.json")
+        os.link(os.path.join(self.build_dir, build.BUILD_INFO_FILE), cached)
+        build.write_build_info(self.build_dir, {"profile": "native"})
+        self.assertEqual(build.read_build_info(self.build_dir), {"profile": "native"})
+        with open(cached) as f:
+            self.assertIn('"default"', f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from pgflux import build_cache
+
+
+class TestBuildCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch.object(build_cache, "BUILD_CACHE_DIR", os.path.join(self.tmp.name, "builds"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _make_prefix(self, name, payload):
+        prefix = os.path.join(self.tmp.name, name)
+        os.makedirs(os.path.join(prefix, "bin"))
+        os.makedirs(os.path.join(prefix, "data"))
+        with open(os.path.join(prefix, "bin", "postgres"), "w") as f:
+            f.write(payload)
+        with open(os.path.join(prefix, "data", "PG_VERSION"), "w") as f:
+            f.write("16")
+        return prefix
+
+    def test_cache_key(self):
+        """Test that every input contributes to the cache key."""
+        base = build_cache.cache_key("abc", ["--prefix=/x"], "gcc 12")
+        self.assertEqual(base, build_cache.cache_key("abc", ["--prefix=/x"], "gcc 12"))
+        self.assertNotEqual(base, build_cache.cache_key("abd", ["--prefix=/x"], "gcc 12"))
+        self.assertNotEqual(base, build_cache.cache_key("abc", ["--prefix=/y"], "gcc 12"))
+        self.assertNotEqual(base, build_cache.cache_key("abc", ["--prefix=/x"], "gcc 13"))
+
+    def test_store_and_restore(self):
+        """Test storing an install tree and restoring it elsewhere."""
+        prefix = self._make_prefix("pg16", "binary")
+        build_cache.store("k1", prefix, {"version": "pg16"}, exclude=["data"])
+        self.assertEqual(build_cache.lookup("k1")["version"], "pg16")
+
+        target = os.path.join(self.tmp.name, "restored")
+        self.assertTrue(build_cache.restore("k1", target))
+        with open(os.path.join(target, "bin", "postgres")) as f:
+            self.assertEqual(f.read(), "binary")
+        self.assertFalse(os.path.exists(os.path.join(target, "data")))
+        self.assertFalse(build_cache.restore("missing", target))
+
+    def test_prune_evicts_least_recently_used(self):
+        """Test size-based LRU eviction."""
+        build_cache.store("old", self._make_prefix("a", "x" * 100), {}, exclude=["data"])
+        build_cache.store("new", self._make_prefix("b", "y" * 100), {}, exclude=["data"])
+        meta = build_cache.lookup("old")
+        meta["last_used"] = time.time() - 3600
+        build_cache._write_meta(build_cache._entry_dir("old"), meta)
+
+        evicted = build_cache.prune("150")
+        self.assertEqual([m["key"] for m in evicted], ["old"])
+        self.assertIsNone(build_cache.lookup("old"))
+        self.assertIsNotNone(build_cache.lookup("new"))
+
+
+if __name__ == "__main__":
+    unittest.main()
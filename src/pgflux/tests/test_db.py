@@ -0,0 +1,21 @@
+import tempfile
+import unittest
+
+from pgflux import db
+
+
+class TestDb(unittest.TestCase):
+
+    def test_connection_errors_are_wrapped(self):
+        """Test that connection failures surface as DatabaseError."""
+        with tempfile.TemporaryDirectory() as socket_dir:
+            with self.assertRaises(db.DatabaseError):
+                db.role_exists(1, "postgres", host=socket_dir)
+            # The failed pool is reused rather than recreated per call.
+            self.assertEqual(len([k for k in db._pools if k[1] == "1"]), 1)
+            db.close_all(port=1)
+            self.assertEqual([k for k in db._pools if k[1] == "1"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
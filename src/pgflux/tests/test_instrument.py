@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from pgflux import instrument
+
+
+class TestInstrument(unittest.TestCase):
+
+    def test_run_records_phase(self):
+        """Test that run() behaves like subprocess.run and records the phase."""
+        with instrument.session("test", "pg16", write=False) as report:
+            result = instrument.run("echo", [sys.executable, "-c", "print('hi')"], capture_output=True, text=True)
+            with self.assertRaises(subprocess.CalledProcessError):
+                instrument.run("fail", [sys.executable, "-c", "raise SystemExit(3)"], check=True)
+        self.assertEqual(result.stdout, "hi\n")
+        self.assertEqual([p["phase"] for p in report.phases], ["echo", "fail"])
+        self.assertEqual(report.phases[1]["returncode"], 3)
+        self.assertGreater(report.phases[0]["wall"], 0)
+        self.assertGreater(report.phases[0]["max_rss_kb"], 0)
+
+    def test_run_timeout(self):
+        """Test that a timeout kills the child and raises TimeoutExpired."""
+        with self.assertRaises(subprocess.TimeoutExpired):
+            instrument.run("sleep", [sys.executable, "-c", "import time; time.sleep(5)"], timeout=0.2)
+
+    def test_compare_flags_regressions(self):
+        """Test phase-by-phase comparison of two reports."""
+        def report(make_wall):
+            return {"phases": [{"phase": "make", "wall": make_wall, "cpu_user": 0, "cpu_sys": 0, "max_rss_kb": 0},
+                               {"phase": "initdb", "wall": 1.0, "cpu_user": 0, "cpu_sys": 0, "max_rss_kb": 0}]}
+        rows = {row[0]: row for row in instrument.compare(report(10.0), report(12.0), threshold=10)}
+        self.assertTrue(rows["make"][4])
+        self.assertAlmostEqual(rows["make"][3], 20.0)
+        self.assertFalse(rows["initdb"][4])
+
+    def test_report_roundtrip(self):
+        """Test writing, listing and loading reports."""
+        with tempfile.TemporaryDirectory() as tmp:
+            report = instrument.Report("start", "pg17")
+            report.add("start", 0.5, 0.1, 0.1, 1024)
+            path = report.write(tmp)
+            (listed_path, data), = instrument.list_reports(tmp, command="start")
+            self.assertEqual(listed_path, path)
+            self.assertEqual(data["phases"][0]["phase"], "start")
+            self.assertEqual(instrument.list_reports(tmp, version="pg16"), [])
+
+    def test_prune_tolerates_concurrent_removal(self):
+        """Test that reports another command already pruned do not fail the prune."""
+        with tempfile.TemporaryDirectory() as tmp:
+            for number in range(instrument.MAX_REPORTS + 2):
+                with open(os.path.join(tmp, f"start-{number}.json"), "w") as f:
+                    f.write("{}")
+            removed = mock.Mock(side_effect=FileNotFoundError)
+            with mock.patch.object(instrument.os, "remove", removed), \
+                    mock.patch.object(instrument.os.path, "getmtime", side_effect=FileNotFoundError):
+                instrument._prune_reports(tmp)
+            self.assertEqual(removed.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
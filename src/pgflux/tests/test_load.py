@@ -0,0 +1,63 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from pgflux import load
+
+
+class TestLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.rows = [f"{n},name {n},{'x' * (n % 17)}\n".encode() for n in range(2000)]
+
+    def _write(self, name, header=b"id,name,pad\n", compress=False):
+        path = os.path.join(self.tmp.name, name)
+        opener = gzip.open if compress else open
+        with opener(path, "wb") as f:
+            f.write(header + b"".join(self.rows))
+        return path
+
+    def _read_all(self, chunk):
+        reader = load.ChunkReader(chunk, load.Progress())
+        try:
+            parts = iter(lambda: reader.read(100), b"")
+            return b"".join(parts), reader.lines
+        finally:
+            reader.close()
+
+    def test_split_on_line_boundaries(self):
+        """Test that chunks start and end on line boundaries, skip the header and cover every row once."""
+        path = self._write("public.items.csv")
+        chunks = load.plan([path], chunk_size=4096, header=True)
+        self.assertGreater(len(chunks), 5)
+        self.assertEqual({(c["table"], c["format"]) for c in chunks}, {("public.items", "csv")})
+
+        pieces = {}
+        for chunk in chunks:
+            data, lines = self._read_all(chunk)
+            self.assertTrue(data.endswith(b"\n"))
+            self.assertEqual(lines, data.count(b"\n"))
+            pieces[chunk["start"]] = data
+        self.assertEqual(b"".join(pieces[start] for start in sorted(pieces)), b"".join(self.rows))
+
+    def test_gzip_and_directories(self):
+        """Test that directories expand to loadable files and gzip'd files load whole, minus their header."""
+        self._write("orders.tsv.gz", compress=True)
+        self._write("notes.md")
+        chunks = load.plan([self.tmp.name], chunk_size=1024, header=True)
+        self.assertEqual([(c["table"], c["format"], c["compressed"]) for c in chunks], [("orders", "text", True)])
+        data, _ = self._read_all(chunks[0])
+        self.assertEqual(data, b"".join(self.rows))
+
+        empty = os.path.join(self.tmp.name, "empty")
+        os.mkdir(empty)
+        with self.assertRaises(load.LoadError):
+            load.plan([empty])
+        self.assertEqual(load.identifier("public.Items").strings, ("public", "Items"))
+
+
+if __name__ == "__main__":
+    unittest.main()
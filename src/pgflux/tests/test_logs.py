@@ -0,0 +1,119 @@
+import os
+import tempfile
+import unittest
+
+from pgflux import logs
+
+SAMPLE_LOG = """\
+2026-01-05 10:00:00.001 UTC [101] LOG:  duration: 12.500 ms  statement: SELECT * FROM t WHERE id = 42
+2026-01-05 10:00:00.002 UTC [101] LOG:  duration: 7.500 ms  statement: select *  from t where id = 7;
+2026-01-05 10:00:00.003 UTC [102] LOG:  duration: 0.100 ms  parse <unnamed>: SELECT $1
+2026-01-05 10:00:00.004 UTC [102] LOG:  duration: 3.000 ms  execute <unnamed>: INSERT INTO t VALUES ($1, 'a'), ($2, 'b')
+2026-01-05 10:00:00.005 UTC [103] LOG:  duration: 1000.000 ms  statement: UPDATE big
+\tSET x = 1
+\tWHERE y IN (1, 2, 3)
+2026-01-05 10:00:01.000 UTC [90] LOG:  checkpoint starting: time
+2026-01-05 10:00:05.000 UTC [90] LOG:  checkpoint complete: wrote 120 buffers (0.7%); 0 WAL file(s) added, 0 removed, 1 recycled; write=3.9 s, sync=0.01 s, total=4.010 s; sync files=3
+2026-01-05 10:00:06.000 UTC [91] LOG:  automatic vacuum of table "app.public.t": index scans: 1
+\tpages: 0 removed, 45 remain
+\tsystem usage: CPU: user: 0.01 s, system: 0.00 s, elapsed: 0.25 s
+2026-01-05 10:00:07.000 UTC [104] LOG:  process 104 still waiting for ShareLock on transaction 900 after 1000.123 ms
+2026-01-05 10:00:08.000 UTC [105] ERROR:  deadlock detected
+2026-01-05 10:00:08.000 UTC [105] DETAIL:  Process 105 waits for ShareLock on transaction 901.
+"""
+
+
+class TestLogs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.tmp.name, "logfile")
+        self.state_dir = os.path.join(self.tmp.name, "state")
+        with open(self.log_file, "w") as f:
+            f.write(SAMPLE_LOG)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_normalize_query(self):
+        """Test that literals, parameters and value lists are replaced so equal statements match."""
+        self.assertEqual(logs.normalize_query("SELECT * FROM t WHERE a = 'x''y' AND b IN (1, 2,3);"),
+                         "SELECT * FROM t WHERE a = ? AND b IN (...)")
+        self.assertEqual(logs.normalize_query("INSERT INTO t VALUES ($1, 'a'), ($2, 'b')"), "INSERT INTO t VALUES (...)")
+        self.assertEqual(logs.fingerprint(logs.normalize_query("select 1")), logs.fingerprint(logs.normalize_query("SELECT  2")))
+
+    def test_scan_aggregates_events(self):
+        """Test that durations, checkpoints, autovacuum, lock waits and errors are aggregated from a sample log."""
+        state = logs.load_state(self.log_file, self.state_dir)
+        logs.scan(self.log_file, state)
+        stats = state["stats"]
+
+        self.assertEqual(len(stats.statements), 3)
+        top = logs.top_statements(stats, 1)[0]
+        self.assertEqual(top["query"], "UPDATE big SET x = ? WHERE y IN (...)")
+        select = [e for e in stats.statements.values() if e["query"].startswith("SELECT")][0]
+        self.assertEqual(select["count"], 2)
+        self.assertAlmostEqual(select["total_ms"], 20.0)
+        self.assertEqual(stats.checkpoints["completed"], 1)
+        self.assertEqual(stats.checkpoints["started"], {"time": 1})
+        self.assertEqual(stats.autovacuum["app.public.t"]["vacuum"], 1)
+        self.assertAlmostEqual(stats.autovacuum["app.public.t"]["seconds"], 0.25)
+        self.assertEqual(stats.locks["waits"], {"ShareLock": 1})
+        self.assertEqual(stats.locks["deadlocks"], 1)
+        self.assertEqual(stats.levels, {"ERROR": 1})
+
+    def test_resume_from_offset(self):
+        """Test that a second run only reads appended lines and that a truncated file is rescanned."""
+        state = logs.load_state(self.log_file, self.state_dir)
+        logs.scan(self.log_file, state)
+        logs.save_state(self.log_file, state, self.state_dir)
+
+        appended = "2026-01-05 10:00:09.000 UTC [101] LOG:  duration: 5.000 ms  statement: SELECT * FROM t WHERE id = 1\n"
+        with open(self.log_file, "a") as f:
+            f.write(appended)
+            f.write("2026-01-05 10:00:09.100 UTC [101] LOG:  duration: 5.000 ms  statement: SELECT partial")
+        state = logs.load_state(self.log_file, self.state_dir)
+        logs.scan(self.log_file, state)
+        counts = sorted(e["count"] for e in state["stats"].statements.values())
+        self.assertEqual(counts, [1, 1, 3])
+        self.assertEqual(state["offset"], len(SAMPLE_LOG) + len(appended))
+
+        with open(self.log_file, "w") as f:
+            f.write("2026-01-05 11:00:00.000 UTC [1] LOG:  database system is ready to accept connections\n")
+        state = logs.load_state(self.log_file, self.state_dir)
+        self.assertEqual(state["offset"], 0)
+        self.assertEqual(state["stats"].statements, {})
+
+    def test_entry_split_across_scans(self):
+        """Test that continuation lines written after a scan still join their entry, which counts once complete."""
+        with open(self.log_file, "w") as f:
+            f.write("2026-01-05 10:00:00.005 UTC [103] LOG:  duration: 1000.000 ms  statement: UPDATE big\n")
+            f.write("\tSET x = 1\n")
+        state = logs.load_state(self.log_file, self.state_dir)
+        logs.scan(self.log_file, state)
+        logs.save_state(self.log_file, state, self.state_dir)
+        self.assertEqual(state["stats"].statements, {})
+
+        with open(self.log_file, "a") as f:
+            f.write("\tWHERE y IN (1, 2, 3)\n")
+        state = logs.load_state(self.log_file, self.state_dir)
+        logs.scan(self.log_file, state)
+        self.assertEqual(state["stats"].statements, {})
+        os.utime(self.log_file, (0, 0))
+        logs.scan(self.log_file, state)
+        self.assertEqual([e["query"] for e in state["stats"].statements.values()],
+                         ["UPDATE big SET x = ? WHERE y IN (...)"])
+        self.assertIsNone(state["pending"])
+
+    def test_fingerprint_limit(self):
+        """Test that the number of tracked statements stays bounded, keeping the most expensive ones."""
+        stats = logs.LogStats()
+        for index in range(logs.MAX_FINGERPRINTS + 10):
+            stats.add_duration(1.0 + index, f"SELECT * FROM t{index}")
+        self.assertEqual(len(stats.statements), logs.MAX_FINGERPRINTS)
+        self.assertNotIn("SELECT * FROM t0", [e["query"] for e in stats.statements.values()])
+
+    def test_tail(self):
+        """Test that tail returns only the last lines of the file."""
+        self.assertEqual(logs.tail(self.log_file, 2)[-1], SAMPLE_LOG.splitlines()[-1])
+        self.assertEqual(len(logs.tail(self.log_file, 2)), 2)
@@ -0,0 +1,123 @@
+import unittest
+
+from pgflux import maintain
+
+BLOCK_SIZE = 8192
+
+
+def table(name, relpages=1500, reltuples=61000, live=61000, dead=0, modified=0, row_width=100, **extra):
+    return dict({"schema": "public", "name": name, "qualified": f"public.{name}", "relpages": relpages,
+                 "reltuples": reltuples, "live_tuples": live, "dead_tuples": dead, "modified": modified,
+                 "never_vacuumed": False, "never_analyzed": False, "size": relpages * BLOCK_SIZE,
+                 "fillfactor": 100, "row_width": row_width}, **extra)
+
+
+def index(name, relpages=2001, reltuples=366000, row_width=4, plain=True):
+    return {"schema": "public", "table_name": "orders", "table": "public.orders", "qualified": f"public.{name}",
+            "relpages": relpages, "reltuples": reltuples, "size": relpages * BLOCK_SIZE, "fillfactor": 90,
+            "row_width": row_width, "plain": plain}
+
+
+class FakeCursor:
+
+    def __init__(self, statements):
+        self.statements = statements
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+
+    def fetchone(self):
+        return (8192,)
+
+
+class FakeConnection:
+    server_version = 160000
+
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return FakeCursor(self.statements)
+
+    def close(self):
+        pass
+
+
+class TestMaintain(unittest.TestCase):
+
+    def test_estimates(self):
+        """Test heap and btree bloat estimates against the pages their rows need at the fillfactor."""
+        # 24-byte header + 104 aligned bytes + 4-byte line pointer: 61 rows per page, 1000 pages expected
+        estimated = maintain.estimate_table(table("orders", dead=6100), BLOCK_SIZE)
+        self.assertEqual(estimated["bloat_bytes"], 500 * BLOCK_SIZE)
+        self.assertAlmostEqual(estimated["bloat_ratio"], 1 / 3)
+        self.assertEqual(estimated["dead_bytes"], 6100 * 132)
+        # 8-byte header + 8 + 4: 366 entries per 90%-full leaf page, 1000 leaves and the metapage expected
+        self.assertEqual(maintain.estimate_index(index("orders_id_idx"), BLOCK_SIZE)["bloat_bytes"],
+                         1000 * BLOCK_SIZE)
+        self.assertIsNone(maintain.estimate_index(index("orders_expr_idx", plain=False), BLOCK_SIZE)["bloat_bytes"])
+        self.assertIsNone(maintain.estimate_table(table("fresh", reltuples=-1), BLOCK_SIZE)["bloat_bytes"])
+
+    def test_plan_ranks_by_gain(self):
+        """Test that tasks pass the thresholds, are ranked by bytes and combine vacuum with analyze."""
+        tables = [maintain.estimate_table(t, BLOCK_SIZE) for t in (
+            table("orders", dead=20000, modified=20000), table("events", dead=2000, live=6000),
+            table("quiet", dead=100), table("customers", modified=10000))]
+        indexes = [maintain.estimate_index(index("orders_id_idx", relpages=3001), BLOCK_SIZE)]
+        tasks = maintain.plan_tasks("app", tables, indexes)
+        self.assertEqual([(t["kind"], t["object"]) for t in tasks], [
+            ("reindex", "public.orders_id_idx"), ("vacuum", "public.orders"), ("analyze", "public.customers"),
+            ("vacuum", "public.events")])
+        self.assertTrue(tasks[1]["analyze"])
+        self.assertEqual(maintain.task_statement(tasks[1], parallel=2, server_version=160000),
+                         "VACUUM (ANALYZE, PARALLEL 2) public.orders")
+        self.assertEqual(maintain.task_statement(tasks[-1], parallel=2, server_version=120000),
+                         "VACUUM public.events")
+        self.assertEqual(maintain.task_statement(tasks[0]), "REINDEX INDEX CONCURRENTLY public.orders_id_idx")
+        self.assertEqual([[t["object"] for t in queue] for queue in maintain.table_queues(tasks)], [
+            ["public.orders_id_idx", "public.orders"], ["public.customers"], ["public.events"]])
+
+    def test_runner_throttles_and_keeps_budget(self):
+        """Test that tasks run throttled and that a REINDEX too large for the time budget is deferred."""
+        connections = []
+
+        def connect(database):
+            connections.append(FakeConnection())
+            return connections[-1]
+
+        tasks = [{"database": "app", "kind": "reindex", "analyze": False, "object": "public.big_idx",
+                  "table": "public.big", "size": 100 * maintain.REINDEX_BYTES_PER_SECOND, "dead_tuples": None},
+                 {"database": "app", "kind": "vacuum", "analyze": False, "object": "public.orders",
+                  "table": "public.orders", "size": BLOCK_SIZE, "dead_tuples": 5000}]
+        results = maintain.Runner(connect, jobs=1, cost_delay=2.0, cost_limit=500, budget=60).run(tasks)
+        self.assertEqual([r["status"] for r in results], ["deferred", "done"])
+        self.assertEqual(results[1]["reclaimed"], 0)
+        statements = connections[0].statements
+        self.assertIn("SET vacuum_cost_limit = %s", statements)
+        self.assertTrue(statements[-3].startswith("SET statement_timeout = "))
+        self.assertNotEqual(statements[-3], "SET statement_timeout = 0")
+        self.assertEqual(statements[-2], "VACUUM public.orders")
+
+    def test_runner_defers_task_when_budget_runs_out_before_it_starts(self):
+        """Test that a task whose budget expires before its statement is deferred, and the timeout is at least 1 ms."""
+        connection = FakeConnection()
+        task = {"database": "app", "kind": "vacuum", "analyze": False, "object": "public.orders",
+                "table": "public.orders", "size": BLOCK_SIZE, "dead_tuples": 5000}
+        runner = maintain.Runner(lambda database: connection, budget=60)
+        runner.remaining = lambda: 0.0
+        self.assertEqual(runner._run_task(connection, task)["status"], "deferred")
+        self.assertNotIn("VACUUM public.orders", connection.statements)
+
+        runner.remaining = lambda: 0.0004
+        self.assertEqual(runner._run_task(connection, task)["status"], "done")
+        self.assertIn("SET statement_timeout = 1", connection.statements)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+from pgflux import metrics
+
+
+def _snapshot(time, commits, rollbacks, hit, read, timed):
+    database = dict.fromkeys(metrics.DATABASE_FIELDS, 0.0)
+    database.update(time=time, commits=commits, rollbacks=rollbacks, blks_hit=hit, blks_read=read)
+    checkpoints = dict.fromkeys(metrics.CHECKPOINT_FIELDS, 0.0)
+    checkpoints.update(timed=timed)
+    return {"connections": {"active": 1, "idle": 2}, "database": database, "checkpoints": checkpoints,
+            "in_recovery": False, "replication": [], "hit_ratio": metrics._hit_ratio(hit, read)}
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_rates_between_snapshots(self):
+        """Test that TPS and the interval hit ratio come from counter deltas."""
+        previous = _snapshot(100.0, 1000, 10, 9000, 1000, 5)
+        current = _snapshot(102.0, 1200, 20, 9900, 1100, 6)
+        delta = metrics.rates(previous, current)
+        self.assertAlmostEqual(delta["tps"], 105.0)
+        self.assertAlmostEqual(delta["hit_ratio"], 0.9)
+        self.assertAlmostEqual(delta["checkpoints"], 1.0)
+        self.assertIsNone(metrics.rates(current, current))
+        lines = metrics.format_snapshot(current, delta)
+        self.assertEqual(lines[0], "Connections: 3 (active 1, idle 2)")
+        self.assertIn("TPS: 105.0", lines[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
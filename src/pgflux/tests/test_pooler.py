@@ -0,0 +1,284 @@
+import asyncio
+import os
+import struct
+import tempfile
+import unittest
+
+from pgflux import pgwire, pool, pooler
+
+# ParseComplete, BindComplete and NoData answer Parse, Bind and Describe; Flush has no reply of its own
+EXTENDED_REPLIES = {b"P": b"1", b"B": b"2", b"D": b"n"}
+
+
+class FakeServer:
+    """
+    Speaks just enough of the backend protocol: trust login, and per query a DataRow naming the backend.
+    BEGIN opens a transaction and COMMIT ends it, as the ReadyForQuery status shows. The extended protocol
+    answers Parse, Bind, Describe and Execute, and Sync after SYNC_DELAY, as a busy server would.
+    """
+
+    SYNC_DELAY = 0.05
+
+    def __init__(self):
+        self.connections = 0
+        self.server = None
+        self.received = []  # (backend, message type) in the order the server read them
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        backend = self.connections
+        await pgwire.read_startup(reader)
+        writer.write(pgwire.auth_request(pgwire.AUTH_OK) + pgwire.parameter_status("server_version", "16.4")
+                     + pgwire.backend_key_data(backend, 1) + pgwire.ready_for_query())
+        status = b"I"
+        try:
+            while True:
+                kind, payload = await pgwire.read_message(reader)
+                self.received.append((backend, kind))
+                if kind == b"X":
+                    break
+                if kind in EXTENDED_REPLIES:
+                    writer.write(pgwire.message(EXTENDED_REPLIES[kind]))
+                    continue
+                if kind == b"E":
+                    writer.write(pgwire.message(b"C", b"SELECT 0\0"))
+                    continue
+                if kind == b"H":
+                    await writer.drain()
+                    continue
+                if kind == b"S":
+                    await asyncio.sleep(self.SYNC_DELAY)
+                    writer.write(pgwire.ready_for_query(status))
+                    await writer.drain()
+                    continue
+                query = payload.rstrip(b"\0").decode()
+                if query == "BEGIN":
+                    status = b"T"
+                elif query == "COMMIT":
+                    status = b"I"
+                value = str(backend).encode()
+                writer.write(pgwire.message(b"D", struct.pack("!hi", 1, len(value)) + value)
+                             + pgwire.message(b"C", b"SELECT 1\0") + pgwire.ready_for_query(status))
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        writer.close()
+
+
+class Client:
+
+    async def connect(self, port, user="app", database="app", password=None):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", port)
+        self.writer.write(pgwire.startup_message({"user": user, "database": database}))
+        scram = None
+        while True:
+            kind, payload = await pgwire.read_message(self.reader)
+            if kind == b"E":
+                return pgwire.error_fields(payload)
+            if kind == b"R":
+                code = struct.unpack("!I", payload[:4])[0]
+                if code == pgwire.AUTH_SASL:
+                    scram = pgwire.ScramClient(password)
+                    self.writer.write(pgwire.sasl_initial_response(pgwire.SCRAM_MECHANISM, scram.first_message()))
+                elif code == pgwire.AUTH_SASL_CONTINUE:
+                    self.writer.write(pgwire.sasl_response(scram.final_message(payload[4:])))
+                elif code == pgwire.AUTH_SASL_FINAL:
+                    scram.verify(payload[4:])
+            if kind == b"Z":
+                return None
+
+    async def query(self, text):
+        """
+        Returns the first column of the rows, or the fields of an ErrorResponse.
+        """
+        self.writer.write(pgwire.message(b"Q", text.encode() + b"\0"))
+        rows = []
+        while True:
+            kind, payload = await pgwire.read_message(self.reader)
+            if kind == b"D":
+                rows.append(payload[6:].decode())
+            elif kind == b"E":
+                return pgwire.error_fields(payload)
+            elif kind == b"Z":
+                return rows
+
+    async def send(self, *messages):
+        """
+        Writes (type, payload) messages without waiting for replies, and returns the types of the replies up to
+        the next ReadyForQuery if one of them is a Sync.
+        """
+        for kind, payload in messages:
+            self.writer.write(pgwire.message(kind, payload))
+        await self.writer.drain()
+        if b"S" not in [kind for kind, _ in messages]:
+            return None
+        replies = []
+        while not replies or replies[-1] != b"Z":
+            kind, _ = await pgwire.read_message(self.reader)
+            replies.append(kind)
+        return replies
+
+    def close(self):
+        self.writer.write(pgwire.message(b"X"))
+        self.writer.close()
+
+
+def pooler_config(server_port, **overrides):
+    config = {"listen_host": "127.0.0.1", "listen_port": 0, "admin_port": 0, "server_host": "127.0.0.1",
+              "server_port": server_port, "pool_size": 1, "pool_sizes": {}, "max_client_conn": 100,
+              "query_wait_timeout": 5.0, "server_idle_timeout": 600.0, "auth": "trust", "auth_file": None}
+    config.update(overrides)
+    return config
+
+
+async def with_pooler(config_overrides, scenario):
+    """
+    Runs scenario(pooler, port) against a pooler in front of a FakeServer and returns its result.
+    """
+    server = FakeServer()
+    server_port = await server.start()
+    instance = pooler.Pooler(pooler_config(server_port, **config_overrides))
+    ready = asyncio.get_running_loop().create_future()
+    serving = asyncio.create_task(instance.serve(ready))
+    port, _ = await ready
+    try:
+        return await scenario(instance, port), server
+    finally:
+        instance.stop()
+        await serving
+        server.server.close()
+
+
+class TestPooler(unittest.TestCase):
+
+    def test_clients_share_server_connection(self):
+        """Test that concurrent clients run their queries over one pooled server connection."""
+        async def scenario(instance, port):
+            clients = [Client() for _ in range(5)]
+            for client in clients:
+                self.assertIsNone(await client.connect(port))
+            results = await asyncio.gather(*(client.query("SELECT 1") for client in clients))
+            for client in clients:
+                client.close()
+            return results, instance.stats()
+
+        (results, stats), server = asyncio.run(with_pooler({}, scenario))
+        self.assertEqual(results, [["1"]] * 5)
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(stats["pools"][0]["transactions"], 5)
+        self.assertEqual(stats["pools"][0]["server_connects"], 1)
+
+    def test_open_transaction_keeps_server_until_commit(self):
+        """Test that a client queues behind an open transaction and times out with query_wait_timeout."""
+        async def scenario(instance, port):
+            first, second = Client(), Client()
+            await first.connect(port)
+            await second.connect(port)
+            await first.query("BEGIN")
+            blocked = await second.query("SELECT 1")
+            await first.query("COMMIT")
+            third = Client()
+            await third.connect(port)
+            after = await third.query("SELECT 1")
+            first.close()
+            third.close()
+            return blocked, after, instance.stats()["pools"][0]
+
+        (blocked, after, stats), _ = asyncio.run(with_pooler({"query_wait_timeout": 0.2}, scenario))
+        self.assertEqual(blocked["M"], "query_wait_timeout")
+        self.assertEqual(after, ["1"])
+        self.assertEqual(stats["timeouts"], 1)
+
+    def test_pipelined_messages_keep_server_until_synced(self):
+        """Test that messages pipelined after a Sync keep the server attached until their own Sync."""
+        parse = (b"P", b"\0SELECT 1\0\0\0")
+
+        async def scenario(instance, port):
+            first, second = Client(), Client()
+            await first.connect(port)
+            await second.connect(port)
+            replies = await first.send(parse, (b"B", b"\0\0\0\0\0\0\0\0"), (b"E", b"\0\0\0\0\0"),
+                                       (b"S", b""), parse)
+            queued = asyncio.create_task(second.query("SELECT 1"))
+            await asyncio.sleep(FakeServer.SYNC_DELAY * 2)
+            waiting = not queued.done()
+            synced = await first.send((b"S", b""))
+            rows = await queued
+            first.close()
+            second.close()
+            return replies, waiting, synced, rows
+
+        (replies, waiting, synced, rows), server = asyncio.run(with_pooler({}, scenario))
+        self.assertEqual(replies, [b"1", b"2", b"C", b"Z"])
+        self.assertTrue(waiting)
+        self.assertEqual(synced, [b"1", b"Z"])
+        self.assertEqual(rows, ["1"])
+        # The second client's query reached the server only after the first client's last Sync
+        kinds = [kind for _, kind in server.received]
+        self.assertEqual(kinds[:7], [b"P", b"B", b"E", b"S", b"P", b"S", b"Q"])
+
+    def test_scram_authentication(self):
+        """Test SCRAM-SHA-256 client authentication against the auth file, and rejection of a wrong password."""
+        with tempfile.TemporaryDirectory() as tmp:
+            auth_file = os.path.join(tmp, "userlist.txt")
+            with open(auth_file, "w") as f:
+                f.write('"app" "secret"\n')
+
+            async def scenario(instance, port):
+                good, bad = Client(), Client()
+                return await good.connect(port, password="secret"), await bad.connect(port, password="wrong")
+
+            (good, bad), _ = asyncio.run(with_pooler({"auth": "scram-sha-256", "auth_file": auth_file}, scenario))
+        self.assertIsNone(good)
+        self.assertEqual(bad["C"], "28P01")
+
+    def test_pool_hands_released_connection_to_waiter(self):
+        """Test that a released connection goes straight to the waiting acquirer and timeouts are counted."""
+        class Conn:
+            closed = False
+            params = {}
+
+            def close(self):
+                self.closed = True
+
+        async def scenario():
+            pool = pooler.Pool("app", "app", 1, lambda database, user: asyncio.sleep(0, Conn()))
+            conn = await pool.acquire(1.0)
+            with self.assertRaises(pooler.PoolTimeout):
+                await pool.acquire(0.05)
+            waiter = asyncio.create_task(pool.acquire(1.0))
+            await asyncio.sleep(0)
+            pool.release(conn)
+            return conn, await waiter, pool.stats()
+
+        conn, handed, stats = asyncio.run(scenario())
+        self.assertIs(handed, conn)
+        self.assertEqual((stats["servers"], stats["timeouts"], stats["waiting"]), (1, 1, 0))
+
+    def test_trust_only_on_loopback(self):
+        """Test that passwordless client auth is refused on addresses other hosts can reach."""
+        for host in ("127.0.0.1", "::1", "localhost"):
+            pool.check_settings(dict(pool.DEFAULT_SETTINGS, listen_host=host))
+        for host in ("0.0.0.0", "192.168.1.10", "db.example.com"):
+            with self.assertRaises(pool.PoolerError):
+                pool.check_settings(dict(pool.DEFAULT_SETTINGS, listen_host=host))
+        pool.check_settings(dict(pool.DEFAULT_SETTINGS, listen_host="0.0.0.0", auth="md5", auth_file="users.txt"))
+
+    def test_scram_round_trip_and_md5(self):
+        """Test that the SCRAM client and server agree on a password and the md5 response format."""
+        client, server = pgwire.ScramClient("secret"), pgwire.ScramServer("secret")
+        server_first = server.first_message(client.first_message())
+        client.verify(server.final_message(client.final_message(server_first)))
+        wrong = pgwire.ScramClient("wrong")
+        server = pgwire.ScramServer("secret")
+        with self.assertRaises(pgwire.ProtocolError):
+            server.final_message(wrong.final_message(server.first_message(wrong.first_message())))
+        self.assertRegex(pgwire.md5_password("app", "secret", b"salt"), r"^md5[0-9a-f]{32}$")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+import os
+import socket
+import unittest
+
+from pgflux import procfs
+
+
+class TestProcfs(unittest.TestCase):
+
+    def test_decode_address(self):
+        """Test that kernel-formatted IPv4 and IPv6 addresses are decoded."""
+        self.assertEqual(procfs.decode_address("0100007F:1538", socket.AF_INET), ("127.0.0.1", 5432))
+        self.assertEqual(procfs.decode_address("00000000000000000000000001000000:1538", socket.AF_INET6), ("::1", 5432))
+
+    def test_port_users_finds_listener(self):
+        """Test that a listening socket is attributed to the process holding it."""
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener:
+            listener.bind(("127.0.0.1", 0))
+            listener.listen(1)
+            port = listener.getsockname()[1]
+            users, _ = procfs.port_users(port)
+            self.assertIn((os.getpid(), "LISTEN", ("127.0.0.1", port)),
+                          [(u["pid"], u["state"], u["local"]) for u in users])
+        self.assertEqual([u for u in procfs.port_users(port)[0] if u["state"] == "LISTEN"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+import unittest
+
+from pgflux import readiness
+
+PIDFILE = "{pid}\n{data_dir}\n1700000000\n5439\n{socket_dir}\nlocalhost\n  5439001  1\n{status}\n"
+
+
+def _serve_once(listener, reply):
+    conn, _ = listener.accept()
+    with conn:
+        conn.recv(1024)
+        conn.sendall(reply)
+
+
+class TestReadiness(unittest.TestCase):
+
+    def test_read_pidfile(self):
+        """Test that postmaster.pid is parsed, including the status line."""
+        with tempfile.TemporaryDirectory() as data_dir:
+            self.assertIsNone(readiness.read_pidfile(data_dir))
+            with open(os.path.join(data_dir, "postmaster.pid"), "w") as f:
+                f.write(PIDFILE.format(pid=4242, data_dir=data_dir, socket_dir="/tmp", status="starting"))
+            info = readiness.read_pidfile(data_dir)
+            self.assertEqual(info["pid"], 4242)
+            self.assertEqual(info["port"], 5439)
+            self.assertEqual(info["socket_dir"], "/tmp")
+            self.assertEqual(info["status"], "starting")
+
+    def test_handshake_distinguishes_starting_up(self):
+        """Test that a 57P03 error means not ready while an auth request means ready."""
+        starting = b"SFATAL\0C57P03\0Mthe database system is starting up\0\0"
+        replies = [
+            (b"E" + struct.pack("!I", 4 + len(starting)) + starting, False),
+            (b"R" + struct.pack("!II", 8, 0), True),
+        ]
+        with tempfile.TemporaryDirectory() as socket_dir:
+            pidinfo = {"port": 5439, "socket_dir": socket_dir}
+            for reply, expected in replies:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+                    path = os.path.join(socket_dir, ".s.PGSQL.5439")
+                    listener.bind(path)
+                    listener.listen(1)
+                    server = threading.Thread(target=_serve_once, args=(listener, reply))
+                    server.start()
+                    self.assertEqual(readiness.handshake(pidinfo), expected)
+                    server.join()
+                os.unlink(path)
+
+    def test_wait_fails_fast_on_fatal_log_line(self):
+        """Test that a FATAL line in the new part of the log aborts the wait immediately."""
+        with tempfile.TemporaryDirectory() as data_dir:
+            log_file = os.path.join(data_dir, "logfile")
+            with open(log_file, "w") as f:
+                f.write("FATAL:  from an earlier run\n")
+            offset = os.path.getsize(log_file)
+
+            def crash():
+                time.sleep(0.1)
+                with open(log_file, "a") as f:
+                    f.write("FATAL:  could not create lock file \"/tmp/.s.PGSQL.5439.lock\"\n")
+
+            writer = threading.Thread(target=crash)
+            writer.start()
+            started = time.perf_counter()
+            with self.assertRaises(readiness.StartupError) as ctx:
+                readiness.wait_until_ready(data_dir, log_file, offset, timeout=10)
+            writer.join()
+            self.assertLess(time.perf_counter() - started, 5)
+            self.assertEqual(len(ctx.exception.log_lines), 1)
+            self.assertIn("lock file", ctx.exception.log_lines[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
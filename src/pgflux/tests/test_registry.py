@@ -0,0 +1,92 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from pgflux import fleet, registry
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "instances.json")
+        self.legacy = os.path.join(self.tmp.name, "pgflux_installed_version.txt")
+        patcher = mock.patch.object(registry, "LEGACY_VERSION_FILES", (self.legacy,))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _instance(self, name, version, port):
+        data_dir = os.path.join(self.tmp.name, name)
+        return registry.new_instance(name, version, os.path.join(self.tmp.name, version), data_dir, port)
+
+    def test_register_and_resolve(self):
+        """Test that instances resolve by name or unique version and that the first one becomes the default."""
+        registry.register(self._instance("main", "pg16", 5432), path=self.path)
+        registry.register(self._instance("reports", "pg17", 5433), path=self.path)
+        registry.register(self._instance("reports-2", "pg17", 5432), path=self.path)
+
+        self.assertEqual(registry.resolve(path=self.path)["name"], "main")
+        self.assertEqual(registry.get("pg16", path=self.path)["name"], "main")
+        self.assertIsNone(registry.get("pg17", path=self.path))
+        self.assertEqual(registry.port_conflicts(registry.get("main", path=self.path), path=self.path), ["reports-2"])
+        with self.assertRaises(registry.RegistryError):
+            registry.resolve("missing", path=self.path)
+        with self.assertRaises(registry.RegistryError):
+            registry.register(dict(self._instance("copy", "pg16", 5440), data_dir=os.path.join(self.tmp.name, "main")),
+                              path=self.path)
+
+        registry.unregister("main", path=self.path)
+        self.assertEqual(registry.resolve(path=self.path)["name"], "reports")
+        self.assertEqual([i["name"] for i in registry.instances(self.path)], ["reports", "reports-2"])
+
+    def test_legacy_version_file(self):
+        """Test that a version recorded by older releases shows up as the default instance."""
+        with open(self.legacy, "w") as f:
+            f.write("pg16\n")
+        instance = registry.resolve(path=self.path)
+        self.assertEqual((instance["name"], instance["data_dir"], instance["port"]),
+                         ("pg16", "/usr/local/pg16/data", registry.DEFAULT_PORT))
+
+    def test_configured_port(self):
+        """Test that the last port setting of postgresql.conf and postgresql.auto.conf wins."""
+        with open(os.path.join(self.tmp.name, "postgresql.conf"), "w") as f:
+            f.write("#port = 5432\nport = 5433\n")
+        self.assertEqual(registry.configured_port(self.tmp.name), 5433)
+        with open(os.path.join(self.tmp.name, "postgresql.auto.conf"), "w") as f:
+            f.write("port = '5500'\n")
+        self.assertEqual(registry.configured_port(self.tmp.name), 5500)
+
+
+class TestFleet(unittest.TestCase):
+
+    def test_run_all_concurrently(self):
+        """Test that instances run in parallel, failures are isolated and results stream in completion order."""
+        instances = [{"name": f"i{n}", "version": "pg16", "delay": 0.3 - n * 0.05} for n in range(5)]
+        active, peak, lock = [0], [0], threading.Lock()
+
+        def action(instance):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(instance["delay"])
+            with lock:
+                active[0] -= 1
+            if instance["name"] == "i2":
+                raise RuntimeError("boom")
+            return instance["delay"]
+
+        reported = []
+        started = time.monotonic()
+        outcomes = fleet.run_all("test", instances, action, report=lambda o: reported.append(o["instance"]["name"]))
+        self.assertLess(time.monotonic() - started, 0.9)
+        self.assertEqual(peak[0], 5)
+        self.assertEqual(reported, ["i4", "i3", "i2", "i1", "i0"])
+        self.assertEqual([str(o["error"]) for o in outcomes if o["error"]], ["boom"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from pgflux import registry, replica
+
+
+class TestReplica(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _instance(self, name, port, **extra):
+        return dict(registry.new_instance(name, "pg16", self.tmp.name, os.path.join(self.tmp.name, name), port),
+                    **extra)
+
+    def test_slot_name(self):
+        """Test that replica names map to valid, bounded replication slot names."""
+        self.assertEqual(replica.slot_name("Reader-1"), "pgflux_replica_reader_1")
+        self.assertEqual(len(replica.slot_name("r" * 100)), replica.MAX_SLOT_NAME)
+
+    def test_replicas_and_next_free_port(self):
+        """Test that standbys are found by primary and new ones get the first unused port above it."""
+        main = self._instance("main", 5432)
+        instances = [main, self._instance("r1", 5433, primary="main"), self._instance("other", 5434),
+                     self._instance("r2", 5436, primary="other")]
+        self.assertEqual([i["name"] for i in replica.replicas(main, instances)], ["r1"])
+        self.assertEqual(replica.next_free_port(main, instances), 5435)
+
+    def test_basebackup_args_and_standby_port(self):
+        """Test the pg_basebackup command line and that the standby's port wins over the copied configuration."""
+        pidinfo = {"pid": 1, "port": 5432, "socket_dir": "", "listen_addr": "", "status": "ready"}
+        args = replica.basebackup_args("pg_basebackup", pidinfo, "postgres", "/data/r1", "pgflux_replica_r1")
+        self.assertEqual(args[1:5], ["-h", "/tmp", "-p", "5432"])
+        self.assertIn("-R", args)
+        self.assertEqual(args[args.index("-S") + 1], "pgflux_replica_r1")
+
+        data_dir = os.path.join(self.tmp.name, "r1")
+        os.makedirs(data_dir)
+        with open(os.path.join(data_dir, "postgresql.conf"), "w") as f:
+            f.write("port = 5432\n")
+        with open(os.path.join(data_dir, "postgresql.auto.conf"), "w") as f:
+            f.write("primary_conninfo = 'port=5432'\n")
+        replica.write_standby_settings(data_dir, 5433)
+        self.assertEqual(registry.configured_port(data_dir), 5433)
+
+    def test_create_requires_running_primary(self):
+        """Test that replicas of stopped primaries and of other replicas are refused before copying anything."""
+        with self.assertRaises(replica.ReplicaError):
+            replica.create(self._instance("main", 5432), "r1", 5433, os.path.join(self.tmp.name, "r1"))
+        with self.assertRaises(replica.ReplicaError):
+            replica.create(self._instance("r1", 5433, primary="main"), "r2", 5434, os.path.join(self.tmp.name, "r2"))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "r1")))
+
+    def test_create_refuses_taken_slot_and_cleans_up_its_own(self):
+        """Test that a slot already in use is refused before copying and that a failed copy drops only its slot."""
+        main = self._instance("main", 5432)
+        os.makedirs(os.path.join(self.tmp.name, "bin"))
+        open(os.path.join(self.tmp.name, "bin", "pg_basebackup"), "w").close()
+        pidinfo = {"pid": 1, "port": 5432, "socket_dir": "", "listen_addr": "", "status": "ready"}
+        data_dir = os.path.join(self.tmp.name, "a_b")
+        failed = subprocess.CompletedProcess([], 1, "", "connection refused")
+        with mock.patch.object(replica, "_running_pidinfo", return_value=pidinfo), \
+                mock.patch.object(replica.db, "query_one", return_value=None) as query_one, \
+                mock.patch.object(replica.instrument, "run", return_value=failed) as run, \
+                mock.patch.object(replica, "drop_slot") as drop_slot:
+            existing = self._instance("a-b", 5433, primary="main", slot=replica.slot_name("a-b"))
+            with self.assertRaisesRegex(replica.ReplicaError, "belongs to replica 'a-b'"):
+                replica.create(main, "A_B", 5434, data_dir, instances=[main, existing])
+            query_one.return_value = (1,)
+            with self.assertRaisesRegex(replica.ReplicaError, "already exists"):
+                replica.create(main, "a_b", 5434, data_dir, instances=[main])
+            run.assert_not_called()
+            drop_slot.assert_not_called()
+
+            query_one.return_value = None
+            with self.assertRaisesRegex(replica.ReplicaError, "pg_basebackup failed"):
+                replica.create(main, "a_b", 5434, data_dir, instances=[main])
+            drop_slot.assert_called_once_with(main, "pgflux_replica_a_b", "postgres")
+        self.assertFalse(os.path.exists(data_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
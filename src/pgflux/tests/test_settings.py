@@ -0,0 +1,29 @@
+import unittest
+
+from pgflux import settings
+
+
+class TestSettings(unittest.TestCase):
+
+    def test_normalize_units(self):
+        """Test that file values with units compare equal to pg_settings' base units."""
+        self.assertEqual(settings.normalize("128MB", "8kB", "integer"), settings.normalize("16384", None, "integer"))
+        self.assertEqual(settings.normalize("1min", "ms", "integer"), 60000)
+        self.assertEqual(settings.normalize("5s", "s", "integer"), 5)
+        self.assertEqual(settings.normalize("1.10", None, "real"), 1.1)
+        self.assertEqual(settings.normalize("yes", None, "bool"), settings.normalize("on", None, "bool"))
+        self.assertNotEqual(settings.normalize("256MB", "8kB", "integer"), settings.normalize("16384", None, "integer"))
+
+    def test_restart_classification(self):
+        """Test that only postmaster-context changes force a restart and bad values are rejected."""
+        changes = [
+            {"name": "work_mem", "context": "user", "error": None},
+            {"name": "shared_buffers", "context": "postmaster", "error": settings.NOT_APPLIED_ERROR},
+            {"name": "bogus", "context": None, "error": "unrecognized configuration parameter \"bogus\""},
+        ]
+        self.assertEqual([c["name"] for c in settings.requires_restart(changes)], ["shared_buffers"])
+        self.assertEqual([c["name"] for c in settings.invalid(changes)], ["bogus"])
+
+
+if __name__ == "__main__":
+    unittest.main()
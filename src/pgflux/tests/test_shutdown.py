@@ -0,0 +1,71 @@
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from pgflux import shutdown
+
+# Ignores SIGTERM like a postmaster waiting on clients in smart mode, exits on SIGINT.
+FAKE_POSTMASTER = """
+import signal, sys, time
+signal.signal(signal.SIGTERM, signal.SIG_IGN)
+signal.signal(signal.SIGINT, lambda *_: sys.exit(0))
+print("ready", flush=True)
+time.sleep(60)
+"""
+
+FAKE_LISTENER = """
+import socket, sys, time
+s = socket.socket()
+s.bind(("127.0.0.1", 0))
+s.listen(1)
+print(s.getsockname()[1], flush=True)
+time.sleep(60)
+"""
+
+
+class TestShutdown(unittest.TestCase):
+
+    def test_backend_pids_with_cluster_name(self):
+        """Test that auxiliary processes are recognized with and without a cluster_name prefix."""
+        children = [(10, "postgres: checkpointer"), (11, "postgres: main: checkpointer"),
+                    (12, "postgres: main: background writer"), (13, "postgres: main: app shop [local] idle"),
+                    (14, "postgres: app shop ::1(50000) idle")]
+        with mock.patch.object(shutdown.procfs, "children", return_value=children):
+            self.assertEqual(shutdown.backend_pids(1), [13, 14])
+
+    def test_escalates_to_fast(self):
+        """Test that a server ignoring smart shutdown is stopped by the fast mode within its timeout."""
+        child = subprocess.Popen([sys.executable, "-c", FAKE_POSTMASTER], stdout=subprocess.PIPE, text=True)
+        try:
+            child.stdout.readline()
+            with tempfile.TemporaryDirectory() as data_dir:
+                with open(os.path.join(data_dir, "postmaster.pid"), "w") as f:
+                    f.write(f"{child.pid}\n{data_dir}\n0\n5439\n\n\n\nready\n")
+                started = time.monotonic()
+                mode = shutdown.stop_server(data_dir, timeouts={"smart": 0.3, "fast": 5}, echo=lambda _: None)
+            self.assertEqual(mode, "fast")
+            self.assertLess(time.monotonic() - started, 3)
+            self.assertEqual(child.wait(timeout=5), 0)
+        finally:
+            child.kill()
+            child.wait()
+
+    def test_clear_port(self):
+        """Test that port holders are found via /proc and terminated without spawning kill."""
+        child = subprocess.Popen([sys.executable, "-c", FAKE_LISTENER], stdout=subprocess.PIPE, text=True)
+        try:
+            port = int(child.stdout.readline())
+            self.assertEqual(shutdown.clear_port(port, echo=lambda _: None), [child.pid])
+            self.assertEqual(child.wait(timeout=5), -signal.SIGTERM)
+        finally:
+            child.kill()
+            child.wait()
+
+
+if __name__ == "__main__":
+    unittest.main()
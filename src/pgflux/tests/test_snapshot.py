@@ -0,0 +1,98 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from pgflux import snapshot
+
+CHUNK = 4096
+
+
+def _tree(root):
+    found = {}
+    for current, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(current, name)
+            if os.path.islink(path):
+                continue
+            with open(path, "rb") as f:
+                found[os.path.relpath(path, root)] = f.read()
+    return found
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = snapshot.Store(os.path.join(self.tmp.name, "store"))
+        self.data_dir = os.path.join(self.tmp.name, "data")
+        files = {
+            "PG_VERSION": b"16\n",
+            "postmaster.pid": b"123\n",
+            "base/1/1259": os.urandom(CHUNK * 3 + 100),
+            "base/1/2608": b"\0" * (CHUNK * 2),
+            "pg_wal/000000010000000000000001": os.urandom(CHUNK),
+            "pg_stat_tmp/global.stat": b"stats",
+        }
+        for rel, data in files.items():
+            path = os.path.join(self.data_dir, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+        os.symlink("/elsewhere", os.path.join(self.data_dir, "pg_tblspc"))
+
+    def _create(self):
+        return snapshot.create(self.store, "main", "pg16", self.data_dir, chunk_size=CHUNK, jobs=4, echo=lambda m: None)
+
+    def test_incremental_snapshot_and_restore(self):
+        """Test that unchanged chunks are deduplicated and a restore reproduces the directory."""
+        first = self._create()
+        self.assertEqual(first["size"], 3 + (CHUNK * 3 + 100) + CHUNK * 2 + CHUNK + 5)
+
+        with open(os.path.join(self.data_dir, "base/1/1259"), "r+b") as f:
+            f.seek(CHUNK + 10)
+            f.write(b"changed")
+        second = self._create()
+        self.assertNotEqual(first["id"], second["id"])
+        self.assertGreater(second["stored"], 0)
+        self.assertLess(second["stored"], first["stored"])
+
+        expected = _tree(self.data_dir)
+        del expected["postmaster.pid"]
+        target = os.path.join(self.tmp.name, "restored")
+        snapshot.replace_data_dir(self.store, self.store.load_manifest("main"), target, jobs=4)
+        self.assertEqual(_tree(target), expected)
+        self.assertEqual(os.readlink(os.path.join(target, "pg_tblspc")), "/elsewhere")
+        self.assertEqual(os.stat(target).st_mode & 0o777, 0o700)
+
+        self.store.delete(second)
+        removed, _ = self.store.gc()
+        self.assertEqual(removed, 1)
+        self.assertEqual(self.store.load_manifest("main", "latest")["id"], first["id"])
+        with self.assertRaises(snapshot.SnapshotError):
+            self.store.load_manifest("main", second["id"])
+
+    def test_gc_waits_for_snapshot_in_progress(self):
+        """Test that gc does not remove chunks while a snapshot holds the store lock, then removes orphans."""
+        done = threading.Event()
+        thread = threading.Thread(target=lambda: (self.store.gc(), done.set()))
+        with self.store.lock():
+            digest, _ = self.store.put(b"not referenced by any manifest yet")
+            thread.start()
+            self.assertFalse(done.wait(0.2))
+            self.assertTrue(os.path.exists(self.store.chunk_path(digest)))
+        thread.join(5)
+        self.assertTrue(done.is_set())
+        self.assertFalse(os.path.exists(self.store.chunk_path(digest)))
+
+    def test_online_walk_skips_runtime_state(self):
+        """Test that an online copy leaves out pg_wal, runtime directories and the lock file."""
+        dirs, files, links = snapshot.walk(self.data_dir, online=True)
+        self.assertEqual(sorted(rel for rel, _, _ in files), ["PG_VERSION", "base/1/1259", "base/1/2608"])
+        self.assertIn("pg_wal", [rel for rel, _ in dirs])
+        self.assertEqual(links, [("pg_tblspc", "/elsewhere")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import subprocess
+import tarfile
+import tempfile
+import unittest
+
+from pgflux import source
+
+
+def _git(args, cwd):
+    subprocess.run(["git", "-c", "user.name=pgflux", "-c", "user.email=pgflux@example.com"] + args,
+                   cwd=cwd, check=True, capture_output=True)
+
+
+class TestSource(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.upstream = os.path.join(self.tmp.name, "upstream")
+        os.makedirs(self.upstream)
+        _git(["init", "-q"], self.upstream)
+        for branch, content in (("REL_16_STABLE", "16"), ("REL_17_STABLE", "17")):
+            _git(["checkout", "-q", "-B", branch], self.upstream)
+            with open(os.path.join(self.upstream, "VERSION"), "w") as f:
+                f.write(content)
+            _git(["add", "VERSION"], self.upstream)
+            _git(["commit", "-q", "-m", content], self.upstream)
+        self.mirror = os.path.join(self.tmp.name, "cache", "postgres.git")
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_worktrees_share_one_mirror(self):
+        """Test checking out two branches from a single bare mirror."""
+        builds = {}
+        for version, branch in (("pg16", "REL_16_STABLE"), ("pg17", "REL_17_STABLE")):
+            source.ensure_mirror(self.upstream, branch, mirror_dir=self.mirror)
+            builds[version] = os.path.join(self.tmp.name, f"{version}_build")
+            source.prepare_worktree(branch, builds[version], mirror_dir=self.mirror)
+
+        self.assertTrue(source.is_worktree(builds["pg16"]))
+        self.assertEqual(self._read(os.path.join(builds["pg16"], "VERSION")), "16")
+        self.assertEqual(self._read(os.path.join(builds["pg17"], "VERSION")), "17")
+
+        source.remove_worktree(builds["pg16"], mirror_dir=self.mirror)
+        self.assertFalse(os.path.exists(builds["pg16"]))
+        self.assertTrue(os.path.isdir(self.mirror))
+
+    def test_legacy_clone_follows_mirror(self):
+        """Test that a full clone from older releases is moved to the commit the mirror fetched."""
+        build_dir = os.path.join(self.tmp.name, "pg16_build")
+        _git(["clone", "-q", "--branch", "REL_16_STABLE", self.upstream, build_dir], self.tmp.name)
+        _git(["checkout", "-q", "REL_16_STABLE"], self.upstream)
+        with open(os.path.join(self.upstream, "VERSION"), "w") as f:
+            f.write("16.1")
+        _git(["commit", "-q", "-am", "16.1"], self.upstream)
+
+        source.ensure_mirror(self.upstream, "REL_16_STABLE", mirror_dir=self.mirror)
+        commit = source.prepare_worktree("REL_16_STABLE", build_dir, mirror_dir=self.mirror)
+        self.assertEqual(self._read(os.path.join(build_dir, "VERSION")), "16.1")
+        self.assertEqual(commit, source.resolve_commit(self.mirror))
+
+    def test_offline_requires_local_source(self):
+        """Test that offline installs refuse to clone from a URL."""
+        with self.assertRaises(RuntimeError):
+            source.ensure_mirror("https://example.invalid/postgres.git", "REL_16_STABLE",
+                                 mirror_dir=self.mirror, offline=True)
+
+    def test_extract_tarball(self):
+        """Test extracting a source tarball and reusing it on the next run."""
+        tarball = os.path.join(self.tmp.name, "postgresql-16.0.tar.gz")
+        with tarfile.open(tarball, "w:gz") as tar:
+            tar.add(os.path.join(self.upstream, "VERSION"), arcname="postgresql-16.0/VERSION")
+        self.assertTrue(source.is_tarball(tarball))
+
+        build_dir = os.path.join(self.tmp.name, "pg16_build")
+        source_id = source.extract_tarball(tarball, build_dir, mirror_dir=self.mirror)
+        self.assertTrue(source_id.startswith("tarball:"))
+        self.assertEqual(self._read(os.path.join(build_dir, "VERSION")), "17")
+        self.assertEqual(source.resolve_commit(build_dir), source_id)
+        self.assertEqual(source.extract_tarball(tarball, build_dir, mirror_dir=self.mirror), source_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
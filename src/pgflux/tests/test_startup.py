@@ -0,0 +1,63 @@
+import re
+import subprocess
+import sys
+import unittest
+
+from pgflux import cli
+
+# Commands people run interactively and expect to answer at once.
+LIGHTWEIGHT_COMMANDS = ("status", "start", "stop", "restart", "instances", "run", "logs")
+
+# Cumulative import time, in milliseconds, a lightweight command may spend before parsing its arguments.
+# Lazy loading measures around 80 ms here; importing every command eagerly took about twice that.
+IMPORT_BUDGET_MS = 150
+
+# Modules that only the commands needing them may import.
+HEAVY_MODULES = ("psycopg2", "asyncio", "ctypes", "pgflux.commands.install_command",
+                 "pgflux.commands.bench_command", "pgflux.build")
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| ( *)\S+$")
+
+
+def import_profile(command):
+    """
+    Runs `pgflux <command> --help` in a fresh interpreter and returns (total ms, imported module names).
+    """
+    # importlib.import_module bypasses the importtime hook for the module it loads, so the imported set is
+    # read from sys.modules; the command module's own imports still show up as top-level entries.
+    code = ("import sys\nfrom pgflux.cli import pgflux_cli\n"
+            f"try:\n    pgflux_cli([{command!r}, '--help'])\nfinally:\n    print('\\n'.join(sys.modules))")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    total_us = 0
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match and not match.group(2):  # top-level imports; their cumulative time covers the nested ones
+            total_us += int(match.group(1))
+    return total_us / 1000, set(result.stdout.splitlines())
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_lightweight_commands_within_budget(self):
+        """Test that lightweight commands import within the budget and skip heavy dependencies."""
+        for command in LIGHTWEIGHT_COMMANDS:
+            with self.subTest(command=command):
+                # The best of three runs filters out scheduling noise on busy machines.
+                profiles = [import_profile(command) for _ in range(3)]
+                elapsed = min(total for total, _ in profiles)
+                modules = profiles[0][1]
+                self.assertIn(cli.COMMANDS[command].split(":")[0], modules)
+                self.assertLess(elapsed, IMPORT_BUDGET_MS)
+                self.assertEqual([m for m in HEAVY_MODULES if m in modules], [])
+
+    def test_lazy_group_resolves_commands(self):
+        """Test that every built-in command is listed and resolved, and unknown names resolve to nothing."""
+        group = cli.pgflux_cli
+        ctx = group.make_context("pgflux", ["--help"], resilient_parsing=True)
+        self.assertTrue(set(cli.COMMANDS) <= set(group.list_commands(ctx)))
+        self.assertIs(group.get_command(ctx, "status"), group.commands["status"])
+        self.assertIsNone(group.get_command(ctx, "no-such-command"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import subprocess
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+from pgflux import templates
+
+FAKE_INITDB = """#!/bin/sh
+echo run >> "$(dirname "$0")/../initdb.calls"
+mkdir -p "$2"
+echo "# sample" > "$2/postgresql.conf"
+echo 16 > "$2/PG_VERSION"
+"""
+
+
+class TestTemplates(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch.object(templates, "TEMPLATES_DIR", os.path.join(self.tmp.name, "templates"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.prefix = os.path.join(self.tmp.name, "pg16")
+        os.makedirs(os.path.join(self.prefix, "bin"))
+        initdb = os.path.join(self.prefix, "bin", "initdb")
+        with open(initdb, "w") as f:
+            f.write(FAKE_INITDB)
+        os.chmod(initdb, os.stat(initdb).st_mode | stat.S_IEXEC)
+        self._write_postgres("v1")
+
+    def _write_postgres(self, content):
+        with open(os.path.join(self.prefix, "bin", "postgres"), "w") as f:
+            f.write(content)
+
+    def _initdb_calls(self):
+        path = os.path.join(self.prefix, "initdb.calls")
+        if not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            return len(f.readlines())
+
+    def test_init_clones_template(self):
+        """Test that initdb runs once and later clusters are cloned from the template."""
+        for name in ("data1", "data2"):
+            data_dir = os.path.join(self.tmp.name, name)
+            templates.init_cluster(self.prefix, "pg16", data_dir, stdout=subprocess.DEVNULL)
+            templates.apply_overrides(data_dir, {"port": 5433, "shared_buffers": "1GB"})
+            self.assertEqual(stat.S_IMODE(os.stat(data_dir).st_mode), 0o700)
+        self.assertEqual(self._initdb_calls(), 1)
+        with open(os.path.join(self.tmp.name, "data2", "postgresql.conf")) as f:
+            conf = f.read()
+        self.assertIn("port = 5433\n", conf)
+        self.assertIn("shared_buffers = '1GB'\n", conf)
+
+    def test_template_invalidated_when_binaries_change(self):
+        """Test that rebuilt binaries replace the stale template."""
+        templates.ensure_template(self.prefix, "pg16", stdout=subprocess.DEVNULL)
+        self._write_postgres("v2")
+        templates.ensure_template(self.prefix, "pg16", stdout=subprocess.DEVNULL)
+        self.assertEqual(self._initdb_calls(), 2)
+        self.assertEqual(len(os.listdir(templates.TEMPLATES_DIR)), 1)
+
+    def test_settings_get_separate_templates(self):
+        """Test that encoding and locale are part of the template key."""
+        utf8 = templates.ensure_template(self.prefix, "pg16", stdout=subprocess.DEVNULL)
+        latin = templates.ensure_template(self.prefix, "pg16", encoding="LATIN1", stdout=subprocess.DEVNULL)
+        self.assertNotEqual(utf8, latin)
+        self.assertEqual(self._initdb_calls(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+
+from pgflux import top
+
+
+class _Cursor:
+
+    def __init__(self, executed, rows):
+        self.executed = executed
+        self.rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchone(self):
+        return self.rows.get(self.executed[-1][0])
+
+
+class _Connection:
+
+    def __init__(self, rows):
+        self.executed = []
+        self.rows = rows
+
+    def cursor(self):
+        return _Cursor(self.executed, self.rows)
+
+
+def _counters(calls, total_ms, blks_read=0.0):
+    return (calls, total_ms, calls, 100.0, blks_read, 0.0, 0.0, 0.0)
+
+
+class TestTop(unittest.TestCase):
+
+    def test_statement_deltas(self):
+        """Test that deltas skip idle statements and restart from zero for new or reset entries."""
+        previous = {(10, 1, 111, True): _counters(100, 500.0), (10, 1, 222, True): _counters(50, 50.0),
+                    (10, 1, 333, True): _counters(80, 800.0)}
+        current = {(10, 1, 111, True): _counters(130, 650.0, 20), (10, 1, 222, True): _counters(50, 50.0),
+                   (10, 1, 333, True): _counters(5, 40.0), (10, 1, 444, True): _counters(2, 9000.0)}
+        deltas = top.statement_deltas(previous, current)
+        self.assertNotIn((10, 1, 222, True), deltas)
+        self.assertEqual(deltas[(10, 1, 111, True)]["calls"], 30)
+        self.assertAlmostEqual(deltas[(10, 1, 111, True)]["total_ms"], 150.0)
+        self.assertEqual(deltas[(10, 1, 333, True)]["calls"], 5)
+        self.assertEqual([key[2] for key, _ in top.top_deltas(deltas, 2)], [444, 111])
+        self.assertEqual([key[2] for key, _ in top.top_deltas(deltas, 1, "calls")], [111])
+        self.assertEqual([key[2] for key, _ in top.top_deltas(deltas, 1, "io")], [111])
+
+    def test_ensure_extension_keeps_preloaded_libraries(self):
+        """Test that pg_stat_statements is appended to shared_preload_libraries as a separate list element."""
+        conn = _Connection({"SELECT 1 FROM pg_available_extensions WHERE name = %s": (1,),
+                            "SHOW shared_preload_libraries": ('auto_explain, "my lib"',)})
+        self.assertFalse(top.ensure_extension(conn, configure=True))
+        self.assertEqual(conn.executed[-1], ("ALTER SYSTEM SET shared_preload_libraries = %s, %s, %s",
+                                             ["auto_explain", "my lib", "pg_stat_statements"]))
+
+    def test_window_round_trip(self):
+        """Test that recorded intervals are written, read back and summed."""
+        deltas = top.statement_deltas({}, {(10, 1, 111, True): _counters(10, 20.0)})
+        records = [top.interval_record(1000.0 + i, 5.0, deltas, {"Lock:transactionid": 4, "CPU:running": 6}, 10,
+                                       {111: "SELECT ?"}, 10) for i in range(3)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "window.jsonl")
+            top.write_window(path, records)
+            statements, waits, elapsed = top.summarize_window(top.read_window(path))
+        entry = statements[(10, 1, 111, True)]
+        self.assertEqual(entry["calls"], 30)
+        self.assertEqual(entry["query"], "SELECT ?")
+        self.assertAlmostEqual(waits["Lock:transactionid"], 0.4)
+        self.assertEqual(elapsed, 15.0)
+        lines = top.format_view(top.top_deltas(statements, 5), waits, 1, elapsed, {111: "SELECT ?"})
+        self.assertEqual(lines[0], "Active sessions: 1.0 avg over 15.0s")
+        self.assertTrue(lines[-1].endswith("SELECT ?"))
+
+
+if __name__ == "__main__":
+    unittest.main()
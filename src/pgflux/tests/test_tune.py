@@ -0,0 +1,38 @@
+import os
+import tempfile
+import unittest
+
+from pgflux import tune
+
+HARDWARE = {"cpus": 8, "memory": 16 * tune.GB, "storage": "nvme"}
+
+
+class TestTune(unittest.TestCase):
+
+    def test_recommend(self):
+        """Test that settings scale with memory, CPUs, storage and the number of clusters."""
+        settings = tune.recommend(HARDWARE, "oltp")
+        self.assertEqual(settings["shared_buffers"], "4GB")
+        self.assertEqual(settings["effective_cache_size"], "12GB")
+        self.assertEqual(settings["maintenance_work_mem"], "1GB")
+        self.assertEqual(settings["max_parallel_workers_per_gather"], "2")
+        self.assertEqual(settings["random_page_cost"], "1.1")
+        self.assertEqual(tune.recommend(HARDWARE, "olap")["max_parallel_workers_per_gather"], "4")
+        self.assertEqual(tune.recommend(HARDWARE, "mixed", clusters=2)["shared_buffers"], "2GB")
+
+    def test_apply_includes_once(self):
+        """Test that the include file is written and referenced from postgresql.conf exactly once."""
+        with tempfile.TemporaryDirectory() as data_dir:
+            with open(os.path.join(data_dir, "postgresql.conf"), "w") as f:
+                f.write("port = 5432\n")
+            contents = tune.render(tune.recommend(HARDWARE, "mixed"), HARDWARE, "mixed")
+            self.assertIn("+shared_buffers = '4GB'", tune.diff(data_dir, contents))
+            tune.apply(data_dir, contents)
+            tune.apply(data_dir, contents)
+            self.assertEqual(tune.diff(data_dir, contents), "")
+            with open(os.path.join(data_dir, "postgresql.conf")) as f:
+                self.assertEqual(f.read().count(tune.INCLUDE_LINE), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+
+from pgflux.utils import clone_tree, format_size, parse_size
+
+
+class TestPgFluxUtils(unittest.TestCase):
+
+    def test_parse_size(self):
+        """Test parsing human readable sizes."""
+        self.assertEqual(parse_size("512"), 512)
+        self.assertEqual(parse_size("1K"), 1024)
+        self.assertEqual(parse_size("1.5g"), int(1.5 * 1024 ** 3))
+        self.assertEqual(parse_size("10GB"), 10 * 1024 ** 3)
+        with self.assertRaises(ValueError):
+            parse_size("lots")
+
+    def test_format_size(self):
+        """Test formatting byte counts."""
+        self.assertEqual(format_size(100), "100B")
+        self.assertEqual(format_size(1536), "1.5K")
+
+    def test_clone_tree(self):
+        """Test cloning a tree with exclusions and symlinks."""
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            os.makedirs(os.path.join(src, "bin"))
+            os.makedirs(os.path.join(src, "data"))
+            with open(os.path.join(src, "bin", "postgres"), "w") as f:
+                f.write("binary")
+            with open(os.path.join(src, "data", "PG_VERSION"), "w") as f:
+                f.write("16")
+            os.symlink("postgres", os.path.join(src, "bin", "postmaster"))
+
+            dst = os.path.join(tmp, "dst")
+            self.assertEqual(clone_tree(src, dst, exclude=["data"]), 1)
+            with open(os.path.join(dst, "bin", "postgres")) as f:
+                self.assertEqual(f.read(), "binary")
+            self.assertEqual(os.readlink(os.path.join(dst, "bin", "postmaster")), "postgres")
+            self.assertFalse(os.path.exists(os.path.join(dst, "data")))
+
+            # Cloning again over an existing tree replaces the files.
+            self.assertEqual(clone_tree(src, dst, link=False), 2)
+
+            # A symlink to a directory is recreated as a link, also over an earlier clone.
+            os.symlink("bin", os.path.join(src, "share"))
+            clone_tree(src, dst)
+            clone_tree(src, dst)
+            self.assertEqual(os.readlink(os.path.join(dst, "share")), "bin")
+
+
+if __name__ == "__main__":
+    unittest.main()
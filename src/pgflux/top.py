@@ -0,0 +1,220 @@
+import json
+import time
+
+EXTENSION = "pg_stat_statements"
+SORT_KEYS = ("total", "calls", "io")
+QUERY_TEXT_CHARS = 200
+
+# showtext := false skips reading the query text file on every sample; texts are fetched only for displayed rows.
+STATEMENTS_SQL = """
+    SELECT userid, dbid, queryid, toplevel, calls, total_exec_time, rows,
+           shared_blks_hit, shared_blks_read, shared_blks_written, temp_blks_read + temp_blks_written,
+           {read_time} + {write_time}
+    FROM pg_stat_statements(false)
+    WHERE queryid IS NOT NULL
+"""
+# PostgreSQL 17 split block I/O timing into shared and local counters.
+IO_TIME_COLUMNS = {True: ("shared_blk_read_time", "shared_blk_write_time"), False: ("blk_read_time", "blk_write_time")}
+QUERY_TEXT_SQL = "SELECT queryid, query FROM pg_stat_statements WHERE queryid = ANY(%s)"
+
+WAITS_SQL = """
+    SELECT coalesce(wait_event_type, 'CPU'), coalesce(wait_event, 'running'), count(*)
+    FROM pg_stat_activity
+    WHERE state = 'active' AND pid <> pg_backend_pid() AND backend_type = 'client backend'
+    GROUP BY 1, 2
+"""
+
+COUNTERS = ("calls", "total_ms", "rows", "blks_hit", "blks_read", "blks_written", "temp_blks", "io_ms")
+
+
+class TopError(Exception):
+    """
+    Raised when pg_stat_statements cannot be used on the server.
+    """
+
+
+def preload_libraries(conn):
+    with conn.cursor() as cur:
+        cur.execute("SHOW shared_preload_libraries")
+        return [lib.strip().strip('"') for lib in cur.fetchone()[0].split(",") if lib.strip()]
+
+
+def ensure_extension(conn, configure=False):
+    """
+    Makes sure pg_stat_statements is preloaded and created. Returns True once it can be sampled.
+
+    When the library is not preloaded yet, it is added to shared_preload_libraries
+    with ALTER SYSTEM if configure is set, and False is returned: the server has
+    to be restarted before the extension collects anything.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_available_extensions WHERE name = %s", (EXTENSION,))
+        if cur.fetchone() is None:
+            raise TopError(f"{EXTENSION} is not installed for this server; reinstall it with 'pgflux install' "
+                           "to build the contrib modules.")
+        libraries = preload_libraries(conn)
+        if EXTENSION not in libraries:
+            if configure:
+                # A list setting: each library is its own literal, or the server reads one long library name
+                libraries.append(EXTENSION)
+                cur.execute("ALTER SYSTEM SET shared_preload_libraries = " + ", ".join(["%s"] * len(libraries)),
+                            libraries)
+            return False
+        cur.execute(f"CREATE EXTENSION IF NOT EXISTS {EXTENSION}")
+    return True
+
+
+def sample_statements(conn):
+    """
+    Reads the cumulative pg_stat_statements counters, keyed by (userid, dbid, queryid, toplevel).
+    """
+    read_time, write_time = IO_TIME_COLUMNS[conn.server_version >= 170000]
+    with conn.cursor() as cur:
+        cur.execute(STATEMENTS_SQL.format(read_time=read_time, write_time=write_time))
+        return {tuple(row[:4]): tuple(float(value) for value in row[4:]) for row in cur.fetchall()}
+
+
+def sample_waits(conn):
+    """
+    Counts active client backends by wait event; backends not waiting are reported as CPU.
+    """
+    with conn.cursor() as cur:
+        cur.execute(WAITS_SQL)
+        return {f"{kind}:{event}": count for kind, event, count in cur.fetchall()}
+
+
+def statement_deltas(previous, current):
+    """
+    Returns per-statement counter differences between two samples, skipping idle statements.
+
+    Entries that are new, or whose counters went backwards because they were
+    evicted and re-added or reset, count from zero.
+    """
+    deltas = {}
+    for key, counters in current.items():
+        before = previous.get(key)
+        if before is None or counters[0] < before[0]:
+            before = (0.0,) * len(counters)
+        if counters[0] > before[0]:
+            deltas[key] = dict(zip(COUNTERS, (after - prior for after, prior in zip(counters, before))))
+    return deltas
+
+
+def sort_value(delta, sort):
+    if sort == "calls":
+        return delta["calls"]
+    if sort == "io":
+        return delta["blks_read"] + delta["blks_written"] + delta["temp_blks"]
+    return delta["total_ms"]
+
+
+def top_deltas(deltas, limit, sort="total"):
+    """
+    Returns the limit busiest (key, delta) pairs of one interval.
+    """
+    return sorted(deltas.items(), key=lambda item: sort_value(item[1], sort), reverse=True)[:limit]
+
+
+class QueryTexts:
+    """
+    Caches query texts by queryid, fetching only the ones not seen yet.
+    """
+
+    def __init__(self):
+        self.texts = {}
+
+    def lookup(self, conn, queryids):
+        missing = [queryid for queryid in set(queryids) if queryid not in self.texts]
+        if missing:
+            with conn.cursor() as cur:
+                cur.execute(QUERY_TEXT_SQL, (missing,))
+                for queryid, query in cur.fetchall():
+                    self.texts[queryid] = " ".join(query.split())[:QUERY_TEXT_CHARS]
+        return {queryid: self.texts.get(queryid, "") for queryid in queryids}
+
+
+def interval_record(started, elapsed, deltas, waits, wait_samples, texts, limit):
+    """
+    Builds the JSON-serializable record of one interval, kept for --output dumps.
+
+    Wait events are stored as average active sessions over the interval.
+    """
+    return {
+        "time": started,
+        "elapsed": elapsed,
+        "statements": [dict(delta, queryid=key[2], dbid=key[1], userid=key[0], toplevel=key[3],
+                            query=texts.get(key[2], ""))
+                       for key, delta in top_deltas(deltas, limit)],
+        "waits": {event: count / wait_samples for event, count in waits.items()},
+    }
+
+
+def write_window(path, records):
+    """
+    Writes interval records as JSON lines.
+    """
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def read_window(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize_window(records):
+    """
+    Adds up the statements of several recorded intervals and averages their wait events.
+    """
+    statements, waits = {}, {}
+    for record in records:
+        for entry in record["statements"]:
+            key = (entry["userid"], entry["dbid"], entry["queryid"], entry["toplevel"])
+            total = statements.setdefault(key, dict.fromkeys(COUNTERS, 0.0))
+            for name in COUNTERS:
+                total[name] += entry[name]
+            total["query"] = entry["query"]
+        for event, count in record["waits"].items():
+            waits[event] = waits.get(event, 0) + count
+    elapsed = sum(record["elapsed"] for record in records)
+    return statements, {event: total / len(records) for event, total in waits.items()}, elapsed
+
+
+def format_view(rows, waits, wait_samples, elapsed, texts, width=200):
+    """
+    Renders one interval as lines: wait events as average active sessions, then the statements.
+    """
+    lines = []
+    sessions = sum(waits.values()) / wait_samples if wait_samples else 0
+    lines.append(f"Active sessions: {sessions:.1f} avg over {elapsed:.1f}s")
+    for event, count in sorted(waits.items(), key=lambda item: item[1], reverse=True)[:8]:
+        lines.append(f"  {event:<40} {count / wait_samples:>6.2f}")
+    lines.append("")
+    lines.append(f"{'calls/s':>9} {'total ms':>11} {'mean ms':>9} {'rows/s':>9} {'hit%':>6} {'read blk':>9} "
+                 f"{'io ms':>8}  query")
+    for key, delta in rows:
+        calls = delta["calls"]
+        blocks = delta["blks_hit"] + delta["blks_read"]
+        hit = f"{delta['blks_hit'] / blocks * 100:.1f}" if blocks else "-"
+        line = (f"{calls / elapsed:>9.1f} {delta['total_ms']:>11.1f} {delta['total_ms'] / calls:>9.2f} "
+                f"{delta['rows'] / elapsed:>9.1f} {hit:>6} {delta['blks_read']:>9.0f} {delta['io_ms']:>8.1f}  "
+                f"{texts.get(key[2], '')}")
+        lines.append(line[:width])
+    return lines
+
+
+def sample_interval(conn, interval, wait_every):
+    """
+    Samples wait events every wait_every seconds until interval has passed. Returns (waits, samples).
+    """
+    waits, samples = {}, 0
+    deadline = time.monotonic() + interval
+    while True:
+        for event, count in sample_waits(conn).items():
+            waits[event] = waits.get(event, 0) + count
+        samples += 1
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return waits, samples
+        time.sleep(min(wait_every, remaining))
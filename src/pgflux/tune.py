@@ -0,0 +1,210 @@
+import difflib
+import math
+import os
+
+TUNE_FILE = "pgflux_tune.conf"
+INCLUDE_LINE = f"include_if_exists = '{TUNE_FILE}'"
+PROFILES = ("oltp", "olap", "mixed")
+DEFAULT_MAX_CONNECTIONS = 100
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+KB = 1024
+MB = 1024 * KB
+GB = 1024 * MB
+
+# Per-profile knobs: maintenance_work_mem fraction of RAM, work_mem divisor, WAL sizing and planner statistics.
+PROFILE_SETTINGS = {
+    "oltp": {"maintenance_fraction": 1 / 16, "work_mem_divisor": 2, "min_wal_size": 2 * GB, "max_wal_size": 8 * GB,
+             "checkpoint_timeout": "15min", "statistics_target": 100, "parallel_per_gather_cap": 2},
+    "olap": {"maintenance_fraction": 1 / 8, "work_mem_divisor": 1, "min_wal_size": 4 * GB, "max_wal_size": 16 * GB,
+             "checkpoint_timeout": "30min", "statistics_target": 500, "parallel_per_gather_cap": None},
+    "mixed": {"maintenance_fraction": 1 / 16, "work_mem_divisor": 2, "min_wal_size": 1 * GB, "max_wal_size": 4 * GB,
+              "checkpoint_timeout": "15min", "statistics_target": 100, "parallel_per_gather_cap": 4},
+}
+STORAGE_SETTINGS = {
+    "hdd": {"random_page_cost": "4", "effective_io_concurrency": 2},
+    "ssd": {"random_page_cost": "1.1", "effective_io_concurrency": 200},
+    "nvme": {"random_page_cost": "1.1", "effective_io_concurrency": 256},
+}
+
+
+def _read(path):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _cgroup_dir():
+    """
+    Returns this process's cgroup v2 directory, or the v1/v2 root if it cannot be resolved.
+    """
+    for line in (_read("/proc/self/cgroup") or "").splitlines():
+        if line.startswith("0::"):
+            path = os.path.join(CGROUP_ROOT, line[3:].lstrip("/"))
+            if os.path.isdir(path):
+                return path
+    return CGROUP_ROOT
+
+
+def _memory_limit():
+    cgroup = _cgroup_dir()
+    for path in (os.path.join(cgroup, "memory.max"), os.path.join(CGROUP_ROOT, "memory", "memory.limit_in_bytes")):
+        value = _read(path)
+        if value and value.isdigit():
+            return int(value)
+    return None
+
+
+def _cpu_limit():
+    cgroup = _cgroup_dir()
+    value = _read(os.path.join(cgroup, "cpu.max"))
+    if value and not value.startswith("max"):
+        quota, period = value.split()
+        return max(1, math.ceil(int(quota) / int(period)))
+    quota = _read(os.path.join(CGROUP_ROOT, "cpu", "cpu.cfs_quota_us"))
+    period = _read(os.path.join(CGROUP_ROOT, "cpu", "cpu.cfs_period_us"))
+    if quota and period and quota.lstrip("-").isdigit() and int(quota) > 0:
+        return max(1, math.ceil(int(quota) / int(period)))
+    return None
+
+
+def _storage_type(path):
+    """
+    Classifies the block device holding path as 'nvme', 'ssd' or 'hdd' from sysfs.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "ssd"
+    device = os.path.realpath(f"/sys/dev/block/{os.major(st.st_dev)}:{os.minor(st.st_dev)}")
+    if not os.path.isdir(device):
+        return "ssd"  # overlay, tmpfs, network filesystems: assume flash-like latency
+    if not os.path.exists(os.path.join(device, "queue")):
+        device = os.path.dirname(device)  # a partition; the queue lives on the parent disk
+    name = os.path.basename(device)
+    # Device mapper and md devices report the rotational flag of their own queue.
+    if _read(os.path.join(device, "queue", "rotational")) == "1":
+        return "hdd"
+    return "nvme" if name.startswith("nvme") else "ssd"
+
+
+def detect_hardware(data_dir="/"):
+    """
+    Returns CPU count, memory and storage type available to a cluster in data_dir, honouring cgroup limits.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    cpu_limit = _cpu_limit()
+    if cpu_limit:
+        cpus = min(cpus, cpu_limit)
+
+    memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    memory_limit = _memory_limit()
+    if memory_limit:
+        memory = min(memory, memory_limit)
+
+    probe = data_dir
+    while not os.path.exists(probe) and probe != os.path.dirname(probe):
+        probe = os.path.dirname(probe)
+    return {"cpus": cpus, "memory": memory, "storage": _storage_type(probe)}
+
+
+def format_memory(num_bytes):
+    """
+    Formats bytes as a postgresql.conf memory value, using the largest exact unit.
+    """
+    kb = max(int(num_bytes) // KB, 64)
+    for unit, factor in (("GB", 1024 * 1024), ("MB", 1024)):
+        if kb >= factor and kb % factor == 0:
+            return f"{kb // factor}{unit}"
+    return f"{kb // KB}MB" if kb >= 16 * KB else f"{kb}kB"
+
+
+def recommend(hardware, profile="mixed", max_connections=DEFAULT_MAX_CONNECTIONS, clusters=1):
+    """
+    Computes settings for a workload profile. Memory is split evenly when several clusters share the host.
+    """
+    knobs = PROFILE_SETTINGS[profile]
+    cpus = hardware["cpus"]
+    memory = hardware["memory"] // max(clusters, 1)
+
+    shared_buffers = memory // 4
+    wal_buffers = min(shared_buffers * 3 // 100, 16 * MB)
+    per_gather = math.ceil(cpus / 2)
+    if knobs["parallel_per_gather_cap"]:
+        per_gather = min(per_gather, knobs["parallel_per_gather_cap"])
+    work_mem = (memory - shared_buffers) // (max_connections * 3) // max(per_gather, 1) // knobs["work_mem_divisor"]
+
+    settings = {
+        "max_connections": str(max_connections),
+        "shared_buffers": format_memory(shared_buffers),
+        "effective_cache_size": format_memory(memory * 3 // 4),
+        "work_mem": format_memory(work_mem),
+        "maintenance_work_mem": format_memory(min(memory * knobs["maintenance_fraction"], 2 * GB)),
+        "wal_buffers": format_memory(wal_buffers if wal_buffers < 14 * MB else 16 * MB),
+        "min_wal_size": format_memory(knobs["min_wal_size"]),
+        "max_wal_size": format_memory(knobs["max_wal_size"]),
+        "checkpoint_timeout": knobs["checkpoint_timeout"],
+        "checkpoint_completion_target": "0.9",
+        "default_statistics_target": str(knobs["statistics_target"]),
+        "random_page_cost": STORAGE_SETTINGS[hardware["storage"]]["random_page_cost"],
+        "effective_io_concurrency": str(STORAGE_SETTINGS[hardware["storage"]]["effective_io_concurrency"]),
+        "max_worker_processes": str(max(cpus, 8)),
+        "max_parallel_workers": str(cpus),
+        "max_parallel_workers_per_gather": str(per_gather),
+        "max_parallel_maintenance_workers": str(min(math.ceil(cpus / 2), 4)),
+    }
+    return settings
+
+
+def render(settings, hardware, profile, clusters=1):
+    """
+    Renders the include file, with a header recording what the values were derived from.
+    """
+    shared = f", shared by {clusters} clusters" if clusters > 1 else ""
+    lines = [
+        "# Generated by pgflux tune; edits are overwritten on the next run.",
+        f"# profile: {profile}, cpus: {hardware['cpus']}, memory: {format_memory(hardware['memory'])}, "
+        f"storage: {hardware['storage']}{shared}",
+    ]
+    lines += [f"{name} = '{value}'" for name, value in settings.items()]
+    return "\n".join(lines) + "\n"
+
+
+def diff(data_dir, contents):
+    """
+    Returns a unified diff between the current include file and contents, empty if unchanged.
+    """
+    path = os.path.join(data_dir, TUNE_FILE)
+    current = _read(path)
+    current = (current + "\n") if current else ""
+    return "".join(difflib.unified_diff(current.splitlines(True), contents.splitlines(True),
+                                        fromfile=f"{path} (current)", tofile=f"{path} (proposed)"))
+
+
+def apply(data_dir, contents):
+    """
+    Writes the include file and makes sure postgresql.conf includes it.
+    """
+    path = os.path.join(data_dir, TUNE_FILE)
+    with open(path + ".tmp", "w") as f:
+        f.write(contents)
+    os.replace(path + ".tmp", path)
+
+    conf_path = os.path.join(data_dir, "postgresql.conf")
+    with open(conf_path, "r") as conf:
+        included = any(line.strip() == INCLUDE_LINE for line in conf)
+    if not included:
+        with open(conf_path, "a") as conf:
+            conf.write(f"\n# Added by pgflux\n{INCLUDE_LINE}\n")
+
+
+def tune_cluster(data_dir, profile="mixed", max_connections=DEFAULT_MAX_CONNECTIONS, clusters=1):
+    """
+    Detects the hardware, writes the tuning include file for data_dir and returns the rendered file.
+    """
+    hardware = detect_hardware(data_dir)
+    contents = render(recommend(hardware, profile, max_connections, clusters), hardware, profile, clusters)
+    apply(data_dir, contents)
+    return contents
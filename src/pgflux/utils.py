@@ -1,11 +1,122 @@
+import errno
+import fcntl
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
+# ioctl request number for FICLONE (reflink a whole file) on Linux
+FICLONE = 0x40049409
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
 
-def parallel_build_args():
-    return f"-j{os.cpu_count() or 1}"
 
+def default_jobs():
+    return os.cpu_count() or 1
 
-def write_installed_version(version):
-    config_file = "/usr/local/pgflux_installed_version.txt"
-    with open(config_file, "w") as f:
-        f.write(version)
+
+def parse_size(value):
+    """
+    Parses a human readable size such as '512M' or '10G' into bytes.
+    """
+    value = str(value).strip().upper().rstrip("B")
+    unit = value[-1:] if value[-1:] in SIZE_UNITS else ""
+    number = value[:-1] if unit else value
+    try:
+        return int(float(number) * SIZE_UNITS[unit])
+    except ValueError:
+        raise ValueError(f"Invalid size '{value}'. Use a number with an optional K, M, G or T suffix.")
+
+
+def format_size(num_bytes):
+    """
+    Formats a byte count for display, e.g. 1536 -> '1.5K'.
+    """
+    for unit in ("", "K", "M", "G"):
+        if abs(num_bytes) < 1024:
+            return f"{num_bytes:.1f}{unit}" if unit else f"{num_bytes}B"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f}T"
+
+
+def tree_size(path):
+    """
+    Returns the apparent size in bytes of all regular files below path.
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            total += st.st_size
+    return total
+
+
+def _reflink(src, dst):
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+
+def _clone_file(source, target, state):
+    if state["reflink"]:
+        try:
+            _reflink(source, target)
+            return
+        except OSError as e:
+            if e.errno not in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.EBADF):
+                raise
+            state["reflink"] = False
+            os.unlink(target)
+    if state["link"]:
+        try:
+            os.link(source, target)
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            state["link"] = False
+    shutil.copy2(source, target)
+
+
+def clone_tree(src, dst, link=True, exclude=(), workers=1):
+    """
+    Recreates the tree at src under dst as cheaply as the filesystem allows.
+
+    Files are reflinked where supported, hardlinked when link is true and
+    copied otherwise; with workers > 1 files are cloned by a thread pool.
+    Paths in exclude are relative to src and skipped. Returns the number
+    of files cloned.
+    """
+    exclude = {os.path.normpath(p) for p in exclude}
+    state = {"reflink": True, "link": link}
+    pending = []
+    for root, dirs, files in os.walk(src):
+        rel_root = os.path.relpath(root, src)
+        dirs[:] = [d for d in dirs if os.path.normpath(os.path.join(rel_root, d)) not in exclude]
+        target_root = os.path.join(dst, rel_root)
+        os.makedirs(target_root, exist_ok=True)
+        shutil.copymode(root, target_root)
+        for name in files + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+            source = os.path.join(root, name)
+            target = os.path.join(target_root, name)
+            # Symlinks first: os.path.isdir follows a link to a directory, which would be left in place
+            if os.path.islink(source):
+                if os.path.isdir(target) and not os.path.islink(target):
+                    shutil.rmtree(target)
+                elif os.path.lexists(target):
+                    os.unlink(target)
+                os.symlink(os.readlink(source), target)
+                continue
+            if os.path.lexists(target) and (os.path.islink(target) or not os.path.isdir(target)):
+                os.unlink(target)
+            pending.append((source, target))
+
+    if workers > 1 and len(pending) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for future in [pool.submit(_clone_file, source, target, state) for source, target in pending]:
+                future.result()
+    else:
+        for source, target in pending:
+            _clone_file(source, target, state)
+    return len(pending)